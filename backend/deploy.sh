@@ -38,6 +38,7 @@ usage() {
     echo ""
     echo "Options:"
     echo "  -e, --environment ENV    Environment to deploy (dev|staging|prod) [default: dev]"
+    echo "  -i, --index-stage N      Dedicated table indexes to deploy (0-4, one more per deployment) [default: 0]"
     echo "  -h, --help               Show this help message"
     echo ""
     echo "Examples:"
@@ -49,6 +50,7 @@ usage() {
 
 # Default values
 ENVIRONMENT="dev"
+INDEX_STAGE="0"
 
 # Parse command line arguments
 while [[ $# -gt 0 ]]; do
@@ -57,6 +59,10 @@ while [[ $# -gt 0 ]]; do
             ENVIRONMENT="$2"
             shift 2
             ;;
+        -i|--index-stage)
+            INDEX_STAGE="$2"
+            shift 2
+            ;;
         -h|--help)
             usage
             ;;
@@ -74,6 +80,12 @@ if [[ ! "$ENVIRONMENT" =~ ^(dev|staging|prod)$ ]]; then
     exit 1
 fi
 
+if [[ ! "$INDEX_STAGE" =~ ^[0-4]$ ]]; then
+    print_error "Invalid index stage: $INDEX_STAGE"
+    print_info "Valid index stages are: 0-4"
+    exit 1
+fi
+
 # Get the script directory and navigate to backend directory
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 cd "$SCRIPT_DIR"
@@ -145,6 +157,7 @@ aws cloudformation deploy \
   --parameter-overrides \
     ProjectName=wiseuni \
     Environment=${ENVIRONMENT} \
+    IndexStage=${INDEX_STAGE} \
   --tags \
     Project=wiseuni \
     Environment=${ENVIRONMENT} \
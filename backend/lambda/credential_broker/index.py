@@ -0,0 +1,133 @@
+"""
+Credential Broker
+Exchanges a User Pool ID token for Identity Pool credentials, with caching
+
+POST /credentials  (Authorization: <ID token>, checked by the API's JWT authorizer)
+-> {"identityId": ..., "accessKeyId": ..., "secretAccessKey": ...,
+    "sessionToken": ..., "expiration": <epoch seconds>}
+
+The browser used to run GetId + GetCredentialsForIdentity before every
+S3/DynamoDB call. Here the result is cached per token until shortly before
+it expires (wiseuni/credentials.py), so most requests never reach Cognito
+Identity, which throttles us at peak times.
+
+Students migrated from the legacy registry (user_migration) get their
+staged profile and group on their first exchange: only here are the ID
+token's sub and the identityId known together (wiseuni/migration.py).
+
+Local service: python backend/lambda/credential_broker/index.py --serve 8787
+"""
+
+import json
+import logging
+import os
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared', 'python'))
+
+from botocore.exceptions import ClientError
+from wiseuni import aws
+from wiseuni.api import ApiError, response
+from wiseuni.credentials import MISS, CredentialBroker
+from wiseuni.migration import ProfileClaims
+from wiseuni.profiling import profiled
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+IDENTITY_POOL_ID = os.environ['IDENTITY_POOL_ID']
+USER_POOL_ID = os.environ['USER_POOL_ID']
+STATS_EVERY = int(os.environ.get('STATS_EVERY', 100))  # Log hit-rate metrics every N requests
+
+ROUTE_KEYS = ('POST /credentials',)
+
+broker = CredentialBroker(
+    aws.client('cognito-identity'),
+    IDENTITY_POOL_ID,
+    f'cognito-idp.{aws.REGION}.amazonaws.com/{USER_POOL_ID}',
+)
+profile_claims = ProfileClaims(aws.table(os.environ['TABLE_NAME']), aws.client('cognito-idp'), USER_POOL_ID)
+aws.warm(broker.client, profile_claims.table, profile_claims.cognito)
+
+# Cognito Identity errors the caller can act on
+CLIENT_ERRORS = {
+    'NotAuthorizedException': (401, 'ID token rejected by Cognito'),
+    'TooManyRequestsException': (429, 'Credential exchange throttled, retry shortly'),
+    'LimitExceededException': (429, 'Credential exchange throttled, retry shortly'),
+}
+
+
+def bearer_token(event):
+    header = (event.get('headers') or {}).get('authorization', '')
+    token = header[7:] if header[:7].lower() == 'bearer ' else header
+    if not token:
+        raise ApiError(401, 'Missing ID token')
+    return token.strip()
+
+
+def verified_claims(event):
+    """ID token claims, present only when the JWT authorizer validated the token"""
+    jwt = event.get('requestContext', {}).get('authorizer', {}).get('jwt') or {}
+    return jwt.get('claims') or {}
+
+
+def verified_subject(event):
+    return verified_claims(event).get('sub')
+
+
+def claim_migrated_profile(event, identity_id):
+    """Best effort: on failure the staged profile stays for the next exchange"""
+    claims = verified_claims(event)
+    if not claims:
+        return
+    try:
+        profile = profile_claims.claim(claims, identity_id)
+    except Exception as e:
+        logger.error(f'Migrated profile claim failed for {identity_id}: {str(e)}', exc_info=True)
+        return
+    if profile:
+        logger.info(f"Migrated profile claimed: {identity_id} ({profile['role']}, legacy id {profile['legacyId']})")
+
+
+def get_credentials(event):
+    try:
+        credentials, source = broker.get(bearer_token(event), verified_subject(event))
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in CLIENT_ERRORS:
+            raise ApiError(*CLIENT_ERRORS[code])
+        raise
+    if source == MISS:
+        claim_migrated_profile(event, credentials['identityId'])
+    # Credentials must never be stored by the browser cache or a proxy
+    return response(200, credentials, {'Cache-Control': 'no-store', 'X-Cache': source})
+
+
+@profiled
+def handler(event, context):
+    """
+    Credential Broker Lambda
+
+    JWT-authorized route, so unlike the other backend routes it does not
+    go through wiseuni.api.handle() (there is no IAM caller yet)
+    """
+    try:
+        if event.get('routeKey') != 'POST /credentials':
+            return response(404, {'error': f"Unknown route: {event.get('routeKey')}"})
+        return get_credentials(event)
+    except ApiError as e:
+        logger.warning(f'Credential exchange rejected ({e.status_code}): {e.message}')
+        return response(e.status_code, {'error': e.message})
+    except Exception as e:
+        logger.error(f'Credential exchange failed: {str(e)}', exc_info=True)
+        return response(500, {'error': 'Internal server error'})
+    finally:
+        stats = broker.stats()
+        if stats['requests'] % STATS_EVERY == 0:
+            logger.info(f'Credential cache: {json.dumps(stats)}')
+
+
+if __name__ == '__main__':
+    from wiseuni.local import main
+    main(handler, ROUTE_KEYS)
@@ -0,0 +1,125 @@
+"""
+Custom Email Sender Lambda Trigger
+Sends every Cognito code email (sign-up, resend, password reset, email
+change, admin invitation) through our own SES account
+
+Without it Cognito mails codes itself (custom_message only changes the
+wording), capped by Cognito's built-in email limit: during sign-up storms
+verification emails queue behind it and students give up. Here:
+
+- the code arrives encrypted under the user pool's KMS key and is
+  decrypted by a pluggable decryptor (wiseuni/codes.py)
+- the branded 'code' template is compiled at init (wiseuni/templates)
+- sent by the shared mailer (wiseuni/mailer.py): pooled SES client,
+  MaxSendRate-aware, per-call latency
+- suppressed addresses are skipped; a retried call does not send twice
+  (wiseuni/idempotency.py, keyed on the encrypted code)
+
+Local run: CODE_DECRYPTOR=plaintext (the event's code is used as is)
+"""
+
+import html
+import logging
+import os
+
+from wiseuni import aws
+from wiseuni.codes import decryptor_from_env
+from wiseuni.idempotency import IdempotencyInProgress, IdempotencyStore, trigger_key
+from wiseuni.mailer import Mailer
+from wiseuni.profiling import profiled
+from wiseuni.suppression import SuppressionIndex
+from wiseuni.templates import code_fallback, render, warm
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TEMPLATE_VARIANTS = {
+    'CustomEmailSender_SignUp': 'signup',
+    'CustomEmailSender_ResendCode': 'resend_code',
+    'CustomEmailSender_ForgotPassword': 'forgot_password',
+    'CustomEmailSender_UpdateUserAttribute': 'verify_email',
+    'CustomEmailSender_VerifyUserAttribute': 'verify_email',
+    'CustomEmailSender_AdminCreateUser': 'invitation',  # code = temporary password
+}
+
+# Compile every locale x variant now, not on a student's sign-up
+warm('code', set(TEMPLATE_VARIANTS.values()))
+
+decryptor = decryptor_from_env()
+mailer = Mailer()
+table = aws.table(os.environ['TABLE_NAME'])
+aws.warm(mailer.client, table)
+
+# Bounce/complaint suppression list, kept warm across invocations
+suppression_index = SuppressionIndex(table)
+
+# Code emails already sent, remembered across retries
+idempotency = IdempotencyStore(table)
+
+
+@profiled
+def handler(event, context):
+    """
+    Triggered whenever Cognito needs to email a code
+
+    Event structure (the code is never logged):
+    {
+        'triggerSource': 'CustomEmailSender_SignUp',
+        'request': {
+            'type': 'customEmailSenderRequestV1',
+            'code': '<base64 Encryption SDK message>',
+            'userAttributes': {'email': ..., 'name': ..., 'locale': ...}
+        }
+    }
+
+    Errors are raised so the call is retried; sending is idempotent.
+    """
+    trigger_source = event.get('triggerSource', '')
+    attributes = event['request'].get('userAttributes') or {}
+    email = attributes.get('email', '')
+
+    variant = TEMPLATE_VARIANTS.get(trigger_source)
+    if variant is None:
+        # e.g. AccountTakeOverNotification: no code, nothing we send
+        logger.info(f'No email for {trigger_source}')
+        return
+    if not email:
+        logger.warning(f'{trigger_source} for a user without an email address: {event.get("userName")}')
+        return
+
+    # Unlike custom_message, we do the sending and can skip it
+    if suppression_index.is_suppressed(email):
+        logger.warning(f'Skipping {trigger_source} email, address is suppressed: {email}')
+        return
+
+    try:
+        result = idempotency.run(trigger_key(event), lambda: send_code(event, variant), context)
+    except IdempotencyInProgress:
+        logger.info(f'{trigger_source} email to {email} is being sent by an earlier call, skipping')
+        return
+
+    message_id = result.outcome.get('messageId', 'N/A')
+    if result.replayed:
+        logger.info(f'{trigger_source} email was already sent to {email}. MessageId: {message_id}')
+    else:
+        logger.info(f'✅ {trigger_source} email sent to {email}. MessageId: {message_id}')
+    logger.info(f'SES send rate: {mailer.stats()}')
+    aws.log_latency(logger)
+
+
+def send_code(event, variant):
+    """Decrypt, render and send one code email; returns {'messageId'}"""
+    attributes = event['request']['userAttributes']
+    locale = attributes.get('locale')
+    code = decryptor.decrypt(event['request']['code'])
+    try:
+        # name is user-controlled: render() strips control characters,
+        # caps its length and HTML-escapes it
+        message = render('code', locale, variant, name=attributes.get('name', 'Student'), code=code)
+        if html.escape(code) not in message.html:
+            raise ValueError('Rendered message lost the code')
+    except Exception as e:
+        # Fail closed: a bare message with the code and no user attributes
+        logger.error(f'Template render failed, sending fallback: {str(e)}')
+        message = code_fallback(code, locale)
+    return {'messageId': mailer.send(attributes['email'], message)}
@@ -7,10 +7,30 @@ This Lambda customizes email messages send by Cognito
 
 import json
 import logging
+import os
+
+from wiseuni import aws
+from wiseuni.profiling import profiled
+from wiseuni.suppression import SuppressionIndex
+from wiseuni.templates import code_fallback, render, warm
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+TEMPLATE_VARIANTS = {
+    'CustomMessage_SignUp': 'signup',
+    'CustomMessage_ForgotPassword': 'forgot_password',
+    'CustomMessage_ResendCode': 'resend_code',
+}
+
+# Compile every locale x variant now, not inside Cognito's 5 second budget
+warm('code', TEMPLATE_VARIANTS.values())
+
+# Bounce/complaint suppression list, kept warm across invocations
+suppression_index = SuppressionIndex(aws.table(os.environ['TABLE_NAME']))
+aws.warm(suppression_index.table)
+
+@profiled
 def handler(event,context):
     """
     Custom Message Lambda Trigger
@@ -25,71 +45,34 @@ def handler(event,context):
 
     try:
         trigger_source = event['triggerSource']
-        code = event['requests']['codeParameter']
+        code = event['request']['codeParameter']
         username = event['username']
         email = event['request']['userAttributes'].get('email','')
         name = event['request']['userAttributes'].get('name','Student')
 
         logger.info(f"Customizing message for :{trigger_source}")
 
-        # Customize Based on trigger type
-        if trigger_source == 'CustomMessage_SignUp':
-            # Email verification message
-            event['response']['emailSubject'] = f'Welcome to WiseUni - Verify Your Email 📧'
-            event['response']['emailMessage'] = f'''
-                <html>
-                <body style="font-family: Arial, sans-serif;">
-                    <h2>Welcome to WiseUni, {name}! 🎓</h2>
-                    <p>Thank you for registering with WiseUni Student Portal.</p>
-                    <p>Your verification code is:</p>
-                    <h1 style="color: #4CAF50; letter-spacing: 5px;">{code}</h1>
-                    <p>Enter this code to verify your email address and activate your account.</p>
-                    <p>This code expires in 24 hours.</p>
-                    <hr>
-                    <p style="color: #666; font-size: 12px;">
-                        If you didn't create this account, please ignore this email.
-                    </p>
-                </body>
-                </html>
-            '''
-
-        elif trigger_source == 'CustomMessage_ForgotPassword':
-            # Password reset message
-            event['response']['emailSubject'] = f'WiseUni - Password Reset Code 🔐'
-            event['response']['emailMessage'] = f'''
-                <html>
-                <body style="font-family: Arial, sans-serif;">
-                    <h2>Password Reset Request</h2>
-                    <p>Hi {name},</p>
-                    <p>You requested to reset your password for your WiseUni account.</p>
-                    <p>Your password reset code is:</p>
-                    <h1 style="color: #FF5722; letter-spacing: 5px;">{code}</h1>
-                    <p>Enter this code to set a new password.</p>
-                    <p>This code expires in 1 hour.</p>
-                    <p><strong>If you didn't request this, please contact support immediately.</strong></p>
-                    <hr>
-                    <p style="color: #666; font-size: 12px;">
-                        WiseUni Security Team<br>
-                        support@wiseuni.com
-                    </p>
-                </body>
-                </html>
-            '''
+        # Cognito sends this message itself and cannot be stopped from here,
+        # but a suppressed recipient is worth flagging: it will bounce again
+        if email and suppression_index.is_suppressed(email):
+            logger.warning(f"Cognito is mailing a suppressed address: {email}")
 
-        elif trigger_source == 'CustomMessage_ResendCode':
-            # Resend verification code
-            event['response']['emailSubject'] = f'WiseUni - New Verification Code 📧'
-            event['response']['emailMessage'] = f'''
-                <html>
-                <body style="font-family: Arial, sans-serif;">
-                    <h2>New Verification Code</h2>
-                    <p>Hi {name},</p>
-                    <p>Here's your new verification code:</p>
-                    <h1 style="color: #2196F3; letter-spacing: 5px;">{code}</h1>
-                    <p>Enter this code to verify your email address.</p>
-                </body>
-                </html>
-            '''
+        # Same branded template for every code email, per-trigger wording/colour
+        variant = TEMPLATE_VARIANTS.get(trigger_source)
+        if variant:
+            locale = event['request']['userAttributes'].get('locale')
+            try:
+                # name is user-controlled: render() strips control characters,
+                # caps its length and HTML-escapes it
+                message = render('code', locale, variant, name=name, code=code)
+                if code not in message.html:
+                    raise ValueError('Rendered message lost the code placeholder')
+            except Exception as e:
+                # Fail closed: a bare message with the code and no user attributes
+                logger.error(f"Template render failed, sending fallback: {str(e)}")
+                message = code_fallback(code, locale)
+            event['response']['emailSubject'] = message.subject
+            event['response']['emailMessage'] = message.html
 
         logger.info(f"Custom message created for: {trigger_source}")
         
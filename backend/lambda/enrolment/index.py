@@ -0,0 +1,163 @@
+"""
+Enrolment API
+Seat-limited enrolment with a FIFO waitlist (wiseuni/enrolment.py)
+
+POST   /courses/{courseId}/enrolment      (students)
+-> 201 {"status": "enrolled", "enrollment": {...}}
+   202 {"status": "waitlisted"}
+   200 {"status": "already_enrolled" | "already_waitlisted"}
+   503 {"error": ...} + Retry-After when every attempt met a conflicting transaction
+DELETE /courses/{courseId}/enrolment      (students) leave the course or its waitlist
+-> {"status": "dropped" | "left_waitlist"}
+GET    /courses/{courseId}/enrolment      (students)
+-> {"status": "enrolled", "enrollment"} | {"status": "waitlisted", "position", "joinedAt"} | {"status": "none"}
+
+GET    /courses/{courseId}/seats          (anyone signed in)
+-> {"courseId", "limit", "taken", "free", "shards", "waitlisted"}   limit null: no limit
+PUT    /courses/{courseId}/seats          (course professor or admin)
+   {"limit": 120, "shards": 12}           limit null removes the limit; shards optional
+-> the seats above + {"promoted": n}
+
+Dropped seats go back from the table stream (enrolment_promoter
+function), which then enrols the oldest waitlisted students.
+
+Local service: python backend/lambda/enrolment/index.py --serve 8791 --identity <identityId> --role student
+"""
+
+import logging
+import os
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared', 'python'))
+
+from wiseuni import aws, enrolment, indexes
+from wiseuni.api import ApiError, handle, parse_body, response
+from wiseuni.profiling import profiled
+from wiseuni.submissions import authorize_course_reader
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RETRY_AFTER_SECONDS = 1
+
+table = aws.table(os.environ['TABLE_NAME'])
+aws.warm(table)
+
+OUTCOME_STATUS = {
+    enrolment.ENROLLED: 201,
+    enrolment.WAITLISTED: 202,
+    enrolment.ALREADY_ENROLLED: 200,
+    enrolment.ALREADY_WAITLISTED: 200,
+}
+
+
+def _course_id(event):
+    course_id = (event.get('pathParameters') or {}).get('courseId')
+    if not course_id:
+        raise ApiError(400, 'Missing courseId')
+    return course_id
+
+
+def _course(course_id):
+    course = table.get_item(
+        Key={'PK': f'COURSE#{course_id}', 'SK': 'METADATA'},
+        ProjectionExpression='#title, professorName',
+        ExpressionAttributeNames={'#title': 'title'},
+    ).get('Item')
+    if not course:
+        raise ApiError(404, f'Course not found: {course_id}')
+    return course
+
+
+def _student(caller):
+    if caller.role != 'student':
+        raise ApiError(403, 'Only students can enrol in courses')
+
+
+def _busy(course_id):
+    logger.warning(f'Enrolment in {course_id} gave up after {enrolment.MAX_ATTEMPTS} conflicting transactions')
+    return response(503, {'error': 'Registration is busy, please try again'},
+                    headers={'Retry-After': str(RETRY_AFTER_SECONDS)})
+
+
+def enrol(event, caller):
+    _student(caller)
+    course_id = _course_id(event)
+    course = _course(course_id)
+    try:
+        outcome = enrolment.enrol(table, course_id, caller.identity_id, course)
+    except enrolment.RegistrationBusy:
+        return _busy(course_id)
+    body = {'status': outcome.status}
+    if outcome.enrollment:
+        body['enrollment'] = outcome.enrollment
+    return response(OUTCOME_STATUS[outcome.status], body)
+
+
+def drop(event, caller):
+    _student(caller)
+    course_id = _course_id(event)
+    status = enrolment.drop(table, course_id, caller.identity_id)
+    if status is None:
+        raise ApiError(404, 'Not enrolled in or waitlisted for this course')
+    return response(200, {'status': status})
+
+
+def status(event, caller):
+    _student(caller)
+    return response(200, enrolment.enrolment_status(table, _course_id(event), caller.identity_id))
+
+
+def get_seats(event, caller):
+    return response(200, enrolment.seats(table, _course_id(event)))
+
+
+def _limit(body):
+    limit, shards = body.get('limit'), body.get('shards')
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 0):
+        raise ApiError(400, 'limit must be a whole number of seats, or null for no limit')
+    if shards is not None and (not isinstance(shards, int) or not 1 <= shards <= enrolment.MAX_SHARDS):
+        raise ApiError(400, f'shards must be between 1 and {enrolment.MAX_SHARDS}')
+    return limit, shards
+
+
+def put_seats(event, caller):
+    course_id = _course_id(event)
+    authorize_course_reader(table, caller, course_id)
+    limit, shards = _limit(parse_body(event))
+    course = _course(course_id)
+
+    enrolled = None
+    if limit is not None and not enrolment.read_shards(table, course_id):
+        # First limit: active enrolments hold a seat from now on (and give it back when dropped)
+        roster = indexes.query(table, 'course_roster', ['status'], course_id=course_id)
+        enrolled = enrolment.hold_seats(table, [item for item in roster if item.get('status', 'active') == 'active'])
+    try:
+        enrolment.configure_seats(table, course_id, limit, shards=shards, enrolled=enrolled)
+        # A raised (or removed) limit: the waitlist moves up now, not at the next drop
+        promoted = enrolment.promote(table, course_id, course)
+    except enrolment.RegistrationBusy:
+        return _busy(course_id)
+    logger.info(f'{caller.identity_id} set the seat limit of {course_id} to {limit}; promoted {promoted}')
+    return response(200, {**enrolment.seats(table, course_id), 'promoted': promoted})
+
+
+ROUTES = {
+    'POST /courses/{courseId}/enrolment': enrol,
+    'DELETE /courses/{courseId}/enrolment': drop,
+    'GET /courses/{courseId}/enrolment': status,
+    'GET /courses/{courseId}/seats': get_seats,
+    'PUT /courses/{courseId}/seats': put_seats,
+}
+
+
+@profiled
+def handler(event, context):
+    """HTTP API (payload v2) entry point"""
+    return handle(event, ROUTES, logger)
+
+
+if __name__ == '__main__':
+    from wiseuni.local import main
+    main(handler, ROUTES)
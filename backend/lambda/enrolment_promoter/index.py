@@ -0,0 +1,39 @@
+"""
+Enrolment Promoter
+Releases the seats of dropped enrolments and fills them from the waitlist
+
+Flow: DynamoDB stream -> this Lambda (filtered to enrolment REMOVEs and
+waitlist INSERTs; wiseuni/enrolment.py)
+
+- REMOVE of an active USER#<id> / ENROLLMENT#<courseId> that holds a seat
+  (seatShard, set by the enrolment API): one seat back, at most once per
+  stream record (RELEASE#<eventId> marker)
+- then, for every course in the batch: the oldest waitlisted students
+  are enrolled while seats are free (a waitlist INSERT only runs this
+  check, for a student who joined as a seat was freed)
+
+A failed batch is retried (and bisected) by the event source mapping;
+releases are idempotent and promotion stops by itself once the course
+is full or the waitlist empty.
+"""
+
+import logging
+import os
+
+from wiseuni import aws
+from wiseuni.enrolment import apply_stream_records
+from wiseuni.profiling import profiled
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table = aws.table(os.environ['TABLE_NAME'])
+
+
+@profiled
+def handler(event, context):
+    """DynamoDB stream entry point"""
+    records = event.get('Records', [])
+    stats = apply_stream_records(table, records)
+    logger.info(f'Enrolment stream batch of {len(records)} record(s): {stats}')
+    return stats
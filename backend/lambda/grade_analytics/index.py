@@ -0,0 +1,155 @@
+"""
+Grade Analytics API
+Distributions, curves and GPAs computed in NumPy (wiseuni/analytics.py)
+
+GET /courses/{courseId}/grades/stats              (course professor or admin)
+    ?curve=z&mean=75&std=10                        z-score curve preview
+    ?curve=linear&top=100 | ?curve=linear&mean=75  linear curve preview
+    ?bins=10
+-> {"courseId", "stats": {...}, "histogram": {...}, "letters": {...},
+    "curve": {"method", "stats", "histogram", "letters",
+              "grades": [{"identityId", "points", "curved", "letter"}]}}
+
+GET /semesters/{semester}/grades/stats             (admins)
+-> {"semester", "stats", "histogram", "letters",
+    "courses": [{"courseId", "count", "mean", "std", "percentiles"}],
+    "gpa": {"stats", "histogram", "weighted"}}
+
+Curves are previews: nothing is written. Grades are read through
+GradeIndex, one Query per course (plus the semester's CatalogIndex); a
+semester's courses are queried ANALYTICS_CONCURRENCY at a time, to stay
+within the HTTP API's 30 second limit.
+
+Local service: python backend/lambda/grade_analytics/index.py --serve 8790 --identity <identityId> --role admin
+"""
+
+import logging
+import math
+import os
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared', 'python'))
+
+from wiseuni import analytics, aws
+from wiseuni.api import ApiError, handle, response
+from wiseuni.profiling import profiled
+from wiseuni.submissions import authorize_course_reader
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_BINS = 100
+CONCURRENCY = int(os.environ.get('ANALYTICS_CONCURRENCY', 16))
+
+TABLE_NAME = os.environ['TABLE_NAME']
+table = aws.table(TABLE_NAME)
+aws.warm(table)
+
+
+def _number(params, name, default=None):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        raise ApiError(400, f'{name} must be a number')
+    if not math.isfinite(number):  # inf would overflow int(), nan compares false
+        raise ApiError(400, f'{name} must be a finite number')
+    return number
+
+
+def _bins(params):
+    bins = int(_number(params, 'bins', 10))
+    if not 1 <= bins <= MAX_BINS:
+        raise ApiError(400, f'bins must be between 1 and {MAX_BINS}')
+    return bins
+
+
+def _distribution(points, bins):
+    return {
+        'stats': analytics.describe(points),
+        'histogram': analytics.histogram(points, bins),
+        'letters': analytics.letter_counts(points),
+    }
+
+
+def _curve(columns, params, bins):
+    method = params.get('curve')
+    if method == 'z':
+        options = {'mean': _number(params, 'mean', 75.0), 'std': _number(params, 'std', 10.0)}
+        curved = analytics.z_curve(columns.points, **options)
+    elif method == 'linear':
+        options = {'top': _number(params, 'top', analytics.MAX_POINTS), 'mean': _number(params, 'mean')}
+        curved = analytics.linear_curve(columns.points, **options)
+    else:
+        raise ApiError(400, 'curve must be z or linear')
+
+    letters = analytics.letters(curved)
+    grades = [
+        {'identityId': identity_id, 'points': points, 'curved': value, 'letter': letter or None}
+        for identity_id, points, value, letter in zip(
+            columns.students[columns.student].tolist(),
+            analytics.json_values(columns.points), analytics.json_values(curved), letters.tolist(),
+        )
+    ]
+    return {'method': method, **options, **_distribution(curved, bins), 'grades': grades}
+
+
+def course_stats(event, caller):
+    course_id = (event.get('pathParameters') or {}).get('courseId')
+    if not course_id:
+        raise ApiError(400, 'Missing courseId')
+    authorize_course_reader(table, caller, course_id)
+
+    params = event.get('queryStringParameters') or {}
+    bins = _bins(params)
+    columns = analytics.load_course(table, course_id)
+    body = {'courseId': course_id, **_distribution(columns.points, bins)}
+    if params.get('curve'):
+        body['curve'] = _curve(columns, params, bins)
+    return response(200, body)
+
+
+def semester_stats(event, caller):
+    if caller.role != 'admin':
+        raise ApiError(403, 'Only admins can see semester reports')
+    semester = (event.get('pathParameters') or {}).get('semester')
+    if not semester:
+        raise ApiError(400, 'Missing semester')
+
+    params = event.get('queryStringParameters') or {}
+    bins = _bins(params)
+    weighted = params.get('weighted', 'true') != 'false'
+    columns = analytics.load_semester(table, semester, CONCURRENCY, lambda: aws.thread_table(TABLE_NAME))
+    averages = analytics.gpa(columns, weighted=weighted)
+    logger.info(f'Semester {semester}: {len(columns)} grades, {len(columns.courses)} courses, '
+                f'{len(columns.students)} students')
+    return response(200, {
+        'semester': semester,
+        **_distribution(columns.points, bins),
+        'courses': analytics.course_report(columns),
+        'gpa': {
+            'stats': analytics.describe(averages),
+            'histogram': analytics.histogram(averages, bins=8, value_range=(0.0, 4.0)),
+            'weighted': weighted,
+        },
+    })
+
+
+ROUTES = {
+    'GET /courses/{courseId}/grades/stats': course_stats,
+    'GET /semesters/{semester}/grades/stats': semester_stats,
+}
+
+
+@profiled
+def handler(event, context):
+    """HTTP API (payload v2) entry point"""
+    return handle(event, ROUTES, logger)
+
+
+if __name__ == '__main__':
+    from wiseuni.local import main
+    main(handler, ROUTES)
@@ -0,0 +1,58 @@
+"""
+Grade Digest
+One email per student per window, however many grades were published in it
+
+Flow (wiseuni/digests.py):
+- DynamoDB stream (filtered to grade INSERTs / MODIFYs) -> pending
+  NOTIFY#<id> entries; a student's first grade opens a window of
+  DIGEST_WINDOW_SECONDS and queues one delayed message
+- digest queue (same function) -> every due student of the batch gets
+  their pending grades in one email, sent DIGEST_CONCURRENCY at a time
+  through the shared Mailer (MaxSendRate aware)
+
+The queue's event source caps how many batches run at once
+(ScalingConfig in services.yaml), so SES sees at most that many
+containers times DIGEST_CONCURRENCY sends in flight.
+"""
+
+import json
+import logging
+import os
+
+from wiseuni import aws
+from wiseuni.digests import DEFAULT_CONCURRENCY, DEFAULT_WINDOW_SECONDS, DigestCollector, DigestQueue, DigestSender
+from wiseuni.mailer import Mailer
+from wiseuni.profiling import profiled
+from wiseuni.suppression import SuppressionIndex
+from wiseuni.templates import warm
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+WINDOW_SECONDS = int(os.environ.get('DIGEST_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS))
+CONCURRENCY = int(os.environ.get('DIGEST_CONCURRENCY', DEFAULT_CONCURRENCY))
+
+warm('grade_digest')
+
+table = aws.table(os.environ['TABLE_NAME'])
+queue = DigestQueue(aws.client('sqs'), os.environ['DIGEST_QUEUE_URL'])
+
+collector = DigestCollector(table, queue, WINDOW_SECONDS)
+# Mailer and suppression list kept warm across invocations
+mailer = Mailer()
+sender = DigestSender(table, mailer, SuppressionIndex(table), queue, CONCURRENCY)
+aws.warm(table, queue.sqs, mailer.client)
+
+
+@profiled
+def handler(event, context):
+    """Table stream batch, or a batch of due windows from the digest queue"""
+    records = event.get('Records', [])
+    if records and records[0].get('eventSource') == 'aws:sqs':
+        failed, stats = sender.deliver([(record['messageId'], json.loads(record['body'])) for record in records])
+        logger.info(f'Digest batch: {json.dumps(stats)}, mailer: {json.dumps(sender.mailer.stats(), default=str)}')
+        return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed]}
+
+    stats = collector.collect(records)
+    logger.info(f'Grade stream batch of {len(records)} record(s): {json.dumps(stats)}')
+    return stats
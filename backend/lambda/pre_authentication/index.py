@@ -12,9 +12,12 @@ import json
 import logging
 from datetime import datetime,time
 
+from wiseuni.profiling import profiled
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+@profiled
 def handler(event,context):
     """
     Pre-authentication Lambda Trigger
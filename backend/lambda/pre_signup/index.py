@@ -6,9 +6,12 @@ Allows all emails EXCEPT blocked domains
 import json
 import logging
 
+from wiseuni.profiling import profiled
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+@profiled
 def handler(event, context):
     """
     Pre-signup Lambda Trigger
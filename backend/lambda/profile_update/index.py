@@ -0,0 +1,136 @@
+"""
+Profile Update
+Write-behind, coalesced partial updates of USER#<id> / PROFILE
+
+PATCH /me/profile  {"changes": {"name": "..."}, "previous": {"name": "..."}}
+-> 202, the update is queued
+
+The queue is read in batches (its batching window in services.yaml is the
+coalescing window): every user's queued updates are merged and written
+with one versioned UpdateItem (wiseuni/profile.py), so a burst of saves
+during onboarding costs one write instead of one full PutItem per save.
+
+Results are visible through GET /me/summary once written.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+
+from botocore.exceptions import ClientError
+from wiseuni import aws
+from wiseuni.api import handle, parse_body, response
+from wiseuni.profile import EDITABLE_FIELDS, build_update, coalesce, profile_key, resolve, validate_update
+from wiseuni.profiling import profiled
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+QUEUE_URL = os.environ['PROFILE_QUEUE_URL']
+TABLE_NAME = os.environ['TABLE_NAME']
+
+sqs = aws.client('sqs')
+table = aws.table(TABLE_NAME)
+aws.warm(sqs, table)
+
+
+# ========================================
+# API: QUEUE
+# ========================================
+
+def queue_update(event, caller):
+    changes, previous = validate_update(parse_body(event))
+    sqs.send_message(
+        QueueUrl=QUEUE_URL,
+        MessageBody=json.dumps({
+            'identityId': caller.identity_id,
+            'changes': changes,
+            'previous': previous,
+            'sentAt': time.time(),
+        }),
+    )
+    return response(202, {'status': 'QUEUED', 'changes': changes})
+
+
+ROUTES = {
+    'PATCH /me/profile': queue_update,
+}
+
+
+# ========================================
+# QUEUE: FLUSH
+# ========================================
+
+def current_profiles(identity_ids):
+    """identityId -> stored profile (version + editable attributes), BatchGetItem in 100s"""
+    names = {f'#f{number}': field for number, field in enumerate(['version', *EDITABLE_FIELDS])}
+    profiles = {}
+    identity_ids = list(identity_ids)
+    for start in range(0, len(identity_ids), 100):
+        request = {TABLE_NAME: {
+            'Keys': [profile_key(identity_id) for identity_id in identity_ids[start:start + 100]],
+            'ProjectionExpression': ', '.join(['PK', *names]),
+            'ExpressionAttributeNames': names,
+        }}
+        while request:
+            # Resource-level batch_get_item returns plain Python values
+            result = aws.resource('dynamodb').batch_get_item(RequestItems=request)
+            for item in result['Responses'].get(TABLE_NAME, []):
+                profiles[item['PK'][len('USER#'):]] = item
+            request = result.get('UnprocessedKeys')
+    return profiles
+
+
+def flush_user(identity_id, updates, stored, counters):
+    if stored is None:
+        # No profile to update (account deleted, or not created yet): drop, retrying cannot help
+        counters['missing'] += 1
+        logger.warning(f'{identity_id}: no profile, {len(updates)} update(s) dropped')
+        return
+    merged = coalesce(updates)
+    to_write, conflicts = resolve(stored, merged)
+    if conflicts:
+        counters['conflicts'] += len(conflicts)
+        logger.warning(f'{identity_id}: changed elsewhere since read, not overwritten: {conflicts}')
+    if not to_write:
+        counters['unchanged'] += 1
+        return
+    table.update_item(**build_update(identity_id, int(stored.get('version', 0)), to_write))
+    counters['writes'] += 1
+
+
+def flush(records):
+    """Returns the messageIds to retry"""
+    by_user = defaultdict(list)
+    message_ids = defaultdict(list)
+    for record in records:
+        body = json.loads(record['body'])
+        by_user[body['identityId']].append((body['sentAt'], body['changes'], body.get('previous') or {}))
+        message_ids[body['identityId']].append(record['messageId'])
+
+    stored = current_profiles(by_user)
+    counters = {'messages': len(records), 'users': len(by_user), 'writes': 0, 'unchanged': 0, 'missing': 0,
+                'conflicts': 0, 'retried': 0}
+    failed = []
+    for identity_id, updates in by_user.items():
+        try:
+            flush_user(identity_id, updates, stored.get(identity_id), counters)
+        except ClientError as e:
+            # Includes ConditionalCheckFailed: the item moved after we read it,
+            # so retry the user's messages, which re-reads and re-resolves
+            logger.warning(f'{identity_id}: profile write failed, will retry: {e.response["Error"]["Code"]}')
+            counters['retried'] += 1
+            failed.extend(message_ids[identity_id])
+    logger.info(f'Profile flush: {json.dumps(counters)}')
+    return failed
+
+
+@profiled
+def handler(event, context):
+    """HTTP API route, or a batch from the profile update queue"""
+    if 'Records' in event:
+        failed = flush(event['Records'])
+        return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed]}
+    return handle(event, ROUTES, logger)
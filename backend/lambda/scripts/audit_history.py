@@ -0,0 +1,80 @@
+"""
+Print the audit history of a course or a student as JSON lines
+
+    python backend/lambda/scripts/audit_history.py --bucket wiseuni-audit-dev-123456789012 \
+        --course CS101 [--from 2024-09-01] [--to 2024-12-31] [--entity enrollment|grade]
+
+    python backend/lambda/scripts/audit_history.py --bucket wiseuni-audit-dev-123456789012 \
+        --student eu-west-2:abc... --table wiseuni-data-dev [--course CS101 ...] [--from ...] [--to ...]
+
+Archive layout and reading: wiseuni/audit.py. Only the objects of the
+wanted courses and dates are listed and read.
+
+A student's history is read from the partitions of their courses: the
+course ids come from their current ENROLLMENT# / GRADE# items (--table);
+add --course for courses whose items have since been deleted.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni.audit import ENTITIES, course_history, student_history  # noqa: E402
+
+
+def student_course_ids(table_name, identity_id):
+    """Course ids of a student's current enrolment and grade items"""
+    table = boto3.resource('dynamodb').Table(table_name)
+    course_ids = set()
+    query = {
+        'KeyConditionExpression': Key('PK').eq(f'USER#{identity_id}'),
+        'ProjectionExpression': 'SK',
+    }
+    while True:
+        page = table.query(**query)
+        for item in page.get('Items', []):
+            if item['SK'].startswith(tuple(ENTITIES)):
+                course_ids.add(item['SK'].split('#', 1)[1])
+        if 'LastEvaluatedKey' not in page:
+            return course_ids
+        query['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--course', action='append', default=[])
+    parser.add_argument('--student')
+    parser.add_argument('--table', help="Look up the student's courses in this table")
+    parser.add_argument('--from', dest='start_date', help='YYYY-MM-DD')
+    parser.add_argument('--to', dest='end_date', help='YYYY-MM-DD (inclusive)')
+    parser.add_argument('--entity', choices=sorted(ENTITIES.values()), action='append')
+    args = parser.parse_args()
+
+    s3 = boto3.client('s3')
+    if args.student:
+        course_ids = set(args.course)
+        if args.table:
+            course_ids |= student_course_ids(args.table, args.student)
+        if not course_ids:
+            parser.error('--student needs --table or at least one --course')
+        records = student_history(s3, args.bucket, args.student, sorted(course_ids),
+                                  args.start_date, args.end_date, args.entity)
+    elif len(args.course) == 1:
+        records = course_history(s3, args.bucket, args.course[0], args.start_date, args.end_date, args.entity)
+    else:
+        parser.error('give exactly one --course, or --student')
+
+    for record in sorted(records, key=lambda record: (record['at'], int(record['sequenceNumber']))):
+        print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
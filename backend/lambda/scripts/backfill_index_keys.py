@@ -0,0 +1,175 @@
+"""
+Backfill the dedicated sparse index keys on existing items
+
+Profiles, enrolments, grades and course metadata written before the
+dedicated indexes existed only carry GSI1 keys; this script adds the
+RolePK/RoleSK, RosterPK/RosterSK, GradePK/GradeSK and CatalogPK/CatalogSK
+keys (wiseuni/indexes.py), and with --drop-gsi1 removes those items' GSI1
+keys once nothing reads them from GSI1 any more.
+
+    python backend/lambda/scripts/backfill_index_keys.py \
+        --table wiseuni-data-dev [--segments 16] [--drop-gsi1] [--dry-run]
+
+Rollout:
+1. Deploy the indexes (IndexStage 1 to 4, one per deployment: a
+   DynamoDB limit)
+2. Run this script. A run that keys every item records each ACTIVE
+   dedicated index as INDEX#BACKFILL / <index name>; readers (the query
+   planner, the frontend) only switch from GSI1 to an index once it is
+   recorded
+3. Set WRITE_GSI1_KEYS to false (wiseuni/indexes.py and the frontend's
+   dynamoDBService.ts), deploy, then run it with --drop-gsi1: GSI1 then
+   only holds submissions and the over-quota list
+
+Like the other bulk scripts: parallel Scan segments with a session each,
+one shared BULK throughput controller, conditional writes (an item
+changed meanwhile keeps its new keys), safe to re-run.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+from botocore.exceptions import ClientError
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni.indexes import FALLBACK_INDEX, INDEXES, WRITE_GSI1_KEYS, backfill_key, index_keys, write_index_keys  # noqa: E402
+from wiseuni.throttle import BULK, ThroughputController  # noqa: E402
+
+_local = threading.local()
+throughput = ThroughputController('index-keys', **BULK)
+
+
+def _table(table_name):
+    # boto3 resources are not thread-safe: one session per worker thread
+    if not hasattr(_local, 'table'):
+        resource = boto3.session.Session().resource('dynamodb')
+        throughput.attach(resource.meta.client)
+        _local.table = resource.Table(table_name)
+    return _local.table
+
+
+def build_update(item, drop_gsi1):
+    """UpdateItem arguments, or None when the item is already done"""
+    keys = index_keys(item)
+    if not keys:
+        return None
+    names, values, sets = {}, {}, []
+    # While writers add GSI1 keys, restore them on items written without
+    wanted = keys if drop_gsi1 else write_index_keys(item)
+    for number, (name, value) in enumerate(sorted(wanted.items())):
+        if item.get(name) != value:
+            names[f'#k{number}'] = name
+            values[f':k{number}'] = value
+            sets.append(f'#k{number} = :k{number}')
+    # GSI1 keys are only dropped where they duplicate the dedicated ones
+    (pk_name, pk), (_, sk) = keys.items()  # Partition key first
+    remove = drop_gsi1 and item.get('GSI1PK') == pk and item.get('GSI1SK') == sk
+    if not sets and not remove:
+        return None
+
+    # The keys are derived from role / semester: only write them if unchanged
+    condition, derived = 'attribute_exists(PK)', {'RolePK': 'role', 'CatalogPK': 'semester'}.get(pk_name)
+    if derived:
+        names['#derived'] = derived
+        values[':derived'] = item[derived]
+        condition += ' AND #derived = :derived'
+    expression = ' '.join(part for part in (
+        'SET ' + ', '.join(sets) if sets else '',
+        'REMOVE GSI1PK, GSI1SK' if remove else '',
+    ) if part)
+    update = {
+        'Key': {'PK': item['PK'], 'SK': item['SK']},
+        'UpdateExpression': expression,
+        'ConditionExpression': condition,
+    }
+    if names:
+        update['ExpressionAttributeNames'] = names
+        update['ExpressionAttributeValues'] = values
+    return update
+
+
+def backfill_segment(table_name, segment, segments, drop_gsi1, dry_run):
+    table = _table(table_name)
+    counters = dict.fromkeys(('scanned', 'updated', 'done', 'changedSince'), 0)
+    scan = {
+        'Segment': segment,
+        'TotalSegments': segments,
+        # Only what index_keys() looks at
+        'ProjectionExpression': 'PK, SK, #role, semester, GSI1PK, GSI1SK, '
+                                'RolePK, RoleSK, RosterPK, RosterSK, GradePK, GradeSK, CatalogPK, CatalogSK',
+        'ExpressionAttributeNames': {'#role': 'role'},
+    }
+    while True:
+        page = table.scan(**scan)
+        for item in page.get('Items', []):
+            counters['scanned'] += 1
+            update = build_update(item, drop_gsi1)
+            if update is None:
+                counters['done'] += 1
+                continue
+            if not dry_run:
+                try:
+                    table.update_item(**update)
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                    counters['changedSince'] += 1  # Re-run to pick it up
+                    continue
+            counters['updated'] += 1
+        if 'LastEvaluatedKey' not in page:
+            return counters
+        scan['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def record_backfilled(table_name):
+    """Mark every ACTIVE dedicated index as backfilled; only call after a run that keyed every item"""
+    table = _table(table_name)
+    described = table.meta.client.describe_table(TableName=table_name)['Table']
+    names = sorted(
+        index['IndexName'] for index in described.get('GlobalSecondaryIndexes', [])
+        if index['IndexName'] in INDEXES and index['IndexName'] != FALLBACK_INDEX
+        and index.get('IndexStatus') == 'ACTIVE' and not index.get('Backfilling')
+    )
+    completed_at = datetime.now(timezone.utc).isoformat()
+    for name in names:
+        table.put_item(Item={**backfill_key(name), 'completedAt': completed_at})
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', required=True)
+    parser.add_argument('--segments', type=int, default=16)
+    parser.add_argument('--drop-gsi1', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    if args.drop_gsi1 and WRITE_GSI1_KEYS:
+        parser.error('writers still add GSI1 keys: set WRITE_GSI1_KEYS to false and deploy first')
+
+    totals = {}
+    with ThreadPoolExecutor(max_workers=args.segments) as pool:
+        futures = [
+            pool.submit(backfill_segment, args.table, segment, args.segments, args.drop_gsi1, args.dry_run)
+            for segment in range(args.segments)
+        ]
+        for done, future in enumerate(futures, 1):
+            for name, value in future.result().items():
+                totals[name] = totals.get(name, 0) + value
+            print(f'{done}/{args.segments} segments, {totals["scanned"]} items scanned')
+
+    print(f"{'Would update' if args.dry_run else 'Updated'}: {json.dumps(totals)}")
+    if not args.dry_run and not totals['changedSince']:
+        print(f'Recorded as backfilled: {", ".join(record_backfilled(args.table)) or "none (no ACTIVE index)"}')
+    print(f'DynamoDB throughput: {throughput.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+One-off backfill of the submission index from objects already in S3
+
+New objects are indexed by the submission ingest Lambda as they arrive;
+this script covers everything uploaded before it was deployed.
+
+    python backend/lambda/scripts/backfill_submission_index.py \
+        --bucket wiseuni-uploads-dev-123456789012 --table wiseuni-data-dev [--workers 16] [--dry-run]
+
+How it stays fast on a large bucket:
+- One lister per role folder finds the per-user prefixes (Delimiter='/')
+- A thread pool then walks the user prefixes concurrently, each with its
+  own paginator, and writes items with a batch writer (25 items/request)
+- Keys already in a user's index are skipped, so the script can be re-run
+- All workers share one BULK throughput controller (wiseuni/throttle.py):
+  they ramp up to what the table absorbs and back off together when it
+  throttles, instead of pushing interactive traffic into throttling
+"""
+
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni.api import ROLE_FOLDERS  # noqa: E402
+from wiseuni.submissions import format_timestamp, index_attributes, parse_object_key  # noqa: E402
+from wiseuni.throttle import BULK, ThroughputController  # noqa: E402
+
+_local = threading.local()
+throughput = ThroughputController('backfill', **BULK)
+
+
+def _clients(table_name):
+    # boto3 resources are not thread-safe: one session per worker thread
+    if not hasattr(_local, 'session'):
+        _local.session = boto3.session.Session()
+        _local.s3 = _local.session.client('s3')
+        resource = _local.session.resource('dynamodb')
+        throughput.attach(resource.meta.client)
+        _local.table = resource.Table(table_name)
+    return _local.s3, _local.table
+
+
+def user_prefixes(s3, bucket, folder):
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f'{folder}/', Delimiter='/'):
+        for prefix in page.get('CommonPrefixes', []):
+            yield prefix['Prefix']
+
+
+def indexed_keys(table, identity_id):
+    keys = set()
+    query = {
+        'KeyConditionExpression': 'PK = :pk AND begins_with(SK, :sk)',
+        'ProjectionExpression': '#key, #status',
+        'ExpressionAttributeNames': {'#key': 'key', '#status': 'status'},
+        'ExpressionAttributeValues': {':pk': f'USER#{identity_id}', ':sk': 'SUBMISSION#'},
+    }
+    while True:
+        page = table.query(**query)
+        keys.update(item['key'] for item in page.get('Items', []) if item.get('status') != 'DELETED')
+        if 'LastEvaluatedKey' not in page:
+            return keys
+        query['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def backfill_prefix(bucket, table_name, prefix, dry_run):
+    s3, table = _clients(table_name)
+    identity_id = prefix.split('/')[1]
+    already = indexed_keys(table, identity_id)
+    written = 0
+
+    paginator = s3.get_paginator('list_objects_v2')
+    with table.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                parsed = parse_object_key(obj['Key'])
+                if parsed is None or obj['Key'] in already or obj['Key'].endswith('/'):
+                    continue
+                owner, course_id, assignment_id, file_name = parsed
+                modified = obj['LastModified'].isoformat()
+                item = {
+                    **index_attributes(owner, course_id, format_timestamp(obj['LastModified'])),
+                    'identityId': owner,
+                    'courseId': course_id,
+                    'assignmentId': assignment_id,
+                    'fileName': file_name,
+                    'bucket': bucket,
+                    'key': obj['Key'],
+                    'size': obj['Size'],
+                    'etag': obj['ETag'],
+                    'status': 'COMPLETE',
+                    'source': 'BACKFILL',
+                    'createdAt': modified,
+                    'completedAt': modified,
+                }
+                if not dry_run:
+                    batch.put_item(Item=item)
+                written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--table', required=True)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    s3 = boto3.client('s3')
+    with ThreadPoolExecutor(max_workers=len(ROLE_FOLDERS)) as pool:
+        prefix_lists = pool.map(lambda folder: list(user_prefixes(s3, args.bucket, folder)), ROLE_FOLDERS.values())
+        prefixes = [prefix for prefix_list in prefix_lists for prefix in prefix_list]
+    print(f'Found {len(prefixes)} user prefixes')
+
+    total = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(backfill_prefix, args.bucket, args.table, prefix, args.dry_run): prefix
+            for prefix in prefixes
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            total += future.result()
+            if done % 100 == 0 or done == len(futures):
+                print(f'{done}/{len(futures)} prefixes, {total} submissions indexed')
+
+    print(f"{'Would index' if args.dry_run else 'Indexed'} {total} submissions")
+    print(f'DynamoDB throughput: {throughput.stats()}')
+
+
+if __name__ == '__main__':
+    main()
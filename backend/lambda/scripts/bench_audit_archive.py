@@ -0,0 +1,165 @@
+"""
+Audit archive benchmark: PUTs, compression and reads for one course
+
+Runs locally, no AWS account needed: a term of synthetic stream records
+(enrolments, status changes, grades and regrades, shaped like the table's
+NEW_AND_OLD_IMAGES records) is archived by wiseuni/audit.py into an
+in-memory bucket, in batches like the event source mapping delivers them.
+
+    python backend/lambda/scripts/bench_audit_archive.py [--students 5000] [--batch 10000]
+
+Reports:
+- PUT requests, batched vs one object per change
+- bytes stored vs raw JSON (compression ratio)
+- objects listed / read for one course over one week, and one student's
+  history, vs every object in the bucket
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.types import TypeSerializer
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni.audit import AuditWriter, audit_record, course_history, student_history  # noqa: E402
+
+TERM_START = datetime(2024, 9, 2, tzinfo=timezone.utc)
+_serializer = TypeSerializer()
+
+
+class MemoryS3:
+    """put_object / get_object / list_objects_v2 paginator, with request counts"""
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = {'put': 0, 'get': 0, 'list': 0}
+
+    def put_object(self, Bucket, Key, Body, **_):
+        self.requests['put'] += 1
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        self.requests['get'] += 1
+        body = self.objects[Key]
+
+        class Stream:
+            @staticmethod
+            def read():
+                return body
+        return {'Body': Stream}
+
+    def get_paginator(self, name):
+        s3 = self
+
+        class Paginator:
+            @staticmethod
+            def paginate(Bucket, Prefix, StartAfter=''):
+                keys = sorted(key for key in s3.objects if key.startswith(Prefix) and key > StartAfter)
+                for start in range(0, max(len(keys), 1), 1000):
+                    s3.requests['list'] += 1
+                    yield {'Contents': [{'Key': key} for key in keys[start:start + 1000]]}
+        return Paginator
+
+
+def image(item):
+    return {name: _serializer.serialize(value) for name, value in item.items()}
+
+
+def make_changes(students, rng):
+    """Stream records for a term, in time order"""
+    courses = [f'C{number:03d}' for number in range(max(10, students // 60))]
+    changes = []
+    for _ in range(students):
+        identity_id = f'eu-west-2:{rng.getrandbits(128):032x}'
+        for course_id in rng.sample(courses, 5):
+            key = {'PK': f'USER#{identity_id}'}
+            enrolled = TERM_START + timedelta(seconds=rng.randrange(14 * 86400))
+            enrolment = {**key, 'SK': f'ENROLLMENT#{course_id}', 'f': 1,
+                         't': enrolled.strftime('%Y-%m-%dT%H:%M:%S.000Z'), 's': 'a'}
+            changes.append((enrolled, 'INSERT', None, enrolment))
+            if rng.random() < 0.1:
+                dropped = enrolled + timedelta(days=rng.randrange(1, 30))
+                changes.append((dropped, 'MODIFY', enrolment, {**enrolment, 's': 'd'}))
+                continue
+            graded = TERM_START + timedelta(days=105, seconds=rng.randrange(7 * 86400))
+            grade = {**key, 'SK': f'GRADE#{course_id}', 'f': 1, 'g': 'B+', 'p': rng.randrange(40, 100),
+                     't': graded.strftime('%Y-%m-%dT%H:%M:%S.000Z'), 'b': f'eu-west-2:{rng.getrandbits(64):016x}'}
+            changes.append((graded, 'INSERT', None, grade))
+            if rng.random() < 0.05:
+                regraded = graded + timedelta(days=rng.randrange(1, 10))
+                changes.append((regraded, 'MODIFY', grade, {**grade, 'g': 'A-', 'p': grade['p'] + 3}))
+    changes.sort(key=lambda change: change[0])
+
+    records = []
+    for number, (at, event, old, new) in enumerate(changes):
+        keys = new or old
+        change = {
+            'Keys': image({'PK': keys['PK'], 'SK': keys['SK']}),
+            'SequenceNumber': str(10**20 + number),
+            'ApproximateCreationDateTime': at.timestamp(),
+            'NewImage': image(new),
+        }
+        if old:
+            change['OldImage'] = image(old)
+        records.append({'eventID': f'{number:032x}', 'eventName': event, 'dynamodb': change})
+    return records, courses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=5_000)
+    parser.add_argument('--batch', type=int, default=10_000, help='Event source mapping BatchSize')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    records, courses = make_changes(args.students, rng)
+    s3 = MemoryS3()
+
+    started = time.perf_counter()
+    totals = {'records': 0, 'objects': 0, 'rawBytes': 0, 'storedBytes': 0}
+    for start in range(0, len(records), args.batch):
+        writer = AuditWriter(s3, 'bench')
+        for record in records[start:start + args.batch]:
+            writer.add(audit_record(record))
+        for name, value in writer.flush().items():
+            totals[name] += value
+    elapsed = time.perf_counter() - started
+
+    # One object per change: each line gzipped on its own
+    single = sum(len(gzip.compress(json.dumps(audit_record(record)).encode())) for record in records[:2000])
+    single = single / min(len(records), 2000) * len(records)
+
+    print(f'{totals["records"]:,} changes in {-(-len(records) // args.batch)} batches, '
+          f'archived in {elapsed:.2f}s ({elapsed / len(records) * 1e6:.1f} µs/change)')
+    print(f'  PUTs: {totals["objects"]:,} batched vs {len(records):,} one per change '
+          f'({totals["objects"] / len(records):.2%})')
+    print(f'  Stored: {totals["storedBytes"] / 2**20:.1f} MiB of {totals["rawBytes"] / 2**20:.1f} MiB JSON '
+          f'(ratio {totals["rawBytes"] / totals["storedBytes"]:.1f}x; one gzip object per change: '
+          f'{single / 2**20:.1f} MiB)')
+
+    # Reads: one course for the first week, then one student's whole term
+    course_id = courses[0]
+    s3.requests = dict.fromkeys(s3.requests, 0)
+    week = list(course_history(s3, 'bench', course_id, '2024-09-02', '2024-09-08'))
+    print(f'  Course {course_id}, one week: {len(week):,} changes from {s3.requests["get"]} objects '
+          f'({s3.requests["list"]} LIST) of {len(s3.objects):,} in the bucket')
+
+    identity_id = audit_record(records[0])['identityId']
+    student_courses = sorted({record['dynamodb']['Keys']['SK']['S'].split('#', 1)[1] for record in records
+                              if record['dynamodb']['Keys']['PK']['S'] == f'USER#{identity_id}'})
+    s3.requests = dict.fromkeys(s3.requests, 0)
+    history = list(student_history(s3, 'bench', identity_id, student_courses))
+    print(f'  One student, whole term: {len(history)} changes from {s3.requests["get"]} objects '
+          f'({s3.requests["list"]} LIST) of {len(s3.objects):,}')
+
+
+if __name__ == '__main__':
+    main()
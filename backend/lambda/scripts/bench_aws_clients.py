@@ -0,0 +1,98 @@
+"""
+AWS client registry benchmark
+
+    python backend/lambda/scripts/bench_aws_clients.py [--live] [--calls 20]
+
+Without --live (no AWS account needed) compares what a cold container pays
+to set up its clients: a fresh boto3.client() per module versus the shared
+registry (one session, cached clients).
+
+With --live (needs credentials allowed to call ses:GetSendQuota) measures
+the first SES call of a new container with and without warm(), then the
+steady-state latency over --calls calls, as reported by aws.latency_stats().
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-2')
+
+SERVICES = ('ses', 's3', 'dynamodb', 'lambda')
+
+# Run in a fresh interpreter: nothing cached, like a cold Lambda container
+COLD_CALL = '''
+import os, sys, time
+sys.path.insert(0, {path!r})
+if {warm}:
+    os.environ['AWS_LAMBDA_FUNCTION_NAME'] = 'bench'
+from wiseuni import aws
+ses = aws.client('ses')
+aws.warm(ses)
+start = time.perf_counter()
+ses.get_send_quota()
+print((time.perf_counter() - start) * 1000)
+'''
+
+
+def setup_ms(make_clients, modules=4):
+    start = time.perf_counter()
+    for _ in range(modules):
+        make_clients()
+    return (time.perf_counter() - start) * 1000
+
+
+def offline():
+    import boto3
+    from wiseuni import aws
+
+    def per_module():
+        for service in SERVICES:
+            boto3.client(service)
+
+    def registry():
+        for service in SERVICES:
+            aws.client(service)
+
+    print(f'client setup, 4 modules x {len(SERVICES)} services:')
+    print(f'  boto3.client() each time: {setup_ms(per_module):8.1f} ms')
+    print(f'  registry (first module):  {setup_ms(registry, modules=1):8.1f} ms')
+    print(f'  registry (cached):        {setup_ms(registry, modules=3):8.3f} ms')
+
+
+def first_call_ms(warm):
+    script = COLD_CALL.format(path=os.path.join(LAMBDA_DIR, 'shared', 'python'), warm=warm)
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip())
+
+
+def live(calls):
+    from wiseuni import aws
+
+    for warm in (False, True):
+        samples = sorted(first_call_ms(warm) for _ in range(5))
+        print(f'first GetSendQuota after start, {"warmed" if warm else "cold  "}: '
+              f'median {samples[2]:.1f} ms, max {samples[-1]:.1f} ms')
+
+    ses = aws.client('ses')
+    for _ in range(calls):
+        ses.get_send_quota()
+    print(f'steady state: {aws.latency_stats()["ses.GetSendQuota"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--live', action='store_true')
+    parser.add_argument('--calls', type=int, default=20)
+    args = parser.parse_args()
+    offline()
+    if args.live:
+        live(args.calls)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Custom email sender benchmark
+
+Runs locally, no AWS account needed. SES is a stub behind real botocore
+clients (botocore's before-send event answers, so requests are built,
+parsed and retried as usual but no socket is opened); it takes
+--ses-ms per call and, like SES, answers 'Maximum sending rate exceeded'
+past the account's --ses-rate emails per second.
+
+    python backend/lambda/scripts/bench_custom_email_sender.py [--emails 600] [--containers 20] [--ses-rate 50]
+
+1. Every CustomEmailSender trigger source through the handler
+   (CODE_DECRYPTOR=plaintext): one email each, code present and escaped,
+   nothing sent again on a retry
+2. Sign-up storm: --emails code emails from --containers containers at
+   once, each sending one after another
+   - before: send_email on the registry client (botocore standard retries)
+   - mailer: wiseuni/mailer.py (MaxSendRate bucket, AIMD, jittered retries)
+   Reports delivered and failed emails, SES throttles, the rate reached
+   and per-email latency.
+"""
+
+import argparse
+import html
+import importlib.util
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+os.environ.setdefault('TABLE_NAME', 'wiseuni-data-bench')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_WARMUP', 'false')
+os.environ.setdefault('CODE_DECRYPTOR', 'plaintext')
+
+import boto3  # noqa: E402
+from botocore import UNSIGNED  # noqa: E402
+from botocore.awsrequest import AWSResponse  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+
+from bench_idempotency import MemoryTable  # noqa: E402
+from wiseuni import aws  # noqa: E402
+from wiseuni.idempotency import IdempotencyStore  # noqa: E402
+from wiseuni.mailer import SEND_RATE, Mailer  # noqa: E402
+from wiseuni.suppression import SuppressionIndex  # noqa: E402
+from wiseuni.throttle import ThroughputController  # noqa: E402
+
+_XMLNS = 'http://ses.amazonaws.com/doc/2010-12-01/'
+
+
+def _load_sender():
+    path = os.path.join(LAMBDA_DIR, 'custom_email_sender', 'index.py')
+    spec = importlib.util.spec_from_file_location('custom_email_sender', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+class StubSes:
+    """Account-wide send rate (sliding one-second window), fixed latency per call"""
+
+    def __init__(self, rate, latency):
+        self.rate = rate
+        self.latency = latency
+        self.sent = []  # (to, subject, html)
+        self.throttles = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def client(self, session):
+        client = session.client('ses', config=Config(
+            signature_version=UNSIGNED, retries={'mode': 'standard', 'max_attempts': 3}))
+        client.meta.events.register('before-send.ses', self._send)
+        return client
+
+    def _send(self, request, **kwargs):
+        time.sleep(self.latency)
+        body = request.body.decode() if isinstance(request.body, bytes) else request.body
+        params = {name: values[0] for name, values in parse_qs(body).items()}
+        action = params['Action']
+        if action == 'GetSendQuota':
+            return self._xml(200, 'GetSendQuota', f'<Max24HourSend>50000.0</Max24HourSend>'
+                                                  f'<MaxSendRate>{self.rate:.1f}</MaxSendRate>'
+                                                  f'<SentLast24Hours>0.0</SentLast24Hours>')
+        now = time.monotonic()
+        with self._lock:
+            while self._window and self._window[0] <= now - 1.0:
+                self._window.popleft()
+            if len(self._window) >= self.rate:
+                self.throttles += 1
+                return AWSResponse(request.url, 400, {}, _Body(
+                    f'<ErrorResponse xmlns="{_XMLNS}"><Error><Type>Sender</Type><Code>Throttling</Code>'
+                    f'<Message>Maximum sending rate exceeded.</Message></Error>'
+                    f'<RequestId>r</RequestId></ErrorResponse>'.encode()))
+            self._window.append(now)
+            self.sent.append(params)
+            message_id = f'msg-{len(self.sent)}'
+        return self._xml(200, 'SendEmail', f'<MessageId>{message_id}</MessageId>')
+
+    @staticmethod
+    def _xml(status, action, result):
+        return AWSResponse('https://email', status, {}, _Body(
+            f'<{action}Response xmlns="{_XMLNS}"><{action}Result>{result}</{action}Result>'
+            f'<ResponseMetadata><RequestId>r</RequestId></ResponseMetadata></{action}Response>'.encode()))
+
+
+# ========================================
+# 1. TRIGGER SOURCES
+# ========================================
+
+def check_trigger_sources(sender, ses):
+    checks = []
+    for i, trigger_source in enumerate(list(sender.TEMPLATE_VARIANTS) + ['CustomEmailSender_AccountTakeOverNotification']):
+        code = 'Tmp&Pw<9' if trigger_source.endswith('AdminCreateUser') else f'{i:06d}'
+        event = {
+            'triggerSource': trigger_source,
+            'userName': f'user{i}',
+            'request': {'type': 'customEmailSenderRequestV1', 'code': code, 'userAttributes': {
+                'sub': f'sub-{i}', 'email': f'student{i}@example.com', 'name': 'Ayşe <b>', 'locale': 'tr' if i % 2 else 'en',
+            }},
+        }
+        before = len(ses.sent)
+        sender.handler(event, None)
+        sender.handler(event, None)  # The retry
+        sent = ses.sent[before:]
+        expected = 0 if trigger_source not in sender.TEMPLATE_VARIANTS else 1
+        body = sent[0].get('Message.Body.Html.Data', '') if sent else ''
+        ok = len(sent) == expected and (not expected or (html.escape(code) in body and '<b>' not in body))
+        checks.append(ok)
+        subject = sent[0].get('Message.Subject.Data', '') if sent else '-'
+        print(f'  {"OK  " if ok else "FAIL"} {trigger_source:<46} emails {len(sent)}  {subject}')
+    return all(checks)
+
+
+# ========================================
+# 2. SIGN-UP STORM
+# ========================================
+
+def storm(label, args, make_send):
+    ses = StubSes(args.ses_rate, args.ses_ms / 1000)
+    session = boto3.session.Session(region_name='us-east-1')
+    work = queue.Queue()
+    for i in range(args.emails):
+        work.put(f'student{i}@example.com')
+    message = aws_rendered()
+    latencies, failed = [], []
+    lock = threading.Lock()
+
+    def container():
+        send = make_send(ses.client(session))
+        while True:
+            try:
+                to = work.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            try:
+                send(to, message)
+            except ClientError:
+                with lock:
+                    failed.append(to)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=container) for _ in range(args.containers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0
+    print(f'  {label:<8} delivered {len(latencies):>5}  failed {len(failed):>5}  throttles {ses.throttles:>6}  '
+          f'{len(latencies) / elapsed:>5.1f} emails/s  p50 {p50:>6.0f} ms  p99 {p99:>6.0f} ms')
+    return len(failed)
+
+
+def aws_rendered():
+    from wiseuni.templates import render
+    return render('code', 'en', 'signup', name='Student', code='123456')
+
+
+def before(client):
+    """post_confirmation's send path before the mailer"""
+    def send(to, message):
+        client.send_email(
+            Source='noreply@wiseuni.co.uk',
+            Destination={'ToAddresses': [to]},
+            Message={'Subject': {'Data': message.subject}, 'Body': {'Html': {'Data': message.html}}},
+        )
+    return send
+
+
+def with_mailer(client):
+    # A controller per container, as in Lambda
+    return Mailer(client, throughput=ThroughputController('ses', **SEND_RATE)).send
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emails', type=int, default=600)
+    parser.add_argument('--containers', type=int, default=20)
+    parser.add_argument('--ses-rate', type=float, default=50)
+    parser.add_argument('--ses-ms', type=float, default=40)
+    args = parser.parse_args()
+    random.seed(1)
+
+    print('Trigger sources (each called twice):')
+    ses = StubSes(rate=1000, latency=0)
+    sender = _load_sender()
+    table = MemoryTable(0)
+    sender.mailer = Mailer(ses.client(aws.session()))
+    sender.suppression_index = SuppressionIndex(table)
+    sender.idempotency = IdempotencyStore(table)
+    sender.logger.disabled = True
+    ok = check_trigger_sources(sender, ses)
+
+    print(f'\nSign-up storm: {args.emails} emails, {args.containers} containers, '
+          f'SES {args.ses_rate:.0f}/s at {args.ses_ms:.0f} ms per call:')
+    storm('before', args, before)
+    storm('mailer', args, with_mailer)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Email template custom resource benchmark
+
+Runs the update_email_template custom resource locally against a stub
+user pool, no AWS account needed. Like Cognito, the stub's UpdateUserPool
+resets every setting it is not given, and every request is validated
+against botocore's UpdateUserPool input shape.
+
+    python backend/lambda/scripts/bench_email_template.py [--deploys 5]
+
+dev, staging and prod each deploy --deploys times (Create, then Updates):
+- before: UpdateUserPool with the subject and message only, on every run
+- after:  DescribeUserPool, fingerprint, merged UpdateUserPool only on change
+Reports control-plane calls (reads / writes) and the pool settings lost,
+then the minified message size against Cognito's limit.
+"""
+
+import argparse
+import copy
+import importlib.util
+import os
+import sys
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_WARMUP', 'false')
+
+from botocore.validate import ParamValidator  # noqa: E402
+
+from wiseuni import aws  # noqa: E402
+from wiseuni.templates import render  # noqa: E402
+
+# What the Cognito stack leaves on the pool (stacks/cognito.yaml), as DescribeUserPool returns it
+DEPLOYED_POOL = {
+    'Id': 'us-east-1_bench',
+    'Name': 'wiseuni-user-pool-dev',
+    'Arn': 'arn:aws:cognito-idp:us-east-1:000000000000:userpool/us-east-1_bench',
+    'Status': 'Enabled',
+    'Policies': {'PasswordPolicy': {'MinimumLength': 8, 'RequireUppercase': True, 'RequireLowercase': True,
+                                    'RequireNumbers': True, 'RequireSymbols': True,
+                                    'TemporaryPasswordValidityDays': 7}},
+    'DeletionProtection': 'INACTIVE',
+    'LambdaConfig': {'PreSignUp': 'arn:aws:lambda:us-east-1:000000000000:function:wiseuni-pre-signup-dev',
+                     'PostConfirmation': 'arn:aws:lambda:us-east-1:000000000000:function:wiseuni-post-confirmation-dev'},
+    'AutoVerifiedAttributes': ['email'],
+    'UsernameAttributes': ['email'],
+    'MfaConfiguration': 'OPTIONAL',
+    'EstimatedNumberOfUsers': 1200,
+    'EmailConfiguration': {'EmailSendingAccount': 'COGNITO_DEFAULT'},
+    'UserPoolAddOns': {'AdvancedSecurityMode': 'ENFORCED'},
+    'AdminCreateUserConfig': {'AllowAdminCreateUserOnly': False, 'UnusedAccountValidityDays': 7},
+    'AccountRecoverySetting': {'RecoveryMechanisms': [{'Priority': 1, 'Name': 'verified_email'}]},
+    'VerificationMessageTemplate': {'DefaultEmailOption': 'CONFIRM_WITH_CODE'},
+}
+WATCHED = ('Policies', 'LambdaConfig', 'AutoVerifiedAttributes', 'MfaConfiguration', 'UserPoolAddOns',
+           'AccountRecoverySetting', 'AdminCreateUserConfig')
+
+
+class StubPool:
+    """DescribeUserPool / UpdateUserPool with Cognito's reset-to-default semantics"""
+
+    def __init__(self, shape):
+        self.pool = copy.deepcopy(DEPLOYED_POOL)
+        self.shape = shape
+        self.reads = self.writes = 0
+
+    def describe_user_pool(self, UserPoolId):
+        self.reads += 1
+        return {'UserPool': copy.deepcopy(self.pool)}
+
+    def update_user_pool(self, **params):
+        ParamValidator().validate(params, self.shape)  # Raises like botocore on a bad request
+        if 'UnusedAccountValidityDays' in (params.get('AdminCreateUserConfig') or {}):
+            raise ValueError('InvalidParameterException: use TemporaryPasswordValidityDays in PasswordPolicy')
+        self.writes += 1
+        kept = {key: self.pool[key] for key in ('Id', 'Name', 'Arn', 'Status', 'UsernameAttributes', 'EstimatedNumberOfUsers')}
+        self.pool = {**kept, **{key: value for key, value in params.items() if key != 'UserPoolId'}}
+
+    def lost(self):
+        """Watched settings that are gone or changed (the deprecated UnusedAccountValidityDays aside)"""
+        expected = copy.deepcopy(DEPLOYED_POOL)
+        expected['AdminCreateUserConfig'].pop('UnusedAccountValidityDays')
+        current = copy.deepcopy(self.pool)
+        (current.get('AdminCreateUserConfig') or {}).pop('UnusedAccountValidityDays', None)
+        return [key for key in WATCHED if current.get(key) != expected[key]]
+
+
+def _load_resource():
+    path = os.path.join(LAMBDA_DIR, 'update_email_template', 'index.py')
+    spec = importlib.util.spec_from_file_location('update_email_template', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.logger.disabled = True
+    return module
+
+
+def before(pool, properties):
+    """The custom resource before: subject and message only, every run"""
+    template = render('code', properties.get('Locale', 'en'), 'verification', code='{####}')
+    pool.update_user_pool(UserPoolId=properties['UserPoolId'], EmailVerificationSubject=template.subject,
+                          EmailVerificationMessage=template.html)
+
+
+def deploy(label, args, apply, shape):
+    reads = writes = 0
+    lost = set()
+    for environment in ('dev', 'staging', 'prod'):
+        pool = StubPool(shape)
+        for _ in range(args.deploys):
+            apply(pool, {'UserPoolId': pool.pool['Id'], 'Locale': 'en', 'TemplateRevision': '1'})
+        reads, writes = reads + pool.reads, writes + pool.writes
+        lost.update(pool.lost())
+    print(f'  {label:<7} reads {reads:>3}  writes {writes:>3}  settings lost: {", ".join(sorted(lost)) or "none"}')
+    return lost
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--deploys', type=int, default=5)
+    args = parser.parse_args()
+
+    resource = _load_resource()
+    shape = aws.client('cognito-idp').meta.service_model.operation_model('UpdateUserPool').input_shape
+
+    def after(pool, properties):
+        resource.cognito = pool
+        resource.apply_template(properties)
+
+    print(f'3 environments x {args.deploys} deploys:')
+    deploy('before', args, before, shape)
+    lost = deploy('after', args, after, shape)
+
+    message = resource.desired_settings({'Locale': 'en'})['message']
+    print(f'\nVerification message: {len(message)} characters (Cognito allows {resource.MAX_MESSAGE_LENGTH})')
+    sys.exit(1 if lost else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,516 @@
+"""
+Seat-limited enrolment load test
+
+Runs locally, no AWS account needed: a fake DynamoDB endpoint is started
+on localhost and wiseuni/enrolment.py talks to it through real boto3
+Table resources. The fake keeps items in memory and implements what
+enrolment uses (Query, GetItem, PutItem, DeleteItem, BatchGetItem,
+TransactWriteItems with condition checks), plus:
+- service time per request (reads ~3 ms, writes ~6 ms, transactions ~12 ms)
+- TransactionConflict: a transaction touching an item another one is
+  still writing is cancelled, like DynamoDB does
+- a stream of INSERT / MODIFY / REMOVE records with old and new images
+
+    python backend/lambda/scripts/bench_enrolment.py [--students 5000] [--seats 300] [--workers 200]
+
+Per run (sharded counters, then a single counter for comparison):
+1. registration opens: every student enrols at once, one thread per
+   concurrent request
+2. churn: enrolled students drop and waitlisted ones leave, while two
+   promoters (the enrolment_promoter function) consume the stream
+3. the whole stream is applied again (a redelivered batch)
+4. enrolments without a seat (a plain PutItem, as the browser wrote them
+   before it had to use the API) are dropped: the promoter must release
+   nothing
+After each phase the invariants are checked: enrolments == seats taken
+== the limit, every student enrolled or waitlisted exactly once, and
+promotions in waitlist order.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-2')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+
+import boto3  # noqa: E402
+from botocore import UNSIGNED  # noqa: E402
+from botocore.awsrequest import AWSResponse  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from wiseuni import enrolment  # noqa: E402
+
+TABLE = 'bench'
+COURSE_ID = 'CS101'
+COURSE = {'title': 'Introduction to Computer Science', 'professorName': 'Dr. Ayşe Kaya'}
+
+SERVICE_MS = {'read': (2, 4), 'write': (4, 8), 'transaction': (8, 16)}
+
+_KEY_CONDITION = re.compile(r'^PK = (:\w+)(?: AND (?:begins_with\(SK, (:\w+)\)|SK BETWEEN (:\w+) AND (:\w+)))?$')
+_EXISTS = re.compile(r'^(attribute_exists|attribute_not_exists)\((\S+)\)$')
+_COMPARE = re.compile(r'^(\S+) (<=|>=|<>|<|>|=) (\S+)$')
+_ADD = re.compile(r'^ADD (\S+) (\S+)$')
+_OPERATORS = {
+    '<': lambda a, b: a < b, '>': lambda a, b: a > b, '=': lambda a, b: a == b,
+    '<=': lambda a, b: a <= b, '>=': lambda a, b: a >= b, '<>': lambda a, b: a != b,
+}
+
+
+# ========================================
+# FAKE DYNAMODB
+# ========================================
+
+def _plain(value):
+    (kind, raw), = value.items()
+    return Decimal(raw) if kind == 'N' else raw
+
+
+class Cancelled(Exception):
+    def __init__(self, reasons):
+        super().__init__(reasons)
+        self.reasons = reasons
+
+
+class FakeTable:
+    """One table, wire-format items, conditions limited to what enrolment.py writes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.partitions = defaultdict(dict)  # PK -> {SK: item}
+        self.sort_keys = defaultdict(list)  # PK -> sorted SKs
+        self.in_flight = {}  # Key -> until when a transaction is writing it
+        self.stream = []
+        self.counters = Counter()
+
+    # ----- storage -----
+
+    def _get(self, key):
+        return self.partitions[key[0]].get(key[1])
+
+    def _set(self, key, item):
+        pk, sk = key
+        old = self.partitions[pk].get(sk)
+        if item is None:
+            if old is None:
+                return
+            del self.partitions[pk][sk]
+            keys = self.sort_keys[pk]
+            keys.pop(_bisect(keys, sk))
+        else:
+            if old is None:
+                keys = self.sort_keys[pk]
+                keys.insert(_bisect(keys, sk), sk)
+            self.partitions[pk][sk] = item
+        record = {'PK': {'S': pk}, 'SK': {'S': sk}}
+        change = {'Keys': record}
+        if old is not None:
+            change['OldImage'] = old
+        if item is not None:
+            change['NewImage'] = item
+        name = 'REMOVE' if item is None else 'MODIFY' if old is not None else 'INSERT'
+        self.stream.append({'eventID': str(len(self.stream)), 'eventName': name, 'dynamodb': change})
+
+    # ----- expressions -----
+
+    @staticmethod
+    def _holds(expression, item, names, values):
+        if not expression:
+            return True
+        for clause in expression.split(' AND '):
+            exists = _EXISTS.match(clause)
+            if exists:
+                present = item is not None and names.get(exists.group(2), exists.group(2)) in item
+                if present != (exists.group(1) == 'attribute_exists'):
+                    return False
+                continue
+            left, operator, right = _COMPARE.match(clause).groups()
+            operands = []
+            for token in (left, right):
+                if token.startswith(':'):
+                    operands.append(_plain(values[token]))
+                else:
+                    name = names.get(token, token)
+                    if item is None or name not in item:
+                        return False
+                    operands.append(_plain(item[name]))
+            if not _OPERATORS[operator](*operands):
+                return False
+        return True
+
+    @staticmethod
+    def _key(action):
+        key = action.get('Key') or action['Item']
+        return key['PK']['S'], key['SK']['S']
+
+    def _apply(self, kind, action):
+        key = self._key(action)
+        if kind == 'Put':
+            self._set(key, action['Item'])
+        elif kind == 'Delete':
+            self._set(key, None)
+        elif kind == 'Update':
+            name, value = _ADD.match(action['UpdateExpression']).groups()
+            name = action.get('ExpressionAttributeNames', {}).get(name, name)
+            item = dict(self._get(key) or action['Key'])
+            total = _plain(item.get(name, {'N': '0'})) + _plain(action['ExpressionAttributeValues'][value])
+            item[name] = {'N': str(total)}
+            self._set(key, item)
+
+    def _check(self, action, item):
+        return self._holds(action.get('ConditionExpression'), item,
+                           action.get('ExpressionAttributeNames', {}), action.get('ExpressionAttributeValues', {}))
+
+    # ----- operations -----
+
+    def Query(self, body):
+        values = body['ExpressionAttributeValues']
+        pk, prefix, first, last = _KEY_CONDITION.match(body['KeyConditionExpression']).groups()
+        pk = values[pk]['S']
+        with self.lock:
+            keys = self.sort_keys[pk]
+            if prefix:
+                start = _bisect(keys, values[prefix]['S'])
+                end = _bisect(keys, values[prefix]['S'] + '\uffff')
+            elif first:
+                start, end = _bisect(keys, values[first]['S']), _bisect(keys, values[last]['S'] + '\x00')
+            else:
+                start, end = 0, len(keys)
+            end = min(end, start + body['Limit']) if 'Limit' in body else end
+            items = [self.partitions[pk][sk] for sk in keys[start:end]]
+        if body.get('Select') == 'COUNT':
+            return {'Count': len(items), 'ScannedCount': len(items)}
+        return {'Items': items, 'Count': len(items), 'ScannedCount': len(items)}
+
+    def GetItem(self, body):
+        with self.lock:
+            item = self._get(self._key(body))
+        return {'Item': item} if item is not None else {}
+
+    def BatchGetItem(self, body):
+        with self.lock:
+            found = [self._get(self._key({'Key': key})) for key in body['RequestItems'][TABLE]['Keys']]
+        return {'Responses': {TABLE: [item for item in found if item is not None]}, 'UnprocessedKeys': {}}
+
+    def _single(self, kind, body):
+        with self.lock:
+            if not self._check(body, self._get(self._key(body))):
+                raise Cancelled(None)
+            self._apply(kind, body)
+        return {}
+
+    def PutItem(self, body):
+        return self._single('Put', body)
+
+    def DeleteItem(self, body):
+        return self._single('Delete', body)
+
+    def TransactWriteItems(self, body):
+        actions = [next(iter(entry.items())) for entry in body['TransactItems']]
+        keys = [self._key(action) for _, action in actions]
+        service = random.uniform(*SERVICE_MS['transaction']) / 1000
+        with self.lock:
+            # In flight for the service time only: waiting for this process's CPU does not count
+            now = time.monotonic()
+            busy = [self.in_flight.get(key, 0) > now for key in keys]
+            if any(busy):
+                self.counters['conflicts'] += 1
+                raise Cancelled(['TransactionConflict' if conflict else 'None' for conflict in busy])
+            self.in_flight.update(dict.fromkeys(keys, now + service))
+        time.sleep(service)
+        with self.lock:
+            reasons = ['None' if self._check(action, self._get(key)) else 'ConditionalCheckFailed'
+                       for (_, action), key in zip(actions, keys)]
+            if 'ConditionalCheckFailed' in reasons:
+                raise Cancelled(reasons)
+            for kind, action in actions:
+                if kind != 'ConditionCheck':
+                    self._apply(kind, action)
+            self.counters['transactions'] += 1
+        return {}
+
+    # ----- test helpers -----
+
+    def items(self, prefix_pk, prefix_sk):
+        with self.lock:
+            return [
+                (pk, sk, item) for pk, partition in self.partitions.items() if pk.startswith(prefix_pk)
+                for sk, item in partition.items() if sk.startswith(prefix_sk)
+            ]
+
+
+def _bisect(keys, value):
+    low, high = 0, len(keys)
+    while low < high:
+        middle = (low + high) // 2
+        if keys[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def respond(fake, operation, body):
+    """(status, payload) of one request, after the operation's service time"""
+    if operation != 'TransactWriteItems':
+        kind = 'read' if operation in ('Query', 'GetItem', 'BatchGetItem') else 'write'
+        time.sleep(random.uniform(*SERVICE_MS[kind]) / 1000)
+    try:
+        return 200, getattr(fake, operation)(body)
+    except Cancelled as e:
+        if e.reasons is None:
+            return 400, {'__type': 'com.amazonaws.dynamodb.v20120810#ConditionalCheckFailedException',
+                         'message': 'The conditional request failed'}
+        return 400, {'__type': 'com.amazonaws.dynamodb.v20120810#TransactionCanceledException',
+                     'message': f"Transaction cancelled [{', '.join(e.reasons)}]",
+                     'CancellationReasons': [{'Code': code} for code in e.reasons]}
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+# ========================================
+# CLIENTS
+# ========================================
+
+class Tables:
+    """
+    A Table resource per thread (a Lambda container each) whose requests
+    the fake answers: botocore's before-send event returns the response,
+    so requests are serialized, parsed and retried as usual but no
+    socket is opened
+    """
+
+    def __init__(self, fake, count):
+        session = boto3.session.Session()
+        self._free = [self._connect(session, fake) for _ in range(count)]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _connect(session, fake):
+        resource = session.resource('dynamodb', endpoint_url='http://fake-dynamodb',
+                                    config=Config(signature_version=UNSIGNED, retries={'mode': 'standard'}))
+
+        def send(request, **kwargs):
+            target = request.headers['X-Amz-Target']
+            operation = (target.decode() if isinstance(target, bytes) else target).split('.')[-1]
+            status, payload = respond(fake, operation, json.loads(request.body))
+            headers = {'Content-Type': 'application/x-amz-json-1.0'}
+            return AWSResponse(request.url, status, headers, _Body(json.dumps(payload).encode()))
+
+        resource.meta.client.meta.events.register('before-send.dynamodb', send)
+        return resource.Table(TABLE)
+
+    def get(self):
+        table = getattr(self._local, 'table', None)
+        if table is None:
+            with self._lock:
+                table = self._local.table = self._free.pop()
+        return table
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def summarize(label, latencies):
+    ordered = sorted(latencies)
+    print(f'  {label}: p50 {percentile(ordered, 0.5) * 1000:6.1f} ms, p99 {percentile(ordered, 0.99) * 1000:6.1f} ms, '
+          f'max {ordered[-1] * 1000:6.1f} ms')
+
+
+# ========================================
+# CHECKS
+# ========================================
+
+def state(fake):
+    enrolled = {pk[len('USER#'):] for pk, sk, _ in fake.items('USER#', f'ENROLLMENT#{COURSE_ID}')}
+    markers = {pk[len('USER#'):] for pk, sk, _ in fake.items('USER#', f'WAITLIST#{COURSE_ID}')}
+    entries = sorted((sk, item['identityId']['S']) for _, sk, item in fake.items(f'COURSE#{COURSE_ID}', 'WAITLIST#'))
+    shards = [item for _, _, item in fake.items(f'COURSE#{COURSE_ID}', 'SEATS#')]
+    taken = sum(int(item['taken']['N']) for item in shards)
+    limit = sum(int(item['capacity']['N']) for item in shards)
+    return enrolled, markers, [identity for _, identity in entries], taken, limit
+
+
+def check(fake, students, label):
+    enrolled, markers, waiting, taken, limit = state(fake)
+    problems = []
+    if len(enrolled) != taken:
+        problems.append(f'{len(enrolled)} enrolments but {taken} seats taken')
+    if taken > limit:
+        problems.append(f'{taken} seats taken of {limit}')
+    if waiting and taken < limit:
+        problems.append(f'{limit - taken} free seat(s) while {len(waiting)} wait')
+    if set(waiting) != markers or len(waiting) != len(markers):
+        problems.append('waitlist entries and student markers differ')
+    if enrolled & markers:
+        problems.append(f'{len(enrolled & markers)} students both enrolled and waitlisted')
+    if students is not None and len(enrolled) + len(waiting) != students:
+        problems.append(f'{students - len(enrolled) - len(waiting)} students neither enrolled nor waitlisted')
+    print(f'  {label}: {len(enrolled)} enrolled, {taken}/{limit} seats taken, {len(waiting)} waitlisted -> '
+          f'{"OK" if not problems else "FAILED: " + "; ".join(problems)}')
+    return not problems
+
+
+# ========================================
+# RUN
+# ========================================
+
+def run(label, args, shards):
+    fake = FakeTable()
+    tables = Tables(fake, args.workers + 3)  # Workers, two promoters and this thread
+    table = tables.get()
+    table.put_item(Item={'PK': f'COURSE#{COURSE_ID}', 'SK': 'METADATA', **COURSE})
+    enrolment.configure_seats(table, COURSE_ID, args.seats, shards=shards, enrolled=0)
+    print(f'{label}: {args.seats} seats in {shards} shard(s), {args.students:,} students, '
+          f'{args.workers} concurrent requests')
+
+    students = [f'eu-west-2:{number:012x}' for number in range(args.students)]
+    outcomes, latencies = Counter(), []
+    lock = threading.Lock()
+    ready = threading.Barrier(args.workers)
+
+    def warm(_):
+        tables.get()
+        ready.wait()  # Every worker is up before registration opens
+
+    def enrol(identity_id):
+        started = time.perf_counter()
+        try:
+            outcome = enrolment.enrol(tables.get(), COURSE_ID, identity_id, COURSE).status
+        except enrolment.RegistrationBusy:
+            outcome = 'busy'
+        with lock:
+            outcomes[outcome] += 1
+            latencies.append(time.perf_counter() - started)
+
+    def leave(identity_id):
+        return enrolment.drop(tables.get(), COURSE_ID, identity_id)
+
+    # Promoters consume the stream from the start: the burst's waitlist INSERTs reach them too
+    cursor, batches, done = [0], Counter(), threading.Event()
+    stream_lock = threading.Lock()
+
+    def promoter():
+        while True:
+            with stream_lock:
+                batch = fake.stream[cursor[0]:cursor[0] + 100]
+                cursor[0] += len(batch)
+            while batch:
+                try:
+                    enrolment.apply_stream_records(tables.get(), batch)
+                except enrolment.RegistrationBusy:
+                    # Like the event source mapping: the same batch again
+                    with stream_lock:
+                        batches['retried'] += 1
+                    continue
+                with stream_lock:
+                    batches['applied'] += 1
+                break
+            if not batch:
+                if done.is_set():
+                    return
+                time.sleep(0.01)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(warm, range(args.workers)))
+        started = time.perf_counter()
+        list(pool.map(enrol, students))
+        elapsed = time.perf_counter() - started
+        print(f'  burst: {args.students:,} requests in {elapsed:.2f}s ({args.students / elapsed:,.0f}/s), '
+              f'{dict(outcomes)}; transactions: {fake.counters["transactions"]:,} committed, '
+              f'{fake.counters["conflicts"]:,} conflicts')
+        summarize('enrol latency', latencies)
+        # A browser retries a 503 (busy); so does this one, until every student has an answer
+        list(pool.map(enrol, [identity for identity in students if not _answered(fake, identity)]))
+        ok = check(fake, args.students, 'after burst')
+
+        # Churn while two promoters consume the stream
+        enrolled, _, waiting, _, _ = state(fake)
+        order = {identity: position for position, identity in enumerate(waiting)}
+        changes = random.sample(sorted(enrolled), min(args.drops, len(enrolled)))
+        changes += random.sample(waiting, min(args.leaves, len(waiting)))
+        random.shuffle(changes)
+        promoters = [threading.Thread(target=promoter) for _ in range(2)]
+        for thread in promoters:
+            thread.start()
+        started = time.perf_counter()
+        left = Counter(pool.map(leave, changes))
+    while True:
+        with stream_lock:
+            if cursor[0] >= len(fake.stream):
+                break
+        time.sleep(0.05)
+    done.set()
+    for thread in promoters:
+        thread.join()
+    print(f'  churn: {dict(left)} in {time.perf_counter() - started:.2f}s, stream batches {dict(batches)}')
+
+    now_enrolled, _, now_waiting, _, _ = state(fake)
+    ok &= check(fake, args.students - len(changes), 'after churn')
+    promoted = now_enrolled - enrolled
+    if promoted and now_waiting:
+        fifo = max(order[identity] for identity in promoted) < min(order[identity] for identity in now_waiting)
+        print(f'  promotions in waitlist order: {"OK" if fifo else "FAILED"} ({len(promoted)} promoted)')
+        ok &= fifo
+
+    replay = enrolment.apply_stream_records(table, list(fake.stream))
+    print(f'  whole stream applied again: {replay}')
+    ok &= check(fake, args.students - len(changes), 'after replay')
+
+    # Enrolments the browser wrote directly (before the API) hold no seat: dropping one must not free one
+    before = len(fake.stream)
+    legacy = [f'eu-west-2:legacy{number:07x}' for number in range(20)]
+    for identity_id in legacy:
+        table.put_item(Item={'PK': f'USER#{identity_id}', 'SK': f'ENROLLMENT#{COURSE_ID}',
+                             'courseId': COURSE_ID, 'status': 'active'})
+    for identity_id in legacy:
+        table.delete_item(Key={'PK': f'USER#{identity_id}', 'SK': f'ENROLLMENT#{COURSE_ID}'})
+    direct = enrolment.apply_stream_records(table, fake.stream[before:])
+    print(f'  {len(legacy)} enrolments without a seat dropped: {direct}')
+    ok &= direct['released'] == 0
+    ok &= check(fake, args.students - len(changes), 'after seatless drops')
+    return ok
+
+
+def _answered(fake, identity_id):
+    with fake.lock:
+        return (f'ENROLLMENT#{COURSE_ID}' in fake.partitions[f'USER#{identity_id}']
+                or f'WAITLIST#{COURSE_ID}' in fake.partitions[f'USER#{identity_id}'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--seats', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=200, help='concurrent requests')
+    parser.add_argument('--drops', type=int, default=100)
+    parser.add_argument('--leaves', type=int, default=50)
+    parser.add_argument('--shards', type=int, help='default: enrolment.default_shards(seats)')
+    args = parser.parse_args()
+
+    random.seed(7)
+    ok = run('sharded', args, args.shards or enrolment.default_shards(args.seats))
+    ok &= run('single counter', args, 1)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Grade analytics benchmark: vectorized vs item-by-item
+
+Runs locally, no AWS account needed: a synthetic semester of GRADE#
+items (1M by default) is loaded into columns (wiseuni/analytics.py),
+then every report is computed both ways and compared.
+
+    python backend/lambda/scripts/bench_grade_analytics.py [--grades 1000000] [--courses 5000]
+
+Reports time for:
+- loading items into columns
+- per-course count / mean / std / percentiles
+- z-score and linear curves of every course
+- credit-weighted GPA of every student
+and checks the vectorized results against the plain Python ones.
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni import analytics  # noqa: E402
+
+
+def make_items(grades, courses, rng):
+    """Decoded GRADE# items: ~5 courses per student, course means spread out"""
+    course_ids = [f'C{number:05d}' for number in range(courses)]
+    course_mean = {course_id: rng.uniform(55, 85) for course_id in course_ids}
+    credits = {course_id: Decimal(rng.choice([5, 6, 7, 8, 10])) for course_id in course_ids}
+    cutoffs = list(zip(analytics.CUTOFFS, analytics.LETTERS))
+    items = []
+    student = 0
+    while len(items) < grades:
+        identity_id = f'eu-west-2:{student:012x}'
+        student += 1
+        for course_id in rng.sample(course_ids, min(5, courses)):
+            points = max(0, min(100, round(rng.gauss(course_mean[course_id], 12))))
+            letter = next(letter for cutoff, letter in cutoffs if points >= cutoff)
+            items.append({
+                'PK': f'USER#{identity_id}', 'SK': f'GRADE#{course_id}',
+                'points': Decimal(points), 'grade': letter,
+            })
+    return items[:grades], credits
+
+
+def columns_of(columns, rows):
+    """The given rows (one course) as their own columns, like load_course() returns"""
+    students, student = np.unique(columns.student[rows], return_inverse=True)
+    return analytics.GradeColumns(
+        columns.students[students], student.astype(np.int32), columns.courses[columns.course[rows[:1]]],
+        np.zeros(len(rows), dtype=np.int32), columns.points[rows], columns.grade_points[rows],
+        columns.credits[rows],
+    )
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    return result, elapsed
+
+
+# Item-by-item versions of the same reports
+
+def loop_course_stats(items):
+    by_course = defaultdict(list)
+    for item in items:
+        by_course[item['SK'][len('GRADE#'):]].append(float(item['points']))
+    report = {}
+    for course_id, points in by_course.items():
+        ordered = sorted(points)
+        marks = []
+        for q in analytics.PERCENTILES:
+            position = (len(ordered) - 1) * q / 100
+            below, above = math.floor(position), math.ceil(position)
+            marks.append(ordered[below] + (ordered[above] - ordered[below]) * (position - below))
+        report[course_id] = (len(points), statistics.fmean(points), statistics.pstdev(points), marks)
+    return report
+
+
+def loop_z_curve(items, mean=75.0, std=10.0):
+    by_course = defaultdict(list)
+    for item in items:
+        by_course[item['SK'][len('GRADE#'):]].append(float(item['points']))
+    moments = {course_id: (statistics.fmean(points), statistics.pstdev(points))
+               for course_id, points in by_course.items()}
+    curved = []
+    for item in items:
+        course_mean, course_std = moments[item['SK'][len('GRADE#'):]]
+        z = (float(item['points']) - course_mean) / course_std if course_std > 0 else 0.0
+        curved.append(min(100.0, max(0.0, mean + std * z)))
+    return curved
+
+
+def loop_gpa(items, credits):
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for item in items:
+        grade_points = analytics.GRADE_POINTS.get(item['grade'])
+        if grade_points is None:
+            continue
+        weight = float(credits.get(item['SK'][len('GRADE#'):], 1))
+        totals[item['PK'][len('USER#'):]][0] += grade_points * weight
+        totals[item['PK'][len('USER#'):]][1] += weight
+    return {student: total / weight for student, (total, weight) in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--grades', type=int, default=1_000_000)
+    parser.add_argument('--courses', type=int, default=5_000)
+    args = parser.parse_args()
+
+    items, credits = make_items(args.grades, args.courses, random.Random(42))
+    columns, load_seconds = timed(lambda: analytics.GradeColumns.from_items(items, credits))
+    print(f'{len(columns):,} grades, {len(columns.students):,} students, {len(columns.courses):,} courses; '
+          f'items -> columns {load_seconds:.2f}s')
+
+    rows = []
+    _, vector = timed(lambda: analytics.course_report(columns))
+    expected, loop = timed(lambda: loop_course_stats(items))
+    # Unrounded, against the same group arrays the report is made of
+    size = len(columns.courses)
+    _, means, stds = analytics.group_stats(columns.points, columns.course, size)
+    marks = analytics.group_percentiles(columns.points, columns.course, size)
+    worst = max(
+        max(abs(means[number] - expected[course_id][1]), abs(stds[number] - expected[course_id][2]),
+            float(np.max(np.abs(marks[number] - expected[course_id][3]))))
+        for number, course_id in enumerate(columns.courses.tolist())
+    )
+    rows.append(('per-course stats + percentiles', vector, loop, worst))
+
+    curved, vector = timed(lambda: analytics.z_curve(columns.points, columns.course))
+    expected_curve, loop = timed(lambda: loop_z_curve(items))
+    # Columns keep the items' order
+    worst = float(np.max(np.abs(curved - np.array(expected_curve))))
+    rows.append(('z-score curve (every course)', vector, loop, worst))
+
+    _, vector = timed(lambda: analytics.linear_curve(columns.points, columns.course))
+    rows.append(('linear curve (every course)', vector, None, None))
+
+    # Split by course with one sort, like load_semester() receives them
+    order = np.argsort(columns.course, kind='stable')
+    bounds = np.cumsum(np.bincount(columns.course, minlength=len(columns.courses)))
+    parts = [columns_of(columns, rows) for rows in np.split(order, bounds[:-1])]
+    semester, concatenate_seconds = timed(lambda: analytics.GradeColumns.concatenate(parts))
+    assert len(semester) == len(columns)
+
+    averages, vector = timed(lambda: analytics.gpa(columns, weighted=True))
+    expected_gpa, loop = timed(lambda: loop_gpa(items, credits))
+    worst = max(abs(averages[number] - expected_gpa[student])
+                for number, student in enumerate(columns.students.tolist()))
+    rows.append(('weighted GPA (every student)', vector, loop, worst))
+
+    _, vector = timed(lambda: (analytics.histogram(columns.points), analytics.letter_counts(columns.points)))
+    rows.append(('histogram + letters', vector, None, None))
+
+    print(f'  {len(columns.courses):,} per-course columns -> one semester: {concatenate_seconds:.2f}s')
+    for label, vector, loop, worst in rows:
+        line = f'  {label:<32} {vector * 1000:8.1f} ms'
+        if loop is not None:
+            line += f'   item-by-item {loop * 1000:8.1f} ms ({loop / vector:5.1f}x)   max difference {worst:.2e}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+"""
+Grade digest benchmark
+
+Runs locally, no AWS account needed: DynamoDB is an in-memory table, the
+digest queue an in-memory delay queue and SES a stub. The hour is
+simulated (stream batches and queue polls every --tick seconds), so
+windows of any length run in seconds.
+
+    python backend/lambda/scripts/bench_grade_digest.py [--students 2000] [--courses 40] [--per-student 10]
+
+1. A faculty publishes --students x --per-student grades within an hour,
+   course after course; some grades are corrected minutes later and some
+   items are rewritten unchanged (compact re-encoding)
+   - per grade: one email per published grade (the naive consumer)
+   - digests:   wiseuni/digests.py for several DIGEST_WINDOW_SECONDS
+   Reports emails, emails per student, delay from grade to email and
+   DynamoDB / SQS calls, and checks that every student's last email
+   shows each course's final grade and nothing is left pending.
+2. Sending one window's digests through the Mailer and a stub SES with
+   --ses-ms latency per call and --ses-rate emails per second: one at a
+   time, then DIGEST_CONCURRENCY at a time.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+os.environ.setdefault('TABLE_NAME', 'wiseuni-data-bench')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_WARMUP', 'false')
+
+import boto3  # noqa: E402
+from boto3.dynamodb.types import TypeSerializer  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+
+from bench_custom_email_sender import StubSes  # noqa: E402
+from wiseuni.digests import DEFAULT_CONCURRENCY, DigestCollector, DigestQueue, DigestSender  # noqa: E402
+from wiseuni.items import encode  # noqa: E402
+from wiseuni.mailer import SEND_RATE, Mailer  # noqa: E402
+from wiseuni.throttle import ThroughputController  # noqa: E402
+
+GRADES = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'D', 'F']
+_serializer = TypeSerializer()
+_ROW = re.compile(r'^- .* \((\S+)\): (\S+) - (\S+)$', re.M)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+# ========================================
+# STUBS
+# ========================================
+
+class MemoryTable:
+    """The Table calls digests.py makes, with its condition expressions"""
+
+    name = os.environ['TABLE_NAME']
+
+    def __init__(self, courses):
+        self.items = {}
+        self.partitions = defaultdict(dict)  # PK -> SK -> item
+        self.calls = Counter()
+        self.meta = self  # table.meta.client.batch_get_item
+        self.client = self
+        for course_id, title in courses.items():
+            self.store({'PK': f'COURSE#{course_id}', 'SK': 'METADATA', 'title': title})
+
+    def store(self, item):
+        self.items[(item['PK'], item['SK'])] = self.partitions[item['PK']][item['SK']] = dict(item)
+
+    def remove(self, key):
+        if self.items.pop((key['PK'], key['SK']), None) is not None:
+            del self.partitions[key['PK']][key['SK']]
+
+    @staticmethod
+    def _failed(operation):
+        return ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'failed'}}, operation)
+
+    @contextmanager
+    def batch_writer(self, overwrite_by_pkeys=None):
+        puts = []
+
+        class Batch:
+            @staticmethod
+            def put_item(Item):
+                puts.append(Item)
+
+        yield Batch()
+        self.calls['BatchWriteItem'] += (len(puts) + 24) // 25
+        for item in puts:
+            self.store(item)
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None):
+        self.calls['PutItem'] += 1
+        old = self.items.get((Item['PK'], Item['SK']))
+        if ConditionExpression and old is not None:
+            # attribute_not_exists(PK) OR dueAt < :stale OR openedBy = :opened_by
+            values = ExpressionAttributeValues
+            if not (old['dueAt'] < values[':stale'] or old['openedBy'] == values[':opened_by']):
+                raise self._failed('PutItem')
+        self.store(Item)
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeValues=None):
+        self.calls['DeleteItem'] += 1
+        old = self.items.get((Key['PK'], Key['SK']))
+        if ConditionExpression and (old is None or old.get('revision') != ExpressionAttributeValues[':revision']):
+            raise self._failed('DeleteItem')
+        self.remove(Key)
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, ConsistentRead=False, ExclusiveStartKey=None):
+        self.calls['Query'] += 1
+        pk, prefix = ExpressionAttributeValues[':pk'], ExpressionAttributeValues[':sk']
+        items = [dict(item) for sk, item in sorted(self.partitions[pk].items()) if sk.startswith(prefix)]
+        return {'Items': items}
+
+    def batch_get_item(self, RequestItems):
+        self.calls['BatchGetItem'] += 1
+        request = RequestItems[self.name]
+        found = []
+        for key in request['Keys']:
+            item = self.items.get((key['PK'], key['SK']))
+            if item is not None:
+                found.append(dict(item))
+        return {'Responses': {self.name: found}}
+
+    def pending(self):
+        return [key for key in self.items if key[0].startswith('NOTIFY#')]
+
+
+class DelayQueue:
+    """send_message_batch with DelaySeconds; receive() returns what is visible"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.messages = []  # (visible at, messageId, body)
+        self.calls = 0
+        self.sent = 0
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls += 1
+        for entry in Entries:
+            self.sent += 1
+            self.messages.append((self.clock() + entry['DelaySeconds'], f'm-{self.sent}', entry['MessageBody']))
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+    def receive(self, limit):
+        now = self.clock()
+        self.messages.sort()
+        count = 0
+        while count < min(limit, len(self.messages)) and self.messages[count][0] <= now:
+            count += 1
+        visible, self.messages = self.messages[:count], self.messages[count:]
+        return [(message_id, json.loads(body)) for _, message_id, body in visible]
+
+
+class CountingSes:
+    """In-process SES: records every email at the simulated time it is sent"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []  # (time, to, text)
+
+    def get_send_quota(self):
+        return {'Max24HourSend': 200_000.0, 'MaxSendRate': 100.0, 'SentLast24Hours': 0.0}
+
+    def send_email(self, Destination, Message, **kwargs):
+        self.sent.append((self.clock(), Destination['ToAddresses'][0], Message['Body']['Text']['Data']))
+        return {'MessageId': f'msg-{len(self.sent)}'}
+
+
+# ========================================
+# 1. AN HOUR OF PUBLISHING
+# ========================================
+
+def publishing_hour(args, seed=11):
+    """
+    (time offset, identityId, courseId, grade, points, kind) in time order;
+    kind: 'publish', 'regrade' or 'rewrite' (same grade, compact encoding)
+    """
+    rng = random.Random(seed)
+    students = [f'eu-west-2:{i:08d}' for i in range(args.students)]
+    rosters = defaultdict(list)
+    for identity_id in students:
+        for course in rng.sample(range(args.courses), args.per_student):
+            rosters[course].append(identity_id)
+
+    writes = []
+    slot = 3600 / args.courses
+    for course in range(args.courses):
+        course_id = f'CS{100 + course}'
+        start = course * slot
+        for identity_id in rosters[course]:
+            at = start + rng.uniform(0, slot * 0.8)  # Entered one by one, course after course
+            grade = rng.choice(GRADES)
+            points = rng.randint(40, 100)
+            writes.append((at, identity_id, course_id, grade, points, 'publish'))
+            if rng.random() < args.regrades:
+                writes.append((at + rng.uniform(60, 900), identity_id, course_id, rng.choice(GRADES), rng.randint(40, 100), 'regrade'))
+            elif rng.random() < args.rewrites:
+                writes.append((at + rng.uniform(60, 900), identity_id, course_id, grade, points, 'rewrite'))
+    writes.sort()
+    return students, writes
+
+
+def _stream_record(number, write, previous):
+    _, identity_id, course_id, grade, points, kind = write
+    item = {
+        'PK': f'USER#{identity_id}', 'SK': f'GRADE#{course_id}',
+        'identityId': identity_id, 'courseId': course_id, 'grade': grade, 'points': points,
+        'gradedAt': '2024-11-02T14:03:11.000Z', 'gradedBy': 'eu-west-2:professor',
+    }
+    if kind == 'rewrite':
+        item = encode(item)
+    image = {name: _serializer.serialize(value) for name, value in item.items()}
+    record = {
+        'eventID': f'e{number}',
+        'eventName': 'INSERT' if previous is None else 'MODIFY',
+        'eventSource': 'aws:dynamodb',
+        'dynamodb': {'Keys': {'PK': image['PK'], 'SK': image['SK']}, 'NewImage': image,
+                     'SequenceNumber': f'{number:021d}'},
+    }
+    if previous is not None:
+        record['dynamodb']['OldImage'] = {name: _serializer.serialize(value) for name, value in previous.items()}
+    return record, item
+
+
+def simulate(args, students, writes, window):
+    """Runs the pipeline over the simulated hour; returns emails and counters"""
+    clock = Clock()
+    start = clock.now
+    courses = {f'CS{100 + course}': f'Course {100 + course}' for course in range(args.courses)}
+    table = MemoryTable(courses)
+    for number, identity_id in enumerate(students):
+        table.store({
+            'PK': f'USER#{identity_id}', 'SK': 'PROFILE', 'email': f'student{number}@wiseuni.co.uk',
+            'name': f'Student {number}', 'locale': 'tr' if number % 3 == 0 else 'en',
+        })
+    sqs = DelayQueue(clock)
+    queue = DigestQueue(sqs, 'https://sqs/digests', clock=clock)
+    ses = CountingSes(clock)
+    collector = DigestCollector(table, queue, window, clock=clock)
+    sender = DigestSender(table, Mailer(client=ses, throughput=None), None, queue, concurrency=1, clock=clock)
+
+    stored, stream, totals = {}, [], Counter()
+    final = {}
+    published_at = defaultdict(list)  # (identityId, courseId) -> offsets of notifying writes
+    position = 0
+    while position < len(writes) or stream or sqs.messages:
+        clock.now += args.tick
+        offset = clock.now - start
+        while position < len(writes) and writes[position][0] <= offset:
+            write = writes[position]
+            key = (write[1], write[2])
+            record, stored[key] = _stream_record(position + 1, write, stored.get(key))
+            stream.append(record)
+            if write[5] != 'rewrite':
+                final[key] = (write[3], str(write[4]))
+                published_at[key].append(write[0])
+            position += 1
+        while stream:
+            batch, stream = stream[:1000], stream[1000:]
+            totals.update(collector.collect(batch))
+        while True:
+            messages = sqs.receive(100)
+            if not messages:
+                break
+            failed, stats = sender.deliver(messages)
+            assert not failed, failed
+            totals.update(stats)
+
+    # Every student's emails, oldest first: the last row seen per course must be its final grade
+    shown, delays = {}, []
+    per_student = Counter()
+    emails_of = {f'student{number}@wiseuni.co.uk': identity_id for number, identity_id in enumerate(students)}
+    for sent_at, to, text in ses.sent:
+        identity_id = emails_of[to]
+        per_student[identity_id] += 1
+        for course_id, grade, points in _ROW.findall(text):
+            key = (identity_id, course_id)
+            shown[key] = (grade, points)
+            waiting = [at for at in published_at[key] if at <= sent_at - start]
+            if waiting:
+                delays.append(sent_at - start - waiting[0])
+                published_at[key] = [at for at in published_at[key] if at > sent_at - start]
+    wrong = sum(1 for key, grade in final.items() if shown.get(key) != grade)
+    return {
+        'emails': len(ses.sent),
+        'per_student_max': max(per_student.values()) if per_student else 0,
+        'per_student_avg': len(ses.sent) / max(1, len(per_student)),
+        'delays': sorted(delays),
+        'wrong': wrong,
+        'left': len(table.pending()),
+        'dynamodb': sum(table.calls.values()),
+        'sqs': sqs.calls,
+        'totals': totals,
+    }
+
+
+def hour(args):
+    students, writes = publishing_hour(args)
+    kinds = Counter(write[5] for write in writes)
+    notifying = kinds['publish'] + kinds['regrade']
+    print(f'{kinds["publish"]:,} grades published for {args.students:,} students in {args.courses} courses within an hour, '
+          f'{kinds["regrade"]} corrected, {kinds["rewrite"]} rewritten unchanged')
+    print(f'  per grade            emails {notifying:>6,}  ({notifying / args.students:.1f} per student)')
+    ok = True
+    for window in args.windows:
+        result = simulate(args, students, writes, window)
+        delays = result['delays']
+        p50 = delays[len(delays) // 2] / 60 if delays else 0
+        print(f'  digests, {window // 60:>3} min window  emails {result["emails"]:>6,}  ({result["emails"] / notifying:>5.1%} of per grade)  '
+              f'per student avg {result["per_student_avg"]:.1f} max {result["per_student_max"]}  '
+              f'delay p50 {p50:>4.1f} min max {(delays[-1] if delays else 0) / 60:>4.1f} min  '
+              f'DynamoDB {result["dynamodb"]:>6,}  SQS {result["sqs"]:>5,}  '
+              f'{"OK" if not result["wrong"] and not result["left"] else "FAIL"}')
+        if result['wrong'] or result['left']:
+            print(f'    {result["wrong"]} final grades not shown, {result["left"]} NOTIFY# items left')
+            ok = False
+    return ok
+
+
+# ========================================
+# 2. SENDING A WINDOW'S DIGESTS
+# ========================================
+
+def sending(args):
+    from wiseuni.digests import digest_message
+
+    courses = {f'CS{100 + course}': {'title': f'Course {100 + course}'} for course in range(args.courses)}
+    rng = random.Random(5)
+    outgoing = []
+    for number in range(args.send_sample):
+        entries = [{'courseId': course_id, 'grade': rng.choice(GRADES), 'points': rng.randint(40, 100)}
+                   for course_id in rng.sample(sorted(courses), args.per_student)]
+        profile = {'email': f'student{number}@wiseuni.co.uk', 'name': f'Student {number}', 'locale': 'en'}
+        outgoing.append((f'id-{number}', profile['email'], digest_message(profile, entries, courses)))
+
+    print(f'\nSending {len(outgoing)} digests, SES {args.ses_ms:.0f} ms per call, {args.ses_rate} emails/s:')
+    session = boto3.session.Session(region_name='us-east-1')
+    for concurrency in (1, DEFAULT_CONCURRENCY):
+        ses = StubSes(args.ses_rate, args.ses_ms / 1000)
+        mailer = Mailer(client=ses.client(session), throughput=ThroughputController('ses-bench', **SEND_RATE))
+        sender = DigestSender(None, mailer, concurrency=concurrency)
+        start = time.perf_counter()
+        results = sender._send_all(outgoing)
+        elapsed = time.perf_counter() - start
+        errors = sum(1 for result in results if isinstance(result, Exception))
+        print(f'  concurrency {concurrency:>2}  sent {len(results) - errors:>5}  failed {errors:>3}  '
+              f'throttles {ses.throttles:>4}  {(len(results) - errors) / elapsed:>6.1f} emails/s  {elapsed:>5.1f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=2_000)
+    parser.add_argument('--courses', type=int, default=40)
+    parser.add_argument('--per-student', type=int, default=10, help='courses per student (grades each)')
+    parser.add_argument('--regrades', type=float, default=0.02)
+    parser.add_argument('--rewrites', type=float, default=0.02)
+    parser.add_argument('--windows', type=int, nargs='+', default=[300, 900, 1800, 3600])
+    parser.add_argument('--tick', type=float, default=10, help='simulated seconds between stream batches / queue polls')
+    parser.add_argument('--send-sample', type=int, default=400)
+    parser.add_argument('--ses-ms', type=float, default=40)
+    parser.add_argument('--ses-rate', type=int, default=50)
+    args = parser.parse_args()
+
+    ok = hour(args)
+    sending(args)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
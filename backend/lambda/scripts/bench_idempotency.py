@@ -0,0 +1,199 @@
+"""
+Idempotency store benchmark
+
+Runs the post_confirmation handler locally under Cognito's retry
+patterns, no AWS account needed: DynamoDB is an in-memory dict and SES a
+stub, both with a fixed per-call latency.
+
+    python backend/lambda/scripts/bench_idempotency.py [--users 100] [--ses-ms 80] [--dynamodb-ms 5]
+
+Patterns, one confirmation per user:
+- same container: the retry reaches the container that answered late
+- new container: the retry reaches a fresh container (empty local tier)
+- overlapping: the retry arrives while the first call is still sending
+- failed send: the first send raises, the retry sends
+
+Reports welcome emails per confirmation (1.00 is right) and the latency
+of the repeat calls, with and without the store.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'post_confirmation'))
+os.environ.setdefault('TABLE_NAME', 'wiseuni-data-bench')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_WARMUP', 'false')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+import index as post_confirmation  # noqa: E402
+from wiseuni.idempotency import IdempotencyStore, Result  # noqa: E402
+from wiseuni.mailer import Mailer  # noqa: E402
+from wiseuni.suppression import SuppressionIndex  # noqa: E402
+
+
+class MemoryTable:
+    """Just enough of the boto3 Table API for the suppression index and the idempotency store"""
+
+    def __init__(self, latency):
+        self.items = {}
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        self.calls += 1
+        time.sleep(self.latency)
+
+    def get_item(self, Key, ConsistentRead=False):
+        self._call()
+        item = self.items.get((Key['PK'], Key['SK']))
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None, **kwargs):
+        self._call()
+        key = (Item['PK'], Item['SK'])
+        with self._lock:
+            old = self.items.get(key)
+            if ConditionExpression and old and not self._claimable(old, ExpressionAttributeValues):
+                error = {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'failed'}}
+                if kwargs.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD':
+                    error['Item'] = dict(old)
+                raise ClientError(error, 'PutItem')
+            self.items[key] = dict(Item)
+
+    @staticmethod
+    def _claimable(old, values):
+        # The idempotency store's claim condition
+        return old['expiresAt'] < values[':now'] or (
+            old['status'] == values[':in_progress'] and old['lockedUntil'] < values[':now_ms'])
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        self._call()
+        names = ExpressionAttributeNames
+        with self._lock:
+            item = self.items.setdefault((Key['PK'], Key['SK']), dict(Key))
+            for assignment in UpdateExpression[len('SET '):].split(', '):
+                name, value = assignment.split(' = ')
+                item[names.get(name, name)] = ExpressionAttributeValues[value]
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None):
+        self._call()
+        with self._lock:
+            item = self.items.get((Key['PK'], Key['SK']))
+            if item and item['status'] == ExpressionAttributeValues[':in_progress']:
+                del self.items[(Key['PK'], Key['SK'])]
+
+
+class StubSes:
+    def __init__(self, latency):
+        self.latency = latency
+        self.sent = 0
+        self.fail_next = set()
+        self._lock = threading.Lock()
+
+    def get_send_quota(self):
+        return {'Max24HourSend': 50_000.0, 'MaxSendRate': 1000.0, 'SentLast24Hours': 0.0}
+
+    def send_email(self, Destination, **kwargs):
+        time.sleep(self.latency)
+        address = Destination['ToAddresses'][0]
+        with self._lock:
+            if address in self.fail_next:
+                self.fail_next.discard(address)
+                raise ClientError({'Error': {'Code': 'MessageRejected', 'Message': 'rejected'}}, 'SendEmail')
+            self.sent += 1
+            return {'MessageId': f'msg-{self.sent}'}
+
+
+class Context:
+    def get_remaining_time_in_millis(self):
+        return 30_000
+
+
+def confirmation(i):
+    return {
+        'triggerSource': 'PostConfirmation_ConfirmSignUp',
+        'userName': f'user{i}',
+        'request': {'userAttributes': {
+            'sub': f'sub-{i}', 'email': f'student{i}@example.com', 'name': f'Student {i}',
+        }},
+    }
+
+
+class Unprotected:
+    """The handler as before: every call sends"""
+
+    def run(self, key, action, context=None):
+        return Result(action(), False)
+
+
+def call(store, event):
+    post_confirmation.idempotency = store
+    start = time.perf_counter()
+    post_confirmation.handler(event, Context())
+    return time.perf_counter() - start
+
+
+def run(pattern, users, table, ses, with_store):
+    """(emails per confirmation, repeat call latencies)"""
+    ses.sent = 0
+    repeats = []
+    for i in range(users):
+        event = confirmation(f'{pattern}-{i}')
+        email = event['request']['userAttributes']['email']
+        if with_store:
+            first, second = IdempotencyStore(table), IdempotencyStore(table)
+        else:
+            # The handler without the store
+            first = second = Unprotected()
+        if pattern == 'same container':
+            call(first, event)
+            repeats.append(call(first, event))
+        elif pattern == 'new container':
+            call(first, event)
+            repeats.append(call(second, event))
+        elif pattern == 'overlapping':
+            thread = threading.Thread(target=call, args=(first, event))
+            thread.start()
+            time.sleep(ses.latency / 2)  # Retry while the first call is sending
+            repeats.append(call(second, event))
+            thread.join()
+        elif pattern == 'failed send':
+            ses.fail_next.add(email)
+            call(first, event)
+            repeats.append(call(second, event))
+    return ses.sent / users, repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--ses-ms', type=float, default=80)
+    parser.add_argument('--dynamodb-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    table = MemoryTable(args.dynamodb_ms / 1000)
+    ses = StubSes(args.ses_ms / 1000)
+    post_confirmation.mailer = Mailer(ses, throughput=None)
+    post_confirmation.suppression_index = SuppressionIndex(table)
+    post_confirmation.logger.disabled = True
+
+    print(f'{"pattern":<16} {"store":<6} {"emails/user":>11} {"repeat p50":>11} {"repeat max":>11}')
+    for pattern in ('same container', 'new container', 'overlapping', 'failed send'):
+        for with_store in (False, True):
+            emails, repeats = run(pattern, args.users, table, ses, with_store)
+            repeats.sort()
+            print(f'{pattern:<16} {"yes" if with_store else "no":<6} {emails:>11.2f} '
+                  f'{repeats[len(repeats) // 2] * 1000:>9.1f}ms {repeats[-1] * 1000:>9.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Sparse index benchmark: index storage, index write units and query plans
+
+Runs locally, no AWS account needed: a synthetic term of profiles,
+enrolments, grades and courses is sized item by item (DynamoDB's size
+rules, wiseuni/items.py) under both designs:
+- GSI1: every item keyed on GSI1, ProjectionType ALL
+- dedicated: RoleIndex / RosterIndex / GradeIndex / CatalogIndex with
+  their projections (wiseuni/indexes.py)
+
+    python backend/lambda/scripts/bench_indexes.py [--students 20000]
+
+Reports index storage, index write units for the term's writes (an index
+copy is written when a key or a projected attribute changes: 1 WCU per
+started KB of the copy), and the planner's choice and read units for
+each access pattern.
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+from decimal import Decimal
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni import indexes  # noqa: E402
+from wiseuni.items import item_size  # noqa: E402
+
+TABLE_KEYS = ('PK', 'SK')
+
+
+def make_term(students, rng):
+    """(item, [changed attribute sets of later updates]) for a term"""
+    term = []
+    courses = [f'C{number:03d}' for number in range(max(10, students // 60))]
+    for course_id in courses:
+        term.append(({
+            'PK': f'COURSE#{course_id}', 'SK': 'METADATA', 'courseId': course_id,
+            'title': 'Intro to Computer Science', 'description': 'Programming fundamentals. ' * 8,
+            'professorId': f'eu-west-2:{rng.getrandbits(128):032x}', 'professorName': 'Dr. Ayşe Yılmaz',
+            'credits': Decimal(6), 'semester': '2024-FALL',
+        }, []))
+    for _ in range(students):
+        identity_id = f'eu-west-2:{rng.getrandbits(128):032x}'
+        pk = f'USER#{identity_id}'
+        # Profile: a few edits (name, locale) and logins (updatedAt) per term
+        term.append(({
+            'PK': pk, 'SK': 'PROFILE', 'identityId': identity_id, 'email': f'{identity_id[-8:]}@uni.example',
+            'name': 'Ayşe Kaya', 'role': 'student', 'locale': 'tr', 'version': Decimal(3),
+            'createdAt': '2024-09-01T10:00:00.000Z', 'updatedAt': '2024-09-01T10:00:00.000Z',
+        }, [{'updatedAt', 'version', rng.choice(['name', 'locale', 'locale'])} for _ in range(4)]))
+        for course_id in rng.sample(courses, 5):
+            # Enrolment: status changes once; grade: regraded once
+            term.append(({
+                'PK': pk, 'SK': f'ENROLLMENT#{course_id}', 'identityId': identity_id, 'courseId': course_id,
+                'courseName': 'Intro to Computer Science', 'professorName': 'Dr. Ayşe Yılmaz',
+                'enrolledAt': '2024-09-02T08:15:00.000Z', 'status': 'active',
+            }, [{'status'}]))
+            term.append(({
+                'PK': pk, 'SK': f'GRADE#{course_id}', 'identityId': identity_id, 'courseId': course_id,
+                'courseName': 'Intro to Computer Science', 'grade': 'B+', 'points': Decimal(87),
+                'gradedAt': '2024-12-20T16:00:00.000Z', 'gradedBy': f'eu-west-2:{rng.getrandbits(128):032x}',
+            }, [{'grade', 'points', 'gradedAt'}]))
+    return term
+
+
+def gsi1_copy(item):
+    keys = indexes.index_keys(item)
+    if not keys:
+        return None
+    (_, pk), (_, sk) = keys.items()
+    return {**item, 'GSI1PK': pk, 'GSI1SK': sk}
+
+
+def dedicated_copy(item):
+    keys = indexes.index_keys(item)
+    if not keys:
+        return None, None
+    index = next(index for index in indexes.INDEXES.values() if index.pk in keys)
+    copy = {name: value for name, value in item.items() if name in TABLE_KEYS or name in index.projected}
+    return {**copy, **keys}, index
+
+
+def write_units(size):
+    return math.ceil(size / 1024)
+
+
+def measure(term):
+    totals = {'gsi1': [0, 0], 'dedicated': [0, 0]}  # [bytes stored, write units]
+    for item, updates in term:
+        copy = gsi1_copy(item)
+        if copy:
+            size = item_size(copy)
+            totals['gsi1'][0] += size
+            # ALL: every write of the item rewrites its index copy
+            totals['gsi1'][1] += write_units(size) * (1 + len(updates))
+        copy, index = dedicated_copy(item)
+        if copy:
+            size = item_size(copy)
+            totals['dedicated'][0] += size
+            touched = sum(1 for changed in updates if changed & index.projected)
+            totals['dedicated'][1] += write_units(size) * (1 + touched)
+    return totals
+
+
+class PlannerTable:
+    """Just enough of a Table for plan(): every index ACTIVE and backfilled"""
+    name = 'bench'
+
+    @staticmethod
+    def query(**kwargs):
+        return {'Items': [indexes.backfill_key(name) for name in indexes.INDEXES]}
+
+    class meta:
+        class client:
+            @staticmethod
+            def describe_table(TableName):
+                return {'Table': {'GlobalSecondaryIndexes': [
+                    {'IndexName': name, 'IndexStatus': 'ACTIVE'} for name in indexes.INDEXES
+                ]}}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=20_000)
+    args = parser.parse_args()
+
+    term = make_term(args.students, random.Random(42))
+    totals = measure(term)
+    writes = sum(1 + len(updates) for _, updates in term)
+    print(f'{len(term):,} items, {writes:,} writes in the term')
+    for name, (stored, units) in totals.items():
+        print(f'  {name:>9}: index storage {stored / 2**20:7.1f} MiB, index write units {units:9,}')
+    gsi1, dedicated = totals['gsi1'], totals['dedicated']
+    print(f'  dedicated / GSI1: storage {dedicated[0] / gsi1[0]:.0%}, write units {dedicated[1] / gsi1[1]:.0%}')
+
+    print('Query plans (100 items):')
+    table = PlannerTable()
+    for pattern, attributes in (
+        ('users_by_role', ['email', 'name']),
+        ('users_by_role', ['email', 'name', 'locale', 'updatedAt']),
+        ('course_roster', ['enrolledAt', 'status']),
+        ('course_grades', ['grade', 'points']),
+        ('course_grades', ['grade', 'points', 'gradedBy']),
+        ('semester_courses', []),
+    ):
+        chosen = indexes.plan(table, pattern, attributes)
+        fallback = indexes.read_units(indexes.PATTERNS[pattern], indexes.INDEXES['GSI1'], False, 100)
+        print(f'  {pattern:>16} {",".join(attributes) or "(keys)":<32} -> {chosen.index:<12} '
+              f'fetch={str(chosen.fetch):<5} {chosen.read_units:5.1f} RCU (GSI1 ALL: {fallback:.1f})')
+
+
+if __name__ == '__main__':
+    main()
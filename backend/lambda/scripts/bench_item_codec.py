@@ -0,0 +1,142 @@
+"""
+Compact item encoding benchmark
+
+Runs locally, no AWS account needed: synthetic enrolment and grade items,
+shaped like the ones the frontend writes, are encoded and decoded.
+
+    python backend/lambda/scripts/bench_item_codec.py [--items 200000]
+
+Reports:
+- average item size, legacy vs compact (GSI1 stores the same again)
+- read units for one student's summary Query and for a course-wide GSI1 query
+- encode / decode time per item
+- round trip: decode(encode(item)) == item for every item, and for the
+  edge cases in EDGE_CASES (exits 1 on a mismatch)
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni.items import decode, encode, item_course_id, item_size  # noqa: E402
+
+COURSES = {
+    f'C{number:03d}': {'title': title, 'professorName': professor}
+    for number, (title, professor) in enumerate([
+        ('Intro to Computer Science', 'Dr. Ayşe Yılmaz'),
+        ('Discrete Mathematics', 'Prof. John Smith'),
+        ('Modern European History', 'Dr. Marie Dubois'),
+        ('Linear Algebra', 'Prof. Kenji Tanaka'),
+        ('Organic Chemistry II', 'Dr. Priya Raman'),
+    ] * 40)
+}
+
+# Items the generator does not produce: attributes a kind has no short name for, odd values
+EDGE_CASES = [{'PK': 'USER#a', 'identityId': 'a', **item} for item in [
+    {'SK': 'GRADE#C000', 'courseId': 'C000', 'courseName': 'Intro to Computer Science',
+     'grade': 'A', 'status': 'completed'},
+    {'SK': 'GRADE#C000', 'courseId': 'C000', 'courseName': 'Intro to Computer Science',
+     'grade': 'B', 'status': 'withdrawn', 'gradedAt': 'yesterday'},
+    {'SK': 'ENROLLMENT#C000', 'courseId': 'C000', 'courseName': 'Renamed course',
+     'professorName': 'Dr. Ayşe Yılmaz', 'status': 'audit'},
+    {'SK': 'ENROLLMENT#C001', 'courseId': 'C001', 'courseName': 'Discrete Mathematics',
+     'professorName': 'Prof. John Smith', 'status': 'completed', 'enrolledAt': '2024-09-01T10:00:00.000Z'},
+]]
+
+
+def iso(moment):
+    # What the frontend writes: new Date().toISOString()
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def make_items(count, rng):
+    start = datetime(2024, 9, 1, tzinfo=timezone.utc)
+    items = []
+    for number in range(count):
+        identity_id = f'eu-west-2:{rng.getrandbits(128):032x}'
+        course_id = rng.choice(list(COURSES))
+        course = COURSES[course_id]
+        moment = iso(start + timedelta(seconds=rng.randrange(10_000_000)))
+        base = {
+            'identityId': identity_id,
+            'courseId': course_id,
+            'courseName': course['title'],
+            'GSI1PK': f'COURSE#{course_id}',
+        }
+        if number % 2:
+            items.append({
+                **base,
+                'PK': f'USER#{identity_id}', 'SK': f'ENROLLMENT#{course_id}',
+                'GSI1SK': f'USER#{identity_id}',
+                'professorName': course['professorName'],
+                'enrolledAt': moment,
+                'status': rng.choice(['active', 'active', 'completed', 'dropped']),
+            })
+        else:
+            items.append({
+                **base,
+                'PK': f'USER#{identity_id}', 'SK': f'GRADE#{course_id}',
+                'GSI1SK': f'GRADE#{identity_id}',
+                'grade': rng.choice(['A', 'A-', 'B+', 'B', 'C']),
+                'points': Decimal(rng.randrange(50, 100)),
+                'gradedAt': moment,
+                'gradedBy': f'eu-west-2:{rng.getrandbits(128):032x}',
+            })
+    return items
+
+
+def read_units(sizes):
+    # Query: item sizes summed, then rounded up to 4 KB; eventually consistent = half
+    return math.ceil(sum(sizes) / 4096) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=200_000)
+    args = parser.parse_args()
+
+    items = make_items(args.items, random.Random(42))
+
+    start = time.perf_counter()
+    encoded = [encode(item, COURSES[item_course_id(item)]) for item in items]
+    encode_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = [decode(item, COURSES[item_course_id(item)]) for item in encoded]
+    decode_seconds = time.perf_counter() - start
+    mismatches = sum(1 for before, after in zip(items, decoded) if before != after)
+    edge_failures = [item for item in EDGE_CASES
+                     if decode(encode(item, COURSES[item_course_id(item)]), COURSES[item_course_id(item)]) != item]
+
+    legacy_sizes = [item_size(item) for item in items]
+    compact_sizes = [item_size(item) for item in encoded]
+    legacy_avg = sum(legacy_sizes) / len(items)
+    compact_avg = sum(compact_sizes) / len(items)
+
+    print(f'{len(items):,} items (half enrolments, half grades)')
+    print(f'  item size:   legacy {legacy_avg:6.1f} B, compact {compact_avg:6.1f} B '
+          f'({compact_avg / legacy_avg:.0%}; table + GSI1 copy per item: '
+          f'{2 * legacy_avg:.0f} B -> {2 * compact_avg:.0f} B)')
+    print(f'  items per 4 KB read unit: legacy {4096 / legacy_avg:5.1f}, compact {4096 / compact_avg:5.1f}')
+    # A student with 8 enrolments + 8 grades; a 600-student course on GSI1
+    print(f'  summary Query (16 items):  legacy {read_units(legacy_sizes[:16]):4.1f} RCU, '
+          f'compact {read_units(compact_sizes[:16]):4.1f} RCU')
+    print(f'  course Query (600 items):  legacy {read_units(legacy_sizes[:600]):4.1f} RCU, '
+          f'compact {read_units(compact_sizes[:600]):4.1f} RCU')
+    print(f'  encode {encode_seconds / len(items) * 1e6:5.2f} us/item, '
+          f'decode {decode_seconds / len(items) * 1e6:5.2f} us/item')
+    print(f'  round trip mismatches: {mismatches}')
+    print(f'  edge cases: {len(EDGE_CASES) - len(edge_failures)}/{len(EDGE_CASES)} round trip'
+          + ''.join(f'\n    FAILED: {item}' for item in edge_failures))
+    sys.exit(1 if mismatches or edge_failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Profiling hook benchmark
+
+Runs locally, no AWS account needed.
+
+    python backend/lambda/scripts/bench_profiling.py [--invocations 300] [--rounds 3]
+
+Two handlers behind @profiled (wiseuni/profiling.py):
+- pre_signup: the real trigger, microseconds of work (the hook's fixed cost)
+- digest: a 50-row grade digest render and a 10 ms wait standing in for
+  the SES call (a typical handler: some CPU, mostly waiting on AWS)
+each with profiling off, at a 1% sample rate and at 100% in sample, cprofile
+and sample + memory mode. Reports the median invocation time (best of
+--rounds) and what the hook adds to the undecorated handler, then checks
+the files written: collapsed stacks that parse, .pstats that pstats loads,
+and that the sampler saw the handler's own frames.
+"""
+
+import argparse
+import importlib.util
+import inspect
+import logging
+import os
+import pstats
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni import profiling  # noqa: E402
+from wiseuni.templates import render, warm  # noqa: E402
+
+CONFIGS = [
+    ('off', {}),
+    ('1% sample', {'PROFILE_SAMPLE_RATE': '0.01'}),
+    ('sample', {'PROFILE_SAMPLE_RATE': '1'}),
+    ('cprofile', {'PROFILE_SAMPLE_RATE': '1', 'PROFILE_MODE': 'cprofile'}),
+    ('sample+memory', {'PROFILE_SAMPLE_RATE': '1', 'PROFILE_MEMORY': '1'}),
+]
+SEND_SECONDS = 0.01
+VARIABLES = ('PROFILE_SAMPLE_RATE', 'PROFILE_MODE', 'PROFILE_MEMORY', 'PROFILE_OUTPUT', 'PROFILE_INTERVAL_MS')
+
+
+def signup_event():
+    return {'request': {'userAttributes': {'email': f'student{uuid.uuid4().hex[:8]}@wiseuni.co.uk'}}, 'response': {}}
+
+
+def digest_handler(event, context):
+    rows = [{'course': f'Course {i}', 'courseId': f'CS{i:03}', 'grade': 'A', 'points': str(90 + i % 10)}
+            for i in range(50)]
+    template = render('grade_digest', 'en', name='Ada', count=str(len(rows)), rows=rows)
+    time.sleep(SEND_SECONDS)
+    return {'size': len(template.html) + len(template.text)}
+
+
+def load_pre_signup():
+    """A fresh import, so @profiled sees the current environment"""
+    path = os.path.join(LAMBDA_DIR, 'pre_signup', 'index.py')
+    spec = importlib.util.spec_from_file_location(f'pre_signup_{uuid.uuid4().hex}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.logger.disabled = True
+    return module.handler
+
+
+def time_calls(handler, make_event, args):
+    """Best median of the rounds"""
+    medians = []
+    for _ in range(args.rounds):
+        durations = []
+        for _ in range(args.invocations):
+            context = SimpleNamespace(function_name='bench', aws_request_id=uuid.uuid4().hex)
+            event = make_event()
+            started = time.perf_counter()
+            handler(event, context)
+            durations.append(time.perf_counter() - started)
+        medians.append(statistics.median(durations))
+    return min(medians)
+
+
+def check_output(output, frame=None):
+    """(files, problems) of everything written under output; frame: must show up in the sampled stacks"""
+    files, problems, sampled = 0, [], 0
+    for directory, _, names in os.walk(output):
+        for name in names:
+            path = os.path.join(directory, name)
+            files += 1
+            try:
+                if name.endswith('.pstats'):
+                    pstats.Stats(path)
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        stack, count = line.rstrip('\n').rsplit(' ', 1)
+                        if not stack or int(count) <= 0:
+                            raise ValueError(f'bad line {line!r}')
+                        sampled += frame is not None and frame in stack
+            except Exception as e:
+                problems.append(f'{name}: {e}')
+    if frame is not None and files and not sampled:
+        problems.append(f'{frame} never sampled')
+    return files, problems
+
+
+def reset_environment():
+    for variable in VARIABLES:
+        os.environ.pop(variable, None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--invocations', type=int, default=300)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.getLogger('wiseuni.profiling').disabled = True
+    warm('grade_digest')
+    # name, handler factory (decorated with the current environment), event, frame the sampler must see
+    workloads = [
+        ('pre_signup', load_pre_signup, signup_event, None),
+        ('digest', lambda: profiling.profiled(digest_handler), dict, 'digest_handler'),
+    ]
+    output = tempfile.mkdtemp(prefix='profiles-')
+    failed = False
+    try:
+        for name, load, make_event, frame in workloads:
+            reset_environment()
+            baseline = load()
+            if baseline is not inspect.unwrap(baseline):
+                print(f'{name}: wrapped with profiling off')
+                failed = True
+            base = time_calls(inspect.unwrap(baseline), make_event, args)
+            print(f'{name}, {args.invocations} invocations x {args.rounds} rounds: {base * 1e6:,.0f} us median undecorated')
+
+            for label, environment in CONFIGS:
+                reset_environment()
+                os.environ.update(environment, PROFILE_OUTPUT=os.path.join(output, name, label))
+                median = time_calls(load(), make_event, args)
+                sampler = 'PROFILE_MODE' not in environment and label != 'off'
+                files, problems = check_output(os.path.join(output, name, label), frame if sampler else None)
+                print(f'  {label:<14} {median * 1e6:>9,.0f} us  {(median - base) * 1e6:>+8,.0f} us  {median / base - 1:>+8.1%}'
+                      f'  files {files:>5}  {"OK" if not problems else problems[0]}')
+                failed = failed or bool(problems)
+            print()
+    finally:
+        reset_environment()
+        shutil.rmtree(output, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
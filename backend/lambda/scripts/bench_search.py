@@ -0,0 +1,119 @@
+"""
+Admin search benchmark
+
+Runs locally, no AWS account needed: synthetic profiles and courses are
+indexed by wiseuni/search.py, snapshot and loaded back, then searched.
+
+    python backend/lambda/scripts/bench_search.py [--users 100000]
+
+Reports:
+- build time, snapshot size and load time (a search container's cold start)
+- query latency (median / p99) for prefix, multi-word, email, typo and
+  course queries, next to filtering every profile the way the admin
+  page did in the browser (accent-folded substring match)
+- stream updates per second (upsert + remove)
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni.search import SearchIndex, fold  # noqa: E402
+
+FIRST = ['Ayşe', 'Mehmet', 'Zeynep', 'Emre', 'Elif', 'Can', 'Oliver', 'Amelia', 'Jack', 'Isla', 'Noah',
+         'Sophie', 'Liam', 'Chloé', 'José', 'Björn', 'Ana', 'Yusuf', 'Hana', 'Mateo', 'Priya', 'Wei']
+LAST = ['Yılmaz', 'Kaya', 'Demir', 'Şahin', 'Çelik', 'Smith', 'Jones', 'Taylor', 'Brown', 'Williams',
+        'García', 'Müller', 'Novák', 'Kowalski', 'Nguyen', 'Patel', 'Chen', 'Okafor', 'Rossi', 'Dubois']
+SUBJECTS = ['Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Economics', 'History',
+            'Linguistics', 'Philosophy', 'Biology', 'Statistics']
+LEVELS = ['Introduction to', 'Advanced', 'Topics in', 'Foundations of', 'Research Methods in']
+
+
+def make_documents(users, rng):
+    docs = []
+    for number in range(users):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        role = 'student' if number % 50 else rng.choice(['professor', 'admin'])
+        email = f'{fold(first)}.{fold(last)}{number}@uni.example'
+        docs.append((f'USER#eu-west-2:{number:08x}', role, f'{first} {last}', email))
+    for number in range(max(20, users // 50)):
+        title = f'{rng.choice(LEVELS)} {rng.choice(SUBJECTS)} {rng.randrange(100, 500)}'
+        docs.append((f'COURSE#C{number:04d}', 'course', title, f'C{number:04d}'))
+    return docs
+
+
+def linear_search(docs, query):
+    """What filtering every listed profile costs"""
+    needle = fold(query)
+    return [doc for doc in docs if needle in fold(doc[2]) or needle in fold(doc[3])]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return result, statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    docs = make_documents(args.users, rng)
+
+    started = time.perf_counter()
+    built = SearchIndex.build(docs)
+    build_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    snapshot = built.to_bytes()
+    snapshot_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    index = SearchIndex.from_bytes(snapshot)
+    load_seconds = time.perf_counter() - started
+    print(f'{len(index):,} documents, {len(index.words):,} words, {len(index.grams):,} trigrams')
+    print(f'  build {build_seconds:.2f}s, snapshot {len(snapshot) / 2**20:.1f} MiB in {snapshot_seconds:.2f}s, '
+          f'load {load_seconds * 1000:.0f} ms')
+
+    print('Queries (ms, median / p99):')
+    for query, kinds in (
+        ('ay', None),
+        ('ayse yil', None),
+        ('zeynep sahin', ('student',)),
+        (docs[12345 % args.users][3], None),
+        ('yilmz', None),
+        ('kowalsky', None),
+        ('advanced phys', ('course',)),
+    ):
+        results, median, p99 = timed(lambda: index.search(query, kinds), args.repeat)
+        _, linear_median, _ = timed(lambda: linear_search(docs, query), 3)
+        top = results[0]['name'] if results else '-'
+        print(f'  {query!r:<36} {median:6.2f} / {p99:6.2f}  (linear {linear_median:7.1f})  '
+              f'{len(results):2} results, top: {top}')
+
+    updates = [(doc[0], doc[1], rng.choice(FIRST) + ' ' + rng.choice(LAST), doc[3])
+               for doc in rng.sample(docs[:args.users], min(5000, args.users))]
+    started = time.perf_counter()
+    for doc in updates:
+        index.upsert(doc)
+    removed = updates[:1000]
+    for doc in removed:
+        index.remove(doc[0])
+    update_seconds = time.perf_counter() - started
+    changes = len(updates) + len(removed)
+    print(f'  {changes:,} stream updates: {changes / update_seconds:,.0f}/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Storage accounting benchmark
+
+Runs locally, no AWS account needed: a synthetic gzipped CSV inventory is
+written to a temporary directory and served in place of S3.
+
+    python backend/lambda/scripts/bench_storage_accounting.py [--objects 2000000] [--files 4]
+
+Reports:
+- accounting throughput (inventory rows per second)
+- peak Python heap during the pass, at a quarter and at the full size
+  (should stay flat: totals grow with users and courses, not objects)
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import quote
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'storage_accounting'))
+os.environ.setdefault('TABLE_NAME', 'wiseuni-data-bench')
+os.environ.setdefault('BUCKET_NAME', 'wiseuni-uploads-bench')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import index as accounting  # noqa: E402
+
+SCHEMA = 'Bucket, Key, VersionId, IsLatest, IsDeleteMarker, Size, LastModifiedDate, StorageClass'
+
+
+class LocalS3:
+    """get_object over files in a directory"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_object(self, Bucket, Key, **kwargs):
+        return {'Body': open(os.path.join(self.root, Key.replace('/', '_')), 'rb')}
+
+
+def write_inventory(root, objects, files, users, courses):
+    rng = random.Random(42)
+    names = []
+    per_file = objects // files
+    for number in range(files):
+        name = f'data/part-{number}.csv.gz'
+        names.append({'key': name})
+        with gzip.open(os.path.join(root, name.replace('/', '_')), 'wt', newline='', compresslevel=1) as out:
+            writer = csv.writer(out, quoting=csv.QUOTE_ALL)
+            for i in range(per_file):
+                user = rng.randrange(users)
+                key = f'students/eu-west-2:{user:08d}/C{rng.randrange(courses)}/hw{i % 5}/report {i}.pdf'
+                writer.writerow([
+                    os.environ['BUCKET_NAME'], quote(key), f'v{i}', 'true' if i % 4 else 'false', 'false',
+                    rng.randrange(10_000, 5_000_000), '2024-10-01T09:30:00.000Z', 'STANDARD',
+                ])
+    manifest = {
+        'destinationBucket': 'arn:aws:s3:::inventory',
+        'fileFormat': 'CSV',
+        'fileSchema': SCHEMA,
+        'files': names,
+    }
+    with open(os.path.join(root, 'manifest.json'), 'w') as out:
+        json.dump(manifest, out)
+
+
+def run(root, closed):
+    sources = accounting.manifest_files('inventory', 'manifest.json')
+    start = time.perf_counter()
+    totals = accounting.account(sources, closed)
+    return totals, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=int, default=2_000_000)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--courses', type=int, default=300)
+    args = parser.parse_args()
+
+    closed = {f'C{i}' for i in range(0, args.courses, 3)}
+    with tempfile.TemporaryDirectory() as root:
+        accounting.s3 = LocalS3(root)
+
+        peaks = []
+        for objects in (args.objects // 4, args.objects):
+            write_inventory(root, objects, args.files, args.users, args.courses)
+            totals, elapsed = run(root, closed)
+            print(f'{totals.rows:>10,} rows: {totals.rows / elapsed:,.0f} rows/s '
+                  f'({len(totals.users):,} users, {len(totals.courses):,} courses)')
+
+            tracemalloc.start()
+            run(root, closed)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        print(f'peak heap: {peaks[0] / 1024 ** 2:.1f} MiB at {args.objects // 4:,} objects, '
+              f'{peaks[1] / 1024 ** 2:.1f} MiB at {args.objects:,}')
+
+        report = accounting.tiering_report(totals, closed)
+        print(f'tiering candidates: {len(report)} closed courses, '
+              f'~${sum(c["estimatedMonthlySavingUsd"] for c in report):,.2f}/month')
+
+
+if __name__ == '__main__':
+    main()
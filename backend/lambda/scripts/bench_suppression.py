@@ -0,0 +1,108 @@
+"""
+Suppression index benchmark
+
+Runs locally, no AWS account needed: DynamoDB is replaced by an in-memory
+dict and SES notifications are generated from a fixture template.
+
+    python backend/lambda/scripts/bench_suppression.py [--suppressed 50000]
+
+Reports:
+- feedback processor throughput (SQS records parsed + suppressed per second)
+- sender check throughput (is_suppressed calls per second)
+- DynamoDB reads per 1000 checks (Bloom filter should keep this near 10)
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'ses_feedback'))
+os.environ.setdefault('TABLE_NAME', 'wiseuni-data-bench')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import index as feedback  # noqa: E402
+from wiseuni.suppression import SuppressionIndex  # noqa: E402
+
+BOUNCE_FIXTURE = {
+    'notificationType': 'Bounce',
+    'bounce': {
+        'bounceType': 'Permanent',
+        'bounceSubType': 'General',
+        'bouncedRecipients': [{'emailAddress': None, 'diagnosticCode': 'smtp; 550 5.1.1 user unknown'}],
+        'feedbackId': 'bench',
+    },
+    'mail': {'source': 'noreply@wiseuni.co.uk'},
+}
+
+
+class MemoryTable:
+    """Just enough of the boto3 Table API for the suppression index"""
+
+    def __init__(self):
+        self.items = {}
+        self.reads = 0
+
+    def get_item(self, Key, ConsistentRead=False):
+        self.reads += 1
+        item = self.items.get((Key['PK'], Key['SK']))
+        return {'Item': item} if item else {}
+
+    def put_item(self, Item, **kwargs):
+        self.items[(Item['PK'], Item['SK'])] = Item
+
+    def batch_writer(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def sqs_record(email):
+    notification = json.loads(json.dumps(BOUNCE_FIXTURE))
+    notification['bounce']['bouncedRecipients'][0]['emailAddress'] = email
+    envelope = {'Type': 'Notification', 'Message': json.dumps(notification)}
+    return {'messageId': email, 'body': json.dumps(envelope)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--suppressed', type=int, default=50_000)
+    parser.add_argument('--checks', type=int, default=200_000)
+    args = parser.parse_args()
+
+    table = MemoryTable()
+    feedback.suppression_index = SuppressionIndex(table)
+
+    records = [sqs_record(f'bounced{i}@example.com') for i in range(args.suppressed)]
+    start = time.perf_counter()
+    for i in range(0, len(records), 10):
+        feedback.handler({'Records': records[i:i + 10]}, None)
+    elapsed = time.perf_counter() - start
+    print(f'feedback processor: {args.suppressed / elapsed:,.0f} notifications/s')
+
+    # Fresh sender-side index, as in a newly started post_confirmation container
+    sender = SuppressionIndex(table)
+    table.reads = 0
+    start = time.perf_counter()
+    hits = 0
+    for i in range(args.checks):
+        # 1 in 100 checks targets a suppressed address
+        email = f'bounced{i}@example.com' if i % 100 == 0 else f'student{i}@example.com'
+        hits += sender.is_suppressed(email)
+    elapsed = time.perf_counter() - start
+
+    print(f'sender check:       {args.checks / elapsed:,.0f} checks/s '
+          f'({elapsed / args.checks * 1e6:.2f} us/check)')
+    print(f'suppressed hits:    {hits}')
+    print(f'DynamoDB reads:     {table.reads} ({table.reads / args.checks * 1000:.1f} per 1000 checks)')
+
+
+if __name__ == '__main__':
+    main()
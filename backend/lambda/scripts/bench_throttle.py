@@ -0,0 +1,167 @@
+"""
+DynamoDB throughput controller benchmark
+
+Runs locally, no AWS account needed: a fake DynamoDB endpoint with a fixed
+capacity (token bucket, ThrottlingException when exceeded) is started on
+localhost and real boto3 clients talk to it.
+
+    python backend/lambda/scripts/bench_throttle.py [--capacity 400] [--seconds 10] [--writers 16]
+
+Two runs, each with bulk writers (BatchWriteItem of 25) saturating the
+table while an interactive client does one GetItem every 20 ms:
+- sdk:        bulk writers rely on the SDK's standard retries
+- controlled: bulk writers share a BULK ThroughputController
+
+Reports items written per second, throttled requests, and the share and
+p99 latency of interactive reads that were throttled.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-2')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+
+import boto3  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from wiseuni.throttle import BULK, INTERACTIVE, ThroughputController  # noqa: E402
+
+TABLE = 'bench'
+
+
+class Capacity:
+    """Item-per-second budget of the fake table"""
+
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.tokens = per_second
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.throttled = 0
+
+    def take(self, items):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.per_second, self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            # Like a hot partition: while over budget, every request is throttled
+            if self.tokens <= 0:
+                self.throttled += 1
+                return False
+            self.tokens -= items
+            return True
+
+
+def fake_dynamodb(capacity):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            operation = self.headers['X-Amz-Target'].split('.')[-1]
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            items = sum(len(requests) for requests in body.get('RequestItems', {}).values()) or 1
+            time.sleep(0.003)  # Service time
+            if capacity.take(items):
+                status, payload = 200, {'UnprocessedItems': {}} if operation == 'BatchWriteItem' else {}
+            else:
+                status = 400
+                payload = {'__type': 'com.amazonaws.dynamodb.v20120810#ThrottlingException',
+                           'message': 'Rate of requests exceeds the allowed throughput.'}
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/x-amz-json-1.0')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_client(endpoint, controller=None, pool=50):
+    client = boto3.session.Session().client(
+        'dynamodb', endpoint_url=endpoint,
+        config=Config(retries={'mode': 'standard', 'max_attempts': 10}, max_pool_connections=pool),
+    )
+    if controller is not None:
+        controller.attach(client)
+    return client
+
+
+def run(label, endpoint, capacity, seconds, writers, controlled):
+    controller = ThroughputController(f'bulk-{label}', **BULK) if controlled else None
+    bulk = make_client(endpoint, controller)
+    interactive = make_client(endpoint, ThroughputController(f'interactive-{label}', **INTERACTIVE))
+    stop = time.monotonic() + seconds
+    written = [0]
+    reads = []
+    lock = threading.Lock()
+
+    def writer(number):
+        batch = [{'PutRequest': {'Item': {'PK': {'S': f'BENCH#{number}'}, 'SK': {'S': str(i)}}}} for i in range(25)]
+        while time.monotonic() < stop:
+            try:
+                bulk.batch_write_item(RequestItems={TABLE: batch})
+                with lock:
+                    written[0] += 25
+            except bulk.exceptions.ClientError:
+                pass
+
+    def reader():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            throttled = False
+            try:
+                response = interactive.get_item(TableName=TABLE, Key={'PK': {'S': 'USER#1'}, 'SK': {'S': 'PROFILE'}})
+                throttled = response['ResponseMetadata']['RetryAttempts'] > 0
+            except interactive.exceptions.ClientError:
+                throttled = True
+            reads.append((time.perf_counter() - start, throttled))
+            time.sleep(0.02)
+
+    capacity.throttled = 0
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)] + [threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(latency for latency, _ in reads)
+    throttled_reads = sum(1 for _, throttled in reads if throttled)
+    print(f'{label:>10}: {written[0] / seconds:7,.0f} items/s written, {capacity.throttled:6,} throttled requests, '
+          f'interactive reads throttled {throttled_reads / len(reads):6.1%}, '
+          f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.1f} ms')
+    if controller is not None:
+        print(f'{"":>10}  controller: {controller.stats()}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capacity', type=int, default=400, help='items per second the fake table accepts')
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--writers', type=int, default=16)
+    args = parser.parse_args()
+
+    for label, controlled in (('sdk', False), ('controlled', True)):
+        capacity = Capacity(args.capacity)
+        server = fake_dynamodb(capacity)
+        endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+        run(label, endpoint, capacity, args.seconds, args.writers, controlled)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+User migration benchmark
+
+Runs locally, no AWS account needed: the legacy directory is a generated
+SQLite (and CSV) export in a temporary folder, DynamoDB an in-memory dict
+and Cognito a stub.
+
+    python backend/lambda/scripts/bench_user_migration.py [--students 20000] [--logins 1000] [--directory-ms 8]
+
+1. The trigger and the claim: right / wrong / unknown passwords, password
+   reset, the staged profile and its claim on the first credential
+   exchange (USER#<identityId> / PROFILE, RoleIndex keys, group)
+2. Login traffic against a remote legacy database (--directory-ms per
+   query, --connect-ms per new connection): every student logs in, some
+   mistype their password first, some usernames are unknown and retried
+   - per call:  a new connection and query on every invocation
+   - cached:    the trigger's CachedDirectory over one kept connection
+   Reports directory connections and queries, and lookup latency.
+3. One-off costs per container: loading the CSV export, one PBKDF2 check
+"""
+
+import argparse
+import csv
+import importlib.util
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+os.environ.setdefault('TABLE_NAME', 'wiseuni-data-bench')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_WARMUP', 'false')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from wiseuni import migration  # noqa: E402
+from wiseuni.migration import (  # noqa: E402
+    DEFAULT_ITERATIONS, CachedDirectory, CsvDirectory, LegacyUser, ProfileClaims, SqliteDirectory,
+    hash_password, verify_password,
+)
+
+ROLES = ['undergraduate'] * 12 + ['postgraduate'] * 4 + ['lecturer', 'staff']
+PASSWORD = 'Legacy-Pass-1'
+
+
+def build_exports(folder, students, iterations):
+    """students.sqlite and students.csv with the same rows"""
+    password_hash = hash_password(PASSWORD, salt='benchsalt', iterations=iterations)
+    users = [LegacyUser(f'L{i:06d}', f'student{i}@legacy.wiseuni.co.uk', f'Student {i}', f'S{i:07d}',
+                        ROLES[i % len(ROLES)], 'tr' if i % 3 == 0 else 'en', password_hash) for i in range(students)]
+    path = os.path.join(folder, 'students.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute(f"CREATE TABLE students ({', '.join(LegacyUser._fields)})")
+    connection.execute('CREATE INDEX students_email ON students (email COLLATE NOCASE)')
+    connection.executemany(f'INSERT INTO students VALUES ({", ".join("?" * len(LegacyUser._fields))})', users)
+    connection.commit()
+    connection.close()
+    with open(os.path.join(folder, 'students.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(LegacyUser._fields)
+        writer.writerows(users)
+    return path, users
+
+
+class DictTable:
+    """get/put/delete of the boto3 Table API, with attribute_not_exists(PK)"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key, ConsistentRead=False):
+        item = self.items.get((Key['PK'], Key['SK']))
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item, ConditionExpression=None):
+        key = (Item['PK'], Item['SK'])
+        if ConditionExpression and key in self.items:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'exists'}}, 'PutItem')
+        self.items[key] = dict(Item)
+
+    def delete_item(self, Key):
+        self.items.pop((Key['PK'], Key['SK']), None)
+
+
+class StubCognito:
+    def __init__(self):
+        self.groups = []
+
+    def admin_add_user_to_group(self, UserPoolId, Username, GroupName):
+        self.groups.append((Username, GroupName))
+
+
+# ========================================
+# 1. TRIGGER AND CLAIM
+# ========================================
+
+def _load_trigger(path):
+    os.environ['LEGACY_DIRECTORY'] = f'sqlite:{path}'
+    spec = importlib.util.spec_from_file_location('user_migration', os.path.join(LAMBDA_DIR, 'user_migration', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.logger.disabled = True
+    return module
+
+
+def _event(source, username, password=None):
+    return {'triggerSource': source, 'userName': username, 'request': {'password': password}, 'response': {}}
+
+
+def check_trigger(path):
+    trigger = _load_trigger(path)
+    table = DictTable()
+    trigger.table = table
+    checks = []
+
+    def check(label, ok):
+        checks.append(ok)
+        print(f'  {"OK  " if ok else "FAIL"} {label}')
+
+    def refused(event):
+        try:
+            trigger.handler(event, None)
+        except Exception:
+            return True
+        return False
+
+    event = trigger.handler(_event('UserMigration_Authentication', 'Student3@legacy.wiseuni.co.uk', PASSWORD), None)
+    response = event['response']
+    check('right password: CONFIRMED, attributes mapped, no email',
+          response['finalUserStatus'] == 'CONFIRMED' and response['messageAction'] == 'SUPPRESS'
+          and response['userAttributes'] == {'email': 'student3@legacy.wiseuni.co.uk', 'email_verified': 'true',
+                                             'name': 'Student 3', 'custom:student_id': 'S0000003', 'locale': 'tr'})
+    check('wrong password refused', refused(_event('UserMigration_Authentication', 'student4@legacy.wiseuni.co.uk', 'nope')))
+    check('unknown user refused', refused(_event('UserMigration_Authentication', 'nobody@legacy.wiseuni.co.uk', PASSWORD)))
+    event = trigger.handler(_event('UserMigration_ForgotPassword', 'student16@legacy.wiseuni.co.uk'), None)
+    check('password reset: created without a password, no email',
+          'finalUserStatus' not in event['response'] and event['response']['messageAction'] == 'SUPPRESS')
+
+    staged = table.get_item(Key=migration.pending_key('student3@legacy.wiseuni.co.uk')).get('Item', {})
+    check('profile staged as MIGRATION#<email> with role and group',
+          staged.get('role') == 'student' and staged.get('group') == 'students' and staged.get('expiresAt', 0) > time.time())
+
+    cognito = StubCognito()
+    claims = ProfileClaims(table, cognito, 'us-east-1_bench')
+    token = {'sub': 'sub-16', 'email': 'student16@legacy.wiseuni.co.uk', 'email_verified': 'true',
+             'cognito:username': 'sub-16'}
+    profile = claims.claim(token, 'us-east-1:identity-16')
+    stored = table.get_item(Key={'PK': 'USER#us-east-1:identity-16', 'SK': 'PROFILE'}).get('Item', {})
+    check('claim: USER#<identityId> / PROFILE with RoleIndex keys, professor group',
+          profile is not None and stored.get('role') == 'professor' and stored.get('RolePK') == 'ROLE#professor'
+          and cognito.groups == [('sub-16', 'professors')]
+          and not table.get_item(Key=migration.pending_key('student16@legacy.wiseuni.co.uk')))
+    check('claim again: nothing to do, no DynamoDB call', claims.claim(token, 'us-east-1:identity-16') is None)
+    unverified = dict(token, sub='sub-3', email='student3@legacy.wiseuni.co.uk', email_verified='false')
+    check('unverified email never claims', ProfileClaims(table, cognito, 'us-east-1_bench').claim(unverified, 'x') is None)
+    return all(checks)
+
+
+# ========================================
+# 2. LOGIN TRAFFIC
+# ========================================
+
+class RemoteSqlite(SqliteDirectory):
+    """The export as a remote database: latency per connection and per query"""
+
+    def __init__(self, path, query_ms, connect_ms):
+        super().__init__(path)
+        self.query_ms = query_ms
+        self.connect_ms = connect_ms
+        self.connections = 0
+
+    def _connect(self):
+        time.sleep(self.connect_ms)
+        self.connections += 1
+        return super()._connect()
+
+    def find(self, email):
+        time.sleep(self.query_ms)
+        return super().find(email)
+
+
+class PerCall:
+    """A new connection for every invocation"""
+
+    def __init__(self, path, query_ms, connect_ms):
+        self.args = (path, query_ms, connect_ms)
+        self.connections = self.queries = 0
+
+    def find(self, email):
+        directory = RemoteSqlite(*self.args)
+        try:
+            return directory.find(email)
+        finally:
+            self.connections += directory.connections
+            self.queries += directory.queries
+            directory._connection.close()
+
+
+def login_attempts(users, logins, seed=7):
+    """Emails looked up: each login once, 20% after a mistyped password, 10% unknown usernames retried 3x"""
+    rng = random.Random(seed)
+    attempts = []
+    for user in rng.sample(users, min(logins, len(users))):
+        attempts.append(user.email)
+        if rng.random() < 0.2:
+            attempts.append(user.email)  # Right password on the second try
+        if rng.random() < 0.1:
+            attempts.extend([user.email.replace('student', 'studnet')] * 3)
+    return attempts
+
+
+def traffic(label, directory, attempts, source):
+    latencies = []
+    for email in attempts:
+        start = time.perf_counter()
+        directory.find(email)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    print(f'  {label:<8} connections {source.connections:>6}  queries {source.queries:>6}  '
+          f'avg {total / len(latencies) * 1000:>5.2f} ms  p50 {latencies[len(latencies) // 2] * 1000:>5.2f} ms  '
+          f'total {total:>5.1f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=20_000)
+    parser.add_argument('--logins', type=int, default=1_000)
+    parser.add_argument('--directory-ms', type=float, default=8)
+    parser.add_argument('--connect-ms', type=float, default=40)
+    parser.add_argument('--iterations', type=int, default=1_000, help='PBKDF2 iterations of the generated hashes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path, users = build_exports(folder, args.students, args.iterations)
+
+        print('Trigger and claim:')
+        ok = check_trigger(path)
+
+        attempts = login_attempts(users, args.logins)
+        print(f'\nLogin traffic: {len(attempts)} lookups for {min(args.logins, len(users))} students, '
+              f'{args.directory_ms:.0f} ms per query, {args.connect_ms:.0f} ms per connection:')
+        per_call = PerCall(path, args.directory_ms / 1000, args.connect_ms / 1000)
+        traffic('per call', per_call, attempts, per_call)
+        remote = RemoteSqlite(path, args.directory_ms / 1000, args.connect_ms / 1000)
+        traffic('cached', CachedDirectory(remote), attempts, remote)
+
+        print(f'\nPer container ({args.students} students):')
+        start = time.perf_counter()
+        CsvDirectory(os.path.join(folder, 'students.csv')).find('student1@legacy.wiseuni.co.uk')
+        print(f'  CSV export loaded and indexed  {(time.perf_counter() - start) * 1000:>7.0f} ms')
+        encoded = hash_password(PASSWORD, iterations=DEFAULT_ITERATIONS)
+        start = time.perf_counter()
+        verify_password(PASSWORD, encoded)
+        print(f'  PBKDF2 check ({DEFAULT_ITERATIONS} iterations)  {(time.perf_counter() - start) * 1000:>7.0f} ms')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
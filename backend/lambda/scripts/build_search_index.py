@@ -0,0 +1,94 @@
+"""
+Build the admin search index from the table and publish it
+
+    python backend/lambda/scripts/build_search_index.py \
+        --table wiseuni-data-dev --bucket wiseuni-search-dev-123456789012 [--segments 16] [--dry-run]
+
+Run it once before the first search (the indexer only applies changes),
+and again whenever the index should be rebuilt from scratch. Index and
+snapshot format: wiseuni/search.py.
+
+Like the other bulk scripts: parallel Scan segments with a session each,
+filtered to PROFILE and course METADATA items, one shared BULK
+throughput controller. A profile changed while the scan runs can be
+missed if its segment was already read; running the script again picks
+it up, as does the user's next change.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni.search import SearchIndex, SearchStore, document  # noqa: E402
+from wiseuni.throttle import BULK, ThroughputController  # noqa: E402
+
+_local = threading.local()
+throughput = ThroughputController('search-index', **BULK)
+
+
+def _table(table_name):
+    # boto3 resources are not thread-safe: one session per worker thread
+    if not hasattr(_local, 'table'):
+        resource = boto3.session.Session().resource('dynamodb')
+        throughput.attach(resource.meta.client)
+        _local.table = resource.Table(table_name)
+    return _local.table
+
+
+def scan_segment(table_name, segment, segments):
+    table = _table(table_name)
+    docs = []
+    scan = {
+        'Segment': segment,
+        'TotalSegments': segments,
+        'FilterExpression': Attr('SK').eq('PROFILE') | (Attr('SK').eq('METADATA') & Attr('PK').begins_with('COURSE#')),
+        # Only what document() looks at
+        'ProjectionExpression': 'PK, SK, #role, #name, email, title, courseId',
+        'ExpressionAttributeNames': {'#role': 'role', '#name': 'name'},
+    }
+    while True:
+        page = table.scan(**scan)
+        docs.extend(filter(None, map(document, page.get('Items', []))))
+        if 'LastEvaluatedKey' not in page:
+            return docs
+        scan['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', required=True)
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--segments', type=int, default=16)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    docs = []
+    with ThreadPoolExecutor(max_workers=args.segments) as pool:
+        futures = [pool.submit(scan_segment, args.table, segment, args.segments) for segment in range(args.segments)]
+        for done, future in enumerate(futures, 1):
+            docs.extend(future.result())
+            print(f'{done}/{args.segments} segments, {len(docs)} documents')
+
+    started = time.perf_counter()
+    index = SearchIndex.build(docs)
+    body = index.to_bytes()
+    print(f'Built {len(index)} documents, {len(index.words)} words: '
+          f'{len(body)} bytes in {time.perf_counter() - started:.1f}s')
+    if not args.dry_run:
+        store = SearchStore(boto3.resource('dynamodb').Table(args.table), boto3.client('s3'), args.bucket)
+        store.replace(index)
+        print('Published')
+    print(f'DynamoDB throughput: {throughput.stats()}')
+
+
+if __name__ == '__main__':
+    main()
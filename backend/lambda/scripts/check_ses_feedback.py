@@ -0,0 +1,96 @@
+"""
+SES feedback fixture check
+
+Runs locally, no AWS account needed: DynamoDB is replaced by the in-memory
+table from bench_suppression.py.
+
+    python backend/lambda/scripts/check_ses_feedback.py
+
+Feeds the recorded notifications in scripts/fixtures/ses (SNS envelopes,
+raw delivery, a configuration set event, a truncated message) through
+ses_feedback.handler as one SQS batch, then checks:
+- the SUPPRESS# items: which addresses, normalized, with their details
+- transient bounces, deliveries and malformed messages suppress nothing
+- a fresh sender-side SuppressionIndex answers is_suppressed() correctly
+- redelivering the batch writes the same items and leaves the Bloom filter alone
+Exits 1 on the first failed check.
+"""
+
+import os
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(SCRIPTS_DIR, 'fixtures', 'ses')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from bench_suppression import MemoryTable, feedback  # noqa: E402
+from wiseuni.suppression import BLOOM_KEY, SuppressionIndex  # noqa: E402
+
+EXPECTED = {
+    'jane.doe@example.com': {
+        'reason': 'Bounce', 'bounceSubType': 'General', 'feedbackId': '0102018f-bounce-permanent-000001',
+        'diagnosticCode': 'smtp; 550 5.1.1 <Jane.Doe@Example.com>: Recipient address rejected: User unknown',
+    },
+    'bob@example.org': {'reason': 'Bounce', 'bounceSubType': 'General', 'diagnosticCode': 'smtp; 550 5.1.1 user unknown'},
+    'angry@example.net': {'reason': 'Complaint', 'complaintFeedbackType': 'abuse',
+                          'feedbackId': '0102018f-complaint-000003'},
+    'listed@example.com': {'reason': 'Bounce', 'bounceSubType': 'Suppressed'},
+}
+NOT_SUPPRESSED = ['full@example.net', 'student@example.com', 'never-mailed@example.com']
+
+
+def fixture_records():
+    records = []
+    for name in sorted(os.listdir(FIXTURES)):
+        with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+            records.append({'messageId': name, 'body': f.read()})
+    return records
+
+
+def check(condition, message):
+    if not condition:
+        print(f'FAIL: {message}')
+        sys.exit(1)
+    print(f'ok    {message}')
+
+
+def suppression_items(table):
+    return {item['email']: item for (pk, sk), item in table.items.items() if sk == 'SUPPRESSION'}
+
+
+def main():
+    table = MemoryTable()
+    feedback.suppression_index = SuppressionIndex(table)
+    records = fixture_records()
+
+    result = feedback.handler({'Records': records}, None)
+    check(result == {'processed': len(records), 'suppressed': len(EXPECTED)},
+          f'{len(records)} fixtures processed, {len(EXPECTED)} addresses suppressed ({result})')
+
+    items = suppression_items(table)
+    check(sorted(items) == sorted(EXPECTED), f'SUPPRESS# items for exactly {", ".join(sorted(EXPECTED))}')
+    for email, fields in EXPECTED.items():
+        item = items[email]
+        check(item['PK'] == f'SUPPRESS#{email}' and all(item.get(k) == v for k, v in fields.items())
+              and item.get('suppressedAt'), f'{email}: key, {", ".join(fields)} and suppressedAt')
+    check(all(None not in item.values() and '' not in item.values() for item in items.values()),
+          'no empty attributes stored')
+
+    sender = SuppressionIndex(table)  # A new sender container: nothing cached
+    for email in EXPECTED:
+        check(sender.is_suppressed(email.upper()), f'is_suppressed({email.upper()!r})')
+    for email in NOT_SUPPRESSED:
+        check(not sender.is_suppressed(email), f'not is_suppressed({email!r})')
+
+    bloom = table.items[(BLOOM_KEY['PK'], BLOOM_KEY['SK'])]
+    snapshot = {key: dict(item, suppressedAt=None) for key, item in table.items.items()}
+    again = feedback.handler({'Records': records}, None)
+    check(again == result, 'redelivered batch gives the same result')
+    check({key: dict(item, suppressedAt=None) for key, item in table.items.items()} == snapshot,
+          'redelivered batch writes the same items')
+    check(table.items[(BLOOM_KEY['PK'], BLOOM_KEY['SK'])]['version'] == bloom['version'],
+          f'Bloom filter not rewritten (version {bloom["version"]})')
+
+
+if __name__ == '__main__':
+    main()
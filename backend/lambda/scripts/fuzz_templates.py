@@ -0,0 +1,117 @@
+"""
+Email template fuzz test and escaping benchmark
+
+Runs locally, no AWS account needed.
+
+    python backend/lambda/scripts/fuzz_templates.py [--cases 20000] [--seed 1]
+
+Renders every template/variant with hostile user attributes (markup,
+quotes, control and bidi characters, lone surrogates, multi-MB names) and
+checks that:
+- no markup from the attribute reaches the HTML (tag count unchanged)
+- subjects stay on one line, and list rows (grade_digest) on theirs
+- the Cognito code placeholder is always present
+- the HTML grows by at most the escaped length of the capped value
+- the result can be encoded as UTF-8 (what SES / Cognito need)
+Then reports the cost per render for ordinary and hostile names.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni import templates  # noqa: E402
+
+CODE = '{####}'
+CASES = [
+    ('welcome', None),
+    ('code', 'signup'),
+    ('code', 'forgot_password'),
+    ('code', 'resend_code'),
+    ('code', 'verification'),
+    ('code', 'verify_email'),
+    ('code', 'invitation'),
+    ('grade_digest', None),
+]
+ROWS = 3
+HOSTILE_PIECES = [
+    '<script>alert(1)</script>', '"><img src=x onerror=alert(1)>', "' onmouseover='x", '&amp;', '&#60;',
+    '\r\nBcc: victim@example.com', '\x00', '\x1b[31m', '‮', '​', '﻿', '\ud800', '{####}',
+    '{{ name }}', '{name}', '%s', '🎓', 'Ağça Şükrü İğdır', '\t', ' ', 'a' * 300,
+]
+
+
+def hostile_name(rng, oversized=0.02):
+    if rng.random() < oversized:
+        return rng.choice(HOSTILE_PIECES) * rng.randint(1_000, 50_000)  # Oversized attribute
+    return ''.join(rng.choice(HOSTILE_PIECES) for _ in range(rng.randint(1, 6)))
+
+
+def rows(name):
+    """List rows for grade_digest, the hostile value as the course name"""
+    return [{'course': name, 'courseId': f'CS10{i}', 'grade': 'A', 'points': '95'} for i in range(ROWS)]
+
+
+def check(template, locale, variant, name, baseline):
+    email = templates.render(template, locale, variant, name=name, email='student@example.com', code=CODE,
+                             count=ROWS, rows=rows(name))
+    email.html.encode('utf-8')
+    email.subject.encode('utf-8')
+    assert email.html.count('<') == baseline.html.count('<'), 'markup injected'
+    assert '\r' not in email.subject and '\n' not in email.subject, 'multi-line subject'
+    if email.text is not None:
+        assert email.text.count('\n') == baseline.text.count('\n'), 'line injected in the text part'
+    if template == 'code':
+        assert CODE in email.html, 'code placeholder missing'
+    growth = len(email.html) - len(baseline.html)
+    # name appears up to twice in the HTML (title + heading), and once per row as a course;
+    # '&quot;' is the widest escape
+    limit = 2 * 6 * templates.FIELD_LIMITS['name'] + ROWS * 6 * templates.DEFAULT_FIELD_LIMIT
+    assert growth <= limit, f'HTML grew by {growth} characters'
+
+
+def per_render_us(template, variant, names):
+    start = time.perf_counter()
+    for name in names:
+        templates.render(template, 'en', variant, name=name, email='student@example.com', code=CODE,
+                         count=ROWS, rows=rows(name))
+    return (time.perf_counter() - start) / len(names) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    for template, variant in CASES:
+        templates.warm(template, (variant,))
+
+    checked = 0
+    for _ in range(args.cases):
+        template, variant = rng.choice(CASES)
+        locale = rng.choice(templates.SUPPORTED_LOCALES)
+        baseline = templates.render(template, locale, variant, name='', email='student@example.com', code=CODE,
+                                    count=ROWS, rows=rows(''))
+        check(template, locale, variant, hostile_name(rng), baseline)
+        checked += 1
+    print(f'fuzz: {checked:,} hostile renders passed')
+
+    ordinary = [f'Student {i}' for i in range(20_000)]
+    hostile = [hostile_name(rng, oversized=0) for _ in range(20_000)]
+    oversized = [hostile_name(rng, oversized=1) for _ in range(200)]
+    for template, variant in (('code', 'signup'), ('welcome', None), ('grade_digest', None)):
+        print(f'{template}/{variant or "-"}: '
+              f'{per_render_us(template, variant, ordinary):.2f} us ordinary, '
+              f'{per_render_us(template, variant, hostile):.2f} us hostile, '
+              f'{per_render_us(template, variant, oversized):.2f} us oversized (up to 15M chars)')
+
+
+if __name__ == '__main__':
+    main()
@@ -22,5 +22,13 @@ pip install -r requirements.txt -t . --upgrade
 cd ../custom_message
 pip install -r requirements.txt -t . --upgrade
 
+# Custom email sender (aws-encryption-sdk)
+cd ../custom_email_sender
+pip install -r requirements.txt -t . --upgrade
+
+# Grade analytics (numpy)
+cd ../grade_analytics
+pip install -r requirements.txt -t . --upgrade
+
 cd ../../..
 echo "All dependencies installed!"
\ No newline at end of file
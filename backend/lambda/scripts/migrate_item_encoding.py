@@ -0,0 +1,133 @@
+"""
+Rewrite enrolment and grade items in the compact encoding (or back)
+
+    python backend/lambda/scripts/migrate_item_encoding.py \
+        --table wiseuni-data-dev [--to compact|legacy] [--segments 16] [--dry-run]
+
+Encoding: wiseuni/items.py. Readers decode both encodings, so the table
+can be migrated while in use, re-run, or rolled back with --to legacy.
+
+How it stays fast and safe on a large table:
+- Parallel Scan: one worker per segment, each with its own session,
+  filtered to ENROLLMENT# / GRADE# items
+- Course names come from COURSE#<id> / METADATA, fetched once per course
+- Every rewrite is a PutItem conditional on the item being exactly as
+  scanned, so a concurrent change wins and is counted, never overwritten
+- All workers share one BULK throughput controller (wiseuni/throttle.py)
+
+Every rewrite goes through the table stream, so each migrated user's
+summary version is bumped once (one cache miss per user).
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'shared', 'python'))
+
+from wiseuni.items import (  # noqa: E402
+    KEY_ATTRIBUTES, course_metadata, decode, encode, item_course_id, item_size,
+)
+from wiseuni.throttle import BULK, ThroughputController  # noqa: E402
+
+_local = threading.local()
+throughput = ThroughputController('item-encoding', **BULK)
+
+
+def _table(table_name):
+    # boto3 resources are not thread-safe: one session per worker thread
+    if not hasattr(_local, 'table'):
+        resource = boto3.session.Session().resource('dynamodb')
+        throughput.attach(resource.meta.client)
+        _local.table = resource.Table(table_name)
+    return _local.table
+
+
+def unchanged_condition(item):
+    """
+    Condition: the stored item still has these values (every writer puts
+    whole items with a fresh timestamp, so a concurrent write fails it)
+    """
+    names, values, clauses = {}, {}, ['attribute_exists(PK)']
+    for number, (name, value) in enumerate(sorted(item.items())):
+        if name in KEY_ATTRIBUTES:
+            continue
+        names[f'#a{number}'] = name
+        values[f':a{number}'] = value
+        clauses.append(f'#a{number} = :a{number}')
+    condition = {'ConditionExpression': ' AND '.join(clauses), 'ExpressionAttributeNames': names}
+    if values:
+        condition['ExpressionAttributeValues'] = values
+    return condition
+
+
+def migrate_segment(table_name, segment, segments, target, dry_run):
+    table = _table(table_name)
+    counters = dict.fromkeys(('scanned', 'rewritten', 'unchanged', 'changedSince', 'bytesBefore', 'bytesAfter'), 0)
+    scan = {
+        'Segment': segment,
+        'TotalSegments': segments,
+        'FilterExpression': Attr('SK').begins_with('ENROLLMENT#') | Attr('SK').begins_with('GRADE#'),
+    }
+    while True:
+        page = table.scan(**scan)
+        items = page.get('Items', [])
+        courses = course_metadata(table, {item_course_id(item) for item in items})
+        for item in items:
+            counters['scanned'] += 1
+            course = courses.get(item_course_id(item))
+            rewritten = encode(item, course) if target == 'compact' else decode(item, course)
+            counters['bytesBefore'] += item_size(item)
+            counters['bytesAfter'] += item_size(rewritten)
+            if rewritten == item:
+                counters['unchanged'] += 1
+                continue
+            if not dry_run:
+                try:
+                    table.put_item(Item=rewritten, **unchanged_condition(item))
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                    counters['changedSince'] += 1  # Re-run to pick it up
+                    continue
+            counters['rewritten'] += 1
+        if 'LastEvaluatedKey' not in page:
+            return counters
+        scan['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', required=True)
+    parser.add_argument('--to', choices=('compact', 'legacy'), default='compact', dest='target')
+    parser.add_argument('--segments', type=int, default=16)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    totals = {}
+    with ThreadPoolExecutor(max_workers=args.segments) as pool:
+        futures = [
+            pool.submit(migrate_segment, args.table, segment, args.segments, args.target, args.dry_run)
+            for segment in range(args.segments)
+        ]
+        for done, future in enumerate(futures, 1):
+            for name, value in future.result().items():
+                totals[name] = totals.get(name, 0) + value
+            print(f'{done}/{args.segments} segments, {totals["scanned"]} items scanned')
+
+    if totals.get('bytesBefore'):
+        totals['sizeRatio'] = round(totals['bytesAfter'] / totals['bytesBefore'], 3)
+    print(f"{'Would rewrite' if args.dry_run else 'Rewrote'} to {args.target}: {json.dumps(totals)}")
+    print(f'DynamoDB throughput: {throughput.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Admin Search API
+Prefix and typo-tolerant search over users and courses (admins only)
+
+GET /admin/search?q=ayse yil&kind=student&limit=20
+-> {"results": [{"kind", "id", "name", "email" | "courseId", "score"}, ...], "documents": 102000}
+
+kind: student, professor, admin or course (repeat with commas: kind=professor,admin)
+
+The index (wiseuni/search.py) is loaded from its S3 snapshot once per
+container and re-checked against the pointer item every
+SEARCH_REFRESH_SECONDS (one GetItem); a query itself touches no AWS
+service, instead of paging through every profile of a role.
+
+Local service: python backend/lambda/search/index.py --serve 8789 --identity <identityId> --role admin
+"""
+
+import logging
+import os
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared', 'python'))
+
+from wiseuni import aws
+from wiseuni.api import ApiError, handle, response
+from wiseuni.profiling import profiled
+from wiseuni.search import DEFAULT_LIMIT, KINDS, SearchStore
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_LIMIT = 100
+MAX_QUERY_LENGTH = 100
+
+store = SearchStore(
+    aws.table(os.environ['TABLE_NAME']),
+    aws.client('s3'),
+    os.environ['SEARCH_BUCKET_NAME'],
+    refresh_seconds=int(os.environ.get('SEARCH_REFRESH_SECONDS', 30)),
+)
+aws.warm(store.table, store.s3)
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    store.current()  # Load the snapshot during init (full CPU, before the first request)
+
+
+def search(event, caller):
+    if caller.role != 'admin':
+        raise ApiError(403, 'Only admins can search users and courses')
+
+    params = event.get('queryStringParameters') or {}
+    query = (params.get('q') or '').strip()
+    if not query:
+        raise ApiError(400, 'Missing q')
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ApiError(400, f'q must be at most {MAX_QUERY_LENGTH} characters')
+
+    kinds = [kind for kind in (params.get('kind') or '').split(',') if kind]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        raise ApiError(400, f"kind must be one of: {', '.join(KINDS)}")
+    try:
+        limit = max(1, min(int(params.get('limit') or DEFAULT_LIMIT), MAX_LIMIT))
+    except ValueError:
+        raise ApiError(400, 'limit must be a number')
+
+    index = store.current()
+    results = index.search(query, kinds=kinds or None, limit=limit)
+    return response(200, {'results': results, 'documents': len(index)})
+
+
+ROUTES = {
+    'GET /admin/search': search,
+}
+
+
+@profiled
+def handler(event, context):
+    """HTTP API (payload v2) entry point"""
+    return handle(event, ROUTES, logger)
+
+
+if __name__ == '__main__':
+    from wiseuni.local import main
+    main(handler, ROUTES)
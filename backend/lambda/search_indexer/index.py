@@ -0,0 +1,40 @@
+"""
+Search Indexer
+Keeps the admin search snapshot current from the table stream
+
+Flow: DynamoDB stream (PROFILE and course METADATA items) -> this Lambda
+-> next snapshot in S3 + pointer item (wiseuni/search.py)
+
+Each batch is applied to the newest snapshot and published as one new
+snapshot, so admins see a change after at most the batching window plus
+the search function's refresh interval. Changes that leave the indexed
+fields alone (logins bumping updatedAt) publish nothing.
+
+Reserved concurrency 1 (services.yaml) keeps stream shards from racing
+each other; the pointer's version check still catches a writer that
+gets in between (scripts/build_search_index.py), and the batch is then
+re-applied to its snapshot.
+"""
+
+import logging
+import os
+
+from wiseuni import aws
+from wiseuni.profiling import profiled
+from wiseuni.search import SearchStore, changes_from_records
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# No refresh interval: the pointer is read before every batch anyway
+store = SearchStore(aws.table(os.environ['TABLE_NAME']), aws.client('s3'), os.environ['SEARCH_BUCKET_NAME'])
+
+
+@profiled
+def handler(event, context):
+    """DynamoDB stream entry point"""
+    records = event.get('Records', [])
+    changes = changes_from_records(records)
+    changed = store.apply(changes) if changes else 0
+    logger.info(f'Search index: {changed} document(s) changed from {len(records)} record(s)')
+    return {'changed': changed}
@@ -0,0 +1,91 @@
+"""
+SES Feedback Processor
+Consumes bounce and complaint notifications in batches and adds the
+affected addresses to the suppression index
+
+Flow: SES -> SNS topic -> SQS queue -> this Lambda (batches of up to 10)
+"""
+
+import json
+import logging
+import os
+
+from wiseuni import aws
+from wiseuni.profiling import profiled
+from wiseuni.suppression import SuppressionIndex
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table = aws.table(os.environ['TABLE_NAME'])
+suppression_index = SuppressionIndex(table)
+
+
+def parse_notification(body):
+    """
+    Turn one SQS message body into a list of suppression entries
+
+    Accepts the SNS envelope or raw message delivery, and both SES
+    identity notifications ('notificationType') and configuration set
+    events ('eventType').
+    """
+    message = json.loads(body)
+    if 'Message' in message and message.get('Type') == 'Notification':
+        message = json.loads(message['Message'])
+
+    kind = message.get('notificationType') or message.get('eventType')
+
+    if kind == 'Bounce':
+        bounce = message['bounce']
+        # Transient bounces (mailbox full, greylisting) are retried by SES
+        # and must not suppress the address
+        if bounce.get('bounceType') != 'Permanent':
+            return []
+        return [
+            {
+                'email': recipient['emailAddress'],
+                'reason': 'Bounce',
+                'bounceSubType': bounce.get('bounceSubType'),
+                'diagnosticCode': recipient.get('diagnosticCode'),
+                'feedbackId': bounce.get('feedbackId'),
+            }
+            for recipient in bounce.get('bouncedRecipients', [])
+        ]
+
+    if kind == 'Complaint':
+        complaint = message['complaint']
+        return [
+            {
+                'email': recipient['emailAddress'],
+                'reason': 'Complaint',
+                'complaintFeedbackType': complaint.get('complaintFeedbackType'),
+                'feedbackId': complaint.get('feedbackId'),
+            }
+            for recipient in complaint.get('complainedRecipients', [])
+        ]
+
+    return []
+
+
+@profiled
+def handler(event, context):
+    """
+    SQS batch handler
+
+    Malformed messages are logged and dropped (retrying cannot fix them).
+    Write failures raise so SQS redelivers the batch; writes are
+    idempotent so reprocessing is safe.
+    """
+    records = event.get('Records', [])
+    entries = []
+
+    for record in records:
+        try:
+            entries.extend(parse_notification(record['body']))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Skipping malformed feedback message {record.get('messageId')}: {str(e)}")
+
+    written = suppression_index.suppress_many(entries)
+    logger.info(f'Processed {len(records)} feedback messages, suppressed {written} addresses')
+
+    return {'processed': len(records), 'suppressed': written}
@@ -0,0 +1,9 @@
+"""
+WiseUni shared Lambda layer
+
+Code used by more than one Lambda function lives here and is deployed
+once as the SharedLayer (see stacks/lambda-triggers.yaml).
+Lambda puts the layer's python/ folder on sys.path, so functions simply:
+
+    from wiseuni.suppression import SuppressionIndex
+"""
@@ -0,0 +1,331 @@
+"""
+Vectorized grade analytics and curves
+
+A course's or a semester's GRADE# items are loaded once into column
+arrays (GradeColumns); every statistic is then a handful of NumPy
+operations over all grades at once instead of a Python loop per item:
+
+- distributions: histogram, percentiles, letter counts
+- per-group statistics (course, student): np.bincount for counts, means
+  and standard deviations; one sort for every group's percentiles
+- curves: z-score (every course to the same mean and spread) and linear
+  (scale the top score to `top`, or shift the mean to `mean`)
+- GPA per student: mean grade points over their courses, optionally
+  weighted by course credits
+
+Letters and grade points follow the student dashboard
+(StudentDashboard.tsx): GPA uses the stored letters, while distributions
+and curved scores map points to letters with CUTOFFS.
+
+    columns = load_course(table, 'CS101')
+    describe(columns.points), z_curve(columns.points, mean=75, std=10)
+
+Needs numpy in the function's package (grade_analytics/requirements.txt).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from wiseuni import indexes
+
+# Lowest points for each letter, best first
+LETTERS = ('A+', 'A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D+', 'D', 'D-', 'F')
+CUTOFFS = (97, 93, 90, 87, 83, 80, 77, 73, 70, 67, 63, 60, 0)
+GRADE_POINTS = {
+    'A+': 4.0, 'A': 4.0, 'A-': 3.7, 'B+': 3.3, 'B': 3.0, 'B-': 2.7, 'C+': 2.3,
+    'C': 2.0, 'C-': 1.7, 'D+': 1.3, 'D': 1.0, 'D-': 0.7, 'F': 0.0,
+}
+PERCENTILES = (10, 25, 50, 75, 90)
+MIN_POINTS, MAX_POINTS = 0.0, 100.0
+
+_ASCENDING_CUTOFFS = np.array(CUTOFFS[::-1], dtype=np.float64)
+
+
+class GradeColumns:
+    """
+    Grades as parallel arrays, one entry per GRADE# item
+
+    student / course: int32 codes into the students / courses label arrays
+    (identity ids, course ids)
+    points, grade_points, credits: float64 (NaN where unknown)
+    """
+
+    def __init__(self, students, student, courses, course, points, grade_points, credits):
+        self.students = students
+        self.student = student
+        self.courses = courses
+        self.course = course
+        self.points = points
+        self.grade_points = grade_points
+        self.credits = credits
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def from_items(cls, items, credits=None):
+        """
+        Columns from (decoded) GRADE# items
+
+        credits: {courseId: credits}, e.g. from the COURSE#<id> / METADATA items
+        """
+        student_codes, course_codes = {}, {}
+        student, course, points, grade_points = [], [], [], []
+        for item in items:
+            # Codes in order of first appearance: no sort of string arrays
+            student.append(student_codes.setdefault(item['PK'][len('USER#'):], len(student_codes)))
+            course.append(course_codes.setdefault(item['SK'][len('GRADE#'):], len(course_codes)))
+            points.append(item.get('points', np.nan))
+            grade_points.append(GRADE_POINTS.get(item.get('grade'), np.nan))
+        courses = np.array(list(course_codes), dtype=object)
+        course = np.array(course, dtype=np.int32)
+        course_credits = np.array([float((credits or {}).get(course_id, np.nan)) for course_id in courses])
+        return cls(
+            np.array(list(student_codes), dtype=object),
+            np.array(student, dtype=np.int32),
+            courses,
+            course,
+            np.array(points, dtype=np.float64),
+            np.array(grade_points, dtype=np.float64),
+            course_credits[course] if len(courses) else np.empty(0),
+        )
+
+    @classmethod
+    def concatenate(cls, parts):
+        """One set of columns from several (e.g. one per course of a semester)"""
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.from_items([])
+        student_codes, course_codes = {}, {}
+
+        def recode(codes, labels, local):
+            # Per label, not per grade
+            mapping = np.array([codes.setdefault(label, len(codes)) for label in labels], dtype=np.int32)
+            return mapping[local]
+
+        student = np.concatenate([recode(student_codes, part.students, part.student) for part in parts])
+        course = np.concatenate([recode(course_codes, part.courses, part.course) for part in parts])
+        return cls(
+            np.array(list(student_codes), dtype=object), student,
+            np.array(list(course_codes), dtype=object), course,
+            np.concatenate([part.points for part in parts]),
+            np.concatenate([part.grade_points for part in parts]),
+            np.concatenate([part.credits for part in parts]),
+        )
+
+
+# ========================================
+# LOADING
+# ========================================
+
+def load_course(table, course_id, credits=None):
+    """A course's grades through the course_grades access pattern (GradeIndex)"""
+    items = indexes.query(table, 'course_grades', ['grade', 'points'], course_id=course_id)
+    return GradeColumns.from_items(items, credits)
+
+
+def load_semester(table, semester, concurrency=1, thread_table=None):
+    """
+    Every grade of a semester's courses, with their credits
+
+    concurrency: courses queried at once; each worker reads through
+    thread_table() (a Table of its own: boto3 resources are not thread-safe)
+    """
+    courses = indexes.query(table, 'semester_courses', [], semester=semester)
+    credits = {
+        item['PK'][len('COURSE#'):]: item['credits']
+        for item in indexes.fetch(table, courses, ['credits']) if 'credits' in item
+    }
+    course_ids = [item['PK'][len('COURSE#'):] for item in courses]
+    if concurrency <= 1 or len(course_ids) <= 1 or thread_table is None:
+        return GradeColumns.concatenate([load_course(table, course_id, credits) for course_id in course_ids])
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(course_ids))) as pool:
+        # map() keeps course order, so the report is the same as read one by one
+        return GradeColumns.concatenate(list(pool.map(
+            lambda course_id: load_course(thread_table(), course_id, credits), course_ids,
+        )))
+
+
+# ========================================
+# DISTRIBUTIONS
+# ========================================
+
+def _known(values):
+    return values[~np.isnan(values)]
+
+
+def histogram(points, bins=10, value_range=(MIN_POINTS, MAX_POINTS)):
+    counts, edges = np.histogram(_known(points), bins=bins, range=value_range)
+    return {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+
+def percentiles(points, q=PERCENTILES):
+    known = _known(points)
+    if not len(known):
+        return {str(p): None for p in q}
+    return dict(zip(map(str, q), np.percentile(known, q).tolist()))
+
+
+def describe(points, q=PERCENTILES):
+    known = _known(points)
+    if not len(known):
+        return {'count': 0}
+    return {
+        'count': int(len(known)),
+        'mean': float(known.mean()),
+        'std': float(known.std()),
+        'min': float(known.min()),
+        'max': float(known.max()),
+        'percentiles': percentiles(known, q),
+    }
+
+
+def _letter_codes(points):
+    # Index into LETTERS for each score
+    codes = len(LETTERS) - np.searchsorted(_ASCENDING_CUTOFFS, np.nan_to_num(points), side='right')
+    return np.minimum(codes, len(LETTERS) - 1)  # Below every cutoff: F
+
+
+def letters(points):
+    """Letter for each score (CUTOFFS); NaN points get ''"""
+    return np.where(np.isnan(points), '', np.array(LETTERS)[_letter_codes(points)])
+
+
+def letter_counts(points):
+    """How many scores fall in each letter's range (CUTOFFS)"""
+    counts = np.bincount(_letter_codes(_known(points)), minlength=len(LETTERS))
+    return dict(zip(LETTERS, counts.tolist()))
+
+
+# ========================================
+# PER-GROUP STATISTICS
+# ========================================
+
+def group_stats(values, groups, size):
+    """
+    count, mean and std of values per group code (0..size-1), NaN values
+    left out; groups without values get count 0 and NaN mean / std
+    """
+    known = ~np.isnan(values)
+    values, groups = values[known], groups[known]
+    count = np.bincount(groups, minlength=size)
+    total = np.bincount(groups, weights=values, minlength=size)
+    squares = np.bincount(groups, weights=values * values, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = np.maximum(squares / count - mean * mean, 0.0)
+    return count, mean, np.sqrt(variance)
+
+
+def group_percentiles(values, groups, size, q=PERCENTILES):
+    """
+    Percentiles per group, shape (size, len(q)), linear interpolation
+    like np.percentile; one sort for all groups
+    """
+    known = ~np.isnan(values)
+    values, groups = values[known], groups[known]
+    # One integer sort by (group, rank of value): faster than lexsort
+    distinct, rank = np.unique(values, return_inverse=True)
+    order = np.argsort(groups.astype(np.int64) * len(distinct) + rank)
+    ordered = values[order]
+    count = np.bincount(groups, minlength=size)
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+
+    position = (count[:, None] - 1) * (np.asarray(q, dtype=np.float64)[None, :] / 100.0)
+    position = np.maximum(position, 0.0)
+    below = np.floor(position).astype(np.int64)
+    above = np.ceil(position).astype(np.int64)
+    last = max(len(ordered) - 1, 0)
+    low = ordered[np.minimum(starts[:, None] + below, last)] if len(ordered) else np.zeros(position.shape)
+    high = ordered[np.minimum(starts[:, None] + above, last)] if len(ordered) else np.zeros(position.shape)
+    result = low + (high - low) * (position - below)
+    result[count == 0] = np.nan
+    return result
+
+
+def course_report(columns, q=PERCENTILES):
+    """Per-course rows: count, mean, std and percentiles of points"""
+    size = len(columns.courses)
+    count, mean, std = group_stats(columns.points, columns.course, size)
+    marks = json_values(group_percentiles(columns.points, columns.course, size, q))
+    labels = list(map(str, q))
+    return [
+        {'courseId': course_id, 'count': courses, 'mean': average, 'std': spread,
+         'percentiles': dict(zip(labels, course_marks))}
+        for course_id, courses, average, spread, course_marks in zip(
+            columns.courses.tolist(), count.tolist(), json_values(mean), json_values(std), marks,
+        )
+    ]
+
+
+def json_values(values):
+    """Rounded Python numbers for JSON; NaN -> None"""
+    rounded = np.round(values, 2).astype(object)
+    rounded[np.isnan(values)] = None
+    return rounded.tolist()
+
+
+# ========================================
+# CURVES
+# ========================================
+
+def _groups(points, groups):
+    if groups is None:
+        return np.zeros(len(points), dtype=np.int32), 1
+    return groups, int(groups.max()) + 1 if len(groups) else 0
+
+
+def z_curve(points, groups=None, mean=75.0, std=10.0, low=MIN_POINTS, high=MAX_POINTS):
+    """
+    Every group (course) to the same mean and standard deviation:
+    curved = mean + std * z, clipped to [low, high]. A group whose scores
+    are all equal gets `mean`.
+    """
+    groups, size = _groups(points, groups)
+    _, group_mean, group_std = group_stats(points, groups, size)
+    spread = group_std[groups]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(spread > 0, (points - group_mean[groups]) / spread, 0.0)
+    z[np.isnan(points)] = np.nan  # Ungraded stays ungraded
+    return np.clip(mean + std * z, low, high)
+
+
+def linear_curve(points, groups=None, top=MAX_POINTS, mean=None, low=MIN_POINTS, high=MAX_POINTS):
+    """
+    Linear curve per group (course), clipped to [low, high]:
+    - mean given: shift every score so the group mean becomes `mean`
+    - otherwise: scale so the group's best score becomes `top`
+    """
+    groups, size = _groups(points, groups)
+    if mean is not None:
+        _, group_mean, _ = group_stats(points, groups, size)
+        curved = points + (mean - group_mean[groups])
+    else:
+        best = np.full(size, np.nan)
+        known = ~np.isnan(points)
+        np.fmax.at(best, groups[known], points[known])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            curved = np.where(best[groups] > 0, points * (top / best[groups]), points)
+    return np.clip(curved, low, high)
+
+
+# ========================================
+# GPA
+# ========================================
+
+def gpa(columns, weighted=False):
+    """
+    GPA per student (aligned with columns.students; NaN without graded
+    courses): mean grade points, weighted by course credits if asked
+    (courses without credits then count as 1)
+    """
+    weights = np.ones(len(columns))
+    if weighted:
+        weights = np.where(np.isnan(columns.credits), 1.0, columns.credits)
+    known = ~np.isnan(columns.grade_points)
+    size = len(columns.students)
+    total = np.bincount(columns.student[known], weights=(columns.grade_points * weights)[known], minlength=size)
+    weight = np.bincount(columns.student[known], weights=weights[known], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / weight
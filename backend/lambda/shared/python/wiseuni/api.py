@@ -0,0 +1,122 @@
+"""
+Helpers for Lambda functions behind the backend HTTP API
+
+The API uses AWS_IAM authorization: the browser signs requests with the
+temporary credentials it already gets from the Identity Pool, and API
+Gateway hands us the caller's identity in the request context.
+"""
+
+import base64
+import json
+import re
+from decimal import Decimal
+
+_ROLE_PATTERN = re.compile(r'-(student|professor|admin)-role-')
+# Course, assignment, ... ids end up in S3 keys and file names
+_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+ROLE_FOLDERS = {
+    'student': 'students',
+    'professor': 'professors',
+    'admin': 'admins',
+}
+
+
+class ApiError(Exception):
+    """Raised by route code; turned into a JSON error response by handle()"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class Caller:
+    """Authenticated caller: Identity Pool identity id and portal role"""
+
+    def __init__(self, identity_id, role):
+        self.identity_id = identity_id
+        self.role = role
+
+    @property
+    def folder(self):
+        """S3 prefix root, same convention as frontend s3Service.ts"""
+        return f'{ROLE_FOLDERS[self.role]}/{self.identity_id}'
+
+
+def caller_from_event(event):
+    """
+    Read the caller from an HTTP API (payload v2) request with IAM auth
+
+    The role comes from the assumed role name, e.g.
+    arn:aws:sts::123:assumed-role/wiseuni-professor-role-dev/CognitoIdentityCredentials
+    """
+    iam = event.get('requestContext', {}).get('authorizer', {}).get('iam') or {}
+    identity_id = (iam.get('cognitoIdentity') or {}).get('identityId')
+    if not identity_id:
+        raise ApiError(403, 'Requests must be signed with Identity Pool credentials')
+
+    match = _ROLE_PATTERN.search(iam.get('userArn', ''))
+    return Caller(identity_id, match.group(1) if match else 'student')
+
+
+def parse_body(event):
+    body = event.get('body') or '{}'
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    try:
+        parsed = json.loads(body)
+    except ValueError:
+        raise ApiError(400, 'Request body must be JSON')
+    if not isinstance(parsed, dict):
+        raise ApiError(400, 'Request body must be a JSON object')
+    return parsed
+
+
+def require(body, *fields):
+    missing = [field for field in fields if not body.get(field)]
+    if missing:
+        raise ApiError(400, f"Missing required field(s): {', '.join(missing)}")
+    return [body[field] for field in fields]
+
+
+def validate_id(value, field):
+    if not _ID_PATTERN.match(str(value)):
+        raise ApiError(400, f'{field} may only contain letters, digits, ".", "_" and "-"')
+    return str(value)
+
+
+def _json_default(value):
+    # DynamoDB returns numbers as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'Not JSON serializable: {type(value).__name__}')
+
+
+def response(status_code, body=None, headers=None):
+    return {
+        'statusCode': status_code,
+        'headers': {'Content-Type': 'application/json', **(headers or {})},
+        'body': json.dumps(body if body is not None else {}, default=_json_default),
+    }
+
+
+def handle(event, routes, logger):
+    """
+    Dispatch an HTTP API event to routes[routeKey](event, caller)
+
+    routeKey looks like 'POST /uploads'. Route functions return a response
+    dict or raise ApiError.
+    """
+    route = routes.get(event.get('routeKey'))
+    if route is None:
+        return response(404, {'error': f"Unknown route: {event.get('routeKey')}"})
+
+    try:
+        return route(event, caller_from_event(event))
+    except ApiError as e:
+        logger.warning(f'{event.get("routeKey")} rejected ({e.status_code}): {e.message}')
+        return response(e.status_code, {'error': e.message})
+    except Exception as e:
+        logger.error(f'{event.get("routeKey")} failed: {str(e)}', exc_info=True)
+        return response(500, {'error': 'Internal server error'})
@@ -0,0 +1,232 @@
+"""
+Audit archive of enrolment and grade changes
+
+Point-in-time recovery only reaches 35 days back; the audit archive keeps
+every change to an ENROLLMENT# or GRADE# item for good, in S3:
+
+    audit/<entity>/course=<courseId>/date=<YYYY-MM-DD>/<HHMMSS>-<first sequence number>.jsonl.gz
+
+One object holds all changes of one batch to one course on one day
+(JSONL + gzip, or Parquet with AUDIT_FORMAT=parquet and pyarrow in the
+package), so the number of PUTs grows with courses x batches, not with
+changes. The key is derived from the batch, so a retried batch overwrites
+its own objects instead of adding more.
+
+Every line is one change:
+    {"eventId", "sequenceNumber", "at", "event": INSERT|MODIFY|REMOVE,
+     "entity", "identityId", "courseId", "changed": [...], "old": {...}, "new": {...}}
+old / new are the item images as stored (compact items: wiseuni/items.py).
+
+Reading only what is needed:
+- course history: one listing of the course's partition, starting at the
+  first date wanted and stopping after the last
+- student history: the same for each of the student's courses, keeping
+  their lines only
+Records are de-duplicated by eventId (a bisected batch may be written twice).
+"""
+
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # Only needed for AUDIT_FORMAT=parquet
+    pyarrow = parquet = None
+
+PREFIX = 'audit/'
+ENTITIES = {'ENROLLMENT#': 'enrollment', 'GRADE#': 'grade'}
+FORMATS = {'jsonl': '.jsonl.gz', 'parquet': '.parquet'}
+
+_deserializer = TypeDeserializer()
+
+
+def _plain(value):
+    # Decimal (DynamoDB numbers) and sets do not serialize to JSON as they are
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {name: _plain(inner) for name, inner in value.items()}
+    if isinstance(value, (list, set, frozenset)):
+        return [_plain(inner) for inner in value]
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('latin-1')
+    return value
+
+
+def _image(image):
+    if not image:
+        return None
+    return {name: _plain(_deserializer.deserialize(value)) for name, value in image.items()}
+
+
+def partition_prefix(entity, course_id, date=None):
+    prefix = f'{PREFIX}{entity}/course={course_id}/'
+    return f'{prefix}date={date}/' if date else prefix
+
+
+def audit_record(record):
+    """One stream record -> one audit line (dict), or None for other items"""
+    change = record['dynamodb']
+    pk = change['Keys']['PK']['S']
+    sk = change['Keys']['SK']['S']
+    entity = next((name for prefix, name in ENTITIES.items() if sk.startswith(prefix)), None)
+    if entity is None or not pk.startswith('USER#'):
+        return None
+
+    old, new = _image(change.get('OldImage')), _image(change.get('NewImage'))
+    changed = sorted(
+        name for name in set(old or {}) | set(new or {})
+        if (old or {}).get(name) != (new or {}).get(name)
+    )
+    at = datetime.fromtimestamp(float(change.get('ApproximateCreationDateTime', 0)), timezone.utc)
+    return {
+        'eventId': record['eventID'],
+        'sequenceNumber': change['SequenceNumber'],
+        'at': at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'event': record['eventName'],
+        'entity': entity,
+        'identityId': pk[len('USER#'):],
+        'courseId': sk.split('#', 1)[1],
+        'changed': changed,
+        'old': old,
+        'new': new,
+    }
+
+
+# ========================================
+# WRITING
+# ========================================
+
+def encode_batch(records, file_format='jsonl'):
+    """Object body for a list of audit records"""
+    if file_format == 'parquet':
+        if parquet is None:
+            raise RuntimeError('AUDIT_FORMAT=parquet needs pyarrow in the deployment package')
+        rows = [{
+            **record,
+            'changed': json.dumps(record['changed']),
+            'old': json.dumps(record['old'], ensure_ascii=False),
+            'new': json.dumps(record['new'], ensure_ascii=False),
+        } for record in records]
+        out = io.BytesIO()
+        parquet.write_table(pyarrow.Table.from_pylist(rows), out, compression='zstd')
+        return out.getvalue()
+    lines = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n' for record in records)
+    return gzip.compress(lines.encode('utf-8'), compresslevel=6)
+
+
+class AuditWriter:
+    """
+    Buffers audit records per partition (entity, course, day) and writes
+    each partition as one object, or several once a buffer passes
+    max_bytes of JSON
+    """
+
+    def __init__(self, s3, bucket, file_format='jsonl', max_bytes=32 * 1024 * 1024):
+        self.s3 = s3
+        self.bucket = bucket
+        self.file_format = file_format
+        self.max_bytes = max_bytes
+        self.buffers = {}  # (entity, courseId, date) -> [records, json bytes]
+        self.stats = {'records': 0, 'objects': 0, 'rawBytes': 0, 'storedBytes': 0}
+
+    def add(self, record):
+        partition = (record['entity'], record['courseId'], record['at'][:10])
+        buffer = self.buffers.setdefault(partition, [[], 0])
+        size = len(json.dumps(record, ensure_ascii=False))
+        buffer[0].append(record)
+        buffer[1] += size + 1
+        self.stats['records'] += 1
+        self.stats['rawBytes'] += size + 1
+        if buffer[1] >= self.max_bytes:
+            self._write(partition)
+
+    def _write(self, partition):
+        records, _ = self.buffers.pop(partition)
+        entity, course_id, date = partition
+        first = records[0]
+        key = (f"{partition_prefix(entity, course_id, date)}"
+               f"{first['at'][11:19].replace(':', '')}-{first['sequenceNumber']}{FORMATS[self.file_format]}")
+        body = encode_batch(records, self.file_format)
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=body,
+            ContentType='application/gzip' if self.file_format == 'jsonl' else 'application/vnd.apache.parquet',
+        )
+        self.stats['objects'] += 1
+        self.stats['storedBytes'] += len(body)
+
+    def flush(self):
+        """Write every buffered partition"""
+        for partition in list(self.buffers):
+            self._write(partition)
+        return self.stats
+
+
+# ========================================
+# READING
+# ========================================
+
+def list_partition_objects(s3, bucket, entity, course_id, start_date=None, end_date=None):
+    """Object keys of one course's partitions from start_date to end_date (inclusive)"""
+    prefix = partition_prefix(entity, course_id)
+    listing = {'Bucket': bucket, 'Prefix': prefix}
+    if start_date:
+        listing['StartAfter'] = f'{prefix}date={start_date}'  # Keys of that day sort after it
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(**listing):
+        for obj in page.get('Contents', []):
+            date = obj['Key'][len(prefix) + len('date='):][:10]
+            if end_date and date > end_date:
+                return  # Keys are in date order: nothing later is wanted
+            yield obj['Key']
+
+
+def read_objects(s3, bucket, keys, identity_id=None):
+    """Audit records from objects, optionally one student's only, each eventId once"""
+    seen = set()
+    for key in keys:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        if key.endswith(FORMATS['parquet']):
+            if parquet is None:
+                raise RuntimeError('Reading Parquet audit objects needs pyarrow')
+            records = parquet.read_table(io.BytesIO(body)).to_pylist()
+            for record in records:
+                for name in ('changed', 'old', 'new'):
+                    record[name] = json.loads(record[name])
+        else:
+            records = (json.loads(line) for line in gzip.decompress(body).splitlines() if line)
+        for record in records:
+            if identity_id and record['identityId'] != identity_id:
+                continue
+            if record['eventId'] in seen:
+                continue
+            seen.add(record['eventId'])
+            yield record
+
+
+def course_history(s3, bucket, course_id, start_date=None, end_date=None, entities=None):
+    """Every change to a course's enrolments and grades in the date range"""
+    for entity in entities or ENTITIES.values():
+        keys = list_partition_objects(s3, bucket, entity, course_id, start_date, end_date)
+        yield from read_objects(s3, bucket, keys)
+
+
+def student_history(s3, bucket, identity_id, course_ids, start_date=None, end_date=None, entities=None):
+    """
+    Every change to a student's enrolments and grades in the given courses
+
+    course_ids: e.g. from the student's ENROLLMENT# / GRADE# items; pass
+    them explicitly for courses whose items have since been deleted.
+    """
+    for course_id in course_ids:
+        for entity in entities or ENTITIES.values():
+            keys = list_partition_objects(s3, bucket, entity, course_id, start_date, end_date)
+            yield from read_objects(s3, bucket, keys, identity_id)
@@ -0,0 +1,287 @@
+"""
+AWS client registry
+
+One boto3 session and one client per (service, region, config) per
+container, instead of every module building its own:
+- Clients share a session, so service models and endpoint rules are
+  loaded once
+- Every client is pinned to the function's region and gets a keep-alive
+  connection pool with the standard retry mode
+- warm() opens the TLS connections of the clients a handler actually
+  uses during Lambda init, so the first real call of an invocation
+  (e.g. the welcome email's SES send) does not pay for DNS + TCP + TLS
+- Each client records per-operation latency (count, total, max and a
+  coarse histogram for p50/p99)
+- DynamoDB clients are run by a throughput controller (wiseuni/throttle.py):
+  the shared interactive one unless another is passed as throughput=
+
+    from wiseuni import aws
+    ses = aws.client('ses')
+    table = aws.table(os.environ['TABLE_NAME'])
+    aws.warm(mailer.client, table)   # at module level, the objects in use
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from wiseuni.throttle import INTERACTIVE, ThroughputController
+
+logger = logging.getLogger(__name__)
+
+REGION = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or 'eu-west-2'
+
+DEFAULT_CONFIG = {
+    'region_name': REGION,
+    'max_pool_connections': 10,
+    'tcp_keepalive': True,
+    'connect_timeout': 2,
+    'read_timeout': 10,
+    'retries': {'mode': 'standard', 'max_attempts': 3},
+}
+
+# Cheap calls used to open a connection; an AccessDenied answer warms it just as well
+WARMUP_CALLS = {
+    'ses': ('get_send_quota', {}),
+    'sesv2': ('get_account', {}),
+    'dynamodb': ('describe_limits', {}),
+    's3': ('list_buckets', {}),
+    'cognito-idp': ('list_user_pools', {'MaxResults': 1}),
+    'cognito-identity': ('list_identity_pools', {'MaxResults': 1}),
+    'lambda': ('get_account_settings', {}),
+    'sqs': ('list_queues', {'MaxResults': 1}),
+    'kms': ('list_aliases', {'Limit': 1}),
+}
+
+# Histogram bucket upper bounds in milliseconds
+_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+
+_lock = threading.RLock()
+_session = None
+_clients = {}
+_resources = {}
+_tables = {}
+_thread_local = threading.local()
+_latency = {}
+
+# Jittered throttle retries and throttle metrics for all request-path DynamoDB calls
+interactive = ThroughputController('interactive', **INTERACTIVE)
+
+
+# ========================================
+# LATENCY COUNTERS
+# ========================================
+
+class LatencyStats:
+    """Calls of one service operation"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(_BUCKETS_MS)
+
+    def add(self, elapsed_ms, error=False):
+        self.count += 1
+        self.errors += error
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(_BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls"""
+        target, seen = fraction * self.count, 0
+        for bound, count in zip(_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avgMs': round(self.total_ms / self.count, 1) if self.count else 0,
+            'p50Ms': round(self.percentile(0.5), 1),
+            'p99Ms': round(self.percentile(0.99), 1),
+            'maxMs': round(self.max_ms, 1),
+        }
+
+
+def _record_start(context, model, **kwargs):
+    context['wiseuni_started'] = time.perf_counter()
+    context['wiseuni_operation'] = f'{model.service_model.service_name}.{model.name}'
+
+
+def _record_end(context, exception=None, parsed=None, **kwargs):
+    # after-call-error is emitted without the operation model: use the key saved at the start
+    started = context.get('wiseuni_started')
+    if started is None:
+        return
+    key = context['wiseuni_operation']
+    stats = _latency.get(key)
+    if stats is None:
+        stats = _latency.setdefault(key, LatencyStats())
+    error = exception is not None or bool((parsed or {}).get('Error'))
+    stats.add((time.perf_counter() - started) * 1000, error)
+
+
+def _instrument(events):
+    # Module-level functions: botocore only keeps weak references to handlers
+    events.register('before-parameter-build', _record_start)
+    events.register('after-call', _record_end)
+    events.register('after-call-error', _record_end)
+
+
+def latency_stats():
+    """{'ses.SendEmail': {'count': .., 'p99Ms': ..}, ...} since container start"""
+    return {key: stats.as_dict() for key, stats in sorted(_latency.items())}
+
+
+def log_latency(log=None):
+    (log or logger).info(f'AWS call latency: {json.dumps(latency_stats())}, '
+                         f'DynamoDB throughput: {json.dumps(interactive.stats())}')
+
+
+# ========================================
+# REGISTRY
+# ========================================
+
+def session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session(region_name=REGION)
+    return _session
+
+
+def _config_key(service, options, throughput=None):
+    return service, json.dumps(options, sort_keys=True, default=str), throughput and throughput.name
+
+
+def client(service, throughput=None, **options):
+    """
+    Shared client for a service; options override DEFAULT_CONFIG
+
+    e.g. aws.client('s3', signature_version='s3v4', max_pool_connections=32)
+    throughput: ThroughputController (DynamoDB default: interactive;
+    other services: none)
+    """
+    key = _config_key(service, options, throughput)
+    existing = _clients.get(key)
+    if existing is not None:
+        return existing
+    with _lock:  # Building clients from one session is not thread-safe
+        existing = _clients.get(key)
+        if existing is None:
+            existing = session().client(service, config=Config(**{**DEFAULT_CONFIG, **options}))
+            _instrument(existing.meta.events)
+            if service == 'dynamodb':
+                (throughput or interactive).attach(existing)
+            elif throughput is not None:
+                throughput.attach(existing)
+            _clients[key] = existing
+    return existing
+
+
+def _new_resource(service, throughput, options):
+    with _lock:
+        created = session().resource(service, config=Config(**{**DEFAULT_CONFIG, **options}))
+    _instrument(created.meta.client.meta.events)
+    if service == 'dynamodb':
+        (throughput or interactive).attach(created.meta.client)
+    return created
+
+
+def resource(service, throughput=None, **options):
+    """Shared boto3 resource; like resources in general, not for use across threads"""
+    key = _config_key(service, options, throughput)
+    existing = _resources.get(key)
+    if existing is None:
+        with _lock:
+            existing = _resources.get(key)
+            if existing is None:
+                existing = _resources[key] = _new_resource(service, throughput, options)
+    return existing
+
+
+def table(name):
+    """Shared DynamoDB Table (single-threaded handlers)"""
+    existing = _tables.get(name)
+    if existing is None:
+        existing = _tables[name] = resource('dynamodb').Table(name)
+    return existing
+
+
+def thread_table(name, throughput=None):
+    """
+    The calling thread's own DynamoDB Table, for worker pools
+
+    Same session, instrumentation and throughput controller as table()
+    (or throughput=, like resource()), but one resource per thread, since
+    resources are not thread-safe.
+    """
+    tables = getattr(_thread_local, 'tables', None)
+    if tables is None:
+        tables = _thread_local.tables = {}
+    key = name, throughput and throughput.name
+    existing = tables.get(key)
+    if existing is None:
+        existing = tables[key] = _new_resource('dynamodb', throughput, {}).Table(name)
+    return existing
+
+
+def _warm_client(target):
+    """The botocore client behind a client, resource or Table"""
+    if isinstance(target, str):
+        return client(target)
+    meta = getattr(target, 'meta', None)
+    if meta is not None and getattr(meta, 'client', None) is not None:
+        return meta.client  # boto3 resource or Table
+    return target
+
+
+def warm(*targets):
+    """
+    Open pooled connections during Lambda init
+
+    targets: the clients, resources or Tables the handler will call, e.g.
+    aws.warm(mailer.client, table). Clients are keyed by their config
+    (throughput, signature version, ...), so warming a service by name
+    opens a connection on the default client only; a str is still
+    accepted for code that uses exactly that client.
+
+    Init code runs before the first request (and with full CPU), so the
+    handshake is not on any request's path. Does nothing outside Lambda
+    or with AWS_WARMUP=false.
+    """
+    if not os.environ.get('AWS_LAMBDA_FUNCTION_NAME') or os.environ.get('AWS_WARMUP', 'true') == 'false':
+        return
+
+    def touch(target):
+        warmed = _warm_client(target)
+        service = warmed.meta.service_model.service_name
+        operation, params = WARMUP_CALLS.get(service, (None, None))
+        if operation is None:
+            return
+        try:
+            getattr(warmed, operation)(**params)
+        except (ClientError, BotoCoreError) as e:
+            logger.debug(f'Warmup {service}.{operation}: {str(e)}')
+
+    # One call per distinct client (the Tables of one function share theirs)
+    clients = list({id(c): c for c in map(_warm_client, targets)}.values())
+    # In parallel: init time is bounded by the slowest handshake, not the sum
+    threads = [threading.Thread(target=touch, args=(c,)) for c in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=3)
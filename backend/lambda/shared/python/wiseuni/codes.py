@@ -0,0 +1,56 @@
+"""
+Codes for Cognito's custom sender triggers
+
+Cognito hands a custom email sender the verification code (or an
+invited user's temporary password) encrypted with the AWS Encryption SDK
+under the user pool's KMS key (LambdaConfig.KMSKeyID), base64-encoded.
+
+A decryptor is anything with decrypt(ciphertext) -> str:
+    KmsDecryptor(key_arn)   Encryption SDK + KMS; needs aws-encryption-sdk
+                            (custom_email_sender/requirements.txt)
+    PlaintextDecryptor()    the "ciphertext" is the code itself; for local
+                            runs and benchmarks, refused inside Lambda
+
+    decryptor = decryptor_from_env()   # KMS_KEY_ARN, or CODE_DECRYPTOR=plaintext
+    code = decryptor.decrypt(event['request']['code'])
+"""
+
+import base64
+import os
+
+
+class KmsDecryptor:
+    """Encryption SDK messages under one KMS key (strict: no other key is tried)"""
+
+    def __init__(self, key_arn):
+        # Imported here: only this decryptor needs the SDK (and its cryptography wheels)
+        import aws_encryption_sdk
+        from aws_encryption_sdk import CommitmentPolicy
+
+        self.key_arn = key_arn
+        self._client = aws_encryption_sdk.EncryptionSDKClient(
+            commitment_policy=CommitmentPolicy.REQUIRE_ENCRYPT_ALLOW_DECRYPT,
+        )
+        # Built once per container: the provider keeps its KMS client
+        self._keys = aws_encryption_sdk.StrictAwsKmsMasterKeyProvider(key_ids=[key_arn])
+
+    def decrypt(self, ciphertext):
+        plaintext, _ = self._client.decrypt(source=base64.b64decode(ciphertext), key_provider=self._keys)
+        return plaintext.decode('utf-8')
+
+
+class PlaintextDecryptor:
+    """Local stand-in: events carry the code in the clear"""
+
+    def decrypt(self, ciphertext):
+        return ciphertext
+
+
+def decryptor_from_env():
+    """KmsDecryptor for KMS_KEY_ARN; PlaintextDecryptor only outside Lambda with CODE_DECRYPTOR=plaintext"""
+    key_arn = os.environ.get('KMS_KEY_ARN')
+    if key_arn:
+        return KmsDecryptor(key_arn)
+    if os.environ.get('CODE_DECRYPTOR') == 'plaintext' and not os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+        return PlaintextDecryptor()
+    raise RuntimeError('KMS_KEY_ARN is not set (CODE_DECRYPTOR=plaintext is for local runs only)')
@@ -0,0 +1,150 @@
+"""
+Identity Pool credential broker
+
+Exchanges a User Pool ID token for temporary AWS credentials
+(GetId + GetCredentialsForIdentity) and keeps the result until shortly
+before it expires, so a dashboard render that needs credentials five
+times costs Cognito Identity two calls instead of ten.
+
+- Credentials are cached per token (SHA-256 of it, never the token itself):
+  a cache hit needs the exact token Cognito already accepted, so a
+  forged token can never be answered from the cache
+- sub -> identityId is cached separately, but only for callers whose token
+  was verified upstream (API Gateway JWT authorizer); a refreshed token
+  then needs only GetCredentialsForIdentity
+- Entries expire MARGIN_SECONDS before the credentials or the token do
+- Concurrent requests for the same token share one upstream exchange
+- stats() reports hits, coalesced waits, misses and upstream calls
+
+    broker = CredentialBroker(aws.client('cognito-identity'), pool_id, provider)
+    credentials, source = broker.get(id_token, subject=claims['sub'])
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+MARGIN_SECONDS = 300
+MAX_ENTRIES = 10_000
+
+HIT, COALESCED, MISS = 'HIT', 'COALESCED', 'MISS'
+
+
+def token_expiry(id_token):
+    """exp claim of a JWT, read without verification (only used to shorten a TTL)"""
+    try:
+        payload = id_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class CredentialBroker:
+    """Thread-safe, per-token cache in front of Cognito Identity"""
+
+    def __init__(self, client, identity_pool_id, provider_name,
+                 margin_seconds=MARGIN_SECONDS, max_entries=MAX_ENTRIES, clock=time.time):
+        self.client = client
+        self.identity_pool_id = identity_pool_id
+        self.provider_name = provider_name  # cognito-idp.<region>.amazonaws.com/<user pool id>
+        self.margin_seconds = margin_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # token hash -> (expires_at, credentials)
+        self._identities = OrderedDict()  # verified sub -> identityId
+        self._inflight = {}  # token hash -> Future
+        self._counters = dict.fromkeys(
+            ('requests', 'hits', 'coalesced', 'misses', 'errors', 'getId', 'getCredentials'), 0
+        )
+
+    def get(self, id_token, subject=None):
+        """
+        (credentials, source) for an ID token; source is HIT, COALESCED or MISS
+
+        Pass subject only when the token's signature has been verified.
+        credentials: identityId, accessKeyId, secretAccessKey, sessionToken,
+        expiration (epoch seconds)
+        """
+        key = hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+        with self._lock:
+            self._counters['requests'] += 1
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._cache.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[1], HIT
+            waiting = self._inflight.get(key)
+            if waiting is None:
+                self._inflight[key] = future = Future()
+                self._counters['misses'] += 1
+            else:
+                self._counters['coalesced'] += 1
+
+        if waiting is not None:
+            return waiting.result(), COALESCED  # Re-raises the leader's error
+
+        try:
+            credentials = self._exchange(id_token, subject)
+            future.set_result(credentials)
+        except Exception as e:
+            with self._lock:
+                self._counters['errors'] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        expires_at = credentials['expiration']
+        token_expires = token_expiry(id_token)
+        if token_expires is not None:
+            expires_at = min(expires_at, token_expires)
+        if expires_at - self.margin_seconds > self.clock():  # Not worth keeping otherwise
+            with self._lock:
+                self._store(self._cache, key, (expires_at - self.margin_seconds, credentials))
+        return credentials, MISS
+
+    def _exchange(self, id_token, subject):
+        logins = {self.provider_name: id_token}
+        identity_id = self._identities.get(subject) if subject else None
+        if identity_id is None:
+            with self._lock:
+                self._counters['getId'] += 1
+            identity_id = self.client.get_id(IdentityPoolId=self.identity_pool_id, Logins=logins)['IdentityId']
+            if subject:
+                with self._lock:
+                    self._store(self._identities, subject, identity_id)
+
+        with self._lock:
+            self._counters['getCredentials'] += 1
+        issued = self.client.get_credentials_for_identity(IdentityId=identity_id, Logins=logins)['Credentials']
+        return {
+            'identityId': identity_id,
+            'accessKeyId': issued['AccessKeyId'],
+            'secretAccessKey': issued['SecretKey'],
+            'sessionToken': issued['SessionToken'],
+            'expiration': issued['Expiration'].timestamp(),
+        }
+
+    def _store(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters['entries'] = len(self._cache)
+        served = counters['hits'] + counters['coalesced']
+        counters['hitRate'] = round(served / counters['requests'], 3) if counters['requests'] else 0.0
+        # Upstream calls avoided versus two per request
+        counters['upstreamSaved'] = 2 * counters['requests'] - counters['getId'] - counters['getCredentials']
+        return counters
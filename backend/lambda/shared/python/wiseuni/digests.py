@@ -0,0 +1,391 @@
+"""
+Grade notification digests
+
+Publishing a course's grades writes one USER#<id> / GRADE#<courseId> item
+per student. One email per write would be 20,000 emails for a faculty's
+busy hour, and a student graded in four courses that afternoon would get
+four. Grades are collected per student instead and sent as one digest
+per window:
+
+    table stream (grade INSERTs, MODIFYs that change grade or points)
+      -> DigestCollector: one pending entry per student and course (a
+         regrade overwrites it); the student's first grade opens a window
+         and queues one delayed message for it
+      -> DigestSender, once the window is over: all of the student's
+         entries in one email (templates/grade_digest), many students per
+         batch, sent with bounded concurrency through the shared Mailer
+
+Layout in the single table:
+    PK = NOTIFY#<identityId>  SK = GRADE#<courseId>   pending entry
+        courseId, grade, points, gradedAt, courseName (when the grade item
+        has one), revision (stream sequence number), expiresAt
+    PK = NOTIFY#<identityId>  SK = DIGEST             the open window
+        dueAt, openedAt, openedBy (stream sequence number), expiresAt
+
+Only the conditional PutItem that opens a window queues a message, so a
+student gets one message and one email per window however many grades
+arrive in it. The sender closes the window before reading the entries: a
+grade written meanwhile opens the next window and is in this digest or
+the next, never in neither. An entry is deleted after its digest went
+out, and only if no regrade replaced it (revision unchanged).
+
+Failures: a stream retry re-puts the same entries and reopens the windows
+it opened (openedBy); a window whose message was lost is reopened by the
+student's next grade once it is STALE_SECONDS past due. A failed send
+keeps the entries and the message is retried; a sent digest whose cleanup
+fails is not, so a duplicate email needs two failures in a row.
+
+    collector = DigestCollector(table, DigestQueue(sqs, queue_url), window_seconds=1800)
+    collector.collect(stream_records)
+    sender = DigestSender(table, Mailer(), SuppressionIndex(table), queue)
+    failed, stats = sender.deliver([(message_id, body), ...])
+"""
+
+import json
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from wiseuni.items import course_metadata, decode
+from wiseuni.profile import profile_key
+from wiseuni.templates import render
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_PREFIX = 'NOTIFY#'
+ENTRY_PREFIX = 'GRADE#'
+WINDOW_SK = 'DIGEST'
+
+DEFAULT_WINDOW_SECONDS = 1800
+DEFAULT_CONCURRENCY = 8
+# SQS DelaySeconds limit; a longer window is waited out in several hops
+MAX_DELAY_SECONDS = 900
+# A window this far past due lost its message: the next grade reopens it
+STALE_SECONDS = 3600
+# Entries nobody sends (no address, DLQ) disappear by the table TTL
+ENTRY_TTL_SECONDS = 14 * 86400
+
+_deserializer = TypeDeserializer()
+
+
+def notify_pk(identity_id):
+    return f'{NOTIFY_PREFIX}{identity_id}'
+
+
+def window_key(identity_id):
+    return {'PK': notify_pk(identity_id), 'SK': WINDOW_SK}
+
+
+def entry_key(identity_id, course_id):
+    return {'PK': notify_pk(identity_id), 'SK': f'{ENTRY_PREFIX}{course_id}'}
+
+
+# ========================================
+# STREAM: PUBLISHED GRADES
+# ========================================
+
+def _image(record, name):
+    image = record.get('dynamodb', {}).get(name)
+    if not image:
+        return None
+    return decode({attribute: _deserializer.deserialize(value) for attribute, value in image.items()})
+
+
+def published_grades(records):
+    """
+    identityId -> {courseId: entry} for the grades published or changed in
+    a batch of stream records; the last write of each student and course wins
+    """
+    published = {}
+    for record in records:
+        keys = record.get('dynamodb', {}).get('Keys', {})
+        pk, sk = keys.get('PK', {}).get('S', ''), keys.get('SK', {}).get('S', '')
+        # The event source filter already does this; kept for manual replays
+        if record.get('eventName') not in ('INSERT', 'MODIFY') or not (pk.startswith('USER#') and sk.startswith('GRADE#')):
+            continue
+        new = _image(record, 'NewImage')
+        if new is None or (new.get('grade') is None and new.get('points') is None):
+            continue
+        old = _image(record, 'OldImage')
+        if old is not None and (old.get('grade'), old.get('points')) == (new.get('grade'), new.get('points')):
+            continue  # Re-encoded (items.py) or touched, not regraded
+
+        course_id = sk[len('GRADE#'):]
+        entry = {'courseId': course_id, 'revision': record['dynamodb'].get('SequenceNumber', '0')}
+        for attribute in ('grade', 'points', 'gradedAt', 'courseName'):
+            if new.get(attribute) is not None:
+                entry[attribute] = new[attribute]
+        published.setdefault(pk[len('USER#'):], {})[course_id] = entry
+    return published
+
+
+class DigestQueue:
+    """Delayed SQS messages, one per window: {"identityId": ..., "dueAt": epoch seconds}"""
+
+    def __init__(self, sqs, queue_url, clock=time.time):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.clock = clock
+
+    def schedule(self, windows):
+        """(identityId, dueAt) pairs, each delayed until dueAt or MAX_DELAY_SECONDS, in 10s"""
+        windows = list(windows)
+        now = self.clock()
+        for start in range(0, len(windows), 10):
+            entries = [{
+                'Id': str(number),
+                'MessageBody': json.dumps({'identityId': identity_id, 'dueAt': due_at}),
+                'DelaySeconds': max(0, min(MAX_DELAY_SECONDS, int(due_at - now))),
+            } for number, (identity_id, due_at) in enumerate(windows[start:start + 10])]
+            failed = self.sqs.send_message_batch(QueueUrl=self.queue_url, Entries=entries).get('Failed')
+            if failed:
+                raise RuntimeError(f'{len(failed)} digest message(s) not queued: {failed[0].get("Message")}')
+
+
+class DigestCollector:
+    """Stream side: stages pending entries and opens one window per student"""
+
+    def __init__(self, table, queue, window_seconds=DEFAULT_WINDOW_SECONDS, clock=time.time):
+        self.table = table
+        self.queue = queue
+        self.window_seconds = window_seconds
+        self.clock = clock
+
+    def collect(self, records):
+        published = published_grades(records)
+        now = self.clock()
+        expires_at = int(now) + ENTRY_TTL_SECONDS
+
+        with self.table.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+            for identity_id, entries in published.items():
+                for course_id, entry in entries.items():
+                    batch.put_item(Item={**entry_key(identity_id, course_id), **entry, 'expiresAt': expires_at})
+
+        due_at = int(now + self.window_seconds)
+        opened = []
+        for identity_id, entries in published.items():
+            # The same record opens it again when this batch is retried
+            opened_by = min(entries.values(), key=lambda entry: int(entry['revision']))['revision']
+            if self._open(identity_id, due_at, opened_by, now):
+                opened.append(identity_id)
+        try:
+            self.queue.schedule((identity_id, due_at) for identity_id in opened)
+        except Exception:
+            # Closed again, so the retried batch opens and queues them anew
+            for identity_id in opened:
+                self._close(identity_id)
+            raise
+
+        return {
+            'grades': sum(len(entries) for entries in published.values()),
+            'students': len(published),
+            'windows': len(opened),
+        }
+
+    def _open(self, identity_id, due_at, opened_by, now):
+        try:
+            self.table.put_item(
+                Item={**window_key(identity_id), 'dueAt': due_at, 'openedAt': int(now), 'openedBy': opened_by,
+                      'expiresAt': int(now) + ENTRY_TTL_SECONDS},
+                ConditionExpression='attribute_not_exists(PK) OR dueAt < :stale OR openedBy = :opened_by',
+                ExpressionAttributeValues={':stale': int(now) - STALE_SECONDS, ':opened_by': opened_by},
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False  # Already open: its message is on the way
+
+    def _close(self, identity_id):
+        try:
+            self.table.delete_item(Key=window_key(identity_id))
+        except ClientError as e:
+            logger.warning(f'Could not close the digest window of {identity_id}: {e}')
+
+
+# ========================================
+# QUEUE: DIGESTS
+# ========================================
+
+def _points(value):
+    if value is None:
+        return '-'
+    if isinstance(value, Decimal):
+        return f'{value.normalize():f}'
+    return str(value)
+
+
+def digest_message(profile, entries, courses=None):
+    """Rendered digest for one student: a row per course, by course id"""
+    courses = courses or {}
+    rows = []
+    for entry in sorted(entries, key=lambda entry: entry['courseId']):
+        course = courses.get(entry['courseId']) or {}
+        rows.append({
+            'course': entry.get('courseName') or course.get('title') or entry['courseId'],
+            'courseId': entry['courseId'],
+            'grade': entry.get('grade') or '-',
+            'points': _points(entry.get('points')),
+        })
+    name = profile.get('name') or profile['email'].split('@')[0]
+    return render('grade_digest', profile.get('locale'), name=name, count=len(rows), rows=rows)
+
+
+class DigestSender:
+    """
+    Queue side: turns due windows into emails
+
+    DynamoDB work stays on the calling thread (boto3 Table objects are
+    not shared across threads); only SES sends run on the pool.
+    """
+
+    def __init__(self, table, mailer, suppression=None, queue=None, concurrency=DEFAULT_CONCURRENCY, clock=time.time):
+        self.table = table
+        self.mailer = mailer
+        self.suppression = suppression
+        self.queue = queue
+        self.concurrency = concurrency
+        self.clock = clock
+
+    def deliver(self, messages):
+        """
+        messages: (messageId, body) pairs from the digest queue; returns
+        the messageIds to retry and counters for the log
+        """
+        now = self.clock()
+        stats = Counter(messages=len(messages))
+        failed = []
+        message_ids, early = {}, []
+        for message_id, body in messages:
+            if body.get('dueAt', 0) > now + 1:
+                early.append((message_id, body))  # Window longer than one SQS delay
+            else:
+                message_ids.setdefault(body['identityId'], []).append(message_id)
+        if early:
+            try:
+                self.queue.schedule((body['identityId'], body['dueAt']) for _, body in early)
+                stats['delayed'] += len(early)
+            except Exception as e:
+                logger.warning(f'Could not delay {len(early)} digest message(s) again, will retry: {e}')
+                failed.extend(message_id for message_id, _ in early)
+
+        pending = {}
+        for identity_id, ids in message_ids.items():
+            try:
+                entries = self._take(identity_id)
+            except ClientError as e:
+                logger.warning(f'{identity_id}: pending grades unreadable, will retry: {e.response["Error"]["Code"]}')
+                failed.extend(ids)
+                continue
+            if entries:
+                pending[identity_id] = entries
+            else:
+                stats['empty'] += 1  # Sent with an earlier window
+
+        outgoing = self._prepare(pending, stats)
+        for (identity_id, _, _), result in zip(outgoing, self._send_all(outgoing)):
+            if isinstance(result, Exception):
+                logger.warning(f'{identity_id}: digest not sent, will retry: {result}')
+                stats['failed'] += 1
+                failed.extend(message_ids[identity_id])
+                continue
+            stats['sent'] += 1
+            stats['grades'] += len(pending[identity_id])
+            self._clear(identity_id, pending[identity_id], stats)
+        return failed, dict(stats)
+
+    # ----------------------------------------
+    # Steps
+    # ----------------------------------------
+
+    def _take(self, identity_id):
+        """Close the window, then read every pending entry of the student"""
+        self.table.delete_item(Key=window_key(identity_id))
+        entries = []
+        request = {
+            'KeyConditionExpression': 'PK = :pk AND begins_with(SK, :sk)',
+            'ExpressionAttributeValues': {':pk': notify_pk(identity_id), ':sk': ENTRY_PREFIX},
+            'ConsistentRead': True,
+        }
+        while True:
+            page = self.table.query(**request)
+            entries.extend(page.get('Items', []))
+            if 'LastEvaluatedKey' not in page:
+                return entries
+            request['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+    def _profiles(self, identity_ids):
+        """identityId -> email, name, locale of the PROFILE item, BatchGetItem in 100s"""
+        profiles = {}
+        identity_ids = list(identity_ids)
+        for start in range(0, len(identity_ids), 100):
+            request = {self.table.name: {
+                'Keys': [profile_key(identity_id) for identity_id in identity_ids[start:start + 100]],
+                'ProjectionExpression': 'PK, email, #name, locale',
+                'ExpressionAttributeNames': {'#name': 'name'},
+            }}
+            while request:
+                result = self.table.meta.client.batch_get_item(RequestItems=request)
+                for item in result['Responses'].get(self.table.name, []):
+                    profiles[item.pop('PK')[len('USER#'):]] = item
+                request = result.get('UnprocessedKeys') or None
+        return profiles
+
+    def _prepare(self, pending, stats):
+        """(identityId, email, Rendered) to send; students with nobody to send to are cleared"""
+        if not pending:
+            return []
+        profiles = self._profiles(pending)
+        # Compact grade items carry no course name: one cached lookup for the batch
+        unnamed = {entry['courseId'] for entries in pending.values() for entry in entries if not entry.get('courseName')}
+        courses = course_metadata(self.table, unnamed) if unnamed else {}
+
+        outgoing = []
+        for identity_id, entries in pending.items():
+            profile = profiles.get(identity_id) or {}
+            email = profile.get('email')
+            if not email:
+                logger.warning(f'{identity_id}: no profile email, {len(entries)} grade notification(s) dropped')
+                stats['no_address'] += 1
+                self._clear(identity_id, entries, stats)
+                continue
+            if self.suppression is not None and self.suppression.is_suppressed(email):
+                logger.info(f'{identity_id}: address is suppressed, digest skipped')
+                stats['suppressed'] += 1
+                self._clear(identity_id, entries, stats)
+                continue
+            outgoing.append((identity_id, email, digest_message(profile, entries, courses)))
+        return outgoing
+
+    def _send_all(self, outgoing):
+        """Message id or the exception, per digest, in order; at most `concurrency` sends at once"""
+        def send(digest):
+            try:
+                return self.mailer.send(digest[1], digest[2])
+            except Exception as e:
+                return e
+
+        if len(outgoing) <= 1 or self.concurrency <= 1:
+            return [send(digest) for digest in outgoing]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(outgoing))) as pool:
+            return list(pool.map(send, outgoing))
+
+    def _clear(self, identity_id, entries, stats):
+        """Delete the entries handled, unless a regrade replaced them since"""
+        for entry in entries:
+            try:
+                self.table.delete_item(
+                    Key=entry_key(identity_id, entry['courseId']),
+                    ConditionExpression='revision = :revision',
+                    ExpressionAttributeValues={':revision': entry['revision']},
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    stats['regraded'] += 1  # Goes out with the next window
+                else:
+                    # Not retried: the email went out; the entry rides along with the next digest
+                    logger.warning(f'{identity_id}: could not clear {entry["courseId"]}: {e}')
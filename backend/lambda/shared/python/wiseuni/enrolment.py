@@ -0,0 +1,577 @@
+"""
+Seat-limited enrolment with a FIFO waitlist
+
+Enrolments used to be a plain PutItem from the browser, so nothing kept a
+popular course from filling past its room. A course with a seat limit
+now keeps it in seat counter items, and an enrolment takes a seat in the
+same TransactWriteItems that creates its ENROLLMENT# item:
+
+    COURSE#<id> / SEATS#00..NN            capacity, taken: one shard of the limit
+    COURSE#<id> / WAITLIST#<joined>#<id>  waitlist entry; sort key order is FIFO
+    USER#<id>   / WAITLIST#<courseId>     the student's side of the entry
+    COURSE#<id> / RELEASE#<eventId>       seat already released for that stream
+                                          record (expiresAt: table TTL)
+
+- Shards: with one counter item, every enrolment transaction of a
+  registration opening would write the same item, and DynamoDB cancels a
+  transaction that touches an item another transaction is writing
+  (TransactionConflict). The limit is split over up to MAX_SHARDS items;
+  an enrolment reads them (one strongly consistent Query), tries those
+  with a free seat in random order and moves on to another on a
+  conflict. The limit stays exact: a shard only gives out a seat while
+  taken < capacity, and a course is full once every shard says so.
+- Waitlist: a full course, or one that already has people waiting, adds
+  the student to the waitlist instead. Entries sort by join time.
+- Seats come back through the table stream (enrolment_promoter
+  function): a REMOVEd active enrolment that holds a seat decrements a
+  shard once per stream record (the RELEASE# marker is written in the
+  same transaction), then the oldest waitlist entries are enrolled while
+  seats are free. A waitlist INSERT triggers the same check, for a
+  student who joined just as a seat was freed.
+- Seat holders: an enrolment that took a seat carries seatShard (the
+  shard it came from). Enrolments written some other way (the browser's
+  PutItem, before the browser roles lost write access to enrolments in
+  stacks/iam-roles.yaml) hold no seat, so removing them gives none back.
+- A course without SEATS# items has no limit.
+
+    outcome = enrol(table, 'CS101', identity_id, course)   # enrolled / waitlisted
+    drop(table, 'CS101', identity_id)                      # the stream does the rest
+"""
+
+import logging
+import random
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from wiseuni.indexes import write_index_keys
+from wiseuni.items import KEY_ATTRIBUTES, course_metadata, decode
+from wiseuni.submissions import format_timestamp
+from wiseuni.throttle import full_jitter
+
+logger = logging.getLogger(__name__)
+
+SHARD_PREFIX = 'SEATS#'
+WAITLIST_PREFIX = 'WAITLIST#'
+RELEASE_PREFIX = 'RELEASE#'
+SEAT_ATTRIBUTE = 'seatShard'
+
+MAX_SHARDS = 16
+SEATS_PER_SHARD = 10  # Small courses get fewer shards: one is enough for a seminar
+MAX_ATTEMPTS = 12  # Conflicted transactions per request before giving up
+BASE_DELAY, MAX_DELAY = 0.01, 0.5
+RELEASE_MARKER_SECONDS = 7 * 24 * 3600  # Longer than a stream record can be retried
+
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+WAITLISTED = 'waitlisted'
+ALREADY_WAITLISTED = 'already_waitlisted'
+DROPPED = 'dropped'
+LEFT_WAITLIST = 'left_waitlist'
+
+# _claim() results besides ENROLLED / ALREADY_ENROLLED
+_FULL = 'full'
+_GONE = 'gone'
+
+_CHECK_FAILED = 'ConditionalCheckFailed'
+_NAMES = {'#taken': 'taken', '#capacity': 'capacity'}
+
+_deserializer = TypeDeserializer()
+
+Shard = namedtuple('Shard', 'number capacity taken')
+Outcome = namedtuple('Outcome', 'status enrollment')
+
+
+class RegistrationBusy(Exception):
+    """Every attempt met a conflicting transaction; the request can be retried"""
+
+
+# ========================================
+# KEYS
+# ========================================
+
+def course_key(course_id, sk):
+    return {'PK': f'COURSE#{course_id}', 'SK': sk}
+
+
+def shard_key(course_id, number):
+    return course_key(course_id, f'{SHARD_PREFIX}{number:02d}')
+
+
+def enrollment_key(identity_id, course_id):
+    return {'PK': f'USER#{identity_id}', 'SK': f'ENROLLMENT#{course_id}'}
+
+
+def waitlist_marker_key(identity_id, course_id):
+    return {'PK': f'USER#{identity_id}', 'SK': f'{WAITLIST_PREFIX}{course_id}'}
+
+
+def default_shards(limit):
+    return max(1, min(MAX_SHARDS, limit // SEATS_PER_SHARD))
+
+
+def _now():
+    # Same format as the browser's toISOString()
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def new_enrollment(identity_id, course_id, course):
+    """ENROLLMENT# item as the frontend writes it, with its RosterIndex (and GSI1) keys"""
+    item = {
+        **enrollment_key(identity_id, course_id),
+        'identityId': identity_id,
+        'courseId': course_id,
+        'courseName': (course or {}).get('title', ''),
+        'professorName': (course or {}).get('professorName', ''),
+        'enrolledAt': _now(),
+        'status': 'active',
+    }
+    item.update(write_index_keys(item))
+    return item
+
+
+def public_enrollment(item):
+    """An enrolment item without its keys or seat marker (decoded if compact)"""
+    return {name: value for name, value in decode(item).items()
+            if name not in KEY_ATTRIBUTES and name != SEAT_ATTRIBUTE}
+
+
+# ========================================
+# READS
+# ========================================
+
+def read_shards(table, course_id):
+    """A course's seat shards, strongly consistent; [] when it has no limit"""
+    request = {
+        'KeyConditionExpression': 'PK = :pk AND begins_with(SK, :sk)',
+        'ExpressionAttributeValues': {':pk': f'COURSE#{course_id}', ':sk': SHARD_PREFIX},
+        'ConsistentRead': True,
+    }
+    shards = []
+    while True:
+        page = table.query(**request)
+        shards.extend(
+            Shard(int(item['SK'][len(SHARD_PREFIX):]), int(item['capacity']), int(item['taken']))
+            for item in page.get('Items', [])
+        )
+        if 'LastEvaluatedKey' not in page:
+            return shards
+        request['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def waitlist_head(table, course_id, limit=1):
+    """The oldest waitlist entries"""
+    return table.query(
+        KeyConditionExpression='PK = :pk AND begins_with(SK, :sk)',
+        ExpressionAttributeValues={':pk': f'COURSE#{course_id}', ':sk': WAITLIST_PREFIX},
+        ConsistentRead=True,
+        Limit=limit,
+    ).get('Items', [])
+
+
+def _count(table, condition, values):
+    request = {'KeyConditionExpression': condition, 'ExpressionAttributeValues': values, 'Select': 'COUNT'}
+    count = 0
+    while True:
+        page = table.query(**request)
+        count += page['Count']
+        if 'LastEvaluatedKey' not in page:
+            return count
+        request['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def waitlist_length(table, course_id):
+    return _count(table, 'PK = :pk AND begins_with(SK, :sk)',
+                  {':pk': f'COURSE#{course_id}', ':sk': WAITLIST_PREFIX})
+
+
+def waitlist_position(table, course_id, entry_sk):
+    """1 for the head of the waitlist; reads every entry ahead, so only on request"""
+    return _count(table, 'PK = :pk AND SK BETWEEN :first AND :entry',
+                  {':pk': f'COURSE#{course_id}', ':first': WAITLIST_PREFIX, ':entry': entry_sk})
+
+
+def seats(table, course_id):
+    """Limit, taken and free seats plus the waitlist length (limit None: no limit)"""
+    shards = read_shards(table, course_id)
+    taken = sum(shard.taken for shard in shards)
+    summary = {'courseId': course_id, 'limit': None, 'taken': taken, 'free': None, 'shards': len(shards)}
+    if shards:
+        limit = sum(shard.capacity for shard in shards)
+        summary.update(limit=limit, free=max(limit - taken, 0))
+    summary['waitlisted'] = waitlist_length(table, course_id)
+    return summary
+
+
+def enrolment_status(table, course_id, identity_id):
+    """{'status': 'enrolled' | 'waitlisted' | 'none', ...} for one student"""
+    item = table.get_item(Key=enrollment_key(identity_id, course_id), ConsistentRead=True).get('Item')
+    if item:
+        return {'status': ENROLLED, 'enrollment': public_enrollment(item)}
+    marker = table.get_item(Key=waitlist_marker_key(identity_id, course_id), ConsistentRead=True).get('Item')
+    if marker:
+        return {
+            'status': WAITLISTED,
+            'joinedAt': marker['joinedAt'],
+            'position': waitlist_position(table, course_id, marker['waitlistSK']),
+        }
+    return {'status': 'none'}
+
+
+# ========================================
+# TRANSACTIONS
+# ========================================
+
+def _transact(table, items):
+    """TransactWriteItems; None when it went through, else one reason code per item"""
+    try:
+        table.meta.client.transact_write_items(TransactItems=items)
+        return None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        reasons = e.response.get('CancellationReasons') or [{}] * len(items)
+        return [reason.get('Code', 'None') for reason in reasons]
+
+
+def _put_new(table, item):
+    return {'Put': {'TableName': table.name, 'Item': item, 'ConditionExpression': 'attribute_not_exists(PK)'}}
+
+
+def _delete(table, key, must_exist=True):
+    delete = {'TableName': table.name, 'Key': key}
+    if must_exist:
+        delete['ConditionExpression'] = 'attribute_exists(PK)'
+    return {'Delete': delete}
+
+
+def _take_seat(table, course_id, shard):
+    return {'Update': {
+        'TableName': table.name,
+        'Key': shard_key(course_id, shard.number),
+        'UpdateExpression': 'ADD #taken :one',
+        'ConditionExpression': '#taken < #capacity',
+        'ExpressionAttributeNames': _NAMES,
+        'ExpressionAttributeValues': {':one': 1},
+    }}
+
+
+def _back_off(attempt):
+    if attempt >= MAX_ATTEMPTS:
+        raise RegistrationBusy('Too many conflicting transactions')
+    time.sleep(full_jitter(attempt, BASE_DELAY, MAX_DELAY))
+
+
+def _claim(table, course_id, enrollment, shards, extra=()):
+    """
+    Create `enrollment` together with one seat and the `extra` writes
+
+    Returns ENROLLED, ALREADY_ENROLLED, _FULL (no shard has a seat) or
+    _GONE (an `extra` condition failed). Without shards there is no seat
+    to take.
+    """
+    attempt = 0
+    while True:
+        free = [shard for shard in shards if shard.taken < shard.capacity]
+        if shards and not free:
+            return _FULL
+        random.shuffle(free)
+        conflicted = False
+        for shard in free or [None]:
+            if shard is not None:
+                enrollment[SEAT_ATTRIBUTE] = shard.number
+            items = [_put_new(table, enrollment), *extra]
+            if shard is not None:
+                items.append(_take_seat(table, course_id, shard))
+            reasons = _transact(table, items)
+            if reasons is None:
+                return ENROLLED
+            if reasons[0] == _CHECK_FAILED:
+                return ALREADY_ENROLLED
+            if _CHECK_FAILED in reasons[1:1 + len(extra)]:
+                return _GONE
+            if shard is None or reasons[-1] != _CHECK_FAILED:
+                # TransactionConflict (or throttled): another shard first, then back off
+                conflicted = True
+                attempt += 1
+            # else: that shard filled up since it was read
+        if conflicted:
+            _back_off(attempt)
+        shards = read_shards(table, course_id)
+
+
+# ========================================
+# ENROL / DROP
+# ========================================
+
+def enrol(table, course_id, identity_id, course):
+    """
+    Enrol a student, or put them on the waitlist
+
+    course: the COURSE#<id> / METADATA item (names for the enrolment).
+    Raises RegistrationBusy after MAX_ATTEMPTS conflicting transactions.
+    """
+    enrollment = new_enrollment(identity_id, course_id, course)
+    shards = read_shards(table, course_id)
+    if not shards:
+        try:
+            table.put_item(Item=enrollment, ConditionExpression='attribute_not_exists(PK)')
+            return Outcome(ENROLLED, public_enrollment(enrollment))
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return Outcome(ALREADY_ENROLLED, None)
+
+    # People already waiting get freed seats first (enrolment_promoter)
+    if any(shard.taken < shard.capacity for shard in shards) and not waitlist_head(table, course_id):
+        result = _claim(table, course_id, enrollment, shards)
+        if result == ENROLLED:
+            return Outcome(ENROLLED, public_enrollment(enrollment))
+        if result == ALREADY_ENROLLED:
+            return Outcome(ALREADY_ENROLLED, None)
+    return join_waitlist(table, course_id, identity_id)
+
+
+def join_waitlist(table, course_id, identity_id):
+    """
+    Waitlist entry for a student who is not enrolled; no position in the
+    answer, counting the entries ahead would read the whole waitlist
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        # Joined when the write goes through: a retry after backing off is not
+        # placed ahead of everyone who joined meanwhile
+        joined_at = format_timestamp()
+        entry_sk = f'{WAITLIST_PREFIX}{joined_at}#{identity_id}'
+        marker = {
+            **waitlist_marker_key(identity_id, course_id),
+            'courseId': course_id, 'waitlistSK': entry_sk, 'joinedAt': joined_at,
+        }
+        entry = {**course_key(course_id, entry_sk), 'identityId': identity_id, 'joinedAt': joined_at}
+        reasons = _transact(table, [
+            {'ConditionCheck': {
+                'TableName': table.name,
+                'Key': enrollment_key(identity_id, course_id),
+                'ConditionExpression': 'attribute_not_exists(PK)',
+            }},
+            _put_new(table, marker),
+            _put_new(table, entry),
+        ])
+        if reasons is None:
+            return Outcome(WAITLISTED, None)
+        if reasons[0] == _CHECK_FAILED:
+            return Outcome(ALREADY_ENROLLED, None)
+        if reasons[1] == _CHECK_FAILED:
+            return Outcome(ALREADY_WAITLISTED, None)
+        _back_off(attempt)  # The student's own concurrent request, or the promoter
+
+
+def drop(table, course_id, identity_id):
+    """
+    Leave a course (DROPPED) or its waitlist (LEFT_WAITLIST); None if the
+    student is on neither. A dropped seat is released from the stream.
+    """
+    for _ in range(2):  # Promoted while leaving the waitlist: drop the enrolment
+        try:
+            table.delete_item(Key=enrollment_key(identity_id, course_id), ConditionExpression='attribute_exists(PK)')
+            return DROPPED
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        marker = table.get_item(Key=waitlist_marker_key(identity_id, course_id), ConsistentRead=True).get('Item')
+        if not marker:
+            return None
+        reasons = _transact(table, [
+            _delete(table, waitlist_marker_key(identity_id, course_id)),
+            _delete(table, course_key(course_id, marker['waitlistSK']), must_exist=False),
+        ])
+        if reasons is None:
+            return LEFT_WAITLIST
+    return None
+
+
+# ========================================
+# SEAT LIMITS
+# ========================================
+
+def _split(total, parts):
+    return [total // parts + (number < total % parts) for number in range(parts)]
+
+
+def hold_seats(table, enrollments):
+    """
+    Mark enrolments made before the course had a limit as seat holders,
+    so dropping them gives their seat back; returns how many hold one
+
+    enrollments: the course's active ENROLLMENT# items (keys are enough).
+    Called before the first configure_seats(), with this as `enrolled`.
+    """
+    held = 0
+    for item in enrollments:
+        try:
+            table.update_item(
+                Key={'PK': item['PK'], 'SK': item['SK']},
+                UpdateExpression='SET #seat = if_not_exists(#seat, :first)',
+                ConditionExpression='attribute_exists(PK)',
+                ExpressionAttributeNames={'#seat': SEAT_ATTRIBUTE},
+                ExpressionAttributeValues={':first': 0},
+            )
+            held += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # Dropped since the roster was read: holds nothing
+    return held
+
+
+def configure_seats(table, course_id, limit, shards=None, enrolled=None):
+    """
+    Set a course's seat limit, or remove it (limit None)
+
+    taken is kept from the existing shards and spread evenly over the new
+    ones. The first time, it is `enrolled`: the course's active enrolments
+    (the caller counts them). A limit below the enrolled count lets no one
+    in until enough students dropped.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        current = read_shards(table, course_id)
+        taken = sum(shard.taken for shard in current) if current else (enrolled or 0)
+        items = []
+        if limit is None:
+            new = []
+        else:
+            count = shards or default_shards(limit)
+            spread = _split(taken, count)
+            if limit >= taken:
+                capacity = [held + free for held, free in zip(spread, _split(limit - taken, count))]
+            else:
+                capacity = _split(limit, count)  # Never above a shard's taken: see release_seat()
+            new = [Shard(number, capacity[number], spread[number]) for number in range(count)]
+
+        # Every write is conditional on the shard not having moved since it was read
+        seen = {shard.number: shard for shard in current}
+        for shard in new:
+            put = {'TableName': table.name, 'Item': {
+                **shard_key(course_id, shard.number), 'capacity': shard.capacity, 'taken': shard.taken,
+            }}
+            if shard.number in seen:
+                put.update(ConditionExpression='#taken = :seen', ExpressionAttributeNames={'#taken': 'taken'},
+                           ExpressionAttributeValues={':seen': seen[shard.number].taken})
+            else:
+                put['ConditionExpression'] = 'attribute_not_exists(PK)'
+            items.append({'Put': put})
+        for shard in (shard for shard in current if shard.number >= len(new)):
+            items.append({'Delete': {
+                'TableName': table.name, 'Key': shard_key(course_id, shard.number),
+                'ConditionExpression': '#taken = :seen', 'ExpressionAttributeNames': {'#taken': 'taken'},
+                'ExpressionAttributeValues': {':seen': shard.taken},
+            }})
+        if not items or _transact(table, items) is None:
+            logger.info(f'Seats of {course_id}: limit {limit}, {taken} taken, {len(new)} shard(s)')
+            return new
+        _back_off(attempt)
+
+
+# ========================================
+# STREAM: RELEASE AND PROMOTE
+# ========================================
+
+def release_seat(table, course_id, event_id):
+    """
+    Give back one seat of a course for a removed enrolment, at most once
+    per stream record; False if it was already given back (or the course
+    has no limit)
+
+    The seat comes off the most overbooked shard: after a limit was
+    lowered below the enrolled count, no shard shows a free seat until
+    the course is back under its limit.
+    """
+    marker = {
+        **course_key(course_id, f'{RELEASE_PREFIX}{event_id}'),
+        'expiresAt': int(time.time()) + RELEASE_MARKER_SECONDS,
+    }
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        held = [shard for shard in read_shards(table, course_id) if shard.taken > 0]
+        if not held:
+            return False
+        excess = max(shard.taken - shard.capacity for shard in held)
+        shard = random.choice([shard for shard in held if shard.taken - shard.capacity == excess])
+        update = {
+            'TableName': table.name,
+            'Key': shard_key(course_id, shard.number),
+            'UpdateExpression': 'ADD #taken :minus',
+            'ExpressionAttributeNames': {'#taken': 'taken'},
+        }
+        if excess > 0:
+            # Still the most overbooked only if nothing changed it since the read
+            update.update(ConditionExpression='#taken = :seen',
+                          ExpressionAttributeValues={':minus': -1, ':seen': shard.taken})
+        else:
+            update.update(ConditionExpression='#taken > :zero', ExpressionAttributeValues={':minus': -1, ':zero': 0})
+        reasons = _transact(table, [{'Update': update}, _put_new(table, marker)])
+        if reasons is None:
+            return True
+        if reasons[1] == _CHECK_FAILED:
+            return False
+        _back_off(attempt)
+
+
+def promote(table, course_id, course=None):
+    """Enrol waitlisted students, oldest first, while the course has free seats; returns how many"""
+    if course is None:
+        course = course_metadata(table, [course_id]).get(course_id)
+    promoted = 0
+    while True:
+        shards = read_shards(table, course_id)
+        if shards and all(shard.taken >= shard.capacity for shard in shards):
+            return promoted
+        head = waitlist_head(table, course_id)
+        if not head:
+            return promoted
+        identity_id, entry_sk = head[0]['identityId'], head[0]['SK']
+        entry_key, marker_key = course_key(course_id, entry_sk), waitlist_marker_key(identity_id, course_id)
+        leave = [_delete(table, entry_key), _delete(table, marker_key, must_exist=False)]
+        result = _claim(table, course_id, new_enrollment(identity_id, course_id, course), shards, leave)
+        if result == ENROLLED:
+            promoted += 1
+        elif result == ALREADY_ENROLLED:
+            # Enrolled some other way: the entry only holds up the queue
+            _transact(table, [_delete(table, entry_key, must_exist=False), _delete(table, marker_key, must_exist=False)])
+        elif result == _FULL:
+            return promoted
+        # _GONE: left the waitlist, or another promoter got there first
+
+
+def _held_seat(record):
+    """Whether a removed enrolment held a seat: active and taken through a shard"""
+    image = record['dynamodb'].get('OldImage')
+    if not image:
+        # The stream is NEW_AND_OLD_IMAGES; without one there is no telling, and a
+        # seat released for an enrolment that never took one would overbook
+        logger.warning(f'No old image for {record.get("eventID")}: seat not released')
+        return False
+    item = decode({name: _deserializer.deserialize(value) for name, value in image.items()})
+    return SEAT_ATTRIBUTE in item and item.get('status') == 'active'
+
+
+def apply_stream_records(table, records):
+    """
+    Release the seats of removed seat-holding enrolments, then fill each touched
+    course from its waitlist; safe to run again on the same records
+    """
+    courses = {}
+    released = 0
+    for record in records:
+        keys = record.get('dynamodb', {}).get('Keys', {})
+        pk, sk = keys.get('PK', {}).get('S', ''), keys.get('SK', {}).get('S', '')
+        # The event source filters already do this; kept for manual replays
+        if record.get('eventName') == 'REMOVE' and pk.startswith('USER#') and sk.startswith('ENROLLMENT#'):
+            course_id = sk[len('ENROLLMENT#'):]
+            if _held_seat(record):
+                released += release_seat(table, course_id, record['eventID'])
+            courses.setdefault(course_id, None)
+        elif record.get('eventName') == 'INSERT' and pk.startswith('COURSE#') and sk.startswith(WAITLIST_PREFIX):
+            courses.setdefault(pk[len('COURSE#'):], None)
+    promoted = sum(promote(table, course_id) for course_id in courses)
+    return {'released': released, 'promoted': promoted, 'courses': len(courses)}
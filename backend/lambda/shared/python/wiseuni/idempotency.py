@@ -0,0 +1,241 @@
+"""
+Idempotency store for Cognito triggers
+
+Cognito calls a trigger again when it times out or fails, and the retry
+can land on a fresh container while the first call is still running. A
+side effect such as the welcome email must still happen once per request.
+
+Layout in the single table:
+    PK = IDEMPOTENCY#<triggerSource>#<sub>   SK = REQUEST#<fingerprint>
+        status       IN_PROGRESS | COMPLETED
+        outcome      JSON of what the side effect returned (e.g. the SES MessageId)
+        lockedUntil  epoch ms; an IN_PROGRESS record past this was abandoned
+                     (its call timed out) and may be taken over
+        expiresAt    epoch seconds (table TTL)
+
+Two tiers:
+- in-container: keys this container completed, answered without an AWS
+  call (a retry often reaches the container that finished the first
+  call late)
+- DynamoDB: one conditional PutItem claims the key. A repeat gets the
+  stored record back from the failed condition
+  (ReturnValuesOnConditionCheckFailure), so it also costs one call
+
+    idempotency = IdempotencyStore(aws.table(os.environ['TABLE_NAME']))
+    result = idempotency.run(trigger_key(event), lambda: send(event), context)
+    result.outcome, result.replayed
+
+Fails open like the suppression index: when DynamoDB is unavailable the
+side effect runs anyway, email problems never block sign-up.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, namedtuple
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+# Cognito gives up after three calls within a few seconds; a day is
+# plenty and the records cost nothing once the TTL removes them
+DEFAULT_TTL_SECONDS = 24 * 3600
+# Lock for a claim made without a Lambda context
+DEFAULT_LOCK_SECONDS = 30
+DEFAULT_CACHE_SIZE = 1024
+
+IdempotencyKey = namedtuple('IdempotencyKey', 'trigger_source sub fingerprint')
+Result = namedtuple('Result', 'outcome replayed')
+
+_deserializer = TypeDeserializer()
+
+
+class IdempotencyInProgress(Exception):
+    """Another call is running the side effect for this key right now"""
+
+
+def fingerprint(value):
+    """Stable digest of a JSON-like value (key order does not matter)"""
+    data = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:32]
+
+
+def trigger_key(event, fields=None):
+    """
+    Key of a Cognito trigger call: its source, the user's sub and a
+    fingerprint of the request, identical across Cognito's retries
+
+    fields: only these request fields count (e.g. ['userAttributes']),
+    for requests that carry values which change between retries
+    """
+    request = event.get('request') or {}
+    if fields is not None:
+        request = {field: request.get(field) for field in fields}
+    attributes = (event.get('request') or {}).get('userAttributes') or {}
+    sub = attributes.get('sub') or event.get('userName', '')
+    return IdempotencyKey(event.get('triggerSource', ''), sub, fingerprint(request))
+
+
+def record_key(key):
+    return {
+        'PK': f'IDEMPOTENCY#{key.trigger_source}#{key.sub}',
+        'SK': f'REQUEST#{key.fingerprint}',
+    }
+
+
+def _plain(item):
+    # The record returned with a failed condition is in wire format
+    if item and isinstance(item.get('PK'), dict):
+        return {name: _deserializer.deserialize(value) for name, value in item.items()}
+    return item
+
+
+class IdempotencyStore:
+    """
+    Runs a side effect at most once per key
+
+    One instance should be created at module level so completed keys
+    survive across warm invocations.
+    """
+
+    def __init__(self, table, ttl_seconds=DEFAULT_TTL_SECONDS, cache_size=DEFAULT_CACHE_SIZE,
+                 clock=time.time):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self._clock = clock
+        # key -> (expiresAt, outcome), oldest first
+        self._completed = OrderedDict()
+
+    def run(self, key, action, context=None):
+        """
+        Call action() unless this key already ran; returns Result with
+        action's outcome (JSON-serializable), or the stored one and
+        replayed=True for a repeat
+
+        Raises IdempotencyInProgress while another call holds the key. If
+        action raises, the claim is released so a retry runs it again.
+        """
+        cached = self._cached(key)
+        if cached is not None:
+            return Result(cached[1], True)
+
+        try:
+            record = self._claim(key, context)
+        except ClientError as e:
+            logger.warning(f'Idempotency store unavailable, running without it: {e}')
+            return Result(action(), False)
+
+        if record is not None:
+            if record.get('status') == COMPLETED:
+                outcome = json.loads(record.get('outcome', 'null'))
+                self._remember(key, int(record['expiresAt']), outcome)
+                return Result(outcome, True)
+            raise IdempotencyInProgress(f'{key.trigger_source} for {key.sub} is already running')
+
+        try:
+            outcome = action()
+        except Exception:
+            self._release(key)
+            raise
+        self._complete(key, outcome)
+        return Result(outcome, False)
+
+    # ----------------------------------------
+    # In-container tier
+    # ----------------------------------------
+
+    def _cached(self, key):
+        entry = self._completed.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self._clock():
+            del self._completed[key]
+            return None
+        return entry
+
+    def _remember(self, key, expires_at, outcome):
+        self._completed[key] = (expires_at, outcome)
+        self._completed.move_to_end(key)
+        while len(self._completed) > self.cache_size:
+            self._completed.popitem(last=False)
+
+    # ----------------------------------------
+    # DynamoDB tier
+    # ----------------------------------------
+
+    def _claim(self, key, context):
+        """
+        Take the key with an IN_PROGRESS record; returns None when taken,
+        otherwise the record that holds it
+        """
+        now = self._clock()
+        lock_ms = context.get_remaining_time_in_millis() if context else DEFAULT_LOCK_SECONDS * 1000
+        try:
+            self.table.put_item(
+                Item={
+                    **record_key(key),
+                    'status': IN_PROGRESS,
+                    'lockedUntil': int(now * 1000) + lock_ms,
+                    'expiresAt': int(now) + self.ttl_seconds,
+                },
+                # Free, expired but not yet removed by the TTL, or abandoned
+                ConditionExpression=(
+                    'attribute_not_exists(PK) OR expiresAt < :now'
+                    ' OR (#status = :in_progress AND lockedUntil < :now_ms)'
+                ),
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':now': int(now),
+                    ':now_ms': int(now * 1000),
+                    ':in_progress': IN_PROGRESS,
+                },
+                ReturnValuesOnConditionCheckFailure='ALL_OLD',
+            )
+            return None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            record = _plain(e.response.get('Item'))
+        if record is None:
+            # Older service versions do not return the record
+            record = self.table.get_item(Key=record_key(key), ConsistentRead=True).get('Item')
+        # None: released by a failed call in between; treated as running,
+        # the next retry claims it
+        return record or {'status': IN_PROGRESS}
+
+    def _complete(self, key, outcome):
+        expires_at = int(self._clock()) + self.ttl_seconds
+        self._remember(key, expires_at, outcome)
+        try:
+            self.table.update_item(
+                Key=record_key(key),
+                UpdateExpression='SET #status = :completed, outcome = :outcome, expiresAt = :expires',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':completed': COMPLETED,
+                    ':outcome': json.dumps(outcome, default=str),
+                    ':expires': expires_at,
+                },
+            )
+        except ClientError as e:
+            # The side effect happened; a retry after lockedUntil would repeat it
+            logger.warning(f'Could not record completed {key.trigger_source} for {key.sub}: {e}')
+
+    def _release(self, key):
+        try:
+            self.table.delete_item(
+                Key=record_key(key),
+                ConditionExpression='#status = :in_progress',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':in_progress': IN_PROGRESS},
+            )
+        except ClientError as e:
+            # Retries wait for lockedUntil instead
+            logger.warning(f'Could not release {key.trigger_source} for {key.sub}: {e}')
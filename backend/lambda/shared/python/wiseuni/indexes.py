@@ -0,0 +1,236 @@
+"""
+Sparse secondary indexes and a query planner
+
+GSI1 projects ALL attributes and every access pattern shares it, so each
+write to a profile, enrolment or grade is written a second time in full,
+and an item's index copy changes whenever any of its attributes changes.
+Each pattern gets a dedicated index instead (stacks/database.yaml):
+
+    index         keys (sparse: only items carrying them)   projection
+    RoleIndex     RolePK=ROLE#<role>     RoleSK=USER#<id>    email, name, createdAt
+    RosterIndex   RosterPK=COURSE#<id>   RosterSK=USER#<id>  enrolment date and status
+    GradeIndex    GradePK=COURSE#<id>    GradeSK=GRADE#<id>  grade and points
+    CatalogIndex  CatalogPK=SEMESTER#<s> CatalogSK=COURSE#<id>  keys only
+
+An index copy is only written when a key or a projected attribute
+changes, and only holds those, so it is a fraction of an ALL copy.
+
+The planner runs a pattern against the cheapest ACTIVE index:
+- estimated read units: the Query over the projected item size, plus one
+  BatchGetItem read per item when a requested attribute is not projected
+  (those are fetched from the table, 100 keys per request)
+- GSI1 is a candidate while writers still add its keys, and the only one
+  while a pattern's own index does not exist yet, is still being built,
+  or has not been backfilled: items written before it
+  existed only carry GSI1 keys until scripts/backfill_index_keys.py has
+  keyed them all and recorded INDEX#BACKFILL / <index name>
+- writers keep adding the GSI1 keys too (WRITE_GSI1_KEYS) until every
+  reader has moved off GSI1 and the backfill has run with --drop-gsi1
+- compact enrolment/grade items (wiseuni/items.py) are decoded
+
+    items = query(table, 'course_grades', ['grade', 'points', 'gradedAt'], course_id='CS101')
+"""
+
+import math
+import threading
+import time
+from collections import namedtuple
+
+from wiseuni.items import FORMAT_ATTRIBUTE, SHORT_NAMES, decode_all
+
+Index = namedtuple('Index', 'name pk sk projected projected_bytes')
+Pattern = namedtuple('Pattern', 'partition sort_prefix kind indexes item_bytes')
+Plan = namedtuple('Plan', 'pattern index fetch attributes read_units')
+
+ALL = None  # Index.projected for ProjectionType ALL
+
+INDEXES = {
+    'GSI1': Index('GSI1', 'GSI1PK', 'GSI1SK', ALL, None),
+    'RoleIndex': Index('RoleIndex', 'RolePK', 'RoleSK', frozenset(('email', 'name', 'createdAt')), 140),
+    'RosterIndex': Index('RosterIndex', 'RosterPK', 'RosterSK',
+                         frozenset(('enrolledAt', 'status', FORMAT_ATTRIBUTE, 't', 's')), 120),
+    'GradeIndex': Index('GradeIndex', 'GradePK', 'GradeSK',
+                        frozenset(('grade', 'points', FORMAT_ATTRIBUTE, 'g', 'p')), 110),
+    'CatalogIndex': Index('CatalogIndex', 'CatalogPK', 'CatalogSK', frozenset(), 70),
+}
+FALLBACK_INDEX = 'GSI1'
+
+# Items keep their GSI1 copy of the dedicated keys (same values) until
+# nothing reads those patterns from GSI1 any more
+WRITE_GSI1_KEYS = True
+
+# INDEX#BACKFILL / <index name>: written by scripts/backfill_index_keys.py
+# once every existing item carries that index's keys
+BACKFILL_PK = 'INDEX#BACKFILL'
+
+# Same key values on every candidate index; item_bytes: average table item
+PATTERNS = {
+    'users_by_role': Pattern('ROLE#{role}', 'USER#', None, ('RoleIndex', 'GSI1'), 250),
+    'course_roster': Pattern('COURSE#{course_id}', 'USER#', 'ENROLLMENT#', ('RosterIndex', 'GSI1'), 320),
+    'course_grades': Pattern('COURSE#{course_id}', 'GRADE#', 'GRADE#', ('GradeIndex', 'GSI1'), 310),
+    'semester_courses': Pattern('SEMESTER#{semester}', 'COURSE#', None, ('CatalogIndex', 'GSI1'), 400),
+}
+
+STATUS_CACHE_SECONDS = 300
+
+_status = {}  # table name -> (expires, set of usable index names)
+_status_lock = threading.Lock()
+
+
+# ========================================
+# INDEX KEYS
+# ========================================
+
+def index_keys(item):
+    """
+    Dedicated index keys for a table item (empty for items no pattern
+    reads), from its PK / SK and role / semester
+    """
+    pk, sk = item.get('PK', ''), item.get('SK', '')
+    if pk.startswith('USER#'):
+        identity_id = pk[len('USER#'):]
+        if sk == 'PROFILE' and item.get('role'):
+            return {'RolePK': f"ROLE#{item['role']}", 'RoleSK': pk}
+        if sk.startswith('ENROLLMENT#'):
+            return {'RosterPK': f"COURSE#{sk[len('ENROLLMENT#'):]}", 'RosterSK': pk}
+        if sk.startswith('GRADE#'):
+            return {'GradePK': f"COURSE#{sk[len('GRADE#'):]}", 'GradeSK': f'GRADE#{identity_id}'}
+    elif pk.startswith('COURSE#') and sk == 'METADATA' and item.get('semester'):
+        return {'CatalogPK': f"SEMESTER#{item['semester']}", 'CatalogSK': pk}
+    return {}
+
+
+def write_index_keys(item):
+    """Every index key a new or rewritten item should carry: dedicated, plus GSI1 while WRITE_GSI1_KEYS"""
+    keys = index_keys(item)
+    if keys and WRITE_GSI1_KEYS:
+        (_, pk), (_, sk) = keys.items()  # Partition key first
+        keys.update(GSI1PK=pk, GSI1SK=sk)
+    return keys
+
+
+def backfill_key(index_name):
+    return {'PK': BACKFILL_PK, 'SK': index_name}
+
+
+# ========================================
+# PLANNER
+# ========================================
+
+def active_indexes(table):
+    """
+    Names of the table's usable GSIs, cached per container: ACTIVE (created
+    and built) and, for a dedicated index, backfilled
+    """
+    now = time.monotonic()
+    with _status_lock:
+        entry = _status.get(table.name)
+        if entry and entry[0] > now:
+            return entry[1]
+    described = table.meta.client.describe_table(TableName=table.name)['Table']
+    active = {
+        index['IndexName'] for index in described.get('GlobalSecondaryIndexes', [])
+        if index.get('IndexStatus') == 'ACTIVE' and not index.get('Backfilling')
+    }
+    backfilled = {item['SK'] for item in table.query(
+        KeyConditionExpression='PK = :pk',
+        ExpressionAttributeValues={':pk': BACKFILL_PK},
+        ProjectionExpression='SK',
+    ).get('Items', [])}
+    active = {name for name in active if name == FALLBACK_INDEX or name not in INDEXES or name in backfilled}
+    with _status_lock:
+        _status[table.name] = (now + STATUS_CACHE_SECONDS, active)
+    return active
+
+
+def _stored_names(pattern, attributes):
+    # Compact items store some attributes under short names (and f=1)
+    if pattern.kind is None:
+        return set(attributes)
+    short_names = SHORT_NAMES[pattern.kind]
+    return set(attributes) | {short_names[name] for name in attributes if name in short_names} | {FORMAT_ATTRIBUTE}
+
+
+def read_units(pattern, index, fetch, expected_items):
+    """Eventually consistent read units to list `expected_items` items"""
+    item_bytes = pattern.item_bytes if index.projected is ALL else index.projected_bytes
+    units = math.ceil(expected_items * item_bytes / 4096) / 2
+    if fetch:
+        # BatchGetItem: every item rounded up to 4 KB on its own
+        units += expected_items * math.ceil(pattern.item_bytes / 4096) / 2
+    return units
+
+
+def plan(table, pattern_name, attributes, expected_items=100):
+    """Cheapest way to run a pattern, from the indexes ACTIVE on the table"""
+    pattern = PATTERNS[pattern_name]
+    active = active_indexes(table)
+    # GSI1 holds every item of the pattern while writers add its keys: then it
+    # competes on cost (it projects ALL, so it wins over fetching from the table)
+    candidates = [name for name in pattern.indexes if name in active and (WRITE_GSI1_KEYS or name != FALLBACK_INDEX)]
+    if not candidates:
+        if FALLBACK_INDEX not in active:
+            raise RuntimeError(f'No index for {pattern_name} on {table.name}')
+        candidates = [FALLBACK_INDEX]
+
+    stored = _stored_names(pattern, attributes)
+    best = None
+    for name in candidates:
+        index = INDEXES[name]
+        fetch = index.projected is not ALL and not stored <= index.projected
+        units = read_units(pattern, index, fetch, expected_items)
+        if best is None or units < best.read_units:
+            best = Plan(pattern_name, name, fetch, sorted(stored), units)
+    return best
+
+
+def query(table, pattern_name, attributes, expected_items=100, **key):
+    """
+    Items of an access pattern with (at least) `attributes`, plus PK and SK
+
+    key: the pattern's partition placeholders, e.g. course_id='CS101'.
+    Results are in index order.
+    """
+    chosen = plan(table, pattern_name, attributes, expected_items)
+    pattern, index = PATTERNS[pattern_name], INDEXES[chosen.index]
+    projected = chosen.attributes if index.projected is ALL else [
+        name for name in chosen.attributes if name in index.projected
+    ]
+    names = {f'#a{number}': name for number, name in enumerate(['PK', 'SK', *projected])}
+    request = {
+        'IndexName': index.name,
+        'KeyConditionExpression': f'{index.pk} = :pk AND begins_with({index.sk}, :sk)',
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': {':pk': pattern.partition.format(**key), ':sk': pattern.sort_prefix},
+    }
+    items = []
+    while True:
+        page = table.query(**request)
+        items.extend(page.get('Items', []))
+        if 'LastEvaluatedKey' not in page:
+            break
+        request['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+    if chosen.fetch:
+        items = fetch(table, items, chosen.attributes)
+    return decode_all(table, items) if pattern.kind else items
+
+
+def fetch(table, items, attributes):
+    """The same items read from the table with `attributes`, 100 keys per BatchGetItem"""
+    names = {f'#a{number}': name for number, name in enumerate(['PK', 'SK', *attributes])}
+    found = {}
+    for start in range(0, len(items), 100):
+        request = {table.name: {
+            'Keys': [{'PK': item['PK'], 'SK': item['SK']} for item in items[start:start + 100]],
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names,
+        }}
+        while request:
+            result = table.meta.client.batch_get_item(RequestItems=request)
+            for item in result['Responses'].get(table.name, []):
+                found[(item['PK'], item['SK'])] = item
+            request = result.get('UnprocessedKeys') or None
+    # Index order; an item deleted since the Query is left out
+    return [found[key] for key in ((item['PK'], item['SK']) for item in items) if key in found]
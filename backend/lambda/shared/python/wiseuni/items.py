@@ -0,0 +1,236 @@
+"""
+Compact encoding of enrolment and grade items
+
+Enrolments and grades are the bulk of the table, and GSI1 (ProjectionType
+ALL) stores every one of them a second time. The original (legacy) items
+repeat what the keys and the course already say:
+
+    PK=USER#<id> SK=GRADE#CS101 GSI1PK=COURSE#CS101 GSI1SK=GRADE#<id>
+    identityId=<id> courseId=CS101 courseName="Intro to Computer Science"
+    grade="A" points=95 gradedAt="2024-11-02T14:03:11.000Z" gradedBy=<id>
+
+Compact items (marked f=1) keep the keys and only what nothing else holds:
+- identityId, courseId: dropped, read back from PK / SK
+- courseName, professorName: dropped when equal to the course's
+  COURSE#<id> / METADATA title / professorName, stored as cn / pn otherwise
+- timestamps: epoch seconds (t) instead of ISO strings; sub-second
+  precision is not kept
+- other attributes: short names (s, g, p, b); an enrolment's status as
+  one letter (other kinds keep theirs as is)
+- anything the codec does not know is kept as is
+
+decode() returns exactly the legacy attribute set, so readers see one
+shape whichever encoding an item is in, and both can exist side by side
+(scripts/migrate_item_encoding.py converts in either direction).
+
+    items = decode_all(table, page['Items'])  # course names fetched for compact items only
+"""
+
+import threading
+import time
+from datetime import datetime
+
+FORMAT_ATTRIBUTE = 'f'
+COMPACT = 1
+
+# Table and index keys (wiseuni/indexes.py): kept as they are
+KEY_ATTRIBUTES = frozenset((
+    'PK', 'SK', 'GSI1PK', 'GSI1SK', 'RolePK', 'RoleSK', 'RosterPK', 'RosterSK',
+    'GradePK', 'GradeSK', 'CatalogPK', 'CatalogSK',
+))
+
+# kind (SK prefix) -> long name -> short name
+SHORT_NAMES = {
+    'ENROLLMENT#': {'status': 's', 'enrolledAt': 't', 'courseName': 'cn', 'professorName': 'pn'},
+    'GRADE#': {'grade': 'g', 'points': 'p', 'gradedAt': 't', 'gradedBy': 'b', 'courseName': 'cn'},
+}
+LONG_NAMES = {kind: {short: long for long, short in names.items()} for kind, names in SHORT_NAMES.items()}
+TIME_FIELDS = frozenset(('enrolledAt', 'gradedAt'))
+
+# Denormalized attribute -> COURSE#<id> / METADATA attribute holding the same value
+COURSE_FIELDS = {'courseName': 'title', 'professorName': 'professorName'}
+
+STATUS_CODES = {'active': 'a', 'completed': 'c', 'dropped': 'd'}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+
+COURSE_CACHE_SECONDS = 300
+
+_course_cache = {}  # courseId -> (expires, metadata or None)
+_course_lock = threading.Lock()
+
+
+def item_kind(item):
+    """'ENROLLMENT#' / 'GRADE#', or None for items this codec leaves alone"""
+    sk = item.get('SK', '')
+    for kind in SHORT_NAMES:
+        if sk.startswith(kind):
+            return kind
+    return None
+
+
+def is_compact(item):
+    return item.get(FORMAT_ATTRIBUTE) == COMPACT
+
+
+def item_course_id(item):
+    return item['SK'].split('#', 1)[1]
+
+
+def _identity_id(item):
+    return item['PK'][len('USER#'):]
+
+
+def _epoch(value):
+    # Only what toISOString() and isoformat() write; anything else stays a string
+    if not isinstance(value, str) or len(value) < 19 or value[10] != 'T':
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.utcoffset() is None:
+        return None  # Naive: no way to tell which zone it meant
+    return int(parsed.timestamp())
+
+
+def _iso(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(int(seconds)))
+
+
+# ========================================
+# CODEC
+# ========================================
+
+def encode(item, course=None):
+    """
+    Compact form of an enrolment or grade item
+
+    course: the item's COURSE#<id> / METADATA item, or None (names are then
+    kept as cn / pn). Items of other kinds, items already compact, and
+    items using a short name as an attribute of their own come back as is.
+    """
+    kind = item_kind(item)
+    if kind is None or is_compact(item):
+        return item
+    short_names = SHORT_NAMES[kind]
+    if any(short in item for short in LONG_NAMES[kind]) or FORMAT_ATTRIBUTE in item:
+        return item
+
+    identity_id, course = _identity_id(item), course or {}
+    compact = {FORMAT_ATTRIBUTE: COMPACT}
+    for name, value in item.items():
+        if name in KEY_ATTRIBUTES:
+            compact[name] = value
+        elif name == 'identityId' and value == identity_id:
+            continue
+        elif name == 'courseId' and value == item_course_id(item):
+            continue
+        elif name in COURSE_FIELDS and course.get(COURSE_FIELDS[name]) == value:
+            continue
+        elif name in TIME_FIELDS:
+            seconds = _epoch(value)
+            if seconds is None:
+                compact[name] = value
+            else:
+                compact[short_names[name]] = seconds
+        elif name == 'status' and name in short_names:
+            if value in STATUS_CODES:
+                compact[short_names[name]] = STATUS_CODES[value]
+            else:
+                compact[name] = value
+        elif name in short_names:
+            compact[short_names[name]] = value
+        else:
+            compact[name] = value
+    return compact
+
+
+def decode(item, course=None):
+    """Legacy form of an item; anything that is not compact comes back as is"""
+    if not is_compact(item):
+        return item
+    kind = item_kind(item)
+    long_names = LONG_NAMES[kind]
+    plain = {'identityId': _identity_id(item), 'courseId': item_course_id(item)}
+    for name, value in item.items():
+        if name == FORMAT_ATTRIBUTE:
+            continue
+        long = long_names.get(name)
+        if long is None:
+            plain[name] = value
+        elif long in TIME_FIELDS:
+            plain[long] = _iso(value)
+        elif long == 'status':
+            plain[long] = STATUS_NAMES.get(value, value)
+        else:
+            plain[long] = value
+    if course:
+        for long, metadata_name in COURSE_FIELDS.items():
+            if long in SHORT_NAMES[kind] and long not in plain and metadata_name in course:
+                plain[long] = course[metadata_name]
+    return plain
+
+
+def item_size(item):
+    """
+    Approximate stored size in bytes, by DynamoDB's rules: attribute name
+    length + value size (strings: UTF-8 bytes, numbers: ~1 byte per two
+    digits + 1)
+    """
+    size = 0
+    for name, value in item.items():
+        size += len(name.encode('utf-8'))
+        if isinstance(value, str):
+            size += len(value.encode('utf-8'))
+        elif isinstance(value, bool) or value is None:
+            size += 1
+        else:
+            digits = len(str(value).lstrip('-').replace('.', '').strip('0')) or 1
+            size += (digits + 1) // 2 + 1
+    return size
+
+
+# ========================================
+# COURSE METADATA
+# ========================================
+
+def course_metadata(table, course_ids):
+    """
+    courseId -> {'title', 'professorName'} (or None if there is no course
+    item), from a per-container cache, BatchGetItem for the rest
+    """
+    now = time.monotonic()
+    found, missing = {}, []
+    with _course_lock:
+        for course_id in set(course_ids):
+            entry = _course_cache.get(course_id)
+            if entry and entry[0] > now:
+                found[course_id] = entry[1]
+            else:
+                missing.append(course_id)
+
+    for start in range(0, len(missing), 100):
+        ids = missing[start:start + 100]
+        fetched = dict.fromkeys(ids)
+        request = {table.name: {
+            'Keys': [{'PK': f'COURSE#{course_id}', 'SK': 'METADATA'} for course_id in ids],
+            'ProjectionExpression': 'PK, #title, professorName',
+            'ExpressionAttributeNames': {'#title': 'title'},
+        }}
+        while request:
+            result = table.meta.client.batch_get_item(RequestItems=request)
+            for metadata in result['Responses'].get(table.name, []):
+                fetched[metadata.pop('PK')[len('COURSE#'):]] = metadata
+            request = result.get('UnprocessedKeys') or None
+        with _course_lock:
+            for course_id, metadata in fetched.items():
+                _course_cache[course_id] = (now + COURSE_CACHE_SECONDS, metadata)
+        found.update(fetched)
+    return found
+
+
+def decode_all(table, items):
+    """decode() a page of items, fetching course names only for compact ones"""
+    compact = {item_course_id(item) for item in items if is_compact(item)}
+    courses = course_metadata(table, compact) if compact else {}
+    return [decode(item, courses.get(item_course_id(item))) if is_compact(item) else item for item in items]
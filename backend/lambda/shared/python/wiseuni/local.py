@@ -0,0 +1,92 @@
+"""
+Run an HTTP API Lambda handler as a local service
+
+Turns plain HTTP requests into API Gateway HTTP API (payload v2) events,
+so a function can be tried without deploying:
+
+    python backend/lambda/credential_broker/index.py --serve 8787
+
+Requests are served on threads, like concurrent invocations would be,
+but in one process (module-level caches are shared).
+--identity/--role fake the IAM authorizer context of AWS_IAM routes;
+JWT routes get no claims, so nothing is treated as verified.
+"""
+
+import argparse
+import base64
+import json
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+def _compile(route_key):
+    method, path = route_key.split(' ', 1)
+    pattern = re.sub(r'\\\{(\w+)\\\}', r'(?P<\1>[^/]+)', re.escape(path))
+    return method, re.compile(f'^{pattern}$'), route_key
+
+
+def build_event(method, target, headers, body, route_keys, identity=None, role='student'):
+    """HTTP API v2 event for one request; routeKey is '$default' when nothing matches"""
+    parts = urlsplit(target)
+    event = {
+        'version': '2.0',
+        'routeKey': '$default',
+        'rawPath': parts.path,
+        'rawQueryString': parts.query,
+        'headers': {name.lower(): value for name, value in headers.items()},
+        'queryStringParameters': dict(parse_qsl(parts.query)) or None,
+        'requestContext': {'http': {'method': method, 'path': parts.path}},
+        'body': base64.b64encode(body).decode('ascii') if body else None,
+        'isBase64Encoded': bool(body),
+    }
+    for route_method, pattern, route_key in map(_compile, route_keys):
+        match = pattern.match(parts.path)
+        if route_method == method and match:
+            event['routeKey'] = route_key
+            event['pathParameters'] = match.groupdict() or None
+            break
+    if identity:
+        event['requestContext']['authorizer'] = {'iam': {
+            'cognitoIdentity': {'identityId': identity},
+            'userArn': f'arn:aws:sts::000000000000:assumed-role/local-{role}-role-dev/CognitoIdentityCredentials',
+        }}
+    return event
+
+
+def serve(handler, route_keys, port=8787, identity=None, role='student'):
+    class Handler(BaseHTTPRequestHandler):
+        def _invoke(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            event = build_event(
+                self.command, self.path, dict(self.headers), self.rfile.read(length) if length else b'',
+                route_keys, identity, role,
+            )
+            result = handler(event, None)
+            body = result.get('body') or ''
+            payload = base64.b64decode(body) if result.get('isBase64Encoded') else body.encode('utf-8')
+            self.send_response(result.get('statusCode', 200))
+            for name, value in (result.get('headers') or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _invoke
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f'Serving {json.dumps(list(route_keys))} on http://127.0.0.1:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+def main(handler, route_keys):
+    """Entry point for `python <function>/index.py --serve [port]`"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', type=int, nargs='?', const=8787, required=True, metavar='PORT')
+    parser.add_argument('--identity', help='Identity Pool identity id to act as (AWS_IAM routes)')
+    parser.add_argument('--role', default='student', choices=('student', 'professor', 'admin'))
+    args = parser.parse_args()
+    serve(handler, route_keys, args.serve, args.identity, args.role)
@@ -0,0 +1,124 @@
+"""
+SES mailer
+
+One sending path for the functions that mail students themselves
+(post_confirmation, custom_email_sender):
+
+- the registry's pooled SES client, so every send shows up in
+  aws.latency_stats() ('ses.SendEmail': count, p50/p99, max)
+- send-rate awareness: a ThroughputController (wiseuni/throttle.py) on
+  the client. The account's MaxSendRate (GetSendQuota, read on the first
+  send and every QUOTA_REFRESH_SECONDS) is its ceiling, so one container
+  sending a batch never goes past it alone. 'Maximum sending rate
+  exceeded' (other containers sending at the same moment) halves the
+  local rate, and every attempt, retries included, waits for a token
+- daily quota: a warning from QUOTA_WARNING of Max24HourSend. 'Daily
+  message quota exceeded' is not a rate throttle and is raised without
+  the controller's retries
+
+    mailer = Mailer()
+    message_id = mailer.send('ayse@example.com', render('welcome', 'tr', name='Ayşe'))
+"""
+
+import logging
+import os
+import time
+
+from botocore.exceptions import ClientError
+from wiseuni import aws
+from wiseuni.templates import brand
+from wiseuni.throttle import ThroughputController
+
+logger = logging.getLogger(__name__)
+
+QUOTA_REFRESH_SECONDS = 600
+QUOTA_WARNING = 0.8
+
+
+def is_rate_throttle(parsed):
+    error = (parsed or {}).get('Error', {})
+    return error.get('Code') == 'Throttling' and 'daily' not in error.get('Message', '').lower()
+
+
+# Unlimited until the quota is read; then MaxSendRate, halved per throttle
+SEND_RATE = {'rate': None, 'min_rate': 1, 'increase': 1, 'max_attempts': 8,
+             'base_delay': 0.1, 'max_delay': 2.0, 'is_throttle': is_rate_throttle}
+
+# One per container, like the DynamoDB interactive controller (wiseuni/aws.py)
+send_rate = ThroughputController('ses', **SEND_RATE)
+
+
+class Mailer:
+    """
+    Sends rendered templates (wiseuni/templates) through SES
+
+    One instance should be created at module level so the quota survives
+    across warm invocations. A client passed in gets the throughput
+    controller attached (throughput=None: no send-rate control).
+    """
+
+    def __init__(self, client=None, source=None, configuration_set=None, throughput=send_rate):
+        self.throughput = throughput
+        if client is None:
+            client = aws.client('ses', throughput=throughput)
+        elif throughput is not None:
+            throughput.attach(client)
+        self.client = client
+        self.source = source or brand('from_address')
+        # Bounces/complaints of emails sent with this set reach the feedback processor
+        self.configuration_set = configuration_set or os.environ.get('SES_CONFIGURATION_SET')
+        self._quota_read = None
+        self.sent = 0
+
+    # ----------------------------------------
+    # Quota
+    # ----------------------------------------
+
+    def refresh_quota(self):
+        """Re-read MaxSendRate and the daily quota; the rate is left as it is if SES says no"""
+        self._quota_read = time.monotonic()
+        try:
+            quota = self.client.get_send_quota()
+        except ClientError as e:
+            logger.warning(f'SES send quota unavailable, keeping the current send rate: {e}')
+            return None
+        if self.throughput is not None:
+            # A lower rate after throttles stays until it grows back by itself
+            self.throughput.set_ceiling(quota.get('MaxSendRate') or None)
+        daily, sent = quota.get('Max24HourSend', 0), quota.get('SentLast24Hours', 0)
+        if daily > 0 and sent >= daily * QUOTA_WARNING:
+            logger.warning(f'SES daily quota {sent:.0f} / {daily:.0f} used')
+        return quota
+
+    def _check_quota(self):
+        if self._quota_read is None or time.monotonic() - self._quota_read >= QUOTA_REFRESH_SECONDS:
+            self.refresh_quota()
+
+    # ----------------------------------------
+    # Sending
+    # ----------------------------------------
+
+    def send(self, to, message):
+        """
+        Send a Rendered (subject, html, text) to one address; returns the
+        SES MessageId (ClientError when SES refuses, or still throttles
+        after the controller's retries)
+        """
+        self._check_quota()
+        body = {'Html': {'Data': message.html, 'Charset': 'UTF-8'}}
+        if message.text:
+            body['Text'] = {'Data': message.text, 'Charset': 'UTF-8'}
+        args = {
+            'Source': self.source,
+            'Destination': {'ToAddresses': [to]},
+            'Message': {'Subject': {'Data': message.subject, 'Charset': 'UTF-8'}, 'Body': body},
+        }
+        if self.configuration_set:
+            args['ConfigurationSetName'] = self.configuration_set
+        message_id = self.client.send_email(**args)['MessageId']
+        self.sent += 1
+        return message_id
+
+    def stats(self):
+        """Sends, throttles and the current / achieved send rate of this container"""
+        return {'sent': self.sent, **(self.throughput.stats() if self.throughput else {})}
@@ -0,0 +1,359 @@
+"""
+Lazy migration from the legacy student directory
+
+Students are moved into the user pool one by one, on their first login
+(user_migration trigger), instead of a bulk re-signup: Cognito calls the
+trigger when a username is not in the pool yet, the password is checked
+against the legacy directory, and the student is created CONFIRMED with
+the same password. Students who never log in again are never migrated.
+
+A directory is anything with find(email) -> LegacyUser or None:
+    SqliteDirectory(path)   read-only SQLite export, one connection per container
+    CsvDirectory(path)      CSV export, read into memory once per container
+    CachedDirectory(dir)    records (and misses) kept across warm invocations
+Both exports share the columns of LegacyUser; password_hash is
+'pbkdf2_sha256$<iterations>$<salt>$<base64 digest>' (or pbkdf2_sha1).
+
+    directory = CachedDirectory(directory_from_env())   # LEGACY_DIRECTORY=sqlite:s3://bucket/students.sqlite
+    user = directory.find('ayse@example.com')
+    if user and verify_password(password, user.password_hash): ...
+
+Profiles: PROFILE items are keyed by the Identity Pool identityId, which
+does not exist before the student's first credential exchange, and a
+migration response cannot add groups. The trigger stages the profile:
+
+    MIGRATION#<email> / PROFILE  -> name, role, group, studentId, locale (expires after PENDING_TTL_DAYS)
+
+and ProfileClaims (credential_broker) moves it to USER#<identityId> /
+PROFILE and adds the group once the ID token's sub and identityId are
+both known.
+"""
+
+import base64
+import csv
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+from wiseuni.indexes import write_index_keys
+from wiseuni.profile import profile_key
+from wiseuni.suppression import normalize_email
+from wiseuni.templates import SUPPORTED_LOCALES
+
+logger = logging.getLogger(__name__)
+
+LegacyUser = namedtuple('LegacyUser', 'legacy_id email name student_id role locale password_hash')
+
+PENDING_SK = 'PROFILE'
+PENDING_TTL_DAYS = 30
+MAX_ENTRIES = 10_000
+
+# Legacy roles -> ours (PROFILE role) and the user pool group of each
+LEGACY_ROLES = {
+    'student': 'student',
+    'undergraduate': 'student',
+    'postgraduate': 'student',
+    'lecturer': 'professor',
+    'professor': 'professor',
+    'staff': 'admin',
+    'admin': 'admin',
+}
+ROLE_GROUPS = {'student': 'students', 'professor': 'professors', 'admin': 'admins'}
+
+PBKDF2_ALGORITHMS = {'pbkdf2_sha256': 'sha256', 'pbkdf2_sha1': 'sha1'}
+DEFAULT_ITERATIONS = 260_000
+
+
+# ========================================
+# PASSWORDS
+# ========================================
+
+def hash_password(password, salt=None, iterations=DEFAULT_ITERATIONS, algorithm='pbkdf2_sha256'):
+    """Legacy format hash, for building local directories"""
+    salt = salt or secrets.token_hex(8)
+    digest = hashlib.pbkdf2_hmac(PBKDF2_ALGORITHMS[algorithm], password.encode('utf-8'), salt.encode('utf-8'), iterations)
+    return f"{algorithm}${iterations}${salt}${base64.b64encode(digest).decode('ascii')}"
+
+
+# Checked for unknown users too, so a miss takes as long as a wrong password
+_DUMMY_HASH = f"pbkdf2_sha256${DEFAULT_ITERATIONS}$unknown${'A' * 43}="
+
+
+def verify_password(password, encoded):
+    """Constant-time check against a legacy hash; False for unknown formats"""
+    try:
+        algorithm, iterations, salt, expected = encoded.split('$', 3)
+        digest = PBKDF2_ALGORITHMS[algorithm]
+        iterations = int(iterations)
+    except (AttributeError, KeyError, ValueError):
+        logger.warning('Unsupported legacy password hash format')
+        return False
+    actual = hashlib.pbkdf2_hmac(digest, password.encode('utf-8'), salt.encode('utf-8'), iterations)
+    return hmac.compare_digest(base64.b64encode(actual).decode('ascii'), expected)
+
+
+def authenticate(directory, email, password):
+    """LegacyUser if the password matches, otherwise None (same cost either way)"""
+    user = directory.find(email)
+    if user is None:
+        verify_password(password, _DUMMY_HASH)
+        return None
+    return user if verify_password(password, user.password_hash) else None
+
+
+# ========================================
+# DIRECTORIES
+# ========================================
+
+def _user(row):
+    return LegacyUser(**{field: (row.get(field) or '').strip() for field in LegacyUser._fields})
+
+
+class SqliteDirectory:
+    """Read-only SQLite export; the connection is opened on first use and kept"""
+
+    def __init__(self, path, table='students'):
+        self.path = path
+        self.table = table
+        self._connection = None
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def _connect(self):
+        connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def find(self, email):
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._connect()
+            self.queries += 1
+            row = self._connection.execute(
+                f'SELECT * FROM {self.table} WHERE email = ? COLLATE NOCASE LIMIT 1', (normalize_email(email),)
+            ).fetchone()
+        return _user(dict(row)) if row else None
+
+
+class CsvDirectory:
+    """CSV export with a header row, indexed by email on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        self._users = None
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def _load(self):
+        with open(self.path, newline='', encoding='utf-8') as f:
+            users = (_user(row) for row in csv.DictReader(f))
+            return {normalize_email(user.email): user for user in users if user.email}
+
+    def find(self, email):
+        with self._lock:
+            if self._users is None:
+                self._users = self._load()
+            self.queries += 1
+        return self._users.get(normalize_email(email))
+
+
+class CachedDirectory:
+    """
+    LRU + TTL cache in front of a directory
+
+    Unknown emails are cached too (for a shorter time): mistyped and
+    guessed usernames reach the trigger on every attempt.
+    """
+
+    def __init__(self, directory, ttl_seconds=300, negative_ttl_seconds=60,
+                 max_entries=MAX_ENTRIES, clock=time.time):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._cache = OrderedDict()  # email -> (expires, LegacyUser or None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, email):
+        email = normalize_email(email)
+        now = self.clock()
+        with self._lock:
+            entry = self._cache.get(email)
+            if entry is not None and entry[0] > now:
+                self._cache.move_to_end(email)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = self.directory.find(email)
+        ttl = self.ttl_seconds if user is not None else self.negative_ttl_seconds
+        with self._lock:
+            self._cache[email] = (now + ttl, user)
+            self._cache.move_to_end(email)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return user
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._cache)}
+
+
+def _local_copy(location):
+    """Path of the export; s3://bucket/key is downloaded to /tmp once per container"""
+    if not location.startswith('s3://'):
+        return location
+    from wiseuni import aws
+
+    bucket, key = location[len('s3://'):].split('/', 1)
+    path = os.path.join('/tmp', 'legacy-' + os.path.basename(key))
+    if not os.path.exists(path):
+        aws.client('s3').download_file(bucket, key, path + '.part')
+        os.replace(path + '.part', path)
+    return path
+
+
+def directory_from_env():
+    """LEGACY_DIRECTORY=sqlite:<path or s3 url> or csv:<path or s3 url>"""
+    location = os.environ.get('LEGACY_DIRECTORY', '')
+    kind, _, source = location.partition(':')
+    if kind == 'sqlite' and source:
+        return SqliteDirectory(_local_copy(source))
+    if kind == 'csv' and source:
+        return CsvDirectory(_local_copy(source))
+    raise RuntimeError(f'LEGACY_DIRECTORY must be sqlite:<location> or csv:<location>, got {location!r}')
+
+
+# ========================================
+# ATTRIBUTES AND STAGED PROFILES
+# ========================================
+
+def role_of(user):
+    return LEGACY_ROLES.get(user.role.lower(), 'student')
+
+
+def user_attributes(user):
+    """Cognito attributes for the migration response"""
+    attributes = {
+        'email': normalize_email(user.email),
+        'email_verified': 'true',  # Verified in the legacy registry; needed for password resets
+        'name': user.name or 'Student',
+    }
+    if user.student_id:
+        attributes['custom:student_id'] = user.student_id
+    if user.locale in SUPPORTED_LOCALES:
+        attributes['locale'] = user.locale
+    return attributes
+
+
+def pending_key(email):
+    return {'PK': f'MIGRATION#{normalize_email(email)}', 'SK': PENDING_SK}
+
+
+def pending_profile(user, now=None):
+    """MIGRATION#<email> item, claimed on the student's first credential exchange"""
+    now = now or time.time()
+    role = role_of(user)
+    item = {
+        **pending_key(user.email),
+        'legacyId': user.legacy_id,
+        'email': normalize_email(user.email),
+        'name': user.name or 'Student',
+        'role': role,
+        'group': ROLE_GROUPS[role],
+        'migratedAt': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+        'expiresAt': int(now) + PENDING_TTL_DAYS * 86400,
+    }
+    if user.student_id:
+        item['studentId'] = user.student_id
+    if user.locale in SUPPORTED_LOCALES:
+        item['locale'] = user.locale
+    return item
+
+
+class ProfileClaims:
+    """
+    Moves staged profiles to USER#<identityId> / PROFILE
+
+    Once per sub per container: a student who was not migrated, or whose
+    profile is already claimed, costs one GetItem on the first exchange
+    and nothing afterwards.
+    """
+
+    def __init__(self, table, cognito, user_pool_id, max_entries=MAX_ENTRIES):
+        self.table = table
+        self.cognito = cognito
+        self.user_pool_id = user_pool_id
+        self.max_entries = max_entries
+        self._settled = OrderedDict()  # sub -> True
+        self._lock = threading.Lock()
+
+    def claim(self, claims, identity_id):
+        """
+        The profile written for a migrated student, or None
+
+        claims: the verified ID token's claims (sub, email, email_verified,
+        cognito:username). Errors are raised; the staged item stays, so
+        the next exchange tries again.
+        """
+        sub, email = claims.get('sub'), claims.get('email')
+        if not sub or not email or str(claims.get('email_verified')).lower() != 'true':
+            return None
+        with self._lock:
+            if sub in self._settled:
+                return None
+
+        pending = self.table.get_item(Key=pending_key(email), ConsistentRead=True).get('Item')
+        if pending is None:
+            self._settle(sub)
+            return None
+
+        profile = {
+            **profile_key(identity_id),
+            'identityId': identity_id,
+            'email': pending['email'],
+            'name': pending['name'],
+            'role': pending['role'],
+            'legacyId': pending['legacyId'],
+            'createdAt': pending['migratedAt'],
+            'updatedAt': datetime.now(timezone.utc).isoformat(),
+        }
+        for attribute in ('studentId', 'locale'):
+            if attribute in pending:
+                profile[attribute] = pending[attribute]
+        profile.update(write_index_keys(profile))
+
+        try:
+            self.table.put_item(Item=profile, ConditionExpression='attribute_not_exists(PK)')
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            logger.info(f'Profile of {identity_id} already exists, keeping it')
+            profile = None
+
+        # AdminAddUserToGroup is idempotent; the group shows in tokens from the next refresh
+        self.cognito.admin_add_user_to_group(
+            UserPoolId=self.user_pool_id,
+            Username=claims.get('cognito:username') or sub,
+            GroupName=pending['group'],
+        )
+        self.table.delete_item(Key=pending_key(email))
+        self._settle(sub)
+        return profile
+
+    def _settle(self, sub):
+        with self._lock:
+            self._settled[sub] = True
+            while len(self._settled) > self.max_entries:
+                self._settled.popitem(last=False)
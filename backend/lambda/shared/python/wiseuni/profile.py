@@ -0,0 +1,149 @@
+"""
+Profile updates: validation, coalescing and versioned partial writes
+
+A client sends only what it wants to change, plus (optionally) the value
+each attribute had when it read it:
+
+    {"changes": {"name": "Ayşe K."}, "previous": {"name": "Ayşe"}}
+
+Updates are queued and written in batches (profile_update function).
+All queued updates of one user are merged - the first `previous` and the
+last value of each attribute win - and written as ONE UpdateItem that:
+- SETs only attributes whose stored value actually differs
+- skips attributes changed by someone else since the client read them
+  (stored value is neither `previous` nor the new value): no lost updates
+- never touches createdAt except to create it
+- is conditional on the item's version not having moved since it was
+  read, and bumps it (otherwise the batch is retried and re-read)
+- is conditional on the profile existing: an update never creates one
+
+Comparing values rather than a client-held version number means a UI
+that saves repeatedly never conflicts with its own earlier, still
+queued saves.
+"""
+
+from datetime import datetime, timezone
+
+from wiseuni.api import ApiError
+from wiseuni.templates import SUPPORTED_LOCALES, clean_value
+
+PROFILE_SK = 'PROFILE'
+
+
+def _text(limit):
+    def validate(value):
+        if not isinstance(value, str):
+            raise ApiError(400, 'Expected a string')
+        value = clean_value(value, limit)
+        if not value:
+            raise ApiError(400, 'Must not be empty')
+        return value
+    return validate
+
+
+def _locale(value):
+    if value not in SUPPORTED_LOCALES:
+        raise ApiError(400, f"Supported locales: {', '.join(SUPPORTED_LOCALES)}")
+    return value
+
+
+# Attributes a user may change on their own profile (role, email: never)
+EDITABLE_FIELDS = {
+    'name': _text(64),
+    'locale': _locale,
+}
+
+
+def profile_key(identity_id):
+    return {'PK': f'USER#{identity_id}', 'SK': PROFILE_SK}
+
+
+def validate_update(body):
+    """(changes, previous) from a PATCH body, or ApiError 400"""
+    changes = body.get('changes')
+    previous = body.get('previous') or {}
+    if not isinstance(changes, dict) or not changes:
+        raise ApiError(400, 'changes must be a non-empty object')
+    if not isinstance(previous, dict):
+        raise ApiError(400, 'previous must be an object')
+    unknown = sorted((set(changes) | set(previous)) - set(EDITABLE_FIELDS))
+    if unknown:
+        raise ApiError(400, f"Not editable: {', '.join(unknown)}")
+
+    cleaned = {}
+    for field, value in changes.items():
+        try:
+            cleaned[field] = EDITABLE_FIELDS[field](value)
+        except ApiError as e:
+            raise ApiError(400, f'{field}: {e.message}')
+    # previous is only compared, never stored: no validation beyond the field name
+    return cleaned, {field: value for field, value in previous.items() if field in cleaned}
+
+
+def coalesce(updates):
+    """
+    Merge one user's queued updates [(sent_at, changes, previous)]
+    -> {field: (previous or None, new value)}
+
+    Applied in send order: the new value is the last one sent, the
+    expected old value is the one before the first change in the burst.
+    """
+    merged = {}
+    for _, changes, previous in sorted(updates, key=lambda update: update[0]):
+        for field, value in changes.items():
+            expected = merged[field][0] if field in merged else previous.get(field)
+            merged[field] = (expected, value)
+    return merged
+
+
+def resolve(current, merged):
+    """
+    (to_write, conflicts) against the stored item
+
+    Unchanged attributes are dropped; an attribute whose stored value is
+    neither the expected old value nor the new one was changed by someone
+    else in the meantime and is not overwritten.
+    """
+    current = current or {}
+    to_write, conflicts = {}, []
+    for field, (expected, value) in merged.items():
+        stored = current.get(field)
+        if stored == value:
+            continue
+        if expected is not None and stored is not None and stored != expected:
+            conflicts.append(field)
+            continue
+        to_write[field] = value
+    return to_write, conflicts
+
+
+def build_update(identity_id, current_version, changes):
+    """UpdateItem arguments: partial SET, version bump, optimistic condition"""
+    now = datetime.now(timezone.utc).isoformat()
+    names = {'#version': 'version', '#updatedAt': 'updatedAt', '#createdAt': 'createdAt', '#identityId': 'identityId'}
+    values = {':next': current_version + 1, ':now': now, ':identity': identity_id}
+    sets = [
+        '#version = :next',
+        '#updatedAt = :now',
+        '#createdAt = if_not_exists(#createdAt, :now)',
+        '#identityId = if_not_exists(#identityId, :identity)',
+    ]
+    for number, (field, value) in enumerate(sorted(changes.items())):
+        names[f'#f{number}'] = field
+        values[f':v{number}'] = value
+        sets.append(f'#f{number} = :v{number}')
+
+    if current_version == 0:
+        # Profiles are created by sign-up, never here: no bare item without email or role
+        condition = 'attribute_exists(PK) AND attribute_not_exists(#version)'
+    else:
+        condition = '#version = :current'
+        values[':current'] = current_version
+
+    return {
+        'Key': profile_key(identity_id),
+        'UpdateExpression': 'SET ' + ', '.join(sets),
+        'ConditionExpression': condition,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+    }
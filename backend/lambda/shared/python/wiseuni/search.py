@@ -0,0 +1,472 @@
+"""
+Admin search over users and courses
+
+Admins could only list users per role and filter in the browser, paging
+through every student. This is an in-memory n-gram index over names,
+emails and course titles, small enough to load in a Lambda container:
+
+    USER#<id> / PROFILE      -> name, email         (kind: the user's role)
+    COURSE#<id> / METADATA   -> title, course id    (kind: 'course')
+
+Index (array-backed: a few MB for 100k users):
+- words of the indexed fields, case- and accent-folded
+  ("Ayşe Yılmaz <ayse.yilmaz@uni.example>" -> ayse, yilmaz, uni, example)
+- postings: word -> array('I') of document numbers, ascending
+- grams: trigram -> array('I') of word numbers, for fuzzy matching
+- the words in sorted order, for prefix matching (bisect)
+
+Searching: every query word must match a word of the document as a
+prefix ("ay yil" finds Ayşe Yılmaz). A query word that is no prefix of
+any word is matched fuzzily instead: within 1 edit (2 from 6 letters up)
+of a word's prefix, checked on the words sharing the most trigrams.
+The most selective query word is looked up first; the others are checked
+on its documents only.
+
+Keeping it current: search_indexer applies PROFILE and METADATA changes
+from the table stream to the newest snapshot and writes the next one
+(versioned S3 object); readers re-check the pointer item every
+refresh_seconds and load a snapshot only when it changed:
+    PK = SEARCH#INDEX   SK = SNAPSHOT -> {version, objectVersion, documents}
+Concurrent writers are reconciled with an optimistic version check, like
+the suppression Bloom filter (wiseuni/suppression.py).
+"""
+
+import bisect
+import heapq
+import json
+import logging
+import re
+import struct
+import sys
+import time
+import unicodedata
+import zlib
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import accumulate, chain, islice
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = {'PK': 'SEARCH#INDEX', 'SK': 'SNAPSHOT'}
+SNAPSHOT_OBJECT = 'search/index.bin'
+KINDS = ('student', 'professor', 'admin', 'course')
+
+DEFAULT_REFRESH_SECONDS = 30
+DEFAULT_LIMIT = 20
+FUZZY_CANDIDATES = 256  # Words checked per fuzzy query word
+
+# Match quality of one query word against one document word
+EXACT, PREFIX, FUZZY = 3, 2, 1
+
+_HEADER = struct.Struct('>4sBI')  # magic, format version, JSON header length
+_MAGIC = b'WUSI'
+_FORMAT = 1
+
+_FOLD = str.maketrans({'ı': 'i', 'ß': 'ss', 'ø': 'o', 'æ': 'ae', 'đ': 'd', 'ł': 'l'})
+_WORD = re.compile(r'[0-9a-z]+')
+
+_deserializer = TypeDeserializer()
+
+
+def fold(text):
+    """Lower case without accents: 'Ayşe YILMAZ' -> 'ayse yilmaz'"""
+    text = unicodedata.normalize('NFKD', (text or '').casefold().translate(_FOLD))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def words(text):
+    return _WORD.findall(fold(text))
+
+
+def trigrams(word, end=True):
+    """Padded trigrams; end=False leaves out the ones at the end (for prefixes)"""
+    padded = f'${word}$' if end else f'${word}'
+    return {padded[start:start + 3] for start in range(max(1, len(padded) - 2))}
+
+
+def prefix_distance(query, word, limit):
+    """Fewest edits turning query into a prefix of word, or limit + 1 if more"""
+    over = limit + 1
+    # Only cells within limit of the diagonal can stay within limit
+    previous = [column if column <= limit else over for column in range(len(word) + 1)]
+    for row, char in enumerate(query, 1):
+        low, high = max(1, row - limit), min(len(word), row + limit)
+        current = [row if row <= limit else over] + [over] * len(word)
+        for column in range(low, high + 1):
+            current[column] = min(
+                previous[column] + 1,
+                current[column - 1] + 1,
+                previous[column - 1] + (char != word[column - 1]),
+            )
+        if min(current) > limit:
+            return over
+        previous = current
+    return min(min(previous), over)
+
+
+def document(item):
+    """Search document (key, kind, name, detail) for a table item, or None"""
+    pk, sk = item.get('PK', ''), item.get('SK', '')
+    if pk.startswith('USER#') and sk == 'PROFILE':
+        return (pk, item.get('role') or 'student', item.get('name') or '', item.get('email') or '')
+    if pk.startswith('COURSE#') and sk == 'METADATA':
+        return (pk, 'course', item.get('title') or '', item.get('courseId') or pk[len('COURSE#'):])
+    return None
+
+
+def is_indexed(pk, sk):
+    return (pk.startswith('USER#') and sk == 'PROFILE') or (pk.startswith('COURSE#') and sk == 'METADATA')
+
+
+class SearchIndex:
+    """
+    Documents, word postings and trigrams of one snapshot
+
+    Updates replace a document under a new number; the old number is only
+    dropped from the postings, and to_bytes() renumbers everything.
+    """
+
+    def __init__(self):
+        self.docs = []  # number -> (key, kind, name, detail), None once removed
+        self.doc_numbers = {}  # key -> number
+        self.doc_words = array('I')  # word numbers of every document, back to back
+        self.doc_starts = array('I', [0])  # document number -> start of its run in doc_words
+        self.words = []  # number -> word
+        self.word_numbers = {}
+        self.postings = []  # word number -> array('I') of document numbers
+        self.sorted_words = []
+        self.grams = {}  # trigram -> array('I') of word numbers
+
+    def __len__(self):
+        return len(self.doc_numbers)
+
+    @classmethod
+    def build(cls, documents):
+        index = cls()
+        for doc in documents:
+            index.upsert(doc)
+        return index
+
+    # ----------------------------------------
+    # Updates
+    # ----------------------------------------
+
+    def _word(self, word):
+        number = self.word_numbers.get(word)
+        if number is None:
+            number = len(self.words)
+            self.words.append(word)
+            self.word_numbers[word] = number
+            self.postings.append(array('I'))
+            bisect.insort(self.sorted_words, word)
+            for gram in trigrams(word):
+                self.grams.setdefault(gram, array('I')).append(number)
+        return number
+
+    def upsert(self, doc):
+        """Add or replace a document; returns False if nothing indexed changed"""
+        key = doc[0]
+        number = self.doc_numbers.get(key)
+        if number is not None:
+            if self.docs[number] == doc:
+                return False
+            self.remove(key)
+        number = len(self.docs)
+        self.docs.append(doc)
+        self.doc_numbers[key] = number
+        word_numbers = array('I', sorted({self._word(word) for word in words(doc[2]) + words(doc[3])}))
+        self.doc_words.extend(word_numbers)
+        self.doc_starts.append(len(self.doc_words))
+        for word_number in word_numbers:
+            self.postings[word_number].append(number)  # Newest number: stays ascending
+        return True
+
+    def remove(self, key):
+        number = self.doc_numbers.pop(key, None)
+        if number is None:
+            return False
+        for word_number in self._words_of(number):
+            posting = self.postings[word_number]
+            del posting[bisect.bisect_left(posting, number)]  # Ascending: no linear search
+        self.docs[number] = None
+        return True
+
+    def _words_of(self, number):
+        return self.doc_words[self.doc_starts[number]:self.doc_starts[number + 1]]
+
+    # ----------------------------------------
+    # Searching
+    # ----------------------------------------
+
+    def _matches(self, query_word, fuzzy):
+        """word number -> match quality for one query word"""
+        matches = {}
+        sorted_words = self.sorted_words
+        start = bisect.bisect_left(sorted_words, query_word)
+        end = bisect.bisect_left(sorted_words, query_word + '{', start)  # '{' sorts after every word character
+        for position in range(start, end):
+            number = self.word_numbers[sorted_words[position]]
+            if self.postings[number]:  # Words of removed documents stay until the next snapshot
+                matches[number] = PREFIX
+        number = self.word_numbers.get(query_word)
+        if number in matches:
+            matches[number] = EXACT
+        if matches or not fuzzy or len(query_word) < 3:
+            return matches
+
+        limit = 1 if len(query_word) < 6 else 2
+        shared = Counter()
+        for gram in trigrams(query_word, end=False):
+            shared.update(self.grams.get(gram, ()))
+        for word_number, _ in shared.most_common(FUZZY_CANDIDATES):
+            if self.postings[word_number] and prefix_distance(query_word, self.words[word_number], limit) <= limit:
+                matches[word_number] = FUZZY
+        return matches
+
+    def search(self, query, kinds=None, limit=DEFAULT_LIMIT, fuzzy=True):
+        """Best matching documents as dicts, best first"""
+        query_words = list(dict.fromkeys(words(query)))
+        if not query_words:
+            return []
+        matched = [self._matches(word, fuzzy) for word in query_words]
+        # Start from the query word with the fewest postings
+        cost = [sum(len(self.postings[number]) for number in matches) for matches in matched]
+        order = sorted(range(len(matched)), key=cost.__getitem__)
+
+        scores = {}
+        for word_number, quality in matched[order[0]].items():
+            for doc_number in self.postings[word_number]:
+                if scores.get(doc_number, 0) < quality:
+                    scores[doc_number] = quality
+        for position in order[1:]:
+            matches = matched[position]
+            if cost[position] <= 4 * len(scores):
+                # Few postings: intersect with them
+                best = {}
+                for word_number, quality in matches.items():
+                    for doc_number in self.postings[word_number]:
+                        if doc_number in scores and best.get(doc_number, 0) < quality:
+                            best[doc_number] = quality
+                scores = {doc_number: scores[doc_number] + quality for doc_number, quality in best.items()}
+            else:
+                # Many postings: check the remaining documents' own words instead
+                narrowed = {}
+                for doc_number, score in scores.items():
+                    quality = max([matches[number] for number in self._words_of(doc_number) if number in matches],
+                                  default=0)
+                    if quality:
+                        narrowed[doc_number] = score + quality
+                scores = narrowed
+
+        if kinds:
+            scores = {number: score for number, score in scores.items() if self.docs[number][1] in kinds}
+        docs = self.docs
+        best = heapq.nsmallest(limit, scores.items(), key=lambda entry: (-entry[1], docs[entry[0]][2].casefold()))
+        return [self._result(number, score) for number, score in best]
+
+    def _result(self, number, score):
+        key, kind, name, detail = self.docs[number]
+        result = {'kind': kind, 'id': key.split('#', 1)[1], 'name': name, 'score': score}
+        result['courseId' if kind == 'course' else 'email'] = detail
+        return result
+
+    # ----------------------------------------
+    # Snapshots
+    # ----------------------------------------
+
+    def to_bytes(self):
+        """Compressed snapshot of the live documents, renumbered"""
+        docs, postings, grams = self.docs, self.postings, self.grams
+        doc_starts, doc_words = self.doc_starts, self.doc_words
+        live = [number for number, doc in enumerate(docs) if doc is not None]
+        kept = [number for number, posting in enumerate(postings) if posting]
+        if len(live) < len(docs) or len(kept) < len(postings):
+            doc_map = {old: new for new, old in enumerate(live)}
+            word_map = {old: new for new, old in enumerate(kept)}
+            docs = [docs[number] for number in live]
+            postings = [array('I', (doc_map[doc] for doc in postings[number])) for number in kept]
+            doc_starts, doc_words = array('I', [0]), array('I')
+            for number in live:
+                doc_words.extend(word_map[word] for word in self._words_of(number))
+                doc_starts.append(len(doc_words))
+            grams = {gram: array('I', (word_map[word] for word in numbers if word in word_map))
+                     for gram, numbers in grams.items()}
+            grams = {gram: numbers for gram, numbers in grams.items() if numbers}
+        words = [self.words[number] for number in kept]
+
+        header = json.dumps({
+            'docs': docs,
+            'words': words,
+            'grams': list(grams),
+            # Lengths of the runs in the flat array that follows; then
+            # doc_starts (one more than docs) and doc_words
+            'postings': [len(posting) for posting in postings],
+            'gramPostings': [len(numbers) for numbers in grams.values()],
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        flat = array('I')
+        for run in (*postings, *grams.values(), doc_starts, doc_words):
+            flat.extend(run)
+        if sys.byteorder == 'big':
+            flat.byteswap()  # Stored little-endian
+        return zlib.compress(_HEADER.pack(_MAGIC, _FORMAT, len(header)) + header + flat.tobytes(), 6)
+
+    @classmethod
+    def from_bytes(cls, data):
+        raw = memoryview(zlib.decompress(data))
+        magic, version, header_length = _HEADER.unpack_from(raw)
+        if magic != _MAGIC or version != _FORMAT:
+            raise ValueError(f'Not a search snapshot (format {version})')
+        header = json.loads(bytes(raw[_HEADER.size:_HEADER.size + header_length]))
+        flat = array('I')
+        flat.frombytes(raw[_HEADER.size + header_length:])
+        if sys.byteorder == 'big':
+            flat.byteswap()
+        ends = list(accumulate(chain(header['postings'], header['gramPostings']), initial=0))
+        runs = [flat[start:end] for start, end in zip(ends, islice(ends, 1, None))]
+        postings_count = len(header['postings'])
+
+        index = cls()
+        index.docs = [tuple(doc) for doc in header['docs']]
+        index.doc_numbers = {doc[0]: number for number, doc in enumerate(index.docs)}
+        index.words = header['words']
+        index.word_numbers = {word: number for number, word in enumerate(index.words)}
+        index.sorted_words = sorted(index.words)
+        index.postings = runs[:postings_count]
+        index.grams = dict(zip(header['grams'], runs[postings_count:]))
+        end = ends[-1] + len(index.docs) + 1
+        index.doc_starts = flat[ends[-1]:end]
+        index.doc_words = flat[end:]
+        return index
+
+
+def changes_from_records(records):
+    """
+    Stream records -> {key: document or None (removed)}, last change wins
+
+    Records whose indexed fields did not change (logins touching
+    updatedAt, say) are left out.
+    """
+    changes = {}
+    for record in records:
+        change = record.get('dynamodb', {})
+        keys = change.get('Keys', {})
+        pk, sk = keys.get('PK', {}).get('S', ''), keys.get('SK', {}).get('S', '')
+        if not is_indexed(pk, sk):
+            continue  # The event source filter already does this; kept for manual replays
+        images = [
+            document({name: _deserializer.deserialize(value) for name, value in change[image].items()})
+            if change.get(image) else None
+            for image in ('OldImage', 'NewImage')
+        ]
+        if images[0] != images[1] or pk in changes:
+            changes[pk] = images[1]
+    return changes
+
+
+class SearchStore:
+    """
+    The current snapshot, for the search function and the indexer
+
+    One instance should be created at module level so the loaded index
+    survives across warm invocations.
+    """
+
+    def __init__(self, table, s3, bucket, refresh_seconds=DEFAULT_REFRESH_SECONDS, clock=time.monotonic):
+        self.table = table
+        self.s3 = s3
+        self.bucket = bucket
+        self.refresh_seconds = refresh_seconds
+        self._clock = clock
+        self._index = None
+        self._version = None
+        self._checked_at = None
+
+    def current(self):
+        """The newest snapshot, re-checked at most every refresh_seconds"""
+        now = self._clock()
+        if self._index is None or now - self._checked_at >= self.refresh_seconds:
+            self._refresh(self._pointer())
+            self._checked_at = now
+        return self._index
+
+    def _pointer(self):
+        return self.table.get_item(Key=SNAPSHOT_KEY, ConsistentRead=True).get('Item')
+
+    def _refresh(self, pointer):
+        version = int(pointer['version']) if pointer else 0
+        if self._index is not None and version == self._version:
+            return
+        if pointer is None:
+            logger.warning('No search snapshot yet: run scripts/build_search_index.py')
+            self._index = SearchIndex()
+        else:
+            started = time.perf_counter()
+            body = self.s3.get_object(
+                Bucket=self.bucket, Key=SNAPSHOT_OBJECT, VersionId=pointer['objectVersion'],
+            )['Body'].read()
+            self._index = SearchIndex.from_bytes(body)
+            logger.info(f'Loaded search snapshot v{version}: {len(self._index)} documents, '
+                        f'{len(body)} bytes in {(time.perf_counter() - started) * 1000:.0f} ms')
+        self._version = version
+
+    def apply(self, changes, max_attempts=5):
+        """
+        Apply {key: document or None} and publish the next snapshot
+
+        Returns the number of documents changed (0: nothing written).
+        """
+        for _ in range(max_attempts):
+            pointer = self._pointer()
+            self._refresh(pointer)
+            index = self._index
+            changed = 0
+            for key, doc in changes.items():
+                changed += index.upsert(doc) if doc else index.remove(key)
+            if not changed:
+                return 0
+            if not self._publish(index, pointer):
+                self._index = None  # Changed under us: reload and re-apply
+                logger.info('Search snapshot changed concurrently, retrying')
+                continue
+            return changed
+        raise RuntimeError('Could not publish search snapshot after retries')
+
+    def replace(self, index):
+        """Publish a freshly built index (scripts/build_search_index.py)"""
+        for _ in range(5):
+            if self._publish(index, self._pointer()):
+                return
+        raise RuntimeError('Could not publish search snapshot after retries')
+
+    def _publish(self, index, pointer):
+        version = int(pointer['version']) if pointer else 0
+        body = index.to_bytes()
+        written = self.s3.put_object(
+            Bucket=self.bucket, Key=SNAPSHOT_OBJECT, Body=body, ContentType='application/octet-stream',
+        )
+        try:
+            self.table.put_item(
+                Item={
+                    **SNAPSHOT_KEY,
+                    'version': version + 1,
+                    'objectVersion': written['VersionId'],
+                    'documents': len(index),
+                    'bytes': len(body),
+                    'updatedAt': datetime.now(timezone.utc).isoformat(),
+                },
+                ConditionExpression='attribute_not_exists(PK) OR version = :v',
+                ExpressionAttributeValues={':v': version},
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+        # Keep the renumbered copy: updates leave removed numbers behind
+        self._index = SearchIndex.from_bytes(body)
+        self._version = version + 1
+        self._checked_at = self._clock()
+        return True
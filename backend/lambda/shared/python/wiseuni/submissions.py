@@ -0,0 +1,178 @@
+"""
+Submission index
+
+Every homework submission is one item in the single table:
+    PK = USER#<identityId>        SK = SUBMISSION#<courseId>#<timestamp>
+    GSI1PK = COURSE#<courseId>    GSI1SK = SUBMISSION#<identityId>#<timestamp>
+
+Students list their own submissions with one Query on their partition,
+professors list a whole course with one Query on GSI1 - instead of a
+ListObjectsV2 walk per student prefix.
+
+Object keys follow the frontend/upload service layout:
+    <roleFolder>/<identityId>/<courseId>/<assignmentId>/<fileName>   (upload service)
+    <roleFolder>/<identityId>/<fileName>                             (legacy direct upload)
+Legacy objects have no course and are indexed under UNASSIGNED, without
+GSI1 keys (they do not belong to any course view).
+"""
+
+import base64
+import json
+from datetime import datetime, timezone
+
+from wiseuni.api import ROLE_FOLDERS, ApiError
+
+UNASSIGNED = 'UNASSIGNED'
+DEFAULT_ASSIGNMENT = 'general'
+MAX_PAGE_SIZE = 100
+
+# Attributes returned by listings (GSI1 projects everything, clients need little)
+LISTING_ATTRIBUTES = [
+    'submissionId', 'identityId', 'courseId', 'assignmentId', 'fileName', 'key',
+    'size', 'contentType', 'sha256', 'status', 'createdAt', 'completedAt',
+]
+
+
+def format_timestamp(moment=None):
+    """Sortable UTC timestamp used in sort keys, e.g. 2024-10-01T09:30:00.000000Z"""
+    return (moment or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def submission_id(course_id, timestamp):
+    return f'{course_id}#{timestamp}'
+
+
+def submission_key(identity_id, sub_id):
+    return {'PK': f'USER#{identity_id}', 'SK': f'SUBMISSION#{sub_id}'}
+
+
+def index_attributes(identity_id, course_id, timestamp):
+    """Primary and GSI1 keys for a new submission item"""
+    sub_id = submission_id(course_id, timestamp)
+    attributes = {**submission_key(identity_id, sub_id), 'submissionId': sub_id}
+    if course_id != UNASSIGNED:
+        # Sparse: legacy uploads without a course stay out of course views
+        attributes['GSI1PK'] = f'COURSE#{course_id}'
+        attributes['GSI1SK'] = f'SUBMISSION#{identity_id}#{timestamp}'
+    return attributes
+
+
+def parse_object_key(key):
+    """
+    Split an object key into (identityId, courseId, assignmentId, fileName)
+
+    Returns None for keys outside the per-user folders (e.g. public/).
+    """
+    parts = key.split('/')
+    if len(parts) < 3 or parts[0] not in ROLE_FOLDERS.values() or not parts[1]:
+        return None
+    if len(parts) >= 5:
+        return parts[1], parts[2], parts[3], '/'.join(parts[4:])
+    return parts[1], UNASSIGNED, DEFAULT_ASSIGNMENT, '/'.join(parts[2:])
+
+
+def authorize_course_reader(table, caller, course_id):
+    """Only the course's professor (COURSE#id/METADATA professorId) or an admin"""
+    if caller.role == 'admin':
+        return
+    if caller.role != 'professor':
+        raise ApiError(403, 'Only professors and admins can access course submissions')
+    course = table.get_item(
+        Key={'PK': f'COURSE#{course_id}', 'SK': 'METADATA'},
+        ProjectionExpression='professorId',
+    ).get('Item')
+    if not course or course.get('professorId') != caller.identity_id:
+        raise ApiError(403, 'You do not teach this course')
+
+
+# ========================================
+# PAGINATED QUERIES
+# ========================================
+
+def encode_cursor(last_evaluated_key):
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor, expected):
+    """
+    Decode a client cursor and check it points into the expected partition
+
+    expected: {'PK': ...} or {'GSI1PK': ...}; stops a caller from paging
+    into someone else's partition with a crafted cursor.
+    """
+    if not cursor:
+        return None
+    try:
+        start_key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except ValueError:
+        raise ApiError(400, 'Invalid cursor')
+    if not isinstance(start_key, dict) or any(start_key.get(k) != v for k, v in expected.items()):
+        raise ApiError(400, 'Invalid cursor')
+    return start_key
+
+
+def _page(table, query, limit, cursor, expected):
+    try:
+        limit = max(1, min(int(limit or MAX_PAGE_SIZE), MAX_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, 'limit must be a number')
+    query.update(
+        Limit=limit,
+        ScanIndexForward=False,  # Newest first
+        ProjectionExpression=', '.join(f'#p{i}' for i in range(len(LISTING_ATTRIBUTES))),
+    )
+    query.setdefault('ExpressionAttributeNames', {}).update(
+        {f'#p{i}': name for i, name in enumerate(LISTING_ATTRIBUTES)}
+    )
+    start_key = decode_cursor(cursor, expected)
+    if start_key:
+        query['ExclusiveStartKey'] = start_key
+
+    result = table.query(**query)
+    return result.get('Items', []), encode_cursor(result.get('LastEvaluatedKey'))
+
+
+def query_user_submissions(table, identity_id, course_id=None, limit=None, cursor=None):
+    """One page of a user's submissions, optionally for one course"""
+    pk = f'USER#{identity_id}'
+    prefix = f'SUBMISSION#{course_id}#' if course_id else 'SUBMISSION#'
+    query = {
+        'KeyConditionExpression': 'PK = :pk AND begins_with(SK, :sk)',
+        'ExpressionAttributeValues': {':pk': pk, ':sk': prefix},
+    }
+    return _page(table, query, limit, cursor, {'PK': pk})
+
+
+def query_course_submissions(table, course_id, identity_id=None, limit=None, cursor=None):
+    """One page of a course's submissions (GSI1), optionally for one student"""
+    gsi1pk = f'COURSE#{course_id}'
+    prefix = f'SUBMISSION#{identity_id}#' if identity_id else 'SUBMISSION#'
+    query = {
+        'IndexName': 'GSI1',
+        'KeyConditionExpression': 'GSI1PK = :pk AND begins_with(GSI1SK, :sk)',
+        'ExpressionAttributeValues': {':pk': gsi1pk, ':sk': prefix},
+    }
+    return _page(table, query, limit, cursor, {'GSI1PK': gsi1pk})
+
+
+def iter_course_submissions(table, course_id, assignment_id=None):
+    """Every COMPLETE submission of a course (all pages), for batch jobs"""
+    query = {
+        'IndexName': 'GSI1',
+        'KeyConditionExpression': 'GSI1PK = :pk AND begins_with(GSI1SK, :sk)',
+        'FilterExpression': '#status = :complete',
+        'ExpressionAttributeNames': {'#status': 'status'},
+        'ExpressionAttributeValues': {':pk': f'COURSE#{course_id}', ':sk': 'SUBMISSION#', ':complete': 'COMPLETE'},
+    }
+    if assignment_id:
+        query['FilterExpression'] += ' AND assignmentId = :assignment'
+        query['ExpressionAttributeValues'][':assignment'] = assignment_id
+    while True:
+        page = table.query(**query)
+        yield from page.get('Items', [])
+        if 'LastEvaluatedKey' not in page:
+            return
+        query['ExclusiveStartKey'] = page['LastEvaluatedKey']
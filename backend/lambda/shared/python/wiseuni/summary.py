@@ -0,0 +1,92 @@
+"""
+User summary: profile + enrolments + grades in one read
+
+Items in a user's partition, in sort-key order:
+    USER#<id> / CONTENT#...      (content index)
+    USER#<id> / ENROLLMENT#...   \
+    USER#<id> / GRADE#...         > the summary: one contiguous SK range
+    USER#<id> / PROFILE          /
+    USER#<id> / SUBMISSION#...
+    USER#<id> / VERSION          summary version, bumped from the table stream
+
+So one Query with SK BETWEEN 'ENROLLMENT#' AND 'PROFILE' returns exactly
+the three kinds of item, instead of a GetItem and two Queries.
+
+The VERSION item changes whenever a summary item does (cache_invalidation
+function), so a response can be cached and revalidated against one small
+GetItem: ETag = identity + version.
+
+Enrolments and grades may be stored compact (wiseuni/items.py); they are
+returned decoded, in the same shape either way.
+"""
+
+import hashlib
+
+from boto3.dynamodb.conditions import Key
+from wiseuni.items import KEY_ATTRIBUTES, decode_all
+
+SUMMARY_SK_FIRST = 'ENROLLMENT#'
+SUMMARY_SK_LAST = 'PROFILE'
+SUMMARY_PREFIXES = ('ENROLLMENT#', 'GRADE#', 'PROFILE')
+VERSION_SK = 'VERSION'
+
+
+def version_key(identity_id):
+    return {'PK': f'USER#{identity_id}', 'SK': VERSION_SK}
+
+
+def is_summary_item(sk):
+    return sk.startswith(SUMMARY_PREFIXES)
+
+
+def read_version(table, identity_id):
+    """Current summary version; 0 until the first change after the stream was enabled"""
+    item = table.get_item(Key=version_key(identity_id), ProjectionExpression='version').get('Item')
+    return int(item['version']) if item else 0
+
+
+def make_etag(identity_id, version):
+    # Opaque to the client; the hash keeps identity ids out of caches and logs
+    digest = hashlib.sha256(identity_id.encode('utf-8')).hexdigest()[:12]
+    return f'"{digest}-{version}"'
+
+
+def _public(item):
+    return {name: value for name, value in item.items() if name not in KEY_ATTRIBUTES}
+
+
+def query_summary(table, identity_id):
+    """{'profile': {...} | None, 'enrollments': [...], 'grades': [...]} from one Query"""
+    query = {
+        'KeyConditionExpression': Key('PK').eq(f'USER#{identity_id}')
+        & Key('SK').between(SUMMARY_SK_FIRST, SUMMARY_SK_LAST),
+    }
+    summary = {'profile': None, 'enrollments': [], 'grades': []}
+    while True:
+        page = table.query(**query)
+        for item in page.get('Items', []):
+            sk = item['SK']
+            if sk == 'PROFILE':
+                summary['profile'] = _public(item)
+            elif sk.startswith('ENROLLMENT#'):
+                summary['enrollments'].append(item)
+            elif sk.startswith('GRADE#'):
+                summary['grades'].append(item)
+        if 'LastEvaluatedKey' not in page:
+            break
+        query['ExclusiveStartKey'] = page['LastEvaluatedKey']
+    # Decoded with the keys still on (they hold identityId and courseId)
+    decoded = [_public(item) for item in decode_all(table, summary['enrollments'] + summary['grades'])]
+    split = len(summary['enrollments'])
+    summary['enrollments'], summary['grades'] = decoded[:split], decoded[split:]
+    return summary
+
+
+def bump_versions(table, identity_ids):
+    """One increment per user, however many of their items changed"""
+    for identity_id in identity_ids:
+        table.update_item(
+            Key=version_key(identity_id),
+            UpdateExpression='ADD version :one',
+            ExpressionAttributeValues={':one': 1},
+        )
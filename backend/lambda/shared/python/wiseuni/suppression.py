@@ -0,0 +1,239 @@
+"""
+Email suppression index
+
+Addresses that hard-bounced or complained must never be mailed again,
+otherwise SES lowers our reputation and eventually pauses sending.
+
+Layout in the single table:
+    PK = SUPPRESS#<email>   SK = SUPPRESSION  -> one item per suppressed address
+    PK = SUPPRESS#INDEX     SK = BLOOM        -> Bloom filter over all of the above
+
+Senders load the Bloom filter once per container (one GetItem) and check
+every address against it in memory. A negative answer is definitive, so
+the common case never touches DynamoDB. Only a positive answer (a real
+suppression or a ~1% false positive) costs one GetItem to confirm.
+"""
+
+import hashlib
+import logging
+import math
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+SUPPRESSION_SK = 'SUPPRESSION'
+BLOOM_KEY = {'PK': 'SUPPRESS#INDEX', 'SK': 'BLOOM'}
+
+# 200k addresses at 1% false positives is ~240 KB of bits before
+# compression, comfortably below DynamoDB's 400 KB item limit
+DEFAULT_CAPACITY = 200_000
+DEFAULT_ERROR_RATE = 0.01
+
+# How often a warm container re-reads the Bloom filter item
+DEFAULT_REFRESH_SECONDS = 300
+
+_HEADER = struct.Struct('>IB')  # size in bits, number of hashes
+
+
+def normalize_email(email):
+    """Suppression is case-insensitive, like Cognito usernames"""
+    return email.strip().lower()
+
+
+def suppression_key(email):
+    return {'PK': f'SUPPRESS#{normalize_email(email)}', 'SK': SUPPRESSION_SK}
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter backed by a bytearray
+
+    Uses double hashing (h1 + i*h2) over a single blake2b digest, so a
+    lookup costs one hash regardless of the number of probes.
+    """
+
+    def __init__(self, size_bits, num_hashes, bits=None):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=DEFAULT_ERROR_RATE):
+        size_bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        num_hashes = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, num_hashes)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        size = self.size_bits
+        return [(h1 + i * h2) % size for i in range(self.num_hashes)]
+
+    def add(self, item):
+        """Set the item's bits; returns True if any bit was newly set"""
+        bits = self.bits
+        changed = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                changed = True
+        return changed
+
+    def __contains__(self, item):
+        bits = self.bits
+        for pos in self._positions(item):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def to_bytes(self):
+        # A sparse filter is mostly zero bytes, so it compresses very well
+        return zlib.compress(_HEADER.pack(self.size_bits, self.num_hashes) + bytes(self.bits), 1)
+
+    @classmethod
+    def from_bytes(cls, data):
+        raw = zlib.decompress(data)
+        size_bits, num_hashes = _HEADER.unpack_from(raw)
+        return cls(size_bits, num_hashes, bytearray(raw[_HEADER.size:]))
+
+
+class SuppressionIndex:
+    """
+    Suppression lookups for senders and writes for the feedback processor
+
+    One instance should be created at module level so the Bloom filter
+    survives across warm invocations.
+    """
+
+    def __init__(self, table, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE,
+                 refresh_seconds=DEFAULT_REFRESH_SECONDS, clock=time.monotonic):
+        self.table = table
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self._clock = clock
+        self._bloom = None
+        self._version = 0
+        self._loaded_at = None
+        # Confirmed suppressions seen by this container (they never expire)
+        self._confirmed = set()
+
+    # ----------------------------------------
+    # Sender side
+    # ----------------------------------------
+
+    def is_suppressed(self, email):
+        """
+        Return True if email must not be sent to
+
+        Fails open: if DynamoDB is unavailable we log and allow the send,
+        matching the triggers' rule that email problems never block sign-up.
+        """
+        address = normalize_email(email)
+        if address in self._confirmed:
+            return True
+
+        try:
+            bloom = self._current_bloom()
+            if address not in bloom:
+                return False
+
+            item = self.table.get_item(Key=suppression_key(address)).get('Item')
+        except ClientError as e:
+            logger.warning(f'Suppression check unavailable, allowing send: {e}')
+            return False
+
+        if item:
+            self._confirmed.add(address)
+            return True
+        return False
+
+    def _current_bloom(self):
+        now = self._clock()
+        if self._bloom is None or now - self._loaded_at >= self.refresh_seconds:
+            self._bloom, self._version = self._load_bloom()
+            self._loaded_at = now
+        return self._bloom
+
+    def _load_bloom(self):
+        item = self.table.get_item(Key=BLOOM_KEY, ConsistentRead=True).get('Item')
+        if not item:
+            return BloomFilter.for_capacity(self.capacity, self.error_rate), 0
+        return BloomFilter.from_bytes(bytes(item['bits'])), int(item['version'])
+
+    # ----------------------------------------
+    # Feedback processor side
+    # ----------------------------------------
+
+    def suppress_many(self, entries):
+        """
+        Record suppressions in one pass
+
+        entries: iterable of dicts with at least 'email' and 'reason'
+        (plus any detail attributes to keep on the item).
+        Returns the number of distinct addresses written.
+        """
+        by_address = {}
+        for entry in entries:
+            address = normalize_email(entry['email'])
+            if address:
+                by_address[address] = entry
+        if not by_address:
+            return 0
+
+        now = datetime.now(timezone.utc).isoformat()
+        with self.table.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+            for address, entry in by_address.items():
+                item = {k: v for k, v in entry.items() if v not in (None, '')}
+                item.update(suppression_key(address))
+                item['email'] = address
+                item.setdefault('suppressedAt', now)
+                batch.put_item(Item=item)
+
+        self._merge_into_bloom(by_address.keys())
+        self._confirmed.update(by_address.keys())
+        return len(by_address)
+
+    def _merge_into_bloom(self, addresses, max_attempts=5):
+        """
+        Add addresses to the shared Bloom filter item
+
+        Concurrent processors are reconciled with an optimistic version
+        check; on conflict we reload the latest filter and re-apply.
+        The item can be a few hundred KB, so it is only rewritten when the
+        batch actually sets new bits (repeat bounces cost nothing).
+        """
+        for _ in range(max_attempts):
+            bloom, version = self._load_bloom()
+            changed = False
+            for address in addresses:
+                changed |= bloom.add(address)
+            if not changed:
+                self._bloom, self._version = bloom, version
+                self._loaded_at = self._clock()
+                return
+
+            try:
+                self.table.put_item(
+                    Item={**BLOOM_KEY, 'bits': bloom.to_bytes(), 'version': version + 1},
+                    ConditionExpression='attribute_not_exists(PK) OR version = :v',
+                    ExpressionAttributeValues={':v': version},
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                logger.info('Bloom filter changed concurrently, retrying merge')
+                continue
+
+            self._bloom, self._version = bloom, version + 1
+            self._loaded_at = self._clock()
+            return
+
+        raise RuntimeError('Could not update suppression Bloom filter after retries')
@@ -0,0 +1,305 @@
+"""
+Email templates
+
+One copy of WiseUni's branding for every email we (or Cognito) send:
+    layout.html            header + footer shared by all HTML emails
+    <name>.layout.html     a template's own, leaner layout instead (code emails)
+    <name>.html / .txt     body of each template (text version optional)
+    <name>.row.html / .txt one repeated row, for templates listing items
+    locales/<lang>.json    translated strings
+    brand.json             addresses, URLs, colours
+
+Placeholders:
+    {{ t:key }}    translated string   - resolved when compiling
+    {{ b:key }}    brand constant      - resolved when compiling
+    {{ name }}     per-recipient value - substituted on every render
+    {{ rows }}     the row template once per item of rows=[{...}, ...]
+
+A (template, locale, variant) is compiled once per container: static
+placeholders resolved, HTML minified, and the result split into literal
+segments around the per-recipient fields. Rendering is then one
+''.join() per part with HTML-escaped values - no parsing per send.
+
+    from wiseuni.templates import render
+    email = render('welcome', 'tr', name='Ayşe', email='ayse@example.com')
+    email.subject, email.html, email.text
+
+Values usually come from user attributes (a student picks their own
+name), so every value is cleaned before use: control, bidi-override and
+zero-width characters removed, whitespace collapsed, and the length capped
+by FIELD_LIMITS. Only then is it HTML-escaped. Row values get the same
+treatment, and at most MAX_ROWS rows are rendered.
+"""
+
+import html
+import json
+import os
+import re
+from collections import namedtuple
+
+SUPPORTED_LOCALES = ('en', 'tr')
+DEFAULT_LOCALE = 'en'
+
+Rendered = namedtuple('Rendered', 'subject html text')
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+_PLACEHOLDER = re.compile(r'\{\{\s*(?:([tb]):)?([\w.]+)\s*\}\}')
+_HTML_SPECIAL = re.compile(r'[&<>"\']')
+# Line breaks (header injection in subjects), other C0/C1 controls, zero-width
+# and bidi controls (spoofed text), lone surrogates (unencodable)
+_UNSAFE_CHARS = re.compile(r'[\x00-\x1f\x7f-\x9f\u200b-\u200f\u2028-\u202e\u2060-\u206f\ufeff\ud800-\udfff]')
+_STYLE_ATTRIBUTE = re.compile(r'style="([^"]*)"')
+_STYLE_SPACING = re.compile(r'\s*([:;,])\s*')
+
+# Characters kept per field after cleaning; others get DEFAULT_FIELD_LIMIT
+# None = never shortened (the Cognito code placeholder must arrive intact)
+FIELD_LIMITS = {'name': 64, 'email': 254, 'code': None}
+DEFAULT_FIELD_LIMIT = 200
+ROWS_FIELD = 'rows'
+MAX_ROWS = 50
+# Rendered emails kept per compiled template, by recipient values; a
+# Cognito code email for a given name is then built once per container
+RENDER_CACHE_SIZE = 256
+MAX_LOCALE_ALIASES = 512
+
+
+def _read(name):
+    path = os.path.join(_DIR, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _load_json(name):
+    return json.loads(_read(name))
+
+
+_LOCALES = {locale: _load_json(f'locales/{locale}.json') for locale in SUPPORTED_LOCALES}
+_BRAND = _load_json('brand.json')
+_BRAND['portal_url'] = os.environ.get('PORTAL_URL', _BRAND['portal_url'])
+
+_compiled = {}
+
+
+def pick_locale(value):
+    """'tr-TR', 'tr_TR', 'TR' -> 'tr'; anything unsupported -> 'en'"""
+    language = str(value or '').replace('_', '-').split('-')[0].lower()
+    return language if language in SUPPORTED_LOCALES else DEFAULT_LOCALE
+
+
+def brand(key):
+    return _BRAND[key]
+
+
+def _lookup(tree, template, variant, key):
+    """Most specific first: <template>.<variant>.<key>, <template>.<key>, common.<key>"""
+    chains = []
+    if variant:
+        chains.append((template, variant))
+    chains += [(template,), ('common',), ()]
+    for chain in chains:
+        node = tree
+        for part in chain + tuple(key.split('.')):
+            node = node.get(part) if isinstance(node, dict) else None
+            if node is None:
+                break
+        if isinstance(node, str):
+            return node
+    return None
+
+
+def _resolve_static(source, template, locale, variant):
+    def replace(match):
+        kind, key = match.groups()
+        if kind is None:
+            return match.group(0)  # Per-recipient: left for render time
+        if kind == 'b':
+            value = _lookup(_BRAND, template, variant, key)
+        else:
+            value = _lookup(_LOCALES[locale], template, variant, key)
+            if value is None:
+                value = _lookup(_LOCALES[DEFAULT_LOCALE], template, variant, key)
+        if value is None:
+            raise KeyError(f'{template}/{variant}: no {kind}:{key} for locale {locale}')
+        return value
+
+    # Translations may themselves contain brand or recipient placeholders
+    for _ in range(3):
+        resolved = _PLACEHOLDER.sub(replace, source)
+        if resolved == source:
+            break
+        source = resolved
+    return source
+
+
+def clean_value(value, limit=DEFAULT_FIELD_LIMIT):
+    """Printable, single-line, at most limit characters (ellipsis when cut)"""
+    value = '' if value is None else str(value)
+    # Common case, nothing to clean (isprintable() is False for every _UNSAFE_CHARS character)
+    if ((limit is None or len(value) <= limit) and value.isprintable() and '  ' not in value
+            and value[:1] != ' ' and value[-1:] != ' '):
+        return value
+    cut = limit is not None and len(value) > limit * 4
+    if cut:
+        # Never scan a huge attribute: cleaning only needs a window past the limit
+        value = value[:limit * 4]
+    if _UNSAFE_CHARS.search(value):
+        value = _UNSAFE_CHARS.sub(' ', value)
+    if '  ' in value or value[:1].isspace() or value[-1:].isspace():
+        value = ' '.join(value.split())
+    if cut or (limit is not None and len(value) > limit):
+        value = value[:limit - 1].rstrip() + '…'
+    return value
+
+
+def _compact_style(match):
+    style = _STYLE_SPACING.sub(r'\1', match.group(1)).strip().rstrip(';')
+    return f'style="{style}"'
+
+
+def minify(markup):
+    """Drop comments, indentation and spacing in inline styles; emails are sent as-is, every byte counts"""
+    markup = re.sub(r'<!--.*?-->', '', markup, flags=re.S)
+    markup = re.sub(r'>\s+<', '><', markup)
+    markup = re.sub(r'\s+', ' ', markup)
+    markup = _STYLE_ATTRIBUTE.sub(_compact_style, markup)
+    return markup.strip()
+
+
+class _Segments:
+    """Literal text split around {{ field }} placeholders; filled with one join"""
+
+    def __init__(self, source):
+        self.literals, self.fields, last = [], [], 0
+        for match in _PLACEHOLDER.finditer(source):
+            self.literals.append(source[last:match.start()])
+            self.fields.append(match.group(2))
+            last = match.end()
+        self.literals.append(source[last:])
+        self.pairs = list(zip(self.fields, self.literals[1:]))
+
+    def fill(self, values):
+        out = [self.literals[0]]
+        for field, literal in self.pairs:
+            out.append(values[field])
+            out.append(literal)
+        return ''.join(out)
+
+
+class CompiledTemplate:
+    """Subject, HTML and text of one (template, locale, variant), ready to fill"""
+
+    def __init__(self, template, locale, variant):
+        self.key = (template, locale, variant)
+        body = _read(f'{template}.html')
+        if body is None:
+            raise KeyError(f'Unknown email template: {template}')
+        page = (_read(f'{template}.layout.html') or _read('layout.html')).replace('{{ content }}', body)
+        text = _read(f'{template}.txt')
+
+        self.subject = _Segments(_resolve_static('{{ t:subject }}', template, locale, variant))
+        self.html = _Segments(minify(_resolve_static(page, template, locale, variant)))
+        self.text = _Segments(_resolve_static(text.strip(), template, locale, variant)) if text else None
+        self.fields = frozenset(self.subject.fields + self.html.fields + (self.text.fields if self.text else []))
+        self.limits = self._limits(self.fields - {ROWS_FIELD})
+        self.value_fields = tuple(field for field, _ in self.limits)
+
+        row = _read(f'{template}.row.html')
+        row_text = _read(f'{template}.row.txt')
+        self.row_html = _Segments(minify(_resolve_static(row, template, locale, variant))) if row else None
+        self.row_text = _Segments(_resolve_static(row_text.strip(), template, locale, variant)) if row_text else None
+        self.row_fields = frozenset((self.row_html.fields if row else []) + (self.row_text.fields if row_text else []))
+        self.row_limits = self._limits(self.row_fields)
+        # Rows are lists (unhashable), and a digest is rarely rendered twice
+        self._rendered = {} if ROWS_FIELD not in self.fields else None
+        if ROWS_FIELD in self.subject.fields or ROWS_FIELD in self.row_fields:
+            raise KeyError(f'{template}: {{{{ {ROWS_FIELD} }}}} only belongs in the HTML and text bodies')
+
+    @staticmethod
+    def _limits(fields):
+        return tuple((field, FIELD_LIMITS.get(field, DEFAULT_FIELD_LIMIT)) for field in sorted(fields))
+
+    @staticmethod
+    def _clean(values, limits):
+        plain, escaped = {}, {}
+        for field, limit in limits:
+            value = plain[field] = clean_value(values.get(field), limit)
+            # Most names and codes have nothing to escape: skip the five replace() calls
+            escaped[field] = html.escape(value) if _HTML_SPECIAL.search(value) else value
+        return plain, escaped
+
+    def render(self, values):
+        key = None
+        if self._rendered is not None:
+            key = tuple(map(values.get, self.value_fields))
+            try:
+                rendered = self._rendered.get(key)
+            except TypeError:  # An unhashable value: render without the cache
+                key = rendered = None
+            if rendered is not None:
+                return rendered
+
+        rendered = self._render(values)
+        if key is not None:
+            if len(self._rendered) >= RENDER_CACHE_SIZE:
+                self._rendered.clear()
+            self._rendered[key] = rendered
+        return rendered
+
+    def _render(self, values):
+        plain, escaped = self._clean(values, self.limits)
+        if ROWS_FIELD in self.fields:
+            html_rows, text_rows = [], []
+            for row in (values.get(ROWS_FIELD) or [])[:MAX_ROWS]:
+                row_plain, row_escaped = self._clean(row, self.row_limits)
+                if self.row_html is not None:
+                    html_rows.append(self.row_html.fill(row_escaped))
+                if self.row_text is not None:
+                    text_rows.append(self.row_text.fill(row_plain))
+            escaped[ROWS_FIELD] = ''.join(html_rows)
+            plain[ROWS_FIELD] = '\n'.join(text_rows)
+        return Rendered(
+            self.subject.fill(plain),
+            self.html.fill(escaped),
+            self.text.fill(plain) if self.text is not None else None,
+        )
+
+
+def get_template(template, locale=DEFAULT_LOCALE, variant=None):
+    """Compiled template from the per-container cache"""
+    # Also cached under the locale as given ('tr-TR'), skipping pick_locale() next time
+    compiled = _compiled.get((template, locale, variant))
+    if compiled is None:
+        key = (template, pick_locale(locale), variant)
+        compiled = _compiled.get(key)
+        if compiled is None:
+            compiled = _compiled[key] = CompiledTemplate(*key)
+        if len(_compiled) < MAX_LOCALE_ALIASES:  # Locales are user attributes: bounded
+            _compiled[(template, locale, variant)] = compiled
+    return compiled
+
+
+def render(template, locale=DEFAULT_LOCALE, variant=None, **values):
+    """Render for one recipient; values cleaned everywhere, HTML-escaped in the HTML part"""
+    return get_template(template, locale, variant).render(values)
+
+
+def warm(template, variants=(None,)):
+    """Compile every locale x variant up front (at import, outside the request path)"""
+    for locale in SUPPORTED_LOCALES:
+        for variant in variants:
+            get_template(template, locale, variant)
+
+
+def code_fallback(code, locale=DEFAULT_LOCALE):
+    """
+    Bare code email, no user attributes and no template files involved
+
+    For Cognito triggers when the branded render fails: the message must
+    still carry the code placeholder, and must not fall back to unescaped text.
+    """
+    code = html.escape(clean_value(code, None))
+    if pick_locale(locale) == 'tr':
+        return Rendered('WiseUni doğrulama kodun', f'<p>WiseUni doğrulama kodun: <b>{code}</b></p>', None)
+    return Rendered('Your WiseUni verification code', f'<p>Your WiseUni verification code is: <b>{code}</b></p>', None)
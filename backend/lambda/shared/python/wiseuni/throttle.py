@@ -0,0 +1,245 @@
+"""
+DynamoDB throughput controller
+
+A PAY_PER_REQUEST table still throttles when traffic jumps past what its
+partitions have scaled to (a registration surge, a backfill). Default SDK
+retries then make every client retry on the same schedule, and the
+retries themselves keep the table throttled.
+
+A ThroughputController attaches to a boto3 DynamoDB client through
+botocore events, so existing code (Table, batch_writer, paginators) is
+controlled without changes:
+- token bucket: every attempt, retries included, waits for tokens
+  (one per item for batch operations)
+- AIMD: rate halves on a throttle (at most once per second), grows by
+  `increase` per second of unthrottled traffic, within [min_rate, max_rate];
+  until the first throttle it doubles every second instead (slow start)
+- throttles (and UnprocessedItems/Keys, DynamoDB's way of throttling batch
+  calls) are retried here with full-jitter backoff:
+      sleep = random(0, min(max_delay, base_delay * 2 ** attempt))
+- stats(): calls, attempts, throttles, retries, time spent waiting,
+  current and achieved rate
+
+Profiles:
+    interactive  no rate limit, quick jittered retries; attached to every
+                 registry DynamoDB client (wiseuni/aws.py)
+    bulk         starts slow, probes upwards, backs off hard - a bulk job
+                 takes what the table can spare, not what users need
+
+Other services attach the same way with their own throttle test, e.g.
+the SES send rate (wiseuni/mailer.py).
+
+    controller = ThroughputController('backfill', **BULK)
+    table = controller.table(os.environ['TABLE_NAME'])
+"""
+
+import random
+import threading
+import time
+from collections import deque
+
+THROTTLE_CODES = frozenset((
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'Throttling',  # Query-protocol services (SES)
+))
+
+INTERACTIVE = {'rate': None, 'max_attempts': 4, 'base_delay': 0.025, 'max_delay': 1.0}
+BULK = {'rate': 50, 'min_rate': 5, 'max_rate': 2000, 'increase': 25, 'max_attempts': 10,
+        'base_delay': 0.05, 'max_delay': 5.0}
+
+_BATCH_OPERATIONS = {
+    'BatchWriteItem': lambda params: sum(len(requests) for requests in params.get('RequestItems', {}).values()),
+    'BatchGetItem': lambda params: sum(len(table.get('Keys', [])) for table in params.get('RequestItems', {}).values()),
+    'TransactWriteItems': lambda params: len(params.get('TransactItems', [])),
+    'TransactGetItems': lambda params: len(params.get('TransactItems', [])),
+}
+
+_controllers = []
+
+
+def full_jitter(attempt, base_delay, max_delay):
+    """AWS 'full jitter': uniformly random up to the capped exponential delay"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def _is_throttle(parsed):
+    return (parsed or {}).get('Error', {}).get('Code') in THROTTLE_CODES
+
+
+class ThroughputController:
+    """
+    Client-side rate limit + AIMD + jittered retries for boto3 clients
+
+    is_throttle(parsed response) -> bool decides what counts as a throttle
+    (default: an error code in THROTTLE_CODES)
+    """
+
+    def __init__(self, name, rate=None, min_rate=1, max_rate=None, increase=10,
+                 max_attempts=8, base_delay=0.05, max_delay=5.0, burst_seconds=1.0, is_throttle=None):
+        self.name = name
+        self.is_throttle = is_throttle or _is_throttle
+        self.rate = float(rate) if rate else None  # None = not rate limited
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.burst_seconds = burst_seconds
+
+        self._lock = threading.Lock()
+        self._tokens = self._capacity()
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self._last_increase = time.monotonic()
+        self._slow_start = True
+        self._consumed = deque()  # (monotonic second, tokens) for the achieved rate
+        self._counters = dict.fromkeys(('calls', 'attempts', 'throttles', 'retries', 'gaveUp'), 0)
+        self._waited = 0.0
+        _controllers.append(self)
+
+    # ----- token bucket -----
+
+    def _capacity(self):
+        return max(1.0, self.rate * self.burst_seconds) if self.rate else 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self._capacity(), self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self, cost=1):
+        """Block until `cost` tokens are available (batches may borrow past the burst size)"""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate is None:
+                    break
+                self._refill(now)
+                # A batch larger than the bucket may start once the bucket is full
+                if self._tokens >= min(cost, self._capacity()):
+                    self._tokens -= cost
+                    break
+                wait = (min(cost, self._capacity()) - self._tokens) / self.rate
+            time.sleep(wait)
+        with self._lock:
+            self._waited += time.monotonic() - start
+            second = int(now)
+            if self._consumed and self._consumed[-1][0] == second:
+                self._consumed[-1][1] += cost
+            else:
+                self._consumed.append([second, cost])
+            while self._consumed and self._consumed[0][0] < second - 10:
+                self._consumed.popleft()
+
+    # ----- AIMD -----
+
+    def on_throttle(self):
+        with self._lock:
+            self._counters['throttles'] += 1
+            now = time.monotonic()
+            # One decrease per second: the attempts already in flight
+            # were sent at the old rate and will throttle too
+            if self.rate is not None and now - self._last_decrease >= 1.0:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._tokens = min(self._tokens, self._capacity())
+                self._slow_start = False
+                self._last_decrease = self._last_increase = now
+
+    def on_success(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.rate is None or now - self._last_increase < 1.0:
+                return
+            elapsed, self._last_increase = now - self._last_increase, now
+            if now - self._last_decrease >= 1.0:
+                if self._slow_start:
+                    self.rate = self.rate * 2 ** min(elapsed, 2)
+                else:
+                    self.rate = self.rate + self.increase * elapsed
+                if self.max_rate:
+                    self.rate = min(self.rate, self.max_rate)
+
+    def set_ceiling(self, max_rate):
+        """
+        New max_rate, e.g. a quota read at run time: the rate is capped to
+        it, or starts there with a full bucket if it was unlimited
+        """
+        with self._lock:
+            self.max_rate = max_rate
+            if not max_rate:
+                return
+            if self.rate is None:
+                self.rate = float(max_rate)
+                self._tokens = self._capacity()
+                self._refilled = time.monotonic()
+            elif self.rate > max_rate:
+                self.rate = float(max_rate)
+                self._tokens = min(self._tokens, self._capacity())
+
+    # ----- botocore events -----
+
+    def attach(self, client):
+        """Control every call made through this client (or resource.meta.client)"""
+        events = client.meta.events
+        service = client.meta.service_model.service_id.hyphenize()
+        events.register(f'before-parameter-build.{service}', self._before_call)
+        events.register(f'request-created.{service}', self._before_attempt)
+        events.register_first(f'needs-retry.{service}', self._needs_retry)
+        events.register(f'after-call.{service}', self._after_call)
+        return client
+
+    def table(self, name):
+        """A Table on a client of its own, controlled by this controller"""
+        from wiseuni import aws  # aws imports this module
+        return aws.resource('dynamodb', throughput=self).Table(name)
+
+    def _before_call(self, params, model, context, **kwargs):
+        cost = _BATCH_OPERATIONS.get(model.name)
+        context['throughput_cost'] = max(1, cost(params)) if cost else 1
+        with self._lock:
+            self._counters['calls'] += 1
+
+    def _before_attempt(self, request, **kwargs):
+        with self._lock:
+            self._counters['attempts'] += 1
+        self.acquire(request.context.get('throughput_cost', 1))
+
+    def _needs_retry(self, response, attempts, caught_exception=None, **kwargs):
+        if caught_exception is not None or response is None or not self.is_throttle(response[1]):
+            return None  # Not a throttle: botocore's own retry rules decide
+        self.on_throttle()
+        if attempts >= self.max_attempts:
+            with self._lock:
+                self._counters['gaveUp'] += 1
+            return False
+        with self._lock:
+            self._counters['retries'] += 1
+        return full_jitter(attempts, self.base_delay, self.max_delay)
+
+    def _after_call(self, parsed, **kwargs):
+        if parsed.get('UnprocessedItems') or parsed.get('UnprocessedKeys'):
+            self.on_throttle()  # The caller (e.g. batch_writer) resends them
+        elif not self.is_throttle(parsed):
+            self.on_success()
+
+    # ----- metrics -----
+
+    def stats(self):
+        with self._lock:
+            now = int(time.monotonic())
+            recent = sum(tokens for second, tokens in self._consumed if second < now)
+            window = min(10, max(1, now - self._consumed[0][0])) if self._consumed else 1
+            return {
+                **self._counters,
+                'waitSeconds': round(self._waited, 2),
+                'rate': round(self.rate, 1) if self.rate else None,
+                'achievedRate': round(recent / window, 1),
+            }
+
+
+def stats():
+    """{controller name: stats} for every controller in this container"""
+    return {controller.name: controller.stats() for controller in _controllers}
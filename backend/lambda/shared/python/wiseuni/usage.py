@@ -0,0 +1,51 @@
+"""
+Storage usage and quotas
+
+The storage accounting job writes one usage item per user and per course:
+    PK = USAGE#<identityId>    SK = USAGE
+    PK = COURSE#<courseId>     SK = USAGE
+User items sit outside USER#<identityId>, the partition the browser roles
+may write, so a student cannot raise or delete their own quota.
+Over-quota users also get GSI1 keys (sparse), so they can be listed - and
+un-flagged on the next run - with one Query:
+    GSI1PK = QUOTA#OVER        GSI1SK = USAGE#<identityId>
+
+The upload service reads the user's item before starting an upload.
+"""
+
+import os
+
+from wiseuni.api import ApiError
+
+OVER_QUOTA_PARTITION = 'QUOTA#OVER'
+USER_QUOTA_BYTES = int(os.environ.get('USER_QUOTA_BYTES', 2 * 1024 ** 3))  # 2 GiB
+
+
+def user_usage_key(identity_id):
+    return {'PK': f'USAGE#{identity_id}', 'SK': 'USAGE'}
+
+
+def legacy_user_usage_key(identity_id):
+    """Where user items were written before they moved out of the user's partition"""
+    return {'PK': f'USER#{identity_id}', 'SK': 'USAGE'}
+
+
+def course_usage_key(course_id):
+    return {'PK': f'COURSE#{course_id}', 'SK': 'USAGE'}
+
+
+def check_quota(table, identity_id, incoming_bytes):
+    """
+    Raise ApiError(403) if incoming_bytes would take the user over quota
+
+    Usage is a snapshot from the last accounting run. A user without a
+    usage item has nothing accounted yet: 0 bytes used of USER_QUOTA_BYTES.
+    """
+    usage = table.get_item(
+        Key=user_usage_key(identity_id),
+        ProjectionExpression='usedBytes, quotaBytes',
+    ).get('Item') or {}
+    used = int(usage.get('usedBytes', 0))
+    quota = int(usage.get('quotaBytes', USER_QUOTA_BYTES))
+    if used + incoming_bytes > quota:
+        raise ApiError(403, f'Storage quota exceeded: {used} of {quota} bytes used')
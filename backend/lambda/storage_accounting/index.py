@@ -0,0 +1,436 @@
+"""
+Storage Accounting
+Daily job: per-user / per-course storage totals, quotas and tiering
+
+Input (one of):
+- The latest S3 Inventory of the homework bucket (CSV or Parquet), or an
+  explicit {"manifest": "s3://bucket/.../manifest.json"} in the event
+- {"source": "index"}: the submission index (before inventory exists)
+
+One streaming pass over the rows:
+- Adds every object to its owner's and its course's totals
+  (memory grows with the number of users/courses, never with objects)
+- Writes USAGE#<id>/USAGE items with quotaBytes and overQuota; the upload
+  service refuses uploads past the quota
+- Reports current STANDARD bytes of courses from closed semesters and,
+  when tiering is applied, tags them storage-tier=archive so the bucket
+  lifecycle rule moves them to Glacier Instant Retrieval
+"""
+
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus, urlparse
+
+from wiseuni import aws, indexes
+from wiseuni.profiling import profiled
+from wiseuni.submissions import parse_object_key
+from wiseuni.throttle import BULK, ThroughputController
+from wiseuni.usage import (
+    OVER_QUOTA_PARTITION,
+    USER_QUOTA_BYTES,
+    course_usage_key,
+    legacy_user_usage_key,
+    user_usage_key,
+)
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:  # Only needed for Parquet inventories
+    parquet = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BUCKET_NAME = os.environ['BUCKET_NAME']
+INVENTORY_BUCKET = os.environ.get('INVENTORY_BUCKET', '')
+INVENTORY_ID = os.environ.get('INVENTORY_ID', 'DailyInventory')
+CLOSED_SEMESTERS = [s.strip() for s in os.environ.get('CLOSED_SEMESTERS', '').split(',') if s.strip()]
+APPLY_TIERING = os.environ.get('APPLY_TIERING', 'false').lower() == 'true'
+MAX_TAGS_PER_RUN = int(os.environ.get('MAX_TAGS_PER_RUN', 200_000))
+FILE_CONCURRENCY = 4  # Inventory data files read at once
+TAG_CONCURRENCY = 16
+
+TIER_TAG = {'Key': 'storage-tier', 'Value': 'archive'}
+
+# us-east-1 list prices per GB-month, only used for the savings estimate
+PRICE_PER_GB_MONTH = {'STANDARD': 0.023, 'GLACIER_IR': 0.004}
+
+s3 = aws.client('s3', max_pool_connections=FILE_CONCURRENCY + TAG_CONCURRENCY + 4)
+table = aws.table(os.environ['TABLE_NAME'])
+# Usage writes and index scans touch every user: run them as bulk traffic
+throughput = ThroughputController('storage-accounting', **BULK)
+bulk_table = throughput.table(os.environ['TABLE_NAME'])
+
+
+# ========================================
+# ROW SOURCES
+# ========================================
+# Every source yields (key, size, is_latest, storage_class) for objects
+# (delete markers skipped), one row at a time.
+
+def latest_manifest():
+    """Newest complete inventory: <src bucket>/<config id>/<date>/manifest.json"""
+    prefix = f'{BUCKET_NAME}/{INVENTORY_ID}/'
+    dates = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=INVENTORY_BUCKET, Prefix=prefix, Delimiter='/'):
+        dates.extend(p['Prefix'] for p in page.get('CommonPrefixes', []) if p['Prefix'][len(prefix)].isdigit())
+    for date_prefix in sorted(dates, reverse=True):
+        # manifest.checksum is written last: its presence means the inventory is complete
+        if s3.list_objects_v2(Bucket=INVENTORY_BUCKET, Prefix=f'{date_prefix}manifest.checksum').get('KeyCount'):
+            return INVENTORY_BUCKET, f'{date_prefix}manifest.json'
+    raise RuntimeError(f'No complete inventory under s3://{INVENTORY_BUCKET}/{prefix}')
+
+
+def _csv_rows(bucket, key, columns):
+    """Gzipped CSV data file, decompressed and parsed as it downloads"""
+    position = {name: i for i, name in enumerate(columns)}
+    key_at, size_at = position['Key'], position['Size']
+    latest_at, marker_at = position.get('IsLatest'), position.get('IsDeleteMarker')
+    class_at = position.get('StorageClass')
+
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    with io.TextIOWrapper(gzip.GzipFile(fileobj=body), encoding='utf-8', newline='') as text:
+        for row in csv.reader(text):
+            if marker_at is not None and row[marker_at] == 'true':
+                continue
+            object_key = row[key_at]
+            if '%' in object_key or '+' in object_key:
+                object_key = unquote_plus(object_key)  # Inventory CSV keys are URL-encoded
+            yield (
+                object_key,
+                int(row[size_at] or 0),
+                latest_at is None or row[latest_at] == 'true',
+                row[class_at] if class_at is not None else None,
+            )
+
+
+class S3RangeFile(io.RawIOBase):
+    """Seekable read-only view of an S3 object using ranged GETs (for Parquet)"""
+
+    def __init__(self, bucket, key, size):
+        self.bucket, self.key, self.size = bucket, key, size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        data = s3.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f'bytes={self.position}-{end - 1}',
+        )['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def _parquet_rows(bucket, key, size):
+    """Parquet data file, one row group at a time"""
+    if parquet is None:
+        raise RuntimeError('Parquet inventory needs pyarrow in the deployment package')
+    source = parquet.ParquetFile(io.BufferedReader(S3RangeFile(bucket, key, size), buffer_size=8 * 1024 * 1024))
+    names = set(source.schema_arrow.names)
+    wanted = [c for c in ('key', 'size', 'is_latest', 'is_delete_marker', 'storage_class') if c in names]
+    for batch in source.iter_batches(batch_size=65536, columns=wanted):
+        data = batch.to_pydict()
+        count = batch.num_rows
+        markers = data.get('is_delete_marker') or [False] * count
+        latest = data.get('is_latest') or [True] * count
+        classes = data.get('storage_class') or [None] * count
+        for i in range(count):
+            if not markers[i]:
+                yield data['key'][i], int(data['size'][i] or 0), bool(latest[i]), classes[i]
+
+
+def manifest_files(bucket, key):
+    """[(callable yielding rows)] for each data file listed in the manifest"""
+    manifest = json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    data_bucket = manifest['destinationBucket'].split(':::')[-1]
+    file_format = manifest['fileFormat'].upper()
+    if file_format == 'CSV':
+        columns = [c.strip() for c in manifest['fileSchema'].split(',')]
+        return [lambda f=f: _csv_rows(data_bucket, f['key'], columns) for f in manifest['files']]
+    if file_format == 'PARQUET':
+        return [lambda f=f: _parquet_rows(data_bucket, f['key'], int(f['size'])) for f in manifest['files']]
+    raise RuntimeError(f'Unsupported inventory format: {file_format}')
+
+
+def index_segments(segments=8):
+    """Parallel Scan segments over COMPLETE submission items"""
+    def rows(segment):
+        scan = {
+            'Segment': segment,
+            'TotalSegments': segments,
+            'FilterExpression': 'begins_with(SK, :sk) AND #status = :complete',
+            'ProjectionExpression': '#key, #size',
+            'ExpressionAttributeNames': {'#key': 'key', '#size': 'size', '#status': 'status'},
+            'ExpressionAttributeValues': {':sk': 'SUBMISSION#', ':complete': 'COMPLETE'},
+        }
+        # Each segment runs in its own thread: boto3 resources are not thread-safe
+        segment_table = aws.thread_table(table.name, throughput=throughput)
+        while True:
+            page = segment_table.scan(**scan)
+            for item in page.get('Items', []):
+                yield item['key'], int(item.get('size') or 0), True, None
+            if 'LastEvaluatedKey' not in page:
+                return
+            scan['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+    return [lambda s=s: rows(s) for s in range(segments)]
+
+
+# ========================================
+# AGGREGATION
+# ========================================
+
+class UsageTotals:
+    """Byte and object totals per user and per course"""
+
+    def __init__(self):
+        self.users = {}    # identityId -> [currentBytes, objects, noncurrentBytes]
+        self.courses = {}  # courseId -> [currentBytes, objects, standardBytes]
+        self.rows = 0
+        self.skipped = 0
+
+    def add(self, key, size, is_latest, storage_class):
+        self.rows += 1
+        parsed = parse_object_key(key)
+        if parsed is None:
+            self.skipped += 1  # archives/, inventory, public files...
+            return None
+        identity_id, course_id = parsed[0], parsed[1]
+
+        user = self.users.get(identity_id)
+        if user is None:
+            user = self.users[identity_id] = [0, 0, 0]
+        if not is_latest:
+            user[2] += size  # Old versions count against the bucket, not the quota
+            return None
+        user[0] += size
+        user[1] += 1
+
+        course = self.courses.get(course_id)
+        if course is None:
+            course = self.courses[course_id] = [0, 0, 0]
+        course[0] += size
+        course[1] += 1
+        if storage_class in (None, 'STANDARD'):
+            course[2] += size
+        return course_id
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.skipped += other.skipped
+        for target, source in ((self.users, other.users), (self.courses, other.courses)):
+            for name, values in source.items():
+                mine = target.get(name)
+                if mine is None:
+                    target[name] = values
+                else:
+                    for i, value in enumerate(values):
+                        mine[i] += value
+
+
+class Tagger:
+    """Tags objects for the Glacier IR lifecycle rule, with bounded queueing"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(TAG_CONCURRENCY * 4)
+        self.pool = ThreadPoolExecutor(max_workers=TAG_CONCURRENCY)
+
+    def submit(self, key):
+        with self.lock:
+            if self.count >= self.limit:
+                return
+            self.count += 1
+        self.slots.acquire()  # Back-pressure: the reader waits instead of queueing millions of keys
+        self.pool.submit(self._tag, key)
+
+    def _tag(self, key):
+        try:
+            s3.put_object_tagging(Bucket=BUCKET_NAME, Key=key, Tagging={'TagSet': [TIER_TAG]})
+        except Exception as e:
+            logger.warning(f'Could not tag {key}: {str(e)}')
+            with self.lock:
+                self.failed += 1
+        finally:
+            self.slots.release()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+def closed_courses():
+    """Course ids of CLOSED_SEMESTERS (semester_courses pattern, wiseuni/indexes.py)"""
+    courses = set()
+    for semester in CLOSED_SEMESTERS:
+        for item in indexes.query(table, 'semester_courses', [], semester=semester):
+            courses.add(item['PK'][len('COURSE#'):])
+    return courses
+
+
+def account(sources, closed, tagger=None):
+    """Run every source through its own UsageTotals in parallel, then merge"""
+    def consume(rows):
+        totals = UsageTotals()
+        for key, size, is_latest, storage_class in rows():
+            course_id = totals.add(key, size, is_latest, storage_class)
+            if tagger and course_id in closed and storage_class in (None, 'STANDARD'):
+                tagger.submit(key)
+        return totals
+
+    result = UsageTotals()
+    with ThreadPoolExecutor(max_workers=FILE_CONCURRENCY) as pool:
+        for totals in pool.map(consume, sources):
+            result.merge(totals)
+    return result
+
+
+# ========================================
+# RESULTS
+# ========================================
+
+def write_usage(totals, closed, measured_at):
+    """Usage items for every user and course; clears stale over-quota flags"""
+    over = set()
+    with bulk_table.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+        for identity_id, (used, objects, noncurrent) in totals.users.items():
+            item = {
+                **user_usage_key(identity_id),
+                'identityId': identity_id,
+                'usedBytes': used,
+                'objectCount': objects,
+                'noncurrentBytes': noncurrent,
+                'quotaBytes': USER_QUOTA_BYTES,
+                'overQuota': used > USER_QUOTA_BYTES,
+                'measuredAt': measured_at,
+            }
+            if item['overQuota']:
+                over.add(identity_id)
+                item['GSI1PK'] = OVER_QUOTA_PARTITION
+                item['GSI1SK'] = item['PK']
+            batch.put_item(Item=item)
+
+        for course_id, (used, objects, standard) in totals.courses.items():
+            batch.put_item(Item={
+                **course_usage_key(course_id),
+                'courseId': course_id,
+                'usedBytes': used,
+                'objectCount': objects,
+                'standardBytes': standard,
+                'closed': course_id in closed,
+                'measuredAt': measured_at,
+            })
+
+    # Users flagged by an earlier run who have no objects at all any more
+    query = {
+        'IndexName': 'GSI1',
+        'KeyConditionExpression': 'GSI1PK = :pk',
+        'ProjectionExpression': 'PK, identityId',
+        'ExpressionAttributeValues': {':pk': OVER_QUOTA_PARTITION},
+    }
+    while True:
+        page = table.query(**query)
+        for item in page.get('Items', []):
+            if item['PK'] == legacy_user_usage_key(item['identityId'])['PK']:
+                # Flagged before usage moved out of USER#<id>: nothing reads it any more
+                table.delete_item(Key=legacy_user_usage_key(item['identityId']))
+            elif item['identityId'] not in totals.users:
+                table.update_item(
+                    Key=user_usage_key(item['identityId']),
+                    UpdateExpression='SET usedBytes = :zero, objectCount = :zero, overQuota = :no, '
+                                     'measuredAt = :now REMOVE GSI1PK, GSI1SK',
+                    ExpressionAttributeValues={':zero': 0, ':no': False, ':now': measured_at},
+                )
+        if 'LastEvaluatedKey' not in page:
+            break
+        query['ExclusiveStartKey'] = page['LastEvaluatedKey']
+    return over
+
+
+def tiering_report(totals, closed):
+    """Closed-semester courses still in STANDARD, largest first"""
+    saving = PRICE_PER_GB_MONTH['STANDARD'] - PRICE_PER_GB_MONTH['GLACIER_IR']
+    candidates = [
+        {
+            'courseId': course_id,
+            'standardBytes': standard,
+            'estimatedMonthlySavingUsd': round(standard / 1024 ** 3 * saving, 2),
+        }
+        for course_id, (_, _, standard) in totals.courses.items()
+        if course_id in closed and standard
+    ]
+    return sorted(candidates, key=lambda c: c['standardBytes'], reverse=True)
+
+
+@profiled
+def handler(event, context):
+    """
+    Scheduled run (no event fields), or manual:
+        {"manifest": "s3://...", "applyTiering": true}
+        {"source": "index"}
+    """
+    event = event or {}
+    started = datetime.now(timezone.utc)
+
+    if event.get('source') == 'index':
+        sources, origin = index_segments(), 'submission index'
+    else:
+        if event.get('manifest'):
+            url = urlparse(event['manifest'])
+            bucket, key = url.netloc, url.path.lstrip('/')
+        else:
+            bucket, key = latest_manifest()
+        sources, origin = manifest_files(bucket, key), f's3://{bucket}/{key}'
+
+    closed = closed_courses()
+    apply_tiering = bool(event.get('applyTiering', APPLY_TIERING)) and event.get('source') != 'index'
+    tagger = Tagger(MAX_TAGS_PER_RUN) if apply_tiering and closed else None
+    try:
+        totals = account(sources, closed, tagger)
+    finally:
+        if tagger:
+            tagger.close()
+
+    over = write_usage(totals, closed, started.isoformat())
+    report = tiering_report(totals, closed)
+
+    summary = {
+        'source': origin,
+        'rows': totals.rows,
+        'skipped': totals.skipped,
+        'users': len(totals.users),
+        'courses': len(totals.courses),
+        'overQuota': len(over),
+        'tieringCandidates': report[:20],
+        'tagged': tagger.count - tagger.failed if tagger else 0,
+        'seconds': round((datetime.now(timezone.utc) - started).total_seconds(), 1),
+        'dynamodb': throughput.stats(),
+    }
+    logger.info(f'Storage accounting: {json.dumps(summary)}')
+    return summary
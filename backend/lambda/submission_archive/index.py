@@ -0,0 +1,392 @@
+"""
+Bulk Submission Download
+Builds one ZIP of every submission for a course (optionally one assignment)
+
+POST /courses/{courseId}/archives               body: {"assignmentId": "hw1"}
+    -> 202 {"archiveId": ...}; the build runs asynchronously
+GET  /courses/{courseId}/archives/{archiveId}
+    -> {"status": "READY", "downloadUrl": <presigned>} once finished
+
+A build that is still RUNNING past JOB_DEADLINE_SECONDS after its
+startedAt was cut off by the Lambda timeout: Lambda's async retry takes
+it over and builds again, and a GET reports it FAILED.
+
+The archive is never held in memory or written to /tmp:
+- Objects are fetched concurrently (ARCHIVE_CONCURRENCY at a time) into
+  small bounded chunk queues
+- zipfile writes entries one after another into a stream that uploads
+  every PART_SIZE bytes as a part of an S3 multipart upload
+Memory stays around concurrency x queue depth x chunk size + one part.
+"""
+
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from wiseuni import aws
+from wiseuni.api import ApiError, handle, parse_body, response, validate_id
+from wiseuni.profiling import profiled
+from wiseuni.submissions import authorize_course_reader, iter_course_submissions
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BUCKET_NAME = os.environ['BUCKET_NAME']
+ARCHIVE_PREFIX = 'archives'
+CONCURRENCY = int(os.environ.get('ARCHIVE_CONCURRENCY', 8))
+PART_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+QUEUE_DEPTH = 4  # Chunks buffered per object being prefetched
+URL_EXPIRY_SECONDS = 3600
+# The function's Timeout (900 s) plus a margin: a RUNNING job older than
+# this is not running anymore
+JOB_DEADLINE_SECONDS = int(os.environ.get('ARCHIVE_DEADLINE_SECONDS', 960))
+
+# Formats that are already compressed: deflating them again only burns CPU
+STORED_EXTENSIONS = {
+    '.zip', '.gz', '.7z', '.rar', '.jpg', '.jpeg', '.png', '.gif', '.mp4', '.mov',
+    '.mkv', '.webm', '.mp3', '.pdf', '.docx', '.xlsx', '.pptx',
+}
+
+s3 = aws.client('s3', signature_version='s3v4', max_pool_connections=CONCURRENCY + 4)
+lambda_client = aws.client('lambda')
+table = aws.table(os.environ['TABLE_NAME'])
+aws.warm(s3, lambda_client, table)
+
+
+# ========================================
+# STREAMING PIECES
+# ========================================
+
+class MultipartUploadWriter:
+    """
+    Write-only, non-seekable file object backed by an S3 multipart upload
+
+    zipfile detects that it cannot seek and writes data descriptors
+    after each entry instead of patching local headers.
+    """
+
+    def __init__(self, bucket, key, content_type='application/zip'):
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)['UploadId']
+        self.parts = []
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= PART_SIZE:
+            self._upload_part(bytes(self.buffer[:PART_SIZE]))
+            del self.buffer[:PART_SIZE]
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def _upload_part(self, body):
+        number = len(self.parts) + 1
+        result = s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body,
+        )
+        self.parts.append({'PartNumber': number, 'ETag': result['ETag']})
+
+    def complete(self):
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer.clear()
+        s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts},
+        )
+        return self.position
+
+    def abort(self):
+        s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+class ObjectReadError(Exception):
+    """A submission could not be read; the archive is built without it"""
+
+
+class PrefetchedObject:
+    """S3 object read by a worker thread into a bounded chunk queue"""
+
+    _DONE = object()
+
+    def __init__(self, bucket, key, stop):
+        self.bucket = bucket
+        self.key = key
+        self.stop = stop  # Set when the writer gives up, so blocked workers exit
+        self.chunks_queue = queue.Queue(maxsize=QUEUE_DEPTH)
+
+    def _put(self, item):
+        # Blocks while the writer is behind, but never past a stop
+        while not self.stop.is_set():
+            try:
+                self.chunks_queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fill(self):
+        if self.stop.is_set():
+            return
+        try:
+            body = s3.get_object(Bucket=self.bucket, Key=self.key)['Body']
+            for chunk in body.iter_chunks(chunk_size=CHUNK_SIZE):
+                if not self._put(chunk):
+                    body.close()
+                    return
+            self._put(self._DONE)
+        except Exception as e:
+            self._put(e)
+
+    def chunks(self):
+        while True:
+            item = self.chunks_queue.get()
+            if item is self._DONE:
+                return
+            if isinstance(item, Exception):
+                raise ObjectReadError(str(item)) from item
+            yield item
+
+
+def _safe_path_part(value):
+    return re.sub(r'[^\w .@()-]', '_', str(value)).strip() or 'unnamed'
+
+
+def student_names(identity_ids):
+    """Profile names for archive folder names, 100 ids per BatchGetItem"""
+    names = {}
+    ids = list(identity_ids)
+    for start in range(0, len(ids), 100):
+        request = {
+            table.name: {
+                'Keys': [{'PK': f'USER#{i}', 'SK': 'PROFILE'} for i in ids[start:start + 100]],
+                'ProjectionExpression': 'identityId, #name',
+                'ExpressionAttributeNames': {'#name': 'name'},
+            }
+        }
+        while request:
+            result = table.meta.client.batch_get_item(RequestItems=request)
+            for item in result['Responses'].get(table.name, []):
+                names[item['identityId']] = item.get('name')
+            request = result.get('UnprocessedKeys') or None
+    return names
+
+
+def build_archive(course_id, assignment_id, archive_key):
+    """Stream every matching submission into archive_key; returns stats"""
+    submissions = {}
+    for item in iter_course_submissions(table, course_id, assignment_id):
+        submissions[item['key']] = item  # One entry per object key
+    names = student_names({item['identityId'] for item in submissions.values()})
+
+    writer = MultipartUploadWriter(BUCKET_NAME, archive_key)
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=CONCURRENCY)
+    failed = []
+    try:
+        objects = [PrefetchedObject(BUCKET_NAME, key, stop) for key in submissions]
+        # Submitted in archive order, so the entry being written is always
+        # among the objects currently being fetched
+        for obj in objects:
+            pool.submit(obj.fill)
+
+        with zipfile.ZipFile(writer, 'w', allowZip64=True) as archive:
+            for obj in objects:
+                item = submissions[obj.key]
+                student = names.get(item['identityId']) or 'student'
+                folder = f"{_safe_path_part(student)} ({_safe_path_part(item['identityId'])})"
+                entry_name = f"{folder}/{_safe_path_part(item['assignmentId'])}/{_safe_path_part(item['fileName'])}"
+                extension = os.path.splitext(entry_name)[1].lower()
+                info = zipfile.ZipInfo(entry_name, date_time=datetime.now(timezone.utc).timetuple()[:6])
+                info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+                try:
+                    with archive.open(info, 'w', force_zip64=True) as entry:
+                        for chunk in obj.chunks():
+                            entry.write(chunk)
+                except ObjectReadError as e:
+                    # Entry stays in the zip truncated; listed in the manifest below
+                    logger.warning(f'Could not add {obj.key}: {str(e)}')
+                    failed.append(obj.key)
+
+            if failed:
+                archive.writestr('MISSING_FILES.txt', 'Could not be read:\n' + '\n'.join(failed) + '\n')
+
+        size = writer.complete()
+    except BaseException:
+        # Release workers blocked on full queues before giving up the upload
+        stop.set()
+        writer.abort()
+        raise
+    finally:
+        pool.shutdown(wait=True)
+
+    return {'fileCount': len(submissions) - len(failed), 'failedCount': len(failed), 'archiveSize': size}
+
+
+# ========================================
+# API ROUTES
+# ========================================
+
+def _archive_key(course_id, archive_id):
+    return {'PK': f'COURSE#{course_id}', 'SK': f'ARCHIVE#{archive_id}'}
+
+
+def _stale_before():
+    """startedAt of a RUNNING job older than this: the build was cut off"""
+    return (datetime.now(timezone.utc) - timedelta(seconds=JOB_DEADLINE_SECONDS)).isoformat()
+
+
+def request_archive(event, caller):
+    course_id = validate_id(event['pathParameters']['courseId'], 'courseId')
+    authorize_course_reader(table, caller, course_id)
+    # Part of the S3 key and of the download's file name
+    assignment_id = parse_body(event).get('assignmentId')
+    if assignment_id:
+        assignment_id = validate_id(assignment_id, 'assignmentId')
+
+    archive_id = uuid.uuid4().hex
+    name = f"{course_id}-{assignment_id or 'all'}-{archive_id[:8]}.zip"
+    key = f"{ARCHIVE_PREFIX}/{course_id}/{name}"
+    table.put_item(Item={
+        **_archive_key(course_id, archive_id),
+        'archiveId': archive_id,
+        'courseId': course_id,
+        'assignmentId': assignment_id or '',
+        'key': key,
+        'status': 'PENDING',
+        'requestedBy': caller.identity_id,
+        'createdAt': datetime.now(timezone.utc).isoformat(),
+    })
+
+    # Building can take minutes, longer than API Gateway waits: run it async
+    lambda_client.invoke(
+        FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+        InvocationType='Event',
+        Payload=json.dumps({'archiveJob': {'courseId': course_id, 'archiveId': archive_id}}).encode('utf-8'),
+    )
+    return response(202, {'archiveId': archive_id, 'status': 'PENDING'})
+
+
+def get_archive(event, caller):
+    course_id = event['pathParameters']['courseId']
+    authorize_course_reader(table, caller, course_id)
+    key = _archive_key(course_id, event['pathParameters']['archiveId'])
+    item = table.get_item(Key=key).get('Item')
+    if not item:
+        raise ApiError(404, 'Archive not found')
+    if item['status'] == 'RUNNING' and item.get('startedAt', item.get('updatedAt', '')) < _stale_before():
+        item = _fail_stale(key, item)
+
+    body = {k: item.get(k) for k in ('archiveId', 'status', 'fileCount', 'failedCount', 'archiveSize', 'error')}
+    if item['status'] == 'READY':
+        body['downloadUrl'] = s3.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': BUCKET_NAME,
+                'Key': item['key'],
+                'ResponseContentDisposition': f"attachment; filename=\"{item['key'].rsplit('/', 1)[-1]}\"",
+            },
+            ExpiresIn=URL_EXPIRY_SECONDS,
+        )
+        body['expiresIn'] = URL_EXPIRY_SECONDS
+    return response(200, body)
+
+
+ROUTES = {
+    'POST /courses/{courseId}/archives': request_archive,
+    'GET /courses/{courseId}/archives/{archiveId}': get_archive,
+}
+
+
+def _set_status(key, status, condition=None, values=None, **attributes):
+    attributes['status'] = status
+    attributes['updatedAt'] = datetime.now(timezone.utc).isoformat()
+    names = {f'#a{i}': name for i, name in enumerate(attributes)}
+    extra = {}
+    if condition:
+        names['#status'] = 'status'
+        extra['ConditionExpression'] = condition
+    table.update_item(
+        Key=key,
+        UpdateExpression='SET ' + ', '.join(f'#a{i} = :v{i}' for i in range(len(attributes))),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues={**{f':v{i}': value for i, value in enumerate(attributes.values())}, **(values or {})},
+        **extra,
+    )
+
+
+def _fail_stale(key, item):
+    """Mark a build cut off by the timeout FAILED (unless something else changed it first)"""
+    error = f'Build did not finish within {JOB_DEADLINE_SECONDS} seconds'
+    try:
+        # updatedAt is only set by status changes, so it pins this RUNNING state
+        _set_status(key, 'FAILED', condition='#status = :running AND updatedAt = :updated',
+                    values={':running': 'RUNNING', ':updated': item['updatedAt']}, error=error)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return table.get_item(Key=key).get('Item')
+    logger.warning(f"Archive {item['archiveId']} timed out (started {item.get('startedAt')})")
+    return {**item, 'status': 'FAILED', 'error': error}
+
+
+def _claim(key):
+    """
+    PENDING -> RUNNING, or take over a RUNNING job past its deadline
+    (Lambda retries an async invocation that timed out); False otherwise
+    """
+    try:
+        _set_status(key, 'RUNNING', condition='#status = :pending OR (#status = :running AND startedAt < :stale)',
+                    values={':pending': 'PENDING', ':running': 'RUNNING', ':stale': _stale_before()},
+                    startedAt=datetime.now(timezone.utc).isoformat())
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+    return True
+
+
+def run_archive_job(job):
+    key = _archive_key(job['courseId'], job['archiveId'])
+    item = table.get_item(Key=key).get('Item')
+    if not item or not _claim(key):
+        # Async invocations can be retried; only one attempt builds at a time
+        logger.info(f"Archive {job['archiveId']} already {item and item['status']}")
+        return
+
+    try:
+        stats = build_archive(item['courseId'], item['assignmentId'] or None, item['key'])
+    except Exception as e:
+        logger.error(f"Archive {job['archiveId']} failed: {str(e)}", exc_info=True)
+        _set_status(key, 'FAILED', error=str(e)[:500])
+        return
+
+    _set_status(key, 'READY', **stats)
+    logger.info(f"Archive {job['archiveId']} ready: {stats}")
+
+
+@profiled
+def handler(event, context):
+    """HTTP API requests, or the asynchronous build job sent by request_archive"""
+    if 'archiveJob' in event:
+        return run_archive_job(event['archiveJob'])
+    return handle(event, ROUTES, logger)
@@ -0,0 +1,269 @@
+"""
+Submission Ingest Pipeline
+Processes every object that lands in the homework bucket
+
+Flow: S3 ObjectCreated/ObjectRemoved -> SQS queue -> this Lambda (batches, processed concurrently)
+
+For each new object version:
+1. Stream it from S3 in chunks and compute its SHA-256 (never held in memory)
+2. Look up the owner's content hash index:
+       PK = USER#<identityId>   SK = CONTENT#<sha256>
+3. If the same file was re-uploaded under the same key and the previous
+   version is byte-identical, delete the new version: the bucket keeps one
+   copy instead of piling up noncurrent versions for 90 days
+4. Record size/type/hash on the hash item and on the SUBMISSION# item;
+   objects uploaded directly (no upload service metadata) get a new
+   SUBMISSION# item so the submission index covers every object
+
+ObjectRemoved events mark the submission DELETED once no current version
+of the key is left.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+
+from botocore.exceptions import ClientError
+from wiseuni import aws
+from wiseuni.profiling import profiled
+from wiseuni.submissions import format_timestamp, index_attributes, parse_object_key
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TABLE_NAME = os.environ['TABLE_NAME']
+CHUNK_SIZE = 1024 * 1024  # 1 MiB reads while hashing
+MAX_WORKERS = int(os.environ.get('INGEST_CONCURRENCY', 8))
+
+# Clients are thread-safe, boto3 resources are not: one Table per worker thread
+s3 = aws.client('s3', max_pool_connections=MAX_WORKERS + 2)
+
+
+def _table():
+    return aws.thread_table(TABLE_NAME)
+
+
+def s3_records(event):
+    """Flatten SQS messages into (messageId, s3 record) pairs"""
+    for message in event.get('Records', []):
+        try:
+            body = json.loads(message['body'])
+        except ValueError:
+            logger.error(f"Skipping malformed message {message.get('messageId')}")
+            continue
+        # S3 sends a one-off s3:TestEvent when the notification is configured
+        for record in body.get('Records', []):
+            if record.get('eventName', '').startswith(('ObjectCreated', 'ObjectRemoved')):
+                yield message['messageId'], record
+
+
+def hash_object(bucket, key, version_id):
+    """Stream the object and return (sha256 hex, size, content type, metadata)"""
+    params = {'Bucket': bucket, 'Key': key}
+    if version_id:
+        params['VersionId'] = version_id
+    obj = s3.get_object(**params)
+
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in obj['Body'].iter_chunks(chunk_size=CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+
+    return digest.hexdigest(), size, obj.get('ContentType', 'application/octet-stream'), obj.get('Metadata', {})
+
+
+def previous_version_id(bucket, key, version_id):
+    """Version that was current right before version_id, if any"""
+    response = s3.list_object_versions(Bucket=bucket, Prefix=key, MaxKeys=10)
+    versions = [v for v in response.get('Versions', []) if v['Key'] == key]
+    for newer, older in zip(versions, versions[1:]):
+        if newer['VersionId'] == version_id:
+            return older['VersionId']
+    return None
+
+
+def _event_time(record):
+    """S3 eventTime ('2024-10-01T09:30:00.123Z') as a sort key timestamp"""
+    moment = datetime.fromisoformat(record['eventTime'].replace('Z', '+00:00'))
+    return format_timestamp(moment)
+
+
+def process(record):
+    """Route one S3 record; returns a short outcome string for logging"""
+    key = unquote_plus(record['s3']['object']['key'])
+    parsed = parse_object_key(key)
+    if parsed is None:
+        return 'skipped'
+    if record['eventName'].startswith('ObjectRemoved'):
+        return remove(record, key, parsed)
+    return ingest(record, key, parsed)
+
+
+def ingest(record, key, parsed):
+    bucket = record['s3']['bucket']['name']
+    version_id = record['s3']['object'].get('versionId')
+    owner, course_id, assignment_id, file_name = parsed
+
+    try:
+        sha256, size, content_type, metadata = hash_object(bucket, key, version_id)
+    except ClientError as e:
+        # Object (version) deleted before we got to it: nothing to ingest
+        if e.response['Error']['Code'] in ('NoSuchKey', 'NoSuchVersion'):
+            return 'gone'
+        raise
+
+    table = _table()
+    now = datetime.now(timezone.utc).isoformat()
+    hash_key = {'PK': f'USER#{owner}', 'SK': f'CONTENT#{sha256}'}
+    existing = table.get_item(Key=hash_key).get('Item')
+
+    if (existing and version_id and existing['key'] == key
+            and existing.get('versionId') != version_id
+            and previous_version_id(bucket, key, version_id) == existing.get('versionId')):
+        # Identical resubmission of the current file: drop the new version so
+        # the original becomes current again and no noncurrent copy is kept
+        s3.delete_object(Bucket=bucket, Key=key, VersionId=version_id)
+        table.update_item(
+            Key=hash_key,
+            UpdateExpression='SET lastSeenAt = :now ADD duplicateCount :one',
+            ExpressionAttributeValues={':now': now, ':one': 1},
+        )
+        _record_on_submission(table, owner, metadata, {
+            'sha256': sha256, 'ingestStatus': 'DUPLICATE', 'duplicateOfVersion': existing.get('versionId'),
+        })
+        return 'deduplicated'
+
+    table.put_item(Item={
+        **hash_key,
+        'sha256': sha256,
+        'bucket': bucket,
+        'key': key,
+        'versionId': version_id or 'null',
+        'size': size,
+        'contentType': content_type,
+        'firstSeenAt': existing['firstSeenAt'] if existing else now,
+        'lastSeenAt': now,
+        # Same bytes already stored under another key (kept, the student chose the name)
+        **({'alsoStoredAs': existing['key']} if existing and existing['key'] != key else {}),
+    })
+    if metadata.get('submission-id'):
+        _record_on_submission(table, owner, metadata, {
+            'sha256': sha256, 'ingestStatus': 'STORED', 'storedSize': size, 'storedContentType': content_type,
+        })
+    else:
+        # Direct upload (frontend PutObject): index it from the key alone.
+        # The sort key comes from the event time, so redelivery overwrites
+        # the same item instead of creating a second one
+        timestamp = _event_time(record)
+        table.put_item(Item={
+            **index_attributes(owner, course_id, timestamp),
+            'identityId': owner,
+            'courseId': course_id,
+            'assignmentId': assignment_id,
+            'fileName': file_name,
+            'bucket': bucket,
+            'key': key,
+            'versionId': version_id or 'null',
+            'size': size,
+            'contentType': content_type,
+            'sha256': sha256,
+            'status': 'COMPLETE',
+            'ingestStatus': 'STORED',
+            'source': 'S3_EVENT',
+            'createdAt': record['eventTime'],
+            'completedAt': record['eventTime'],
+        })
+    return 'stored'
+
+
+def remove(record, key, parsed):
+    """
+    Mark the key's submissions DELETED once the object has no current version
+
+    Deleting one noncurrent version (including our own dedup deletes)
+    leaves the object in place and changes nothing.
+    """
+    bucket = record['s3']['bucket']['name']
+    owner, course_id = parsed[0], parsed[1]
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return 'still-current'
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', '405', 'MethodNotAllowed'):
+            raise
+
+    table = _table()
+    now = datetime.now(timezone.utc).isoformat()
+    query = {
+        'KeyConditionExpression': 'PK = :pk AND begins_with(SK, :sk)',
+        'FilterExpression': '#key = :key AND #status <> :deleted',
+        'ExpressionAttributeNames': {'#key': 'key', '#status': 'status'},
+        'ExpressionAttributeValues': {
+            ':pk': f'USER#{owner}', ':sk': f'SUBMISSION#{course_id}#', ':key': key, ':deleted': 'DELETED',
+        },
+    }
+    while True:
+        page = table.query(**query)
+        for item in page.get('Items', []):
+            table.update_item(
+                Key={'PK': item['PK'], 'SK': item['SK']},
+                UpdateExpression='SET #status = :deleted, deletedAt = :now',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':deleted': 'DELETED', ':now': now},
+            )
+        if 'LastEvaluatedKey' not in page:
+            return 'deleted'
+        query['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def _record_on_submission(table, owner, metadata, attributes):
+    """Copy ingest results onto the SUBMISSION# item created by the upload service"""
+    submission_id = metadata.get('submission-id')
+    if not submission_id:
+        return
+    names = {f'#a{i}': name for i, name in enumerate(attributes)}
+    values = {f':v{i}': value for i, value in enumerate(attributes.values())}
+    try:
+        table.update_item(
+            Key={'PK': f'USER#{owner}', 'SK': f'SUBMISSION#{submission_id}'},
+            UpdateExpression='SET ' + ', '.join(f'#a{i} = :v{i}' for i in range(len(attributes))),
+            ConditionExpression='attribute_exists(PK)',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.warning(f'No submission item {submission_id} for {owner}')
+
+
+@profiled
+def handler(event, context):
+    """
+    SQS batch handler with partial batch responses
+
+    Records are ingested concurrently; only messages whose records failed
+    are returned to the queue for retry.
+    """
+    work = list(s3_records(event))
+    failed = set()
+    outcomes = {}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = [(message_id, record, pool.submit(process, record)) for message_id, record in work]
+        for message_id, record, future in futures:
+            try:
+                outcome = future.result()
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            except Exception as e:
+                logger.error(f"Ingest failed for {record['s3']['object']['key']}: {str(e)}", exc_info=True)
+                failed.add(message_id)
+
+    logger.info(f'Processed {len(work)} object events: {outcomes}, {len(failed)} messages failed')
+
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed]}
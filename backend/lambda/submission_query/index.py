@@ -0,0 +1,71 @@
+"""
+Submission Listing API
+Paginated reads of the submission index (see wiseuni/submissions.py)
+
+GET /submissions                        -> caller's own submissions
+    ?courseId=CS101&limit=50&cursor=...
+GET /courses/{courseId}/submissions     -> every submission for a course
+    ?studentId=<identityId>&limit=50&cursor=...   (course professor or admin)
+
+One Query per page instead of a ListObjectsV2 walk per student prefix.
+"""
+
+import logging
+import os
+
+from wiseuni import aws
+from wiseuni.api import ApiError, handle, response
+from wiseuni.profiling import profiled
+from wiseuni.submissions import authorize_course_reader, query_course_submissions, query_user_submissions
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table = aws.table(os.environ['TABLE_NAME'])
+aws.warm(table)
+
+
+def _params(event):
+    return event.get('queryStringParameters') or {}
+
+
+def list_my_submissions(event, caller):
+    params = _params(event)
+    items, cursor = query_user_submissions(
+        table,
+        caller.identity_id,
+        course_id=params.get('courseId'),
+        limit=params.get('limit'),
+        cursor=params.get('cursor'),
+    )
+    return response(200, {'items': items, 'cursor': cursor})
+
+
+def list_course_submissions(event, caller):
+    course_id = (event.get('pathParameters') or {}).get('courseId')
+    if not course_id:
+        raise ApiError(400, 'Missing courseId')
+
+    authorize_course_reader(table, caller, course_id)
+
+    params = _params(event)
+    items, cursor = query_course_submissions(
+        table,
+        course_id,
+        identity_id=params.get('studentId'),
+        limit=params.get('limit'),
+        cursor=params.get('cursor'),
+    )
+    return response(200, {'items': items, 'cursor': cursor})
+
+
+ROUTES = {
+    'GET /submissions': list_my_submissions,
+    'GET /courses/{courseId}/submissions': list_course_submissions,
+}
+
+
+@profiled
+def handler(event, context):
+    """HTTP API (payload v2) entry point"""
+    return handle(event, ROUTES, logger)
@@ -0,0 +1,331 @@
+"""
+Homework Submission Upload Service
+Presigned S3 multipart uploads for homework submissions
+
+The browser never uploads the file in one request. Instead:
+1. POST /uploads           -> we start a multipart upload and presign part URLs
+2. browser PUTs parts      -> in parallel, straight to S3
+3. POST /uploads/parts     -> (resume) which parts S3 already has + fresh URLs
+4. POST /uploads/complete  -> we collect part ETags from S3, check the real sizes
+                              against the declared size and quota, and complete
+   POST /uploads/abort     -> or give up and free the stored parts
+
+Each upload is tracked as a SUBMISSION# item in the single table:
+    PK = USER#<identityId>   SK = SUBMISSION#<courseId>#<timestamp>
+    GSI1PK = COURSE#<courseId>   GSI1SK = SUBMISSION#<identityId>#<timestamp>
+"""
+
+import logging
+import math
+import os
+import re
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+from wiseuni import aws
+from wiseuni.api import ApiError, handle, parse_body, require, response, validate_id
+from wiseuni.profiling import profiled
+from wiseuni.submissions import (
+    DEFAULT_ASSIGNMENT,
+    UNASSIGNED,
+    format_timestamp,
+    index_attributes,
+    submission_key,
+)
+from wiseuni.usage import check_quota
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BUCKET_NAME = os.environ['BUCKET_NAME']
+
+# S3 limits: parts are 5 MiB - 5 GiB (except the last), at most 10,000 parts
+MIN_PART_SIZE = 8 * 1024 * 1024
+MAX_PARTS = 10_000
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 5 * 1024 ** 3))  # 5 GiB
+
+# Presign at most this many part URLs per response; the client asks for more
+PRESIGN_BATCH = 100
+URL_EXPIRY_SECONDS = 3600
+
+# Presigned URLs must be SigV4 and regional, otherwise browsers get redirects
+s3 = aws.client('s3', signature_version='s3v4', s3={'addressing_style': 'virtual'})
+table = aws.table(os.environ['TABLE_NAME'])
+aws.warm(s3, table)
+
+def _safe_file_name(file_name):
+    # Keep only the last path component, browsers sometimes send full paths
+    name = re.split(r'[\\/]', str(file_name))[-1].strip()
+    if not name or name in ('.', '..'):
+        raise ApiError(400, 'Invalid fileName')
+    return name[:255]
+
+
+def plan_parts(size):
+    """
+    Pick a part size so the file fits in MAX_PARTS parts
+
+    Part size is rounded up to a whole MiB; always at least one part.
+    """
+    part_size = max(MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+    part_size = math.ceil(part_size / (1024 * 1024)) * 1024 * 1024
+    return part_size, max(1, math.ceil(size / part_size))
+
+
+def presign_parts(key, upload_id, part_numbers):
+    return [
+        {
+            'partNumber': number,
+            'url': s3.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': BUCKET_NAME, 'Key': key, 'UploadId': upload_id, 'PartNumber': number},
+                ExpiresIn=URL_EXPIRY_SECONDS,
+            ),
+        }
+        for number in part_numbers
+    ]
+
+
+def uploaded_parts(key, upload_id):
+    """Parts S3 has received so far; S3 is the source of truth for ETags"""
+    parts = []
+    paginator = s3.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Key=key, UploadId=upload_id):
+        parts.extend(page.get('Parts', []))
+    return parts
+
+
+def _load_open_upload(caller, body):
+    (submission_id,) = require(body, 'submissionId')
+    item = table.get_item(Key=submission_key(caller.identity_id, submission_id), ConsistentRead=True).get('Item')
+    if not item:
+        raise ApiError(404, 'Submission not found')
+    if item['status'] != 'UPLOADING':
+        raise ApiError(409, f"Submission is already {item['status'].lower()}")
+    return item
+
+
+# ========================================
+# ROUTES
+# ========================================
+
+def start_upload(event, caller):
+    body = parse_body(event)
+    course_id, file_name = require(body, 'courseId', 'fileName')
+    course_id = validate_id(course_id, 'courseId')
+    if course_id == UNASSIGNED:
+        raise ApiError(400, f'{UNASSIGNED} is reserved')
+    assignment_id = validate_id(body.get('assignmentId') or DEFAULT_ASSIGNMENT, 'assignmentId')
+    file_name = _safe_file_name(file_name)
+    content_type = body.get('contentType') or 'application/octet-stream'
+
+    try:
+        size = int(body.get('size'))
+    except (TypeError, ValueError):
+        raise ApiError(400, 'size must be the file size in bytes')
+    if not 0 < size <= MAX_UPLOAD_BYTES:
+        raise ApiError(413, f'File size must be between 1 byte and {MAX_UPLOAD_BYTES} bytes')
+    check_quota(table, caller.identity_id, size)
+
+    part_size, part_count = plan_parts(size)
+    now = datetime.now(timezone.utc)
+    timestamp = format_timestamp(now)
+    index_keys = index_attributes(caller.identity_id, course_id, timestamp)
+    submission_id = index_keys['submissionId']
+    key = f'{caller.folder}/{course_id}/{assignment_id}/{file_name}'
+
+    upload = s3.create_multipart_upload(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        ContentType=content_type,
+        # Lets bucket event processors tie the object back to this item
+        Metadata={
+            'identity-id': caller.identity_id,
+            'course-id': course_id,
+            'assignment-id': assignment_id,
+            'submission-id': submission_id,
+        },
+    )
+    upload_id = upload['UploadId']
+
+    table.put_item(
+        Item={
+            **index_keys,
+            'identityId': caller.identity_id,
+            'courseId': course_id,
+            'assignmentId': assignment_id,
+            'fileName': file_name,
+            'contentType': content_type,
+            'bucket': BUCKET_NAME,
+            'key': key,
+            'size': size,
+            'uploadId': upload_id,
+            'partSize': part_size,
+            'partCount': part_count,
+            'status': 'UPLOADING',
+            'createdAt': now.isoformat(),
+        },
+        ConditionExpression='attribute_not_exists(PK)',
+    )
+
+    logger.info(f'Started upload {submission_id} for {caller.identity_id}: {size} bytes in {part_count} parts')
+
+    return response(201, {
+        'submissionId': submission_id,
+        'key': key,
+        'partSize': part_size,
+        'partCount': part_count,
+        'parts': presign_parts(key, upload_id, range(1, min(part_count, PRESIGN_BATCH) + 1)),
+        'expiresIn': URL_EXPIRY_SECONDS,
+    })
+
+
+def presign_more_parts(event, caller):
+    """
+    Resume support: report parts already stored and presign the next ones
+
+    With no partNumbers in the body, URLs are issued for the first
+    PRESIGN_BATCH parts S3 does not have yet.
+    """
+    body = parse_body(event)
+    item = _load_open_upload(caller, body)
+    part_count = int(item['partCount'])
+
+    done = {part['PartNumber']: part for part in uploaded_parts(item['key'], item['uploadId'])}
+
+    requested = body.get('partNumbers')
+    if requested:
+        try:
+            numbers = sorted({int(n) for n in requested})
+        except (TypeError, ValueError):
+            raise ApiError(400, 'partNumbers must be a list of integers')
+        if numbers[0] < 1 or numbers[-1] > part_count:
+            raise ApiError(400, f'partNumbers must be between 1 and {part_count}')
+    else:
+        numbers = [n for n in range(1, part_count + 1) if n not in done]
+    numbers = numbers[:PRESIGN_BATCH]
+
+    return response(200, {
+        'submissionId': item['submissionId'],
+        'uploadedParts': [
+            {'partNumber': number, 'size': part['Size']} for number, part in sorted(done.items())
+        ],
+        'parts': presign_parts(item['key'], item['uploadId'], numbers),
+        'expiresIn': URL_EXPIRY_SECONDS,
+    })
+
+
+def _discard(caller, item, status, reason):
+    """Free the stored parts and close the item (status ABORTED or REJECTED)"""
+    try:
+        s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=item['key'], UploadId=item['uploadId'])
+    except ClientError as e:
+        # Already aborted/expired by the lifecycle rule: nothing left to free
+        if e.response['Error']['Code'] != 'NoSuchUpload':
+            raise
+
+    table.update_item(
+        Key=submission_key(caller.identity_id, item['submissionId']),
+        UpdateExpression='SET #status = :closed, abortedAt = :now, abortReason = :reason REMOVE uploadId',
+        ConditionExpression='#status = :uploading',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':closed': status,
+            ':uploading': 'UPLOADING',
+            ':reason': reason,
+            ':now': datetime.now(timezone.utc).isoformat(),
+        },
+    )
+
+
+def check_parts(caller, item, parts):
+    """
+    What S3 actually stored must fit what was declared in start_upload
+
+    Each presigned part URL accepts up to 5 GiB whatever the declared
+    size, so the quota and MAX_UPLOAD_BYTES are enforced again here on the
+    real part sizes. A violating upload is discarded (parts freed) and
+    the request fails.
+    """
+    declared, part_size, part_count = int(item['size']), int(item['partSize']), int(item['partCount'])
+    total = sum(part['Size'] for part in parts)
+    problem = None
+    if any(part['PartNumber'] > part_count for part in parts):
+        problem = (413, f'Upload has more than the {part_count} parts its declared size needs')
+    elif any(part['Size'] > part_size for part in parts):
+        problem = (413, f'Parts may be at most {part_size} bytes')
+    elif total > min(declared, MAX_UPLOAD_BYTES):
+        problem = (413, f'Uploaded {total} bytes, more than the declared size of {declared} bytes')
+    else:
+        try:
+            check_quota(table, caller.identity_id, total)
+        except ApiError as e:
+            problem = (e.status_code, e.message)
+    if problem:
+        logger.warning(f"Rejected upload {item['submissionId']} of {caller.identity_id} "
+                       f"({total} bytes in {len(parts)} parts, {declared} declared): {problem[1]}")
+        _discard(caller, item, 'REJECTED', problem[1])
+        raise ApiError(*problem)
+    return total
+
+
+def complete_upload(event, caller):
+    body = parse_body(event)
+    item = _load_open_upload(caller, body)
+    part_count = int(item['partCount'])
+
+    parts = uploaded_parts(item['key'], item['uploadId'])
+    size = check_parts(caller, item, parts)
+    missing = sorted(set(range(1, part_count + 1)) - {part['PartNumber'] for part in parts})
+    if missing:
+        raise ApiError(409, f'Parts not uploaded yet: {missing[:20]}')
+
+    result = s3.complete_multipart_upload(
+        Bucket=BUCKET_NAME,
+        Key=item['key'],
+        UploadId=item['uploadId'],
+        MultipartUpload={
+            'Parts': [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in parts]
+        },
+    )
+
+    table.update_item(
+        Key=submission_key(caller.identity_id, item['submissionId']),
+        UpdateExpression='SET #status = :complete, etag = :etag, versionId = :version, '
+                         '#size = :size, completedAt = :now REMOVE uploadId',
+        ConditionExpression='#status = :uploading',
+        ExpressionAttributeNames={'#status': 'status', '#size': 'size'},
+        ExpressionAttributeValues={
+            ':complete': 'COMPLETE',
+            ':uploading': 'UPLOADING',
+            ':etag': result['ETag'],
+            ':version': result.get('VersionId', 'null'),
+            ':size': size,
+            ':now': datetime.now(timezone.utc).isoformat(),
+        },
+    )
+
+    logger.info(f"Completed upload {item['submissionId']} ({size} bytes, {len(parts)} parts)")
+    return response(200, {'submissionId': item['submissionId'], 'key': item['key'], 'size': size})
+
+
+def abort_upload(event, caller):
+    body = parse_body(event)
+    item = _load_open_upload(caller, body)
+    _discard(caller, item, 'ABORTED', 'Aborted by the uploader')
+    logger.info(f"Aborted upload {item['submissionId']}")
+    return response(200, {'submissionId': item['submissionId'], 'status': 'ABORTED'})
+
+
+ROUTES = {
+    'POST /uploads': start_upload,
+    'POST /uploads/parts': presign_more_parts,
+    'POST /uploads/complete': complete_upload,
+    'POST /uploads/abort': abort_upload,
+}
+
+
+@profiled
+def handler(event, context):
+    """HTTP API (payload v2) entry point"""
+    return handle(event, ROUTES, logger)
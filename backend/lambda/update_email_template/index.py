@@ -1,48 +1,163 @@
+"""
+Cognito Email Template Custom Resource
+Puts the branded verification email (wiseuni/templates) on the user pool
+
+UpdateUserPool resets every setting it is not given, and each call is a
+control-plane write (dev, staging and prod deploy the same stack). So on
+Create / Update:
+
+- the template is rendered (minified) and checked against Cognito's
+  message size limit
+- the pool's current settings are read with DescribeUserPool; the
+  template settings and the pool's matching settings are fingerprinted
+  (SHA-256), and an unchanged template is not written again
+- otherwise UpdateUserPool gets every current setting back, with only
+  the verification subject / message replaced
+
+Resource properties: UserPoolId, Locale (default en). Any other property
+(e.g. TemplateRevision) is only part of the fingerprint: bump it to make
+CloudFormation run the resource after a template edit.
+Delete leaves the pool as it is.
+"""
+
+import hashlib
 import json
-import boto3
-import cfnresponse
-import os
+import logging
+import urllib.request
+
+from wiseuni import aws
+from wiseuni.profiling import profiled
+from wiseuni.templates import render
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Cognito's limits for EmailVerificationMessage / VerificationMessageTemplate.EmailMessage
+MAX_MESSAGE_LENGTH = 20_000
+MAX_SUBJECT_LENGTH = 140
+
+cognito = aws.client('cognito-idp')
+
+# Settings UpdateUserPool accepts; everything else DescribeUserPool returns is read-only
+UPDATABLE = frozenset(cognito.meta.service_model.operation_model('UpdateUserPool').input_shape.members)
+
+
+# ========================================
+# TEMPLATE SETTINGS
+# ========================================
+
+def desired_settings(properties):
+    """Verification subject and message for the pool, or ValueError past Cognito's limits"""
+    # Shared branded template (wiseuni/templates); Cognito fills in {####}
+    template = render('code', properties.get('Locale', 'en'), 'verification', code='{####}')
+    if '{####}' not in template.html:
+        raise ValueError('Rendered template lost the {####} code placeholder')
+    if len(template.html) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f'Verification message is {len(template.html)} characters, Cognito allows {MAX_MESSAGE_LENGTH}')
+    if len(template.subject) > MAX_SUBJECT_LENGTH:
+        raise ValueError(f'Verification subject is {len(template.subject)} characters, Cognito allows {MAX_SUBJECT_LENGTH}')
+    return {'subject': template.subject, 'message': template.html}
+
+
+def current_settings(pool):
+    """The same two settings as the pool has them now"""
+    template = pool.get('VerificationMessageTemplate') or {}
+    return {
+        'subject': template.get('EmailSubject') or pool.get('EmailVerificationSubject'),
+        'message': template.get('EmailMessage') or pool.get('EmailVerificationMessage'),
+    }
+
 
-cognito = boto3.client('cognito-idp')
+def fingerprint(settings):
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
 
+
+def merged_update(pool, settings):
+    """
+    UpdateUserPool arguments: every updatable setting the pool has now,
+    with only the email verification subject / message replaced
+    """
+    update = {key: value for key, value in pool.items() if key in UPDATABLE}
+    update['UserPoolId'] = pool['Id']
+
+    admin_create = dict(update.get('AdminCreateUserConfig') or {})
+    # Deprecated, still returned by DescribeUserPool; rejected next to
+    # PasswordPolicy.TemporaryPasswordValidityDays
+    admin_create.pop('UnusedAccountValidityDays', None)
+    if admin_create:
+        update['AdminCreateUserConfig'] = admin_create
+
+    template = dict(update.get('VerificationMessageTemplate') or {})
+    template['EmailSubject'] = settings['subject']
+    template['EmailMessage'] = settings['message']
+    template.setdefault('DefaultEmailOption', 'CONFIRM_WITH_CODE')
+    update['VerificationMessageTemplate'] = template
+    # Legacy fields, kept in step so the two never disagree
+    update['EmailVerificationSubject'] = settings['subject']
+    update['EmailVerificationMessage'] = settings['message']
+    return update
+
+
+def apply_template(properties):
+    """Data for CloudFormation: Fingerprint, Updated ('true' / 'false'), MessageSize"""
+    user_pool_id = properties['UserPoolId']
+    settings = desired_settings(properties)
+    wanted = fingerprint(settings)
+
+    pool = cognito.describe_user_pool(UserPoolId=user_pool_id)['UserPool']
+    if fingerprint(current_settings(pool)) == wanted:
+        logger.info(f'Email template of {user_pool_id} is already up to date ({wanted[:12]}), skipping UpdateUserPool')
+        updated = False
+    else:
+        cognito.update_user_pool(**merged_update(pool, settings))
+        logger.info(f'Email template of {user_pool_id} updated ({wanted[:12]}, {len(settings["message"])} characters)')
+        updated = True
+
+    # Resource parameters are part of the reported fingerprint too
+    parameters = {key: value for key, value in properties.items() if key != 'ServiceToken'}
+    return {
+        'Fingerprint': fingerprint({'settings': wanted, 'parameters': parameters}),
+        'Updated': str(updated).lower(),
+        'MessageSize': str(len(settings['message'])),
+    }
+
+
+# ========================================
+# CLOUDFORMATION
+# ========================================
+
+def send_response(event, context, status, data=None, reason=None):
+    """PUT the result to CloudFormation's presigned URL (cfnresponse only exists for inline code)"""
+    physical_id = event.get('PhysicalResourceId') or f"{event['ResourceProperties'].get('UserPoolId', 'user-pool')}-email-template"
+    body = json.dumps({
+        'Status': status,
+        'Reason': reason or f'See CloudWatch log stream {getattr(context, "log_stream_name", "-")}',
+        'PhysicalResourceId': physical_id,
+        'StackId': event['StackId'],
+        'RequestId': event['RequestId'],
+        'LogicalResourceId': event['LogicalResourceId'],
+        'Data': data or {},
+    }).encode('utf-8')
+    request = urllib.request.Request(event['ResponseURL'], data=body, method='PUT',
+                                     headers={'Content-Type': '', 'Content-Length': str(len(body))})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        logger.info(f'CloudFormation response: {status} ({response.status})')
+
+
+@profiled
 def handler(event, context):
     """
     Custom resource to update Cognito User Pool email template
     """
-    print(f"Event: {json.dumps(event)}")
-    
+    request_type = event['RequestType']
+    logger.info(f"{request_type} {event.get('LogicalResourceId')}: {json.dumps(event.get('ResourceProperties'))}")
+
     try:
-        request_type = event['RequestType']
-        properties = event['ResourceProperties']
-        
-        if request_type in ['Create', 'Update']:
-            user_pool_id = properties['UserPoolId']
-            
-            # Read HTML template from file
-            html_file = os.path.join(os.path.dirname(__file__), 'verification.html')
-            with open(html_file, 'r', encoding='utf-8') as f:
-                email_template = f.read()
-            
-            print(f"Updating User Pool: {user_pool_id}")
-            
-            # Update User Pool with custom email template
-            response = cognito.update_user_pool(
-                UserPoolId=user_pool_id,
-                EmailVerificationSubject='Your WiseUni verification code',
-                EmailVerificationMessage=email_template
-            )
-            
-            print(f"Update successful: {response}")
-            cfnresponse.send(event, context, cfnresponse.SUCCESS, {
-                'Message': 'Email template updated successfully'
-            })
-        
-        elif request_type == 'Delete':
-            # No action needed on delete
-            cfnresponse.send(event, context, cfnresponse.SUCCESS, {})
-    
+        data = {}
+        if request_type in ('Create', 'Update'):
+            data = apply_template(event['ResourceProperties'])
+        # Delete: the pool keeps its template
+        send_response(event, context, 'SUCCESS', data)
     except Exception as e:
-        print(f"Error: {str(e)}")
-        cfnresponse.send(event, context, cfnresponse.FAILED, {
-            'Message': str(e)
-        })
\ No newline at end of file
+        logger.error(f'Email template update failed: {str(e)}', exc_info=True)
+        send_response(event, context, 'FAILED', reason=str(e)[:1000])
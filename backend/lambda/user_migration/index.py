@@ -0,0 +1,80 @@
+"""
+User Migration Lambda Trigger
+Moves students from the legacy registry into the user pool on their first login
+
+Cognito calls it when a username is not in the pool yet:
+- UserMigration_Authentication: the password is checked against the
+  legacy directory; on a match the student is created CONFIRMED with the
+  same password and signed straight in
+- UserMigration_ForgotPassword: a legacy student who forgot their
+  password is created so the reset code can be sent
+
+Lazy, not bulk: the directory only sees real logins, spread over weeks,
+instead of a multi-hour import (and students skip re-signing up).
+Directory records, misses included, are cached across warm invocations
+and the SQLite connection is kept (wiseuni/migration.py). The profile and
+group are staged and claimed on the first credential exchange.
+
+Cognito waits at most 5 seconds for this trigger.
+"""
+
+import logging
+import os
+
+from wiseuni import aws
+from wiseuni.migration import CachedDirectory, authenticate, directory_from_env, pending_profile, user_attributes
+from wiseuni.profiling import profiled
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Opened (and downloaded from S3) once per container
+directory = CachedDirectory(directory_from_env())
+table = aws.table(os.environ['TABLE_NAME'])
+aws.warm(table)
+
+
+@profiled
+def handler(event, context):
+    """
+    Triggered when a login or password reset names an unknown user
+
+    Event structure (the password is never logged):
+    {
+        'triggerSource': 'UserMigration_Authentication',
+        'userName': 'ayse@example.com',
+        'request': {'password': '...', 'validationData': {...}},
+        'response': {}
+    }
+
+    Raising refuses the migration: Cognito answers as for an unknown user
+    or a wrong password.
+    """
+    trigger_source = event.get('triggerSource', '')
+    username = event.get('userName', '')
+
+    if trigger_source == 'UserMigration_Authentication':
+        user = authenticate(directory, username, event['request'].get('password') or '')
+        if user is None:
+            logger.info(f'Legacy login refused for {username}')
+            raise Exception('Bad username or password')
+        event['response']['finalUserStatus'] = 'CONFIRMED'
+    elif trigger_source == 'UserMigration_ForgotPassword':
+        user = directory.find(username)
+        if user is None:
+            logger.info(f'No legacy account for {username}')
+            raise Exception('User not found')
+    else:
+        logger.warning(f'Unknown trigger source: {trigger_source}')
+        return event
+
+    # Profile and group follow on the first credential exchange (credential_broker)
+    table.put_item(Item=pending_profile(user))
+
+    event['response']['userAttributes'] = user_attributes(user)
+    # The student already has an account: no welcome or temporary-password email
+    event['response']['messageAction'] = 'SUPPRESS'
+
+    logger.info(f'✅ Migrated {username} (legacy id {user.legacy_id}) via {trigger_source}. '
+                f'Directory cache: {directory.stats()}')
+    return event
@@ -0,0 +1,103 @@
+"""
+User Summary API
+Profile, enrolments and grades of the caller in one cacheable response
+
+GET /me/summary
+-> {"profile": {...}, "enrollments": [...], "grades": [...], "version": 7}
+   with ETag; send it back as If-None-Match to get 304 Not Modified
+
+Cost per request:
+- unchanged since the client's copy:         GetItem on VERSION -> 304
+- unchanged since this container's copy:     GetItem on VERSION -> 200 from memory
+- changed:                                   GetItem + one Query (wiseuni/summary.py)
+instead of a GetItem and two Queries from the browser on every refresh.
+
+Changes become visible once the cache_invalidation function has bumped
+the version from the table stream (usually within a second).
+
+Local service: python backend/lambda/user_summary/index.py --serve 8788 --identity <identityId>
+"""
+
+import logging
+import os
+import sys
+from collections import OrderedDict
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared', 'python'))
+
+from wiseuni import aws
+from wiseuni.api import handle, response
+from wiseuni.profiling import profiled
+from wiseuni.summary import make_etag, query_summary, read_version
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CACHE_ENTRIES = int(os.environ.get('SUMMARY_CACHE_ENTRIES', 2000))
+
+table = aws.table(os.environ['TABLE_NAME'])
+aws.warm(table)
+
+# identityId -> (version, summary); per container, bounded (least recently used out)
+_cache = OrderedDict()
+_counters = {'notModified': 0, 'memory': 0, 'queried': 0}
+
+
+def _cached(identity_id, version):
+    entry = _cache.get(identity_id)
+    if entry is None or entry[0] != version:
+        return None
+    _cache.move_to_end(identity_id)
+    return entry[1]
+
+
+def _remember(identity_id, version, summary):
+    _cache[identity_id] = (version, summary)
+    _cache.move_to_end(identity_id)
+    while len(_cache) > CACHE_ENTRIES:
+        _cache.popitem(last=False)
+
+
+def get_summary(event, caller):
+    identity_id = caller.identity_id
+    # Read the version BEFORE the data: a write in between leaves newer data
+    # under an older version, which the next bump replaces - never the reverse
+    version = read_version(table, identity_id)
+    etag = make_etag(identity_id, version)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache',  # Browser may keep it, but must revalidate
+    }
+
+    if (event.get('headers') or {}).get('if-none-match') == etag:
+        _counters['notModified'] += 1
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+    summary = _cached(identity_id, version)
+    if summary is None:
+        summary = query_summary(table, identity_id)
+        summary['version'] = version
+        _remember(identity_id, version, summary)
+        _counters['queried'] += 1
+    else:
+        _counters['memory'] += 1
+    return response(200, summary, headers)
+
+
+ROUTES = {
+    'GET /me/summary': get_summary,
+}
+
+
+@profiled
+def handler(event, context):
+    """HTTP API (payload v2) entry point"""
+    result = handle(event, ROUTES, logger)
+    logger.info(f'Summary cache: {_counters} ({len(_cache)} entries)')
+    return result
+
+
+if __name__ == '__main__':
+    from wiseuni.local import main
+    main(handler, ROUTES)
@@ -2,13 +2,17 @@
 // Uses Cognito Identity Pool credentials for fine-grained access control
 
 import {
+  BatchGetItemCommand,
   DynamoDBClient,
   GetItemCommand,
   PutItemCommand,
   DeleteItemCommand,
   QueryCommand,
+  UpdateItemCommand,
 } from "@aws-sdk/client-dynamodb";
 import { marshall, unmarshall } from "@aws-sdk/util-dynamodb";
+import { Sha256 } from "@aws-crypto/sha256-js";
+import { SignatureV4 } from "@smithy/signature-v4";
 import { getAWSCredentials } from "./s3Service"; // Reuse credential fetching
 
 // ========================================
@@ -18,6 +22,8 @@ import { getAWSCredentials } from "./s3Service"; // Reuse credential fetching
 const config = {
   region: import.meta.env.VITE_AWS_REGION || "us-east-1",
   tableName: import.meta.env.VITE_DYNAMODB_TABLE || "WiseUni-Data-dev",
+  // Backend HTTP API (AWS_IAM): enrolment goes through it
+  backendApiUrl: import.meta.env.VITE_BACKEND_API_URL,
 };
 
 // ========================================
@@ -86,6 +92,279 @@ async function getDynamoDBClient(idToken: string): Promise<{
   return { client, identityId: identityId || "" };
 }
 
+// ========================================
+// BACKEND API
+// ========================================
+
+// CHANGE: SigV4-signed requests to the backend HTTP API
+// REASON: Its routes use AWS_IAM authorization; the same Identity Pool
+// credentials as DynamoDB/S3 sign them, and API Gateway tells the Lambda
+// who called (backend/stacks/services.yaml, BackendApi)
+
+export class BackendApiError extends Error {
+  status: number;
+  retryAfterSeconds?: number;
+
+  constructor(message: string, status: number, retryAfterSeconds?: number) {
+    super(message);
+    this.status = status;
+    this.retryAfterSeconds = retryAfterSeconds;
+  }
+}
+
+async function backendRequest<T>(
+  idToken: string,
+  method: string,
+  path: string,
+  body?: unknown
+): Promise<{ status: number; body: T }> {
+  if (!config.backendApiUrl) {
+    throw new Error("VITE_BACKEND_API_URL is not set");
+  }
+  const { credentials } = await getAWSCredentials(idToken);
+  const url = new URL(`${config.backendApiUrl.replace(/\/$/, "")}${path}`);
+  const payload = body === undefined ? undefined : JSON.stringify(body);
+
+  const signer = new SignatureV4({
+    service: "execute-api",
+    region: config.region,
+    credentials,
+    sha256: Sha256,
+  });
+  const signed = await signer.sign({
+    method,
+    protocol: url.protocol,
+    hostname: url.hostname,
+    path: url.pathname,
+    headers: {
+      host: url.host,
+      ...(payload ? { "content-type": "application/json" } : {}),
+    },
+    body: payload,
+  });
+  // The browser sets Host itself (same value as signed)
+  const headers: Record<string, string> = { ...signed.headers };
+  delete headers.host;
+
+  const response = await fetch(url, { method, headers, body: payload });
+  const result = await response.json().catch(() => ({}));
+  if (!response.ok) {
+    const retryAfter = response.headers.get("Retry-After");
+    throw new BackendApiError(
+      result.error || `${method} ${path} failed: ${response.status}`,
+      response.status,
+      retryAfter ? Number(retryAfter) : undefined
+    );
+  }
+  return { status: response.status, body: result as T };
+}
+
+// ========================================
+// SECONDARY INDEXES
+// ========================================
+
+// CHANGE: Dedicated sparse indexes, GSI1 until they are backfilled
+// REASON: RoleIndex / RosterIndex / GradeIndex / CatalogIndex are added one
+// per stack update, and items written before an index existed only carry
+// GSI1 keys until backend/lambda/scripts/backfill_index_keys.py has run
+// (backend/lambda/shared/python/wiseuni/indexes.py). Reads use an index once
+// the backfill has recorded it (INDEX#BACKFILL / <name>); writes keep adding
+// the GSI1 keys (same values) while WRITE_GSI1_KEYS is set
+
+const WRITE_GSI1_KEYS = true;
+
+type IndexKeys = { IndexName: string; pk: string; sk: string };
+
+const GSI1: IndexKeys = { IndexName: "GSI1", pk: "GSI1PK", sk: "GSI1SK" };
+
+// Backfill state is looked up once per page load
+const backfilledIndexes = new Map<string, Promise<boolean>>();
+
+async function readIndex(
+  client: DynamoDBClient,
+  index: IndexKeys
+): Promise<IndexKeys> {
+  let backfilled = backfilledIndexes.get(index.IndexName);
+  if (!backfilled) {
+    backfilled = client
+      .send(
+        new GetItemCommand({
+          TableName: config.tableName,
+          Key: marshall({ PK: "INDEX#BACKFILL", SK: index.IndexName }),
+          ProjectionExpression: "PK",
+        })
+      )
+      .then((response) => Boolean(response.Item))
+      .catch(() => false); // GSI1 is always complete
+    backfilledIndexes.set(index.IndexName, backfilled);
+  }
+  return (await backfilled) ? index : GSI1;
+}
+
+function indexKeys(
+  index: IndexKeys,
+  pk: string,
+  sk: string
+): Record<string, string> {
+  return {
+    [index.pk]: pk,
+    [index.sk]: sk,
+    ...(WRITE_GSI1_KEYS ? { [GSI1.pk]: pk, [GSI1.sk]: sk } : {}),
+  };
+}
+
+// Dedicated index of each access pattern
+const ROLE_INDEX: IndexKeys = {
+  IndexName: "RoleIndex",
+  pk: "RolePK",
+  sk: "RoleSK",
+};
+const ROSTER_INDEX: IndexKeys = {
+  IndexName: "RosterIndex",
+  pk: "RosterPK",
+  sk: "RosterSK",
+};
+const GRADE_INDEX: IndexKeys = {
+  IndexName: "GradeIndex",
+  pk: "GradePK",
+  sk: "GradeSK",
+};
+const CATALOG_INDEX: IndexKeys = {
+  IndexName: "CatalogIndex",
+  pk: "CatalogPK",
+  sk: "CatalogSK",
+};
+
+// ========================================
+// COMPACT ITEMS
+// ========================================
+
+// CHANGE: Read enrolment and grade items in either encoding
+// REASON: Items may be migrated to the compact encoding
+// (backend/lambda/shared/python/wiseuni/items.py): marked f=1, short
+// attribute names, epoch-second timestamps, course names left to the
+// COURSE#<id> / METADATA item unless they differ from it
+
+type CourseNames = { title?: string; professorName?: string };
+
+const COMPACT_STATUS: Record<string, Enrollment["status"]> = {
+  a: "active",
+  c: "completed",
+  d: "dropped",
+};
+
+// Course names change rarely: cached for the page's lifetime
+const courseNameCache = new Map<string, CourseNames>();
+
+async function getCourseNames(
+  client: DynamoDBClient,
+  courseIds: string[]
+): Promise<Map<string, CourseNames>> {
+  const missing = [...new Set(courseIds)].filter(
+    (courseId) => !courseNameCache.has(courseId)
+  );
+
+  for (let start = 0; start < missing.length; start += 100) {
+    let request: BatchGetItemCommand["input"]["RequestItems"] = {
+      [config.tableName]: {
+        Keys: missing
+          .slice(start, start + 100)
+          .map((courseId) => marshall({ PK: `COURSE#${courseId}`, SK: "METADATA" })),
+        ProjectionExpression: "PK, #title, professorName",
+        ExpressionAttributeNames: { "#title": "title" },
+      },
+    };
+    while (request && Object.keys(request).length > 0) {
+      const response = await client.send(
+        new BatchGetItemCommand({ RequestItems: request })
+      );
+      for (const item of response.Responses?.[config.tableName] || []) {
+        const { PK, ...names } = unmarshall(item);
+        courseNameCache.set(PK.slice("COURSE#".length), names);
+      }
+      request = response.UnprocessedKeys;
+    }
+  }
+  for (const courseId of missing) {
+    if (!courseNameCache.has(courseId)) courseNameCache.set(courseId, {});
+  }
+  return courseNameCache;
+}
+
+function isCompact(data: Record<string, any>): boolean {
+  return data.f === 1;
+}
+
+function fromEpoch(value: any): string {
+  return typeof value === "number"
+    ? new Date(value * 1000).toISOString()
+    : value;
+}
+
+function courseIdOf(data: Record<string, any>): string {
+  return data.SK.split("#").slice(1).join("#");
+}
+
+function decodeEnrollment(
+  data: Record<string, any>,
+  course: CourseNames = {}
+): Enrollment {
+  if (!isCompact(data)) {
+    return {
+      identityId: data.identityId,
+      courseId: data.courseId,
+      courseName: data.courseName,
+      professorName: data.professorName,
+      enrolledAt: data.enrolledAt,
+      status: data.status,
+    };
+  }
+  return {
+    identityId: data.PK.slice("USER#".length),
+    courseId: courseIdOf(data),
+    courseName: data.cn ?? course.title,
+    professorName: data.pn ?? course.professorName,
+    enrolledAt: fromEpoch(data.t ?? data.enrolledAt),
+    status: COMPACT_STATUS[data.s] ?? data.s ?? data.status,
+  };
+}
+
+function decodeGrade(
+  data: Record<string, any>,
+  course: CourseNames = {}
+): Grade {
+  if (!isCompact(data)) {
+    return {
+      identityId: data.identityId,
+      courseId: data.courseId,
+      courseName: data.courseName,
+      grade: data.grade,
+      points: data.points,
+      gradedAt: data.gradedAt,
+      gradedBy: data.gradedBy,
+    };
+  }
+  return {
+    identityId: data.PK.slice("USER#".length),
+    courseId: courseIdOf(data),
+    courseName: data.cn ?? course.title,
+    grade: data.g,
+    points: data.p,
+    gradedAt: fromEpoch(data.t ?? data.gradedAt),
+    gradedBy: data.b,
+  };
+}
+
+async function withCourseNames(
+  client: DynamoDBClient,
+  items: Record<string, any>[]
+): Promise<Map<string, CourseNames>> {
+  const compact = items.filter(isCompact).map(courseIdOf);
+  return compact.length > 0
+    ? getCourseNames(client, compact)
+    : new Map<string, CourseNames>();
+}
+
 // ========================================
 // USER PROFILE OPERATIONS
 // ========================================
@@ -123,6 +402,9 @@ export async function getUserProfile(
 
 // CHANGE: Create or update user profile
 // REASON: First-time login should create profile; updates allowed for own data
+// UpdateItem, not PutItem: keeps createdAt and bumps version, so write-behind
+// updates queued by PATCH /me/profile (read at the old version) re-read
+// instead of overwriting this save
 
 export async function saveUserProfile(
   idToken: string,
@@ -131,28 +413,55 @@ export async function saveUserProfile(
   const { client, identityId } = await getDynamoDBClient(idToken);
 
   const now = new Date().toISOString();
-  const item: UserProfile = {
-    ...profile,
-    identityId,
-    createdAt: now,
-    updatedAt: now,
-  };
-
-  await client.send(
-    new PutItemCommand({
+  // Sparse RoleIndex (and GSI1) for admin lookups
+  const keys = indexKeys(
+    ROLE_INDEX,
+    `ROLE#${profile.role}`,
+    `USER#${identityId}`
+  );
+  const keyNames = Object.keys(keys);
+  const response = await client.send(
+    new UpdateItemCommand({
       TableName: config.tableName,
-      Item: marshall({
+      Key: marshall({
         PK: `USER#${identityId}`,
         SK: "PROFILE",
-        ...item,
-        // GSI for admin lookups
-        GSI1PK: `ROLE#${profile.role}`,
-        GSI1SK: `USER#${identityId}`,
       }),
+      UpdateExpression:
+        "SET #email = :email, #name = :name, #role = :role, identityId = :identityId, " +
+        "createdAt = if_not_exists(createdAt, :now), updatedAt = :now, " +
+        keyNames.map((name, number) => `${name} = :k${number}`).join(", ") +
+        " ADD #version :one",
+      ExpressionAttributeNames: {
+        "#email": "email",
+        "#name": "name",
+        "#role": "role",
+        "#version": "version",
+      },
+      ExpressionAttributeValues: marshall({
+        ":email": profile.email,
+        ":name": profile.name,
+        ":role": profile.role,
+        ":identityId": identityId,
+        ":now": now,
+        ":one": 1,
+        ...Object.fromEntries(
+          keyNames.map((name, number) => [`:k${number}`, keys[name]])
+        ),
+      }),
+      ReturnValues: "ALL_NEW",
     })
   );
 
-  return item;
+  const item = unmarshall(response.Attributes!);
+  return {
+    identityId,
+    email: item.email,
+    name: item.name,
+    role: item.role,
+    createdAt: item.createdAt,
+    updatedAt: item.updatedAt,
+  };
 }
 
 // ========================================
@@ -178,56 +487,71 @@ export async function getMyEnrollments(idToken: string): Promise<Enrollment[]> {
 
   if (!response.Items) return [];
 
-  return response.Items.map((item) => {
-    const data = unmarshall(item);
-    return {
-      identityId: data.identityId,
-      courseId: data.courseId,
-      courseName: data.courseName,
-      professorName: data.professorName,
-      enrolledAt: data.enrolledAt,
-      status: data.status,
-    };
-  });
+  const items = response.Items.map((item) => unmarshall(item));
+  const courses = await withCourseNames(client, items);
+  return items.map((data) =>
+    decodeEnrollment(data, courses.get(courseIdOf(data)))
+  );
 }
 
-// CHANGE: Enroll current user in a course
-// REASON: Creates enrollment record under user's partition + course's roster
+// CHANGE: Enroll current user in a course, or join its waitlist
+// REASON: The enrolment API (backend/lambda/enrolment) takes the seat and
+// writes the enrollment in one transaction; the browser may no longer
+// write ENROLLMENT# items itself, which skipped every seat limit
+// NOTE: 503 means registration is busy; retried after Retry-After
+
+export type EnrollmentStatus =
+  | "enrolled"
+  | "waitlisted"
+  | "already_enrolled"
+  | "already_waitlisted";
+
+export interface EnrollmentResult {
+  status: EnrollmentStatus;
+  enrollment?: Enrollment; // Only when newly enrolled
+}
+
+const ENROLL_ATTEMPTS = 3;
 
 export async function enrollInCourse(
   idToken: string,
-  courseId: string,
-  courseName: string,
-  professorName: string
-): Promise<Enrollment> {
-  const { client, identityId } = await getDynamoDBClient(idToken);
-
-  const now = new Date().toISOString();
-  const enrollment: Enrollment = {
-    identityId,
-    courseId,
-    courseName,
-    professorName,
-    enrolledAt: now,
-    status: "active",
-  };
+  courseId: string
+): Promise<EnrollmentResult> {
+  const path = `/courses/${encodeURIComponent(courseId)}/enrolment`;
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await backendRequest<EnrollmentResult>(
+        idToken,
+        "POST",
+        path
+      );
+      return response.body;
+    } catch (error) {
+      if (
+        !(error instanceof BackendApiError) ||
+        error.status !== 503 ||
+        attempt >= ENROLL_ATTEMPTS
+      ) {
+        throw error;
+      }
+      const seconds = error.retryAfterSeconds ?? 1;
+      await new Promise((resolve) => setTimeout(resolve, seconds * 1000));
+    }
+  }
+}
 
-  // Write to user's partition
-  await client.send(
-    new PutItemCommand({
-      TableName: config.tableName,
-      Item: marshall({
-        PK: `USER#${identityId}`,
-        SK: `ENROLLMENT#${courseId}`,
-        ...enrollment,
-        // GSI for course roster lookups
-        GSI1PK: `COURSE#${courseId}`,
-        GSI1SK: `USER#${identityId}`,
-      }),
-    })
-  );
+// CHANGE: Drop a course, or leave its waitlist
+// REASON: Through the enrolment API like enrolling, so the seat is given
+// back and the waitlist moves up (enrolment_promoter)
 
-  return enrollment;
+export async function dropCourse(
+  idToken: string,
+  courseId: string
+): Promise<"dropped" | "left_waitlist"> {
+  const response = await backendRequest<{
+    status: "dropped" | "left_waitlist";
+  }>(idToken, "DELETE", `/courses/${encodeURIComponent(courseId)}/enrolment`);
+  return response.body.status;
 }
 
 // ========================================
@@ -253,18 +577,9 @@ export async function getMyGrades(idToken: string): Promise<Grade[]> {
 
   if (!response.Items) return [];
 
-  return response.Items.map((item) => {
-    const data = unmarshall(item);
-    return {
-      identityId: data.identityId,
-      courseId: data.courseId,
-      courseName: data.courseName,
-      grade: data.grade,
-      points: data.points,
-      gradedAt: data.gradedAt,
-      gradedBy: data.gradedBy,
-    };
-  });
+  const items = response.Items.map((item) => unmarshall(item));
+  const courses = await withCourseNames(client, items);
+  return items.map((data) => decodeGrade(data, courses.get(courseIdOf(data))));
 }
 
 // ========================================
@@ -351,12 +666,13 @@ export async function getCourseRoster(
 ): Promise<{ identityId: string; name: string; enrolledAt: string }[]> {
   const { client } = await getDynamoDBClient(idToken);
 
-  // Query GSI to get all users enrolled in this course
+  // RosterIndex (sparse: enrolments only) once backfilled, GSI1 until then
+  const index = await readIndex(client, ROSTER_INDEX);
   const response = await client.send(
     new QueryCommand({
       TableName: config.tableName,
-      IndexName: "GSI1",
-      KeyConditionExpression: "GSI1PK = :pk AND begins_with(GSI1SK, :sk)",
+      IndexName: index.IndexName,
+      KeyConditionExpression: `${index.pk} = :pk AND begins_with(${index.sk}, :sk)`,
       ExpressionAttributeValues: marshall({
         ":pk": `COURSE#${courseId}`,
         ":sk": "USER#",
@@ -369,9 +685,9 @@ export async function getCourseRoster(
   return response.Items.map((item) => {
     const data = unmarshall(item);
     return {
-      identityId: data.identityId,
+      identityId: data.PK.slice("USER#".length),
       name: data.name || "Unknown",
-      enrolledAt: data.enrolledAt,
+      enrolledAt: isCompact(data) ? fromEpoch(data.t) : data.enrolledAt,
     };
   });
 }
@@ -407,9 +723,12 @@ export async function assignGrade(
         PK: `USER#${studentIdentityId}`,
         SK: `GRADE#${courseId}`,
         ...gradeRecord,
-        // GSI for grade analytics
-        GSI1PK: `COURSE#${courseId}`,
-        GSI1SK: `GRADE#${studentIdentityId}`,
+        // Sparse GradeIndex (and GSI1) for grade analytics
+        ...indexKeys(
+          GRADE_INDEX,
+          `COURSE#${courseId}`,
+          `GRADE#${studentIdentityId}`
+        ),
       }),
     })
   );
@@ -437,8 +756,12 @@ export async function createCourse(
         PK: `COURSE#${course.courseId}`,
         SK: "METADATA",
         ...course,
-        GSI1PK: `SEMESTER#${course.semester}`,
-        GSI1SK: `COURSE#${course.courseId}`,
+        // Sparse CatalogIndex (and GSI1) for semester listings
+        ...indexKeys(
+          CATALOG_INDEX,
+          `SEMESTER#${course.semester}`,
+          `COURSE#${course.courseId}`
+        ),
       }),
     })
   );
@@ -448,40 +771,53 @@ export async function createCourse(
 
 // CHANGE: Get all users (Admin only)
 // REASON: Admin needs to manage all users in the system
+// Served by the index alone: RoleIndex projects email, name and createdAt,
+// and identityId / role are its keys (no BatchGetItem of every profile).
+// updatedAt is left out: projecting it would put every profile save on
+// the index
+
+export type UserListing = Omit<UserProfile, "updatedAt">;
 
 export async function getAllUsers(
   idToken: string,
   role?: "student" | "professor" | "admin"
-): Promise<UserProfile[]> {
+): Promise<UserListing[]> {
   const { client } = await getDynamoDBClient(idToken);
-
-  let params: any = {
-    TableName: config.tableName,
-    IndexName: "GSI1",
-  };
-
-  if (role) {
-    params.KeyConditionExpression = "GSI1PK = :pk";
-    params.ExpressionAttributeValues = marshall({
-      ":pk": `ROLE#${role}`,
-    });
+  const roles = role ? [role] : ["student", "professor", "admin"];
+  const index = await readIndex(client, ROLE_INDEX);
+
+  const users: UserListing[] = [];
+  for (const listedRole of roles) {
+    let startKey: Record<string, any> | undefined;
+    do {
+      const response = await client.send(
+        new QueryCommand({
+          TableName: config.tableName,
+          IndexName: index.IndexName,
+          KeyConditionExpression: `${index.pk} = :pk AND begins_with(${index.sk}, :sk)`,
+          ExpressionAttributeNames: { "#name": "name" },
+          ExpressionAttributeValues: marshall({
+            ":pk": `ROLE#${listedRole}`,
+            ":sk": "USER#",
+          }),
+          ProjectionExpression: `${index.sk}, email, #name, createdAt`,
+          ExclusiveStartKey: startKey,
+        })
+      );
+      for (const item of response.Items || []) {
+        const data = unmarshall(item);
+        users.push({
+          identityId: data[index.sk].slice("USER#".length),
+          email: data.email,
+          name: data.name,
+          role: listedRole as UserProfile["role"],
+          createdAt: data.createdAt,
+        });
+      }
+      startKey = response.LastEvaluatedKey;
+    } while (startKey);
   }
-
-  const response = await client.send(new QueryCommand(params));
-
-  if (!response.Items) return [];
-
-  return response.Items.map((item) => {
-    const data = unmarshall(item);
-    return {
-      identityId: data.identityId,
-      email: data.email,
-      name: data.name,
-      role: data.role,
-      createdAt: data.createdAt,
-      updatedAt: data.updatedAt,
-    };
-  });
+  return users;
 }
 
 // CHANGE: Delete a user (Admin only)
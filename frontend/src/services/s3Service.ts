@@ -16,11 +16,76 @@ const config = {
   identityPoolId: import.meta.env.VITE_IDENTITY_POOL_ID,
   userPoolId: import.meta.env.VITE_USER_POOL_ID,
   bucketName: import.meta.env.VITE_UPLOADS_BUCKET,
+  // Optional: exchange tokens through the backend credential broker
+  backendApiUrl: import.meta.env.VITE_BACKEND_API_URL,
 };
 
 // CHANGE: Added function to get temporary AWS credentials
 // REASON: These credentials have the IAM policy attached that restricts S3 access
-export async function getAWSCredentials(idToken: string) {
+//
+// CHANGE: Credentials are cached per ID token until 5 minutes before they expire,
+// and concurrent callers share one exchange
+// REASON: Every S3/DynamoDB call used to run GetId + GetCredentialsForIdentity;
+// one dashboard render made several full Cognito Identity round trips
+export interface AWSCredentialsResult {
+  identityId: string | undefined;
+  credentials: {
+    accessKeyId: string;
+    secretAccessKey: string;
+    sessionToken: string;
+    expiration?: Date;
+  };
+}
+
+const REFRESH_MARGIN_MS = 5 * 60 * 1000;
+const credentialCache = new Map<string, Promise<AWSCredentialsResult>>();
+
+export function getAWSCredentials(idToken: string): Promise<AWSCredentialsResult> {
+  const cached = credentialCache.get(idToken);
+  if (cached) return cached;
+
+  const pending = exchangeToken(idToken).then(
+    (result) => {
+      // Drop the entry shortly before expiry so the next call refreshes
+      const expiresIn = result.credentials.expiration
+        ? result.credentials.expiration.getTime() - Date.now() - REFRESH_MARGIN_MS
+        : 0;
+      setTimeout(() => credentialCache.delete(idToken), Math.max(expiresIn, 0));
+      return result;
+    },
+    (error) => {
+      credentialCache.delete(idToken); // Never cache failures
+      throw error;
+    }
+  );
+  // Old tokens are never used again after a refresh
+  credentialCache.clear();
+  credentialCache.set(idToken, pending);
+  return pending;
+}
+
+async function exchangeToken(idToken: string): Promise<AWSCredentialsResult> {
+  if (config.backendApiUrl) {
+    // Credential broker (backend/lambda/credential_broker): cached server-side too
+    const response = await fetch(`${config.backendApiUrl}/credentials`, {
+      method: "POST",
+      headers: { Authorization: `Bearer ${idToken}` },
+    });
+    if (!response.ok) {
+      throw new Error(`Credential exchange failed: ${response.status}`);
+    }
+    const body = await response.json();
+    return {
+      identityId: body.identityId,
+      credentials: {
+        accessKeyId: body.accessKeyId,
+        secretAccessKey: body.secretAccessKey,
+        sessionToken: body.sessionToken,
+        expiration: new Date(body.expiration * 1000),
+      },
+    };
+  }
+
   const cognitoIdentity = new CognitoIdentityClient({ region: config.region });
 
   // Step 1: Get Identity ID from token
@@ -53,6 +118,7 @@ export async function getAWSCredentials(idToken: string) {
       accessKeyId: credentialsResponse.Credentials!.AccessKeyId!,
       secretAccessKey: credentialsResponse.Credentials!.SecretKey!,
       sessionToken: credentialsResponse.Credentials!.SessionToken!,
+      expiration: credentialsResponse.Credentials!.Expiration,
     },
   };
 }